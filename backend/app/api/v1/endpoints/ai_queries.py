@@ -0,0 +1,143 @@
+"""
+AI 查询日志接口 (仅管理员) - 按 SQL 指纹排行,定位需要补充索引 / 物化视图的查询;聚合导航 (汇总表改写) 与问题模板快速通道统计
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.v1.endpoints.auth import get_current_admin_user
+from app.db.session import get_db
+from app.models.bi_schema import SysAiQueryLog, SysUser
+from app.services.intent_templates import intent_matcher
+
+router = APIRouter()
+
+Log = SysAiQueryLog
+
+
+@router.get("/fingerprints")
+async def rank_fingerprints(
+    admin: Annotated[SysUser, Depends(get_current_admin_user)],
+    db: AsyncSession = Depends(get_db),
+    order: Literal["slowest", "frequent", "total"] = Query(
+        "total", description="slowest 平均耗时 / frequent 执行次数 / total 累计耗时"
+    ),
+    days: int = Query(7, ge=1, le=365, description="统计最近 N 天"),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    按 SQL 指纹汇总 AI 查询
+
+    每个指纹返回: 执行次数、平均 / P95 / 最大耗时、累计耗时、平均返回行数、失败次数、
+    全表扫描的表 (来自执行计划) 与最近执行时间
+    """
+    stats = (
+        select(
+            Log.fingerprint,
+            func.max(Log.normalized_sql).label("normalized_sql"),
+            func.count().label("executions"),
+            func.avg(Log.duration_ms).label("avg_ms"),
+            func.percentile_cont(0.95).within_group(Log.duration_ms).label("p95_ms"),
+            func.max(Log.duration_ms).label("max_ms"),
+            func.sum(Log.duration_ms).label("total_ms"),
+            func.avg(Log.row_count).label("avg_rows"),
+            func.count().filter(Log.error.isnot(None)).label("errors"),
+            func.max(Log.seq_scans).label("seq_scans"),
+            func.bool_or(Log.explain_plan.isnot(None)).label("has_plan"),
+            func.max(Log.created_at).label("last_seen"),
+        )
+        .where(Log.created_at >= datetime.now() - timedelta(days=days))
+        .group_by(Log.fingerprint)
+    )
+    sort_key = {"slowest": "avg_ms", "frequent": "executions", "total": "total_ms"}[order]
+    result = await db.execute(stats.order_by(stats.selected_columns[sort_key].desc()).limit(limit))
+    return {
+        "order": order,
+        "days": days,
+        "fingerprints": [
+            {
+                **row._mapping,
+                "avg_ms": round(float(row.avg_ms), 1),
+                "p95_ms": round(float(row.p95_ms), 1),
+                "max_ms": float(row.max_ms),
+                "total_ms": float(row.total_ms),
+                "avg_rows": round(float(row.avg_rows), 1) if row.avg_rows is not None else None,
+                "seq_scans": row.seq_scans.split(",") if row.seq_scans else [],
+            }
+            for row in result
+        ],
+    }
+
+
+@router.get("/fingerprints/{fingerprint}")
+async def get_fingerprint(
+    fingerprint: str,
+    admin: Annotated[SysUser, Depends(get_current_admin_user)],
+    db: AsyncSession = Depends(get_db),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """单个指纹最近的执行记录与最近一次采集的执行计划"""
+    result = await db.execute(
+        select(Log).where(Log.fingerprint == fingerprint).order_by(Log.created_at.desc()).limit(limit)
+    )
+    executions = result.scalars().all()
+    if not executions:
+        raise HTTPException(status_code=404, detail="指纹不存在或记录已被清理")
+
+    plan = await db.execute(
+        select(Log.explain_plan, Log.seq_scans, Log.duration_ms, Log.created_at)
+        .where(Log.fingerprint == fingerprint, Log.explain_plan.isnot(None))
+        .order_by(Log.created_at.desc())
+        .limit(1)
+    )
+    latest_plan = plan.first()
+    return {
+        "fingerprint": fingerprint,
+        "normalized_sql": executions[0].normalized_sql,
+        "latest_plan": dict(latest_plan._mapping) if latest_plan else None,
+        "executions": [
+            {
+                "sql": log.sql_text,
+                "original_sql": log.original_sql,
+                "duration_ms": float(log.duration_ms),
+                "row_count": log.row_count,
+                "total_count": log.total_count,
+                "truncated": log.truncated,
+                "error": log.error,
+                "created_at": log.created_at,
+            }
+            for log in executions
+        ],
+    }
+
+
+@router.get("/rollups")
+async def get_rollups(admin: Annotated[SysUser, Depends(get_current_admin_user)]):
+    """
+    聚合导航统计 (当前进程): 改写次数与比例、未改写原因、各汇总表的改写次数,
+    以及后台对比得到的原查询 / 汇总表平均耗时与估算节省的时间
+    """
+    from app.services.aggregate_navigator import aggregate_navigator  # 依赖 sqlglot,延迟导入
+
+    return aggregate_navigator.report()
+
+
+@router.post("/rollups/refresh")
+async def refresh_rollups(admin: Annotated[SysUser, Depends(get_current_admin_user)]):
+    """立即刷新全部汇总表 (其他 worker 正在刷新时跳过)"""
+    from app.services.aggregate_navigator import aggregate_navigator, default_dsn
+
+    refreshed = await asyncio.to_thread(aggregate_navigator.refresh, default_dsn(), True)
+    return {"refreshed": refreshed}
+
+
+@router.get("/fast-path")
+async def get_fast_path(admin: Annotated[SysUser, Depends(get_current_admin_user)]):
+    """
+    问题模板快速通道统计 (当前进程): 问答数、模板命中数与覆盖率、模板 SQL 执行失败数、各模板命中次数
+    """
+    return intent_matcher.snapshot()
@@ -13,7 +13,9 @@ from app.core.security import (
     create_access_token,
     verify_password,
     get_password_hash,
-    decode_access_token
+    decode_access_token,
+    check_user_permissions,
+    UserRole
 )
 from app.db.session import get_db
 from app.models.bi_schema import SysUser
@@ -72,6 +74,15 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_admin_user(
+    current_user: Annotated[SysUser, Depends(get_current_active_user)]
+) -> SysUser:
+    """获取当前管理员用户 (运维诊断类接口使用)"""
+    if not check_user_permissions(current_user.role, UserRole.ADMIN):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return current_user
+
+
 @router.post("/login", response_model=Token, summary="用户登录")
 async def login_access_token(
     login_data: LoginRequest,
@@ -1,6 +1,7 @@
 """
 进销存业务操作接口
 """
+import uuid
 from datetime import datetime, date
 from typing import Annotated
 from decimal import Decimal
@@ -38,10 +39,10 @@ router = APIRouter()
 
 
 def generate_order_no(order_type: OrderType) -> str:
-    """生成订单编号"""
+    """生成订单编号 (时间戳 + 随机后缀,同一秒内的并发下单不会冲突)"""
     prefix = "PO" if order_type == OrderType.PURCHASE else "SO"
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    return f"{prefix}{timestamp}"
+    return f"{prefix}{timestamp}{uuid.uuid4().hex[:6].upper()}"
 
 
 @router.post("/products", response_model=ProductResponse, summary="创建商品")
@@ -3,9 +3,11 @@ ChatBI 智能问答接口 - 基于 Vanna + 通义千问
 """
 from typing import Dict, Any, List, Optional
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from loguru import logger
 
+from app.core.serialization import dumps
 from app.services.vanna_service import vanna_service
 
 router = APIRouter()
@@ -18,9 +20,12 @@ class ChatRequest(BaseModel):
 
 
 class ChatDataResponse(BaseModel):
-    """数据响应格式"""
+    """数据响应格式 (列式: values[i] 为 columns[i] 列的全部取值)"""
     columns: List[str]
-    rows: List[Dict[str, Any]]
+    values: List[List[Any]]
+    row_count: int = 0  # 返回的行数
+    total_count: Optional[int] = None  # 查询结果总行数 (截断且未统计时为 null)
+    truncated: bool = False  # 是否因行数上限被截断
 
 
 class ChatResponse(BaseModel):
@@ -57,33 +62,35 @@ async def chat_with_ai(request: ChatRequest):
         "chart_type": "bar",
         "data": {
             "columns": ["region", "total_sales"],
-            "rows": [{"region": "华东", "total_sales": 1000000}]
+            "values": [["华东", "华南"], [1000000, 800000]],
+            "row_count": 2,
+            "total_count": 2,
+            "truncated": false
         }
     }
     ```
+    
+    单次返回的行数受 `CHAT_MAX_ROWS` 限制,超出时 `truncated` 为 true,
+    `total_count` 为查询结果总行数
     """
     try:
         logger.info(f"📥 收到问题: {request.question}")
         
-        # 调用 Vanna 服务处理问题
-        result = await vanna_service.ask_question(request.question, request.context)
+        # 调用 Vanna 服务处理问题 (返回已序列化的 JSON,缓存命中时为 Redis 中的原始 bytes)
+        body, cache_hit = await vanna_service.ask_question_json(request.question, request.context)
         
-        if not result:
+        if not body:
             raise HTTPException(
                 status_code=500, 
                 detail="AI 服务返回空结果,请稍后重试"
             )
         
-        logger.info(f"✅ 查询成功,图表类型: {result.get('chart_type')}")
+        logger.info(f"✅ 查询成功 (cache {'hit' if cache_hit else 'miss'})")
         
-        return ChatResponse(
-            answer_text=result.get("answer_text", ""),
-            sql=result.get("sql", ""),
-            chart_type=result.get("chart_type", "table"),
-            data=ChatDataResponse(
-                columns=result.get("data", {}).get("columns", []),
-                rows=result.get("data", {}).get("rows", [])
-            )
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"X-Cache": "HIT" if cache_hit else "MISS"}
         )
 
     except HTTPException:
@@ -99,6 +106,44 @@ async def chat_with_ai(request: ChatRequest):
         )
 
 
+def _format_sse(event: str, payload: Dict[str, Any]) -> str:
+    """格式化为 Server-Sent Events 消息"""
+    data = dumps(payload).decode("utf-8")
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.post("/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    """
+    AI 智能问答流式接口 (Server-Sent Events)
+
+    在 Agent 产出结果的同时逐步推送,无需等待整个问答完成:
+    
+    1. `status` - 处理阶段 (thinking / querying)
+    2. `sql` - 生成的 SQL
+    3. `rows` - 分批推送的列式结果 `{"columns": [...], "offset": 0, "values": [[...], ...]}`
+    4. `chart` - 推荐的图表类型
+    5. `answer` - 自然语言回答
+    6. `done` - 结束标记 `{"row_count": 10, "total_count": 10, "truncated": false, "cached": false}`
+    
+    出错时推送 `error` 事件 `{"message": "..."}`
+    """
+    logger.info(f"📥 收到问题 (stream): {request.question}")
+
+    async def event_generator():
+        async for event, payload in vanna_service.stream_question(request.question, request.context):
+            yield _format_sse(event, payload)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 禁用 Nginx 缓冲,保证事件即时送达
+        }
+    )
+
+
 @router.get("/history")
 async def get_chat_history():
     """
@@ -0,0 +1,78 @@
+"""
+请求剖析接口 (仅管理员) - 查看 / 下载剖析报告,调整采样比例
+
+单个请求的剖析通过请求头 X-Profile 触发,见 app/core/profiling.py
+"""
+import os
+from typing import Annotated, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, Response
+from pydantic import BaseModel, Field
+
+from app.api.v1.endpoints.auth import get_current_admin_user
+from app.core.profiling import REPORT_FORMATS, profile_store, profiling_available
+from app.models.bi_schema import SysUser
+
+router = APIRouter()
+
+ReportFormat = Literal["html", "text", "speedscope", "pstats"]
+
+
+async def require_admin(
+    current_user: Annotated[SysUser, Depends(get_current_admin_user)],
+) -> SysUser:
+    if not profiling_available():
+        raise HTTPException(status_code=501, detail="pyinstrument 未安装,无法剖析请求")
+    return current_user
+
+
+class SamplingConfig(BaseModel):
+    """采样剖析配置: 每个路由每 every 个请求剖析 1 个 (0 表示关闭)"""
+    every: int = Field(ge=0)
+    reset: bool = Field(default=False, description="是否清空已合并的采样结果")
+
+
+@router.get("/reports")
+async def list_reports(admin: Annotated[SysUser, Depends(require_admin)]):
+    """最近的单次请求剖析报告 (新的在前)"""
+    return {"reports": list(reversed(profile_store.reports.values()))}
+
+
+@router.get("/reports/{profile_id}")
+async def get_report(
+    profile_id: str,
+    admin: Annotated[SysUser, Depends(require_admin)],
+    format: ReportFormat = Query("html", description="html 调用树 / text / speedscope 火焰图 / pstats 调用统计"),
+):
+    """下载单次请求的剖析报告"""
+    if profile_id not in profile_store.reports:
+        raise HTTPException(status_code=404, detail="剖析报告不存在或已被清理")
+    path = profile_store.path(profile_id, format)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="剖析报告不存在或已被清理")
+    return FileResponse(path, media_type=REPORT_FORMATS[format][1])
+
+
+@router.get("/sampled")
+async def get_sampled(
+    admin: Annotated[SysUser, Depends(require_admin)],
+    route: Optional[str] = Query(None, description="路由模板,如 /api/v1/chat/query;为空时返回各路由汇总"),
+    format: ReportFormat = Query("text"),
+):
+    """采样剖析结果: 各路由汇总 (按 CPU 时间排序),或单个路由合并后的报告"""
+    if route is None:
+        return {"sample_every": profile_store.sample_every, "routes": profile_store.sampled_summary()}
+    content = profile_store.render_sampled(route, format)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"路由 {route} 暂无采样结果")
+    return Response(content=content, media_type=REPORT_FORMATS[format][1])
+
+
+@router.put("/sampling")
+async def set_sampling(config: SamplingConfig, admin: Annotated[SysUser, Depends(require_admin)]):
+    """运行时调整采样比例 (只影响当前进程)"""
+    profile_store.sample_every = config.every
+    if config.reset:
+        profile_store.reset_sampled()
+    return {"sample_every": profile_store.sample_every}
@@ -1,55 +1,70 @@
 """
 报表查询和导出接口
 """
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, HTTPException, Query, Depends
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-import pandas as pd
+import asyncio
+import os
+import uuid
 from datetime import datetime
 
-from app.services.vanna_service import vanna_service
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.core.config import settings
+from app.core.serialization import ORJSONResponse, dumps
+from app.schemas.report import ReportRequest, ExportRequest
+from app.services.report_engine import ReportQueryError, report_engine
+from app.services.export_jobs import MEDIA_TYPES, export_jobs
+from app.services.kpi_service import kpi_service
+from app.services.report_arrow import (
+    ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE, arrow_available, iter_arrow, table_bytes, write_parquet
+)
+from app.services.report_export import CSV_MEDIA_TYPE, iter_csv, ranged_file_response, write_xlsx
 
 router = APIRouter()
 
-class ReportRequest(BaseModel):
-    """报表请求模型"""
-    dimensions: List[str] = []  # 维度字段
-    metrics: List[str] = []     # 指标字段
-    filters: Dict[str, Any] = {}  # 筛选条件
-    group_by: List[str] = []     # 分组字段
-    order_by: Optional[str] = None
-    limit: Optional[int] = 1000
+EXPORT_FORMATS = ("xlsx", "csv", "arrow", "parquet")
 
-class ExportRequest(BaseModel):
-    """导出请求模型"""
-    report_request: ReportRequest
-    format: str = "xlsx"  # xlsx, csv
+def _require_arrow(fmt: str):
+    if not arrow_available():
+        raise HTTPException(status_code=501, detail=f"服务端未安装 pyarrow,不支持 {fmt} 格式")
 
 @router.post("/query")
-async def query_report(request: ReportRequest):
+async def query_report(request: ReportRequest, output: str = Query("json", alias="format")):
     """
     通用报表查询接口
 
-    支持多维度筛选、分组汇总等功能
-    """
-    try:
-        # 构建查询 SQL
-        sql = vanna_service.build_report_sql(request)
+    支持多维度筛选、分组汇总等功能;
+    总计与按第一个维度的小计在同一条 SQL 中通过 GROUPING SETS 计算
 
-        # 执行查询
-        data = await vanna_service.execute_sql(sql)
-
-        # 计算汇总数据
-        summary = vanna_service.calculate_summary(data, request.metrics)
+    format=arrow 时返回 Arrow IPC stream (列式),format=parquet 时返回 Parquet 文件;
+    汇总信息放在 schema 元数据 (summary / total_count / sql / dataset) 中
+    """
+    output = output.lower()
+    if output not in ("json", "arrow", "parquet"):
+        raise HTTPException(status_code=400, detail="不支持的返回格式")
+    if output != "json":
+        _require_arrow(output)
 
-        return {
-            "data": data,
-            "summary": summary,
-            "total_count": len(data),
-            "sql": sql
+    try:
+        result = await report_engine.query(request)
+        if output == "json":
+            return result
+
+        types = report_engine.output_types(request)
+        columns = list(types)
+        metadata = {
+            "summary": dumps(result["summary"]).decode("utf-8"),
+            "total_count": str(result["total_count"]),
+            "sql": result["sql"],
+            "dataset": result["dataset"],
         }
+        rows = [tuple(row[col] for col in columns) for row in result["data"]]
+        body = await asyncio.to_thread(table_bytes, columns, rows, types, metadata, output)
+        return Response(content=body, media_type=PARQUET_MEDIA_TYPE if output == "parquet" else ARROW_MEDIA_TYPE)
 
+    except ReportQueryError as e:
+        raise HTTPException(status_code=400, detail=f"报表请求不合法: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"报表查询失败: {str(e)}")
 
@@ -58,55 +73,113 @@ async def export_report(request: ExportRequest):
     """
     导出报表数据
 
-    支持 Excel 和 CSV 格式导出
+    支持 Excel、CSV、Arrow IPC stream 与 Parquet 格式导出;数据通过服务端游标逐批读取,
+    CSV / Arrow 边读边发送,XLSX / Parquet 写入临时文件 (发送后删除),不在工作目录留下文件
     """
+    export_format = request.format.lower()
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="不支持的导出格式")
+    if export_format in ("arrow", "parquet"):
+        _require_arrow(export_format)
+
+    if request.background:
+        return await _submit_export_job(request)
+
+    batches = report_engine.stream(request.report_request, settings.report_export_batch_size)
     try:
-        # 先查询数据
-        query_result = await query_report(request.report_request)
+        # 先取列名: 请求校验与 SQL 执行错误在开始发送前返回
+        types = report_engine.output_types(request.report_request)
+        columns = await batches.__anext__()
+    except ReportQueryError as e:
+        await batches.aclose()
+        raise HTTPException(status_code=400, detail=f"报表请求不合法: {str(e)}")
+    except Exception as e:
+        await batches.aclose()
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
-        # 转换为 DataFrame
-        df = pd.DataFrame(query_result["data"])
+    filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.{export_format}"
+    disposition = {"Content-Disposition": f'attachment; filename="{filename}"'}
 
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"report_{timestamp}.{request.format}"
+    if export_format == "csv":
+        return StreamingResponse(iter_csv(columns, batches), media_type=CSV_MEDIA_TYPE, headers=disposition)
+    if export_format == "arrow":
+        return StreamingResponse(iter_arrow(columns, batches, types), media_type=ARROW_MEDIA_TYPE, headers=disposition)
 
-        # 保存文件
-        if request.format == "xlsx":
-            df.to_excel(filename, index=False)
-        elif request.format == "csv":
-            df.to_csv(filename, index=False, encoding='utf-8-sig')
+    try:
+        if export_format == "parquet":
+            path = await write_parquet(columns, batches, settings.report_export_tmp_dir, types)
         else:
-            raise HTTPException(status_code=400, detail="不支持的导出格式")
+            path = await write_xlsx(columns, batches, settings.report_export_tmp_dir)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
-        # 返回文件
-        return FileResponse(
-            filename,
-            media_type='application/octet-stream',
-            filename=filename
-        )
+    return FileResponse(
+        path,
+        media_type=MEDIA_TYPES[export_format],
+        filename=filename,
+        background=BackgroundTask(os.remove, path)
+    )
 
+async def _submit_export_job(request: ExportRequest):
+    """提交后台导出任务,返回 202 与任务状态"""
+    try:
+        report_engine.build(request.report_request, export=True)  # 提交前校验请求
+        job = await export_jobs.submit(request)
+    except ReportQueryError as e:
+        raise HTTPException(status_code=400, detail=f"报表请求不合法: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"提交导出任务失败: {str(e)}")
+    return ORJSONResponse(status_code=202, content=job)
+
+@router.get("/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """
+    查询后台导出任务状态
+
+    status: queued / running / done / failed;progress 为已写行数占总行数的比例
+    """
+    job = await export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    return job
+
+@router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, http_request: Request):
+    """
+    下载后台导出产物
+
+    支持 HTTP Range (断点续传)
+    """
+    job = await export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"导出任务尚未完成: {job['status']}")
+
+    path = export_jobs.artifact_path(job_id, job["format"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="导出文件已清理,请重新提交")
+    return ranged_file_response(
+        path, http_request.headers.get("range"), MEDIA_TYPES[job["format"]], job["filename"]
+    )
 
 @router.get("/dashboard")
 async def get_dashboard_data():
     """
     获取仪表板基础数据
 
-    返回 KPI 指标和基础图表数据
+    返回 KPI 指标和基础图表数据;与 /dashboard/overview 共用 kpi_service 的指标缓存,
+    last_updated 为数据的最近变更时间
     """
     try:
-        # 获取关键指标
-        kpis = await vanna_service.get_dashboard_kpis()
-
-        # 获取基础图表数据
-        charts = await vanna_service.get_dashboard_charts()
-
+        data = await kpi_service.overview()
         return {
-            "kpis": kpis,
-            "charts": charts,
-            "last_updated": datetime.now().isoformat()
+            "kpis": {**data["kpi"], **data["finance_status"]},
+            "charts": {
+                "sales_trend": data["trends"],
+                "inventory_alerts": data["inventory_alerts"],
+            },
+            "last_updated": data["last_updated"]
         }
 
     except Exception as e:
@@ -27,9 +27,125 @@ class Settings(BaseSettings):
     redis_host: str = "redis"  # Docker service name
     redis_port: int = 6379
     redis_url: str = "redis://localhost:6379/0"
+    # 缓存值编码: json (命中时免解码直接返回) / msgpack
+    cache_encoding: str = "json"
+    # 缓存值压缩: zstd (未安装 zstandard 时回退 zlib) / zlib / none
+    cache_compression: str = "zstd"
+    # 超过该字节数才压缩
+    cache_compress_min_bytes: int = 1024
 
     # AI 服务配置
     dashscope_api_key: str = ""
+    # LLM 后端: dashscope (通义千问) / openai (任意 OpenAI 兼容服务,如 scripts/mock_llm_server.py)
+    llm_backend: str = "dashscope"
+    llm_model: str = "qwen-plus"
+    llm_base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    # openai 后端使用的 API Key (本地 mock 服务可留空)
+    llm_api_key: str = ""
+    llm_timeout_seconds: float = 60.0
+    # 录制 LLM 问答记录 (JSONL) 的路径,供 mock 服务回放;为空时不录制
+    llm_record_path: str = ""
+    # 流式问答每批推送的结果行数
+    chat_stream_batch_size: int = 200
+    # AI 查询单次最多返回的行数 (超出部分截断并标记 truncated)
+    chat_max_rows: int = 5000
+    # 结果被截断时是否额外执行 COUNT(*) 统计总行数
+    chat_count_total: bool = True
+    # 统计总行数的 COUNT(*) 的 statement_timeout (毫秒),超时时总行数为空
+    chat_count_timeout_ms: int = 5000
+    # 问题模板快速通道: 常见问题 (总量 / 排名 / 趋势 / 占比) 直接生成 SQL,不调用 LLM
+    chat_fast_path_enabled: bool = True
+    # AI 查询结果 CSV 落盘目录 (为空则不落盘,结果帧只在内存中传递;可指向 /dev/shm)
+    sql_spill_dir: str = ""
+    # 落盘文件最长保留时间 (秒)
+    sql_spill_max_age_seconds: int = 3600
+    # 落盘目录总大小上限 (MB),超出时从最旧的文件开始删除
+    sql_spill_max_mb: int = 256
+    # 落盘目录清理间隔 (秒)
+    sql_spill_janitor_interval_seconds: int = 300
+    # 报表查询单次最多返回的明细行数 (ReportRequest.limit 的上限)
+    report_max_rows: int = 10000
+    # 报表导出的行数上限 (xlsx 单个工作表最多 1048576 行)
+    report_export_max_rows: int = 1000000
+    # 报表导出时每批从服务端游标读取的行数
+    report_export_batch_size: int = 5000
+    # XLSX 导出临时文件目录 (为空则使用系统临时目录,发送后删除)
+    report_export_tmp_dir: str = ""
+    # 每个请求的 SQL 语句数预算 (超出时告警;0 表示不检查)
+    db_query_budget: int = 30
+    # 同一语句形状在一个请求内执行超过该次数时视为 N+1 并告警
+    db_query_repeat_threshold: int = 5
+    # 超出预算或出现 N+1 时的处理: warn (记录日志) / raise (抛出 QueryBudgetExceeded,测试环境使用)
+    db_query_budget_action: str = "warn"
+    # 链路追踪导出方式: 空 (关闭) / otlp / file (JSON Lines,离线分析) / console
+    otel_exporter: str = ""
+    # OTLP/HTTP 地址 (如 http://localhost:4318/v1/traces);为空时使用 OTEL_EXPORTER_OTLP_ENDPOINT 环境变量
+    otel_exporter_otlp_endpoint: str = ""
+    # file 导出方式的输出文件
+    otel_trace_file: str = "traces.jsonl"
+    otel_service_name: str = "inventory-bi-backend"
+    # 采样比例 (0~1),上游已采样的请求始终跟随上游
+    otel_sample_ratio: float = 1.0
+    # AI SQL 执行前检查: 只允许单条 SELECT,自动补充 / 收紧 LIMIT,按代价估算拒绝过大的查询
+    ai_sql_guard_enabled: bool = True
+    # 规划器代价估算 (EXPLAIN 的 Total Cost) 上限,超过时拒绝执行 (0 表示不检查)
+    ai_sql_max_cost: float = 5000000
+    # 聚合导航: AI 聚合查询改写为查询最小的可用汇总物化视图 (mv_sales_*)
+    ai_rollup_enabled: bool = True
+    # 汇总表新鲜度 (与 biz_order 实时水位比较) 的探测间隔 (秒);过期时查询原视图
+    ai_rollup_freshness_check_seconds: int = 30
+    # 汇总表刷新检查间隔 (秒),数据有变更时 REFRESH MATERIALIZED VIEW CONCURRENTLY (0 表示不自动刷新)
+    ai_rollup_refresh_seconds: int = 300
+    # 每 N 次改写在后台对比一次原查询与汇总表查询的结果和耗时 (0 表示不对比)
+    ai_rollup_verify_every: int = 20
+    # 后台对比查询的 statement_timeout (毫秒)
+    ai_rollup_verify_timeout_ms: int = 30000
+    # AI 查询日志: 记录每条 AI 生成 SQL 的指纹、耗时与行数 (表 sys_ai_query_log)
+    ai_query_log_enabled: bool = True
+    # 耗时超过该值 (毫秒) 的 AI 查询以完整 SQL 记录告警日志 (0 表示不告警)
+    ai_query_slow_ms: int = 1000
+    # 耗时超过该值 (毫秒) 的 AI 查询额外采集 EXPLAIN (ANALYZE, BUFFERS) (0 表示不采集)
+    ai_query_explain_ms: int = 1000
+    # EXPLAIN ANALYZE 会重新执行查询: 同一指纹在该间隔 (秒) 内只采集一次
+    ai_query_explain_interval_seconds: int = 600
+    # EXPLAIN ANALYZE 的 statement_timeout (毫秒)
+    ai_query_explain_timeout_ms: int = 30000
+    # AI 查询日志保留天数 (每天清理一次)
+    ai_query_log_retention_days: int = 30
+    # 请求剖析报告保存目录 (为空则使用系统临时目录下的 inventory_bi_profiles)
+    profile_dir: str = ""
+    # 最多保留的单次请求剖析报告数量
+    profile_keep: int = 50
+    # 采样剖析: 每个路由每 N 个请求剖析 1 个并合并结果 (0 表示关闭,管理员可在运行时调整)
+    profile_sample_every: int = 0
+    # 剖析采样间隔 (秒)
+    profile_interval_seconds: float = 0.001
+    # 仪表盘指标缓存的最长有效期 (秒);数据表无变更时在此期间直接复用
+    kpi_cache_ttl_seconds: int = 600
+    # 仪表盘数据新鲜度 (数据表最近变更时间) 的探测间隔 (秒)
+    kpi_freshness_check_seconds: int = 30
+    # 后台导出任务执行方式: inprocess (API 进程内) / redis (队列,由 scripts/export_worker.py 消费)
+    export_job_mode: str = "inprocess"
+    # 后台导出任务并发数 (inprocess 模式)
+    export_job_concurrency: int = 2
+    # 后台导出产物目录 (为空则使用系统临时目录下的 bi_exports)
+    export_job_dir: str = ""
+    # 后台导出任务状态与产物的保留时间 (秒),有效期内相同请求直接复用
+    export_job_ttl_seconds: int = 3600
+    # 排队 / 执行中的导出任务超过该秒数没有更新 (进度或状态) 时视为已中断 (如 API 重启),相同请求重新执行
+    export_job_stale_seconds: int = 600
+    # 启动时是否在后台预热 AI Agent (关闭则在首次问答时初始化)
+    vanna_eager_init: bool = True
+    # Agent Memory 存储: pgvector (持久化,多 worker 共享) / memory (进程内,仅用于演示)
+    agent_memory_backend: str = "pgvector"
+    # Agent Memory 向量维度 (表创建后修改需重建 ai_tool_memory / ai_text_memory)
+    agent_memory_embedding_dim: int = 256
+    # Prompt 附带的相似示例数上限
+    prompt_max_examples: int = 3
+    # Prompt 动态部分 (相关字段 + 示例 + 问题) 的 token 预算
+    prompt_token_budget: int = 1200
+    # 附带示例的最低相似度
+    prompt_example_min_score: float = 0.5
 
     # 应用配置
     app_name: str = "进销存 BI 系统"
@@ -0,0 +1,268 @@
+"""
+Prometheus 指标
+
+- HTTP: 每路由 (路由模板,不含路径参数) 的请求延迟与状态码
+- 数据库: 每条语句的耗时 (按操作类型)、每请求的语句数 / 数据库耗时 / N+1 次数 (按路由)
+- 缓存: Redis (vanna_cache:*) 与进程内缓存 (KPI) 的读写延迟、命中 / 未命中次数;写入 Redis 的值大小与压缩比
+- LLM: 每次调用的延迟与 token 数 (按后端与模型)
+- 问题模板快速通道: 按模板统计命中 / 未识别 / 执行失败的问答数 (覆盖率)
+- 聚合导航: AI 查询改写到各汇总表的次数,以及后台对比时原查询 / 汇总表查询的耗时
+- 连接池: 数据库与 Redis 连接池的使用量与饱和度 (抓取时读取)
+
+prometheus_client 为可选依赖,未安装时所有记录函数为空操作,/metrics 返回 501
+多进程部署 (gunicorn 多 worker) 时设置 PROMETHEUS_MULTIPROC_DIR,/metrics 汇总所有 worker 的数据
+"""
+import os
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # 未安装时不采集指标
+    CollectorRegistry = None
+
+
+# 秒级延迟分桶 (覆盖 1ms ~ 60s,LLM 调用落在后段)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+RATIO_BUCKETS = (1, 1.25, 1.5, 2, 3, 4, 6, 8, 12, 16)
+
+
+def metrics_available() -> bool:
+    return CollectorRegistry is not None
+
+
+if metrics_available():
+    REGISTRY = CollectorRegistry(auto_describe=True)
+
+    HTTP_REQUEST_SECONDS = Histogram(
+        "http_request_duration_seconds", "HTTP 请求耗时",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+    )
+    DB_STATEMENT_SECONDS = Histogram(
+        "db_statement_duration_seconds", "单条 SQL 语句耗时",
+        ["operation"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+    )
+    DB_REQUEST_QUERIES = Histogram(
+        "db_request_queries", "每个请求执行的 SQL 语句数",
+        ["route"], buckets=QUERY_COUNT_BUCKETS, registry=REGISTRY,
+    )
+    DB_REQUEST_SECONDS = Histogram(
+        "db_request_duration_seconds", "每个请求的数据库总耗时",
+        ["route"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+    )
+    DB_N_PLUS_ONE = Counter(
+        "db_n_plus_one_requests", "出现重复语句形状 (疑似 N+1) 的请求数",
+        ["route"], registry=REGISTRY,
+    )
+    CACHE_OPERATION_SECONDS = Histogram(
+        "cache_operation_duration_seconds", "缓存读写耗时",
+        ["cache", "operation"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+    )
+    CACHE_REQUESTS = Counter(
+        "cache_requests", "缓存读取次数",
+        ["cache", "result"], registry=REGISTRY,
+    )
+    CACHE_VALUE_BYTES = Histogram(
+        "cache_value_bytes", "写入缓存的值大小 (raw 编码后压缩前 / stored 压缩后含文件头)",
+        ["compression", "stage"], buckets=SIZE_BUCKETS, registry=REGISTRY,
+    )
+    CACHE_COMPRESSION_RATIO = Histogram(
+        "cache_compression_ratio", "缓存值压缩比 (压缩前 / 压缩后)",
+        ["compression"], buckets=RATIO_BUCKETS, registry=REGISTRY,
+    )
+    LLM_REQUEST_SECONDS = Histogram(
+        "llm_request_duration_seconds", "LLM 调用耗时",
+        ["backend", "model"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+    )
+    LLM_TOKENS = Histogram(
+        "llm_request_tokens", "每次 LLM 调用的 token 数",
+        ["backend", "model", "kind"], buckets=TOKEN_BUCKETS, registry=REGISTRY,
+    )
+    CHAT_FAST_PATH = Counter(
+        "chat_fast_path_questions", "问题模板快速通道结果 (hit / miss / error)",
+        ["template", "result"], registry=REGISTRY,
+    )
+    AI_ROLLUP_QUERIES = Counter(
+        "ai_rollup_queries", "AI 查询按汇总表的改写次数 (none 表示未改写)",
+        ["rollup"], registry=REGISTRY,
+    )
+    AI_ROLLUP_VERIFY_SECONDS = Histogram(
+        "ai_rollup_verify_duration_seconds", "后台对比时原查询 (raw) 与汇总表查询 (rollup) 的耗时",
+        ["rollup", "source"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+    )
+
+
+def sql_operation(statement: str) -> str:
+    """SQL 操作类型 (SELECT / INSERT / ...),作为低基数标签"""
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def observe_http(method: str, route: str, status: int, seconds: float):
+    if metrics_available():
+        HTTP_REQUEST_SECONDS.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_statement(statement: str, seconds: float):
+    if metrics_available():
+        DB_STATEMENT_SECONDS.labels(sql_operation(statement)).observe(seconds)
+
+
+def observe_db_request(route: str, queries: int, seconds: float, n_plus_one: bool):
+    if metrics_available():
+        DB_REQUEST_QUERIES.labels(route).observe(queries)
+        DB_REQUEST_SECONDS.labels(route).observe(seconds)
+        if n_plus_one:
+            DB_N_PLUS_ONE.labels(route).inc()
+
+
+def observe_cache(cache: str, operation: str, seconds: float, result: Optional[str] = None):
+    """
+    记录一次缓存操作
+
+    Args:
+        cache: 缓存名称 (vanna / kpi ...)
+        operation: get / set
+        result: 读取结果 hit / miss / error (写入时为空)
+    """
+    if metrics_available():
+        CACHE_OPERATION_SECONDS.labels(cache, operation).observe(seconds)
+        if result is not None:
+            CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def observe_cache_value(compression: str, raw_bytes: int, stored_bytes: int):
+    """
+    记录一次缓存写入的值大小
+
+    Args:
+        compression: 实际使用的压缩算法 (none / zstd / zlib)
+    """
+    if metrics_available():
+        CACHE_VALUE_BYTES.labels(compression, "raw").observe(raw_bytes)
+        CACHE_VALUE_BYTES.labels(compression, "stored").observe(stored_bytes)
+        if stored_bytes:
+            CACHE_COMPRESSION_RATIO.labels(compression).observe(raw_bytes / stored_bytes)
+
+
+def observe_llm(seconds: float, prompt_tokens: int, completion_tokens: int):
+    if metrics_available():
+        labels = (settings.llm_backend, settings.llm_model)
+        LLM_REQUEST_SECONDS.labels(*labels).observe(seconds)
+        LLM_TOKENS.labels(*labels, "prompt").observe(prompt_tokens)
+        LLM_TOKENS.labels(*labels, "completion").observe(completion_tokens)
+
+
+def observe_fast_path(template: Optional[str], result: str):
+    if metrics_available():
+        CHAT_FAST_PATH.labels(template or "none", result).inc()
+
+
+def observe_rollup(rollup: Optional[str]):
+    if metrics_available():
+        AI_ROLLUP_QUERIES.labels(rollup or "none").inc()
+
+
+def observe_rollup_verify(rollup: str, raw_seconds: float, rollup_seconds: float):
+    if metrics_available():
+        AI_ROLLUP_VERIFY_SECONDS.labels(rollup, "raw").observe(raw_seconds)
+        AI_ROLLUP_VERIFY_SECONDS.labels(rollup, "rollup").observe(rollup_seconds)
+
+
+class PoolCollector:
+    """抓取时读取连接池状态 (数据库引擎与 Redis 连接池)"""
+
+    @staticmethod
+    def _families():
+        return (
+            GaugeMetricFamily("connection_pool_in_use", "连接池中正在使用的连接数", labels=["pool"]),
+            GaugeMetricFamily("connection_pool_capacity", "连接池的最大连接数", labels=["pool"]),
+            GaugeMetricFamily("connection_pool_saturation", "连接池饱和度 (使用中 / 最大)", labels=["pool"]),
+        )
+
+    def describe(self):
+        # 注册时只声明指标名,不读取连接池 (避免导入 app.db.session 造成循环导入)
+        return list(self._families())
+
+    def collect(self):
+        in_use, capacity, saturation = self._families()
+        for name, used, limit in _pool_states():
+            in_use.add_metric([name], used)
+            capacity.add_metric([name], limit)
+            saturation.add_metric([name], used / limit if limit else 0.0)
+        yield in_use
+        yield capacity
+        yield saturation
+
+
+def _pool_states():
+    """[(连接池名称, 使用中, 最大连接数), ...];尚未创建的连接池跳过"""
+    states = []
+    from app.db.session import engine
+
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        states.append(("db", pool.checkedout(), pool.size() + max(0, getattr(pool, "_max_overflow", 0))))
+
+    from app.services.vanna_service import vanna_service
+
+    redis_client = vanna_service.redis_client
+    redis_pool = getattr(redis_client, "connection_pool", None)
+    if redis_pool is not None:
+        states.append(("redis_cache", len(getattr(redis_pool, "_in_use_connections", ())), redis_pool.max_connections))
+    return states
+
+
+if metrics_available():
+    REGISTRY.register(PoolCollector())
+
+
+def render_metrics() -> tuple:
+    """
+    生成 Prometheus 文本格式
+
+    Returns:
+        (body, content_type)
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector())  # 连接池状态只反映当前 worker
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """记录每个 HTTP 请求的耗时 (含流式响应的完整发送时间),按路由模板打标签"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics_available():
+            await self.app(scope, receive, send)
+            return
+
+        from app.db.query_stats import route_label
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            observe_http(scope["method"], route_label(scope), status, time.perf_counter() - started)
@@ -0,0 +1,250 @@
+"""
+按需请求剖析 (pyinstrument 采样剖析)
+
+两种触发方式 (生产环境可用,无需重新部署):
+1. 单个请求: 管理员 Token + 请求头 X-Profile
+   - X-Profile: store  (或 1) 正常返回响应,剖析报告保存到 PROFILE_DIR,响应头 X-Profile-Id 为报告编号
+   - X-Profile: inline 用剖析报告 (HTML 火焰/调用树) 替换响应体,便于浏览器中直接查看
+2. 采样: 每个路由每 N 个请求剖析 1 个 (PROFILE_SAMPLE_EVERY,或管理员通过 /api/v1/profiling/sampling 动态调整),
+   同一路由的结果合并,查看 CPU 主要消耗在哪里 (如 ask_question 的结果后处理、业务接口)
+
+每份报告保存 HTML (调用树)、speedscope JSON (火焰图,https://www.speedscope.app)、pstats (调用统计,snakeviz 等工具可读)
+以 async_mode 运行: 只统计当前请求所在协程的时间,并发请求互不干扰;线程池中的阻塞调用显示为 await 等待
+
+pyinstrument 为可选依赖,未安装时中间件直接放行
+"""
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import ConsoleRenderer, HTMLRenderer, PstatsRenderer, SpeedscopeRenderer
+    from pyinstrument.session import Session
+except ImportError:  # 未安装时不剖析
+    Profiler = None
+
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# 报告格式 → (文件扩展名, 媒体类型)
+REPORT_FORMATS = {
+    "html": ("html", "text/html; charset=utf-8"),
+    "text": ("txt", "text/plain; charset=utf-8"),
+    "speedscope": ("speedscope.json", "application/json"),
+    "pstats": ("pstats", "application/octet-stream"),
+}
+
+
+def profiling_available() -> bool:
+    return Profiler is not None
+
+
+def _render(session, fmt: str):
+    if fmt == "html":
+        return HTMLRenderer().render(session)
+    if fmt == "text":
+        return ConsoleRenderer(unicode=True, show_all=False).render(session)
+    if fmt == "speedscope":
+        return SpeedscopeRenderer().render(session)
+    # pstats 为 marshal 二进制 (渲染器以 surrogateescape 解码为 str)
+    return PstatsRenderer().render(session).encode("utf-8", errors="surrogateescape")
+
+
+def _is_admin(scope) -> bool:
+    """请求是否携带有效的管理员 Token (只校验签名与角色声明,不查询数据库)"""
+    from app.core.security import UserRole, decode_access_token
+
+    for key, value in scope.get("headers", []):
+        if key == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return False
+            try:
+                return decode_access_token(token).get("role") == UserRole.ADMIN
+            except Exception:
+                return False
+    return False
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1").strip().lower()
+    return None
+
+
+def _match_route(scope) -> str:
+    """在路由前匹配路由模板 (采样计数按路由,路由后 scope 中才有 endpoint)"""
+    from starlette.routing import Match
+
+    for route in getattr(scope.get("app"), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+class ProfileStore:
+    """剖析报告 (单次请求) 与按路由合并的采样结果 (进程内)"""
+
+    def __init__(self, directory: str = "", keep: int = 50):
+        self._directory = directory
+        self.keep = keep
+        self.sample_every = settings.profile_sample_every
+        self.reports: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.sampled: Dict[str, Dict[str, Any]] = {}
+        self._counters: Dict[str, int] = {}
+
+    @property
+    def directory(self) -> str:
+        if not self._directory:
+            self._directory = settings.profile_dir or os.path.join(tempfile.gettempdir(), "inventory_bi_profiles")
+        os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    def path(self, profile_id: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{REPORT_FORMATS[fmt][0]}")
+
+    def should_sample(self, route: str) -> bool:
+        if self.sample_every <= 0:
+            return False
+        count = self._counters.get(route, 0) + 1
+        self._counters[route] = count
+        return count % self.sample_every == 0
+
+    def save(self, profile_id: str, session, method: str, route: str, status: int) -> Dict[str, Any]:
+        """保存各格式的报告,超出保留数量时删除最旧的报告 (在线程中调用)"""
+        for fmt in REPORT_FORMATS:
+            content = _render(session, fmt)
+            mode = "wb" if isinstance(content, bytes) else "w"
+            with open(self.path(profile_id, fmt), mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+                f.write(content)
+        entry = {
+            "id": profile_id,
+            "method": method,
+            "route": route,
+            "status": status,
+            "duration_ms": round(session.duration * 1000, 1),
+            "cpu_ms": round(session.cpu_time * 1000, 1),
+            "created_at": time.time(),
+        }
+        self.reports[profile_id] = entry
+        while len(self.reports) > self.keep:
+            old_id, _ = self.reports.popitem(last=False)
+            for fmt in REPORT_FORMATS:
+                try:
+                    os.remove(self.path(old_id, fmt))
+                except FileNotFoundError:
+                    pass
+        return entry
+
+    def add_sample(self, route: str, session):
+        """合并同一路由的采样结果"""
+        entry = self.sampled.get(route)
+        if entry is None:
+            self.sampled[route] = {"session": session, "requests": 1}
+        else:
+            entry["session"] = Session.combine(entry["session"], session)
+            entry["requests"] += 1
+
+    def sampled_summary(self) -> List[Dict[str, Any]]:
+        return sorted(
+            (
+                {
+                    "route": route,
+                    "requests": entry["requests"],
+                    "total_ms": round(entry["session"].duration * 1000, 1),
+                    "cpu_ms": round(entry["session"].cpu_time * 1000, 1),
+                    "avg_ms": round(entry["session"].duration * 1000 / entry["requests"], 1),
+                }
+                for route, entry in self.sampled.items()
+            ),
+            key=lambda item: item["cpu_ms"],
+            reverse=True,
+        )
+
+    def render_sampled(self, route: str, fmt: str):
+        entry = self.sampled.get(route)
+        return None if entry is None else _render(entry["session"], fmt)
+
+    def reset_sampled(self):
+        self.sampled.clear()
+        self._counters.clear()
+
+
+profile_store = ProfileStore(keep=settings.profile_keep)
+
+
+class ProfilingMiddleware:
+    """按请求头或采样比例剖析请求 (纯 ASGI 中间件,流式响应包含完整发送时间)"""
+
+    def __init__(self, app, store: Optional[ProfileStore] = None):
+        self.app = app
+        self.store = store or profile_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        mode = _header(scope, PROFILE_HEADER.lower().encode())
+        if mode in ("1", "true", "store", "inline") and _is_admin(scope):
+            mode = "inline" if mode == "inline" else "store"
+        elif self.store.sample_every > 0 and self.store.should_sample(_match_route(scope)):
+            mode = "sample"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:16]
+        status = 500
+        buffered = mode == "inline"
+
+        async def send_profiled(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if mode == "store":
+                    headers = list(message.get("headers", []))
+                    headers.append((PROFILE_ID_HEADER.lower().encode(), profile_id.encode()))
+                    message = {**message, "headers": headers}
+            if not buffered:  # inline 模式丢弃原响应,结束后发送报告
+                await send(message)
+
+        profiler = Profiler(interval=settings.profile_interval_seconds, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            session = profiler.stop()
+
+        from app.db.query_stats import route_label
+
+        route = route_label(scope)
+        if mode == "sample":
+            self.store.add_sample(route, session)
+        elif mode == "store":
+            # 渲染报告较慢,放到线程中 (响应已发送完毕)
+            entry = await asyncio.to_thread(self.store.save, profile_id, session, scope["method"], route, status)
+            logger.info(f"🔬 请求剖析已保存: {scope['method']} {route} → {profile_id} ({entry['duration_ms']}ms)")
+        else:
+            body = (await asyncio.to_thread(_render, session, "html")).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", REPORT_FORMATS["html"][1].encode()),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
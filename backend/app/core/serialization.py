@@ -0,0 +1,46 @@
+"""
+JSON 序列化 - 基于 orjson
+
+orjson 在 C 层直接处理 datetime/date、numpy 数组与标量以及 NaN (输出为 null),
+只有 orjson 不认识的类型 (Decimal、pandas Timestamp/NaT 等) 才回调 json_default。
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def json_default(obj: Any) -> Any:
+    """orjson 无法原生序列化的类型"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    # pandas NaT (不引入 pandas 依赖)
+    if type(obj).__name__ == "NaTType":
+        return None
+    # pandas Timestamp 等带 isoformat 的时间类型
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    # numpy 标量 / pandas 扩展类型
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 JSON bytes"""
+    return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+
+
+def loads(data: Any) -> Any:
+    """反序列化 JSON (bytes / str)"""
+    return orjson.loads(data)
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 渲染的 JSON 响应,支持 Decimal/datetime/numpy"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,208 @@
+"""
+OpenTelemetry 链路追踪 (可选)
+
+设置 OTEL_EXPORTER 后开启:
+- otlp: 通过 OTLP/HTTP 发送到 Collector / Jaeger / Tempo (地址见 OTEL_EXPORTER_OTLP_ENDPOINT)
+- file: 每个 span 一行 JSON 追加写入 OTEL_TRACE_FILE,便于离线分析
+- console: 打印到标准输出 (调试用)
+
+覆盖范围:
+- HTTP 请求 (TracingMiddleware,按路由模板命名,支持 traceparent 传入)
+- 每条 SQL 语句 (query_stats 中的引擎事件,仪表盘 / 业务接口的查询都在其中)
+- Redis 缓存读写、AI 查询执行器、Agent 组件、LLM 调用、DataFrame 构造与列式转换、图表推荐
+
+opentelemetry-sdk 为可选依赖,未安装或未开启时 span() 为空操作
+"""
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.propagate import extract
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SpanExporter,
+        SpanExportResult,
+    )
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # 未安装时不追踪
+    trace = None
+    SpanExporter = object
+
+
+_provider = None
+_tracer = None
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """每个 span 一行 JSON,追加写入文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> "SpanExportResult":
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _build_exporter(kind: str):
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        # 地址为空时使用 OTEL_EXPORTER_OTLP_ENDPOINT 环境变量 (默认 http://localhost:4318)
+        return OTLPSpanExporter(endpoint=settings.otel_exporter_otlp_endpoint or None)
+    if kind == "file":
+        return JsonLinesSpanExporter(settings.otel_trace_file)
+    if kind == "console":
+        return ConsoleSpanExporter()
+    raise ValueError(f"不支持的链路追踪导出方式: {kind}")
+
+
+def setup_tracing(exporter=None) -> bool:
+    """
+    初始化链路追踪 (重复调用无副作用)
+
+    Args:
+        exporter: 自定义 SpanExporter (测试使用);为空时按 OTEL_EXPORTER 创建
+
+    Returns:
+        是否已开启
+    """
+    global _provider, _tracer
+    if _tracer is not None:
+        return True
+    if trace is None or (exporter is None and not settings.otel_exporter):
+        return False
+
+    exporter = exporter or _build_exporter(settings.otel_exporter)
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.otel_service_name}),
+        sampler=ParentBased(TraceIdRatioBased(settings.otel_sample_ratio)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("inventory_bi")
+    logger.info(f"🔭 链路追踪已开启 (导出: {type(exporter).__name__})")
+    return True
+
+
+def shutdown_tracing():
+    """导出剩余 span 并关闭"""
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = None
+    _tracer = None
+
+
+def force_flush():
+    if _provider is not None:
+        _provider.force_flush()
+
+
+def _attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉空值,非基本类型转为字符串 (OTel 属性只接受 str / bool / int / float)"""
+    return {
+        key: value if isinstance(value, (str, bool, int, float)) else str(value)
+        for key, value in attributes.items()
+        if value is not None
+    }
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Any]]:
+    """
+    在当前上下文中开启一个 span (未开启追踪时为空操作,yield None)
+
+    异常会记录到 span 并标记为错误后继续抛出
+    注意: 不要跨 async generator 的 yield 使用 (上下文会在其他协程中恢复)
+    """
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, kind: str = "internal", **attributes):
+    """开启一个不切换当前上下文的 span (由调用方 end_span 结束),未开启追踪时返回 None"""
+    if _tracer is None:
+        return None
+    span_kind = SpanKind.CLIENT if kind == "client" else SpanKind.INTERNAL
+    return _tracer.start_span(name, kind=span_kind, attributes=_attributes(attributes))
+
+
+def end_span(current, error: Optional[BaseException] = None, **attributes):
+    if current is None:
+        return
+    if attributes:
+        current.set_attributes(_attributes(attributes))
+    if error is not None:
+        current.record_exception(error)
+        current.set_status(Status(StatusCode.ERROR, str(error)))
+    current.end()
+
+
+def record_span(name: str, start_time_ns: int, **attributes):
+    """补记一个从 start_time_ns (time.time_ns()) 到现在的 span,用于无法包裹的回调式阶段"""
+    if _tracer is None:
+        return
+    _tracer.start_span(name, start_time=start_time_ns, attributes=_attributes(attributes)).end()
+
+
+class TracingMiddleware:
+    """为每个 HTTP 请求创建服务端 span (纯 ASGI 中间件,流式响应包含完整发送时间)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        from app.db.query_stats import route_label
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with _tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.method": method, "http.target": scope["path"]},
+        ) as current:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = route_label(scope)
+                current.update_name(f"{method} {route}")
+                current.set_attribute("http.route", route)
+                current.set_attribute("http.status_code", status)
+                if status >= 500:
+                    current.set_status(Status(StatusCode.ERROR))
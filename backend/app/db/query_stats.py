@@ -0,0 +1,231 @@
+"""
+每请求 SQL 统计与 N+1 检测
+
+通过 SQLAlchemy 引擎事件 (before/after_cursor_execute) 统计当前请求的:
+- 语句数与数据库总耗时
+- 语句形状 (参数与 IN 列表归一化后的 SQL) 的重复次数,同一形状重复过多通常是 N+1 查询
+
+QueryStatsMiddleware 为每个 HTTP 请求开启统计:
+- DEBUG 模式在响应头中返回 Server-Timing / X-DB-Queries
+- 按路由累计到 query_metrics,并记录为 Prometheus 指标 (见 app/core/metrics.py)
+- 超出 DB_QUERY_BUDGET 或出现 N+1 时记录告警;DB_QUERY_BUDGET_ACTION=raise 时抛出 QueryBudgetExceeded (测试使用)
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.metrics import observe_db_request, observe_statement, sql_operation
+from app.core.tracing import end_span, start_span
+
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+
+# 当前请求的统计 (由中间件或 count_queries 创建)
+_current: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+_IN_LIST = re.compile(r"\(\s*(?:\$\d+|%\(\w+\)s|\?)(?:::\w+(?:\[\])?)?(?:\s*,\s*(?:\$\d+|%\(\w+\)s|\?)(?:::\w+(?:\[\])?)?)+\s*\)")
+_PARAM = re.compile(r"\$\d+(?:::\w+(?:\[\])?)?|%\(\w+\)s")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """请求的 SQL 语句数超出预算"""
+
+
+def statement_shape(statement: str) -> str:
+    """归一化 SQL: 参数占位符统一为 ?,IN 列表折叠为 (?),合并空白"""
+    shape = _IN_LIST.sub("(?)", statement)
+    shape = _PARAM.sub("?", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+@dataclass
+class QueryStats:
+    """一个请求内的 SQL 统计"""
+    count: int = 0
+    total_ms: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: Optional[int] = None) -> List[Tuple[str, int]]:
+        """执行次数超过阈值的语句形状 (疑似 N+1)"""
+        threshold = settings.db_query_repeat_threshold if threshold is None else threshold
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries"'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_query_started", []).append(time.perf_counter())
+    if context is not None:
+        attributes = {"db.system": conn.dialect.name, "db.statement": statement}
+        context._query_span = start_span(f"db {sql_operation(statement)}", kind="client", **attributes)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end_span(getattr(context, "_query_span", None))
+    started = conn.info.get("_query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    # 语句耗时指标覆盖所有语句 (包括后台任务),每请求统计只在请求上下文中记录
+    observe_statement(statement, elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed * 1000)
+
+
+def _handle_error(exception_context):
+    # 执行失败时 after_cursor_execute 不会触发: 结束 span 并丢弃开始时间
+    context = exception_context.execution_context
+    if not hasattr(context, "_query_span"):
+        return  # 语句尚未开始执行 (如连接失败)
+    end_span(context._query_span, error=exception_context.original_exception)
+    started = exception_context.connection.info.get("_query_started")
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """为引擎 (Engine 或 AsyncEngine) 注册统计与追踪事件,重复调用无副作用"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+    return engine
+
+
+@contextmanager
+def count_queries(budget: Optional[int] = None) -> Iterator[QueryStats]:
+    """
+    统计代码块内的 SQL 语句 (测试中断言查询数)
+
+    Args:
+        budget: 语句数上限,超出时抛出 QueryBudgetExceeded
+
+    使用示例:
+        with count_queries(budget=3) as stats:
+            await service.do_something()
+    """
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+    if budget is not None and stats.count > budget:
+        raise QueryBudgetExceeded(f"执行了 {stats.count} 条 SQL,超出预算 {budget}: {stats.shapes.most_common(3)}")
+
+
+class RouteQueryMetrics:
+    """按路由累计的 SQL 统计 (进程内)"""
+
+    def __init__(self):
+        self.routes: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, route: str, stats: QueryStats, over_budget: bool, n_plus_one: bool):
+        entry = self.routes.setdefault(route, {
+            "requests": 0, "queries": 0, "db_ms": 0.0, "max_queries": 0, "over_budget": 0, "n_plus_one": 0,
+        })
+        entry["requests"] += 1
+        entry["queries"] += stats.count
+        entry["db_ms"] += stats.total_ms
+        entry["max_queries"] = max(entry["max_queries"], stats.count)
+        entry["over_budget"] += over_budget
+        entry["n_plus_one"] += n_plus_one
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            route: {
+                **entry,
+                "db_ms": round(entry["db_ms"], 1),
+                "avg_queries": round(entry["queries"] / entry["requests"], 2),
+            }
+            for route, entry in self.routes.items()
+        }
+
+
+query_metrics = RouteQueryMetrics()
+
+# endpoint → 路由模板 (/api/v1/dashboard/overview),避免路径参数导致标签爆炸
+_route_labels: Dict[Any, str] = {}
+
+
+def route_label(scope) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    label = _route_labels.get(endpoint)
+    if label is None:
+        label = scope.get("path", "unmatched")
+        for route in getattr(scope.get("app"), "routes", ()):
+            if getattr(route, "endpoint", None) is endpoint:
+                label = route.path
+                break
+        _route_labels[endpoint] = label
+    return label
+
+
+class QueryStatsMiddleware:
+    """为每个 HTTP 请求开启 SQL 统计 (纯 ASGI 中间件,流式响应同样适用)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            # 响应头在响应开始时发送: 流式响应只包含此前执行的语句
+            if message["type"] == "http.response.start" and settings.debug:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                headers.append((QUERY_COUNT_HEADER.lower().encode(), str(stats.count).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            self._check(scope, stats)
+
+    @staticmethod
+    def _check(scope, stats: QueryStats):
+        route = route_label(scope)
+        budget = settings.db_query_budget
+        over_budget = bool(budget) and stats.count > budget
+        repeated = stats.repeated()
+        query_metrics.record(route, stats, over_budget, bool(repeated))
+        observe_db_request(route, stats.count, stats.total_ms / 1000, bool(repeated))
+
+        problems = []
+        if over_budget:
+            problems.append(f"执行了 {stats.count} 条 SQL (预算 {budget})")
+        for shape, n in repeated[:3]:
+            problems.append(f"疑似 N+1: 同一语句执行 {n} 次: {shape[:200]}")
+        if not problems:
+            return
+        message = f"{scope.get('method')} {route}: " + "; ".join(problems)
+        if settings.db_query_budget_action == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(f"⚠️  {message}")
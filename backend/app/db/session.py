@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.query_stats import instrument_engine
 
 # 创建异步数据库引擎
 engine = create_async_engine(
@@ -14,6 +15,8 @@ engine = create_async_engine(
     future=True,
     pool_pre_ping=True,
 )
+# 每请求 SQL 统计 (见 app/db/query_stats.py)
+instrument_engine(engine)
 
 # 创建异步会话工厂
 AsyncSessionLocal = sessionmaker(
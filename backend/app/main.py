@@ -1,11 +1,23 @@
 """
 进销存 BI 系统 - FastAPI 后端服务入口
 """
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from loguru import logger
 
-from app.api.v1.endpoints import chat, report, dashboard, auth, business
+from app.api.v1.endpoints import chat, report, dashboard, auth, business, profiling, ai_queries
 from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, metrics_available, render_metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
+from app.core.serialization import ORJSONResponse
+from app.db.query_stats import QueryStatsMiddleware
+from app.services.ai_query_log import ai_query_log
+from app.services.export_jobs import export_jobs
+from app.services.vanna_service import vanna_service
 
 # 导入数据库模型（可在 API 路由中使用）
 from app.models.bi_schema import (
@@ -17,13 +29,114 @@ from app.models.bi_schema import (
     PartnerType, OrderType, OrderStatus, FinanceRecordType
 )
 
+
+async def _warmup_vanna():
+    """后台预热 AI Agent,失败时不影响应用启动 (首次问答时会重试)"""
+    try:
+        await vanna_service.ensure_ready()
+    except Exception as e:
+        logger.error(f"❌ AI Agent 预热失败: {e}")
+
+
+async def _spill_janitor():
+    """定期清理 AI 查询结果落盘目录"""
+    # sql_runner 依赖 pandas / vanna,延迟导入,保持应用启动轻量
+    from app.services.sql_runner import prune_spill_dir
+
+    while True:
+        await asyncio.sleep(settings.sql_spill_janitor_interval_seconds)
+        try:
+            removed, freed = await asyncio.to_thread(
+                prune_spill_dir,
+                settings.sql_spill_dir,
+                settings.sql_spill_max_age_seconds,
+                settings.sql_spill_max_mb * 1024 * 1024,
+            )
+            if removed:
+                logger.info(f"🧹 清理落盘结果 {removed} 个文件, 释放 {freed / 1024 / 1024:.1f}MB")
+        except Exception as e:
+            logger.warning(f"⚠️  清理落盘目录失败: {e}")
+
+
+async def _export_janitor():
+    """定期清理过期的后台导出产物 (每 1/4 个有效期检查一次)"""
+    while True:
+        await asyncio.sleep(max(60, settings.export_job_ttl_seconds / 4))
+        try:
+            removed, freed = await asyncio.to_thread(export_jobs.prune_artifacts)
+            if removed:
+                logger.info(f"🧹 清理导出产物 {removed} 个文件, 释放 {freed / 1024 / 1024:.1f}MB")
+        except Exception as e:
+            logger.warning(f"⚠️  清理导出产物失败: {e}")
+
+
+async def _ai_query_log_janitor():
+    """每天清理超过保留天数的 AI 查询日志"""
+    while True:
+        try:
+            removed = await ai_query_log.prune()
+            if removed:
+                logger.info(f"🧹 清理 AI 查询日志 {removed} 条")
+        except Exception as e:
+            logger.warning(f"⚠️  清理 AI 查询日志失败: {e}")
+        await asyncio.sleep(24 * 3600)
+
+
+async def _rollup_refresher():
+    """
+    定期在数据有变更时刷新汇总物化视图
+
+    汇总表由 scripts/init_db.py 创建;刷新在 advisory lock 下执行,多个 worker 同时只有一个刷新
+    """
+    # aggregate_navigator 依赖 sqlglot,延迟导入,保持应用启动轻量
+    from app.services.aggregate_navigator import aggregate_navigator, default_dsn
+
+    dsn = default_dsn()
+    while settings.ai_rollup_refresh_seconds > 0:
+        await asyncio.sleep(settings.ai_rollup_refresh_seconds)
+        try:
+            await asyncio.to_thread(aggregate_navigator.refresh, dsn)
+        except Exception as e:
+            logger.warning(f"⚠️  刷新汇总表失败: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期: 启动时后台预热,关闭时释放连接"""
+    setup_tracing()
+    tasks = []
+    if settings.vanna_eager_init:
+        tasks.append(asyncio.create_task(_warmup_vanna()))
+    if settings.sql_spill_dir:
+        tasks.append(asyncio.create_task(_spill_janitor()))
+    if settings.export_job_mode == "inprocess":
+        tasks.append(asyncio.create_task(_export_janitor()))
+    if settings.ai_query_log_enabled:
+        tasks.append(asyncio.create_task(_ai_query_log_janitor()))
+    if settings.ai_rollup_enabled:
+        tasks.append(asyncio.create_task(_rollup_refresher()))
+    yield
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    await export_jobs.close()
+    await vanna_service.close()
+    await asyncio.to_thread(ai_query_log.close)
+    if settings.ai_rollup_enabled:
+        from app.services.aggregate_navigator import aggregate_navigator
+        await asyncio.to_thread(aggregate_navigator.close)
+    shutdown_tracing()
+
+
 # 创建 FastAPI 应用实例
 app = FastAPI(
     title="进销存 BI 系统",
     description="基于 AI 的智能商业智能分析系统",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # orjson 序列化,原生支持 Decimal/datetime/numpy
 )
 
 # 配置 CORS
@@ -35,12 +148,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 每请求 SQL 统计: DEBUG 模式返回 Server-Timing / X-DB-Queries 响应头,超出预算或 N+1 时告警
+app.add_middleware(QueryStatsMiddleware)
+
+# 按需请求剖析: 管理员请求头 X-Profile 或按路由采样 (PROFILE_SAMPLE_EVERY)
+app.add_middleware(ProfilingMiddleware)
+
+# Prometheus 指标: 每路由请求耗时 (包含内层中间件的耗时)
+app.add_middleware(MetricsMiddleware)
+
+# OpenTelemetry 链路追踪 (最外层: SQL / 缓存 / LLM 的 span 都挂在请求 span 下;OTEL_EXPORTER 为空时不开启)
+app.add_middleware(TracingMiddleware)
+
 # 注册路由
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(business.router, prefix="/api/v1/business", tags=["business"])
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
 app.include_router(report.router, prefix="/api/v1/report", tags=["report"])
 app.include_router(dashboard.router, prefix="/api/v1/dashboard", tags=["dashboard"])
+app.include_router(profiling.router, prefix="/api/v1/profiling", tags=["profiling"])
+app.include_router(ai_queries.router, prefix="/api/v1/ai-queries", tags=["ai-queries"])
 
 @app.get("/")
 async def root():
@@ -49,5 +176,13 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "healthy"}
+    """健康检查 (ai_ready: AI Agent 是否已完成初始化)"""
+    return {"status": "healthy", "ai_ready": vanna_service.is_ready}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指标 (未安装 prometheus_client 时返回 501)"""
+    if not metrics_available():
+        return Response("prometheus_client 未安装", status_code=501, media_type="text/plain")
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
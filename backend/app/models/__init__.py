@@ -15,6 +15,8 @@ from .bi_schema import (
     BizOrderItem,
     FactFinance,
     InvCurrentStock,
+    # 运维日志表
+    SysAiQueryLog,
     # 枚举类型
     PartnerType,
     OrderType,
@@ -36,6 +38,8 @@ __all__ = [
     "BizOrderItem",
     "FactFinance",
     "InvCurrentStock",
+    # 运维日志表
+    "SysAiQueryLog",
     # 枚举类型
     "PartnerType",
     "OrderType",
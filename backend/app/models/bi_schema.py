@@ -658,3 +658,78 @@ class InvCurrentStock(Base):
     __table_args__ = (
         {"comment": "实时库存表（仓库+商品唯一）"},
     )
+
+
+# ==================== 运维日志表 ====================
+
+class SysAiQueryLog(Base):
+    """AI 查询日志 - 记录每条 AI 生成 SQL 的执行情况,用于定位慢查询与需要补充的索引 / 物化视图"""
+    __tablename__ = "sys_ai_query_log"
+
+    id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        comment="记录ID"
+    )
+    fingerprint: Mapped[str] = mapped_column(
+        String(16),
+        nullable=False,
+        index=True,
+        comment="SQL 指纹（字面量归一化后的哈希）"
+    )
+    normalized_sql: Mapped[str] = mapped_column(
+        Text,
+        nullable=False,
+        comment="归一化 SQL（字面量替换为 ?）"
+    )
+    sql_text: Mapped[str] = mapped_column(
+        Text,
+        nullable=False,
+        comment="实际执行的 SQL（含执行前检查补充的 LIMIT、汇总表改写）"
+    )
+    original_sql: Mapped[Optional[str]] = mapped_column(
+        Text,
+        nullable=True,
+        comment="Agent 生成的原始 SQL（与实际执行的 SQL 不同时记录）"
+    )
+    duration_ms: Mapped[Decimal] = mapped_column(
+        Numeric(12, 1),
+        nullable=False,
+        comment="执行耗时（毫秒）"
+    )
+    row_count: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        nullable=True,
+        comment="返回行数"
+    )
+    total_count: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        nullable=True,
+        comment="结果总行数（截断时统计）"
+    )
+    truncated: Mapped[bool] = mapped_column(
+        default=False,
+        comment="结果是否被截断"
+    )
+    error: Mapped[Optional[str]] = mapped_column(
+        Text,
+        nullable=True,
+        comment="执行失败时的错误信息"
+    )
+    explain_plan: Mapped[Optional[str]] = mapped_column(
+        Text,
+        nullable=True,
+        comment="EXPLAIN (ANALYZE, BUFFERS) 输出（仅慢查询）"
+    )
+    seq_scans: Mapped[Optional[str]] = mapped_column(
+        String(500),
+        nullable=True,
+        comment="执行计划中全表扫描的表（逗号分隔）"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.now,
+        index=True,
+        comment="执行时间"
+    )
@@ -3,7 +3,7 @@ Dashboard 数据模型
 """
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from datetime import date
+from datetime import date, datetime
 from decimal import Decimal
 
 
@@ -44,3 +44,4 @@ class DashboardOverview(BaseModel):
     trends: List[TrendPoint] = Field(description="销售趋势(30天)")
     inventory_alerts: List[InventoryAlert] = Field(description="库存预警(前5)")
     finance_status: FinanceStatus = Field(description="资金状况")
+    last_updated: Optional[datetime] = Field(None, description="数据最近变更时间")
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 
 class ReportRequest(BaseModel):
     """报表请求模型"""
+    dataset: Optional[str] = None  # 数据集 sales/purchase/inventory/finance,为空时按字段自动选择
     dimensions: List[str] = []  # 维度字段
     metrics: List[str] = []     # 指标字段
     filters: Dict[str, Any] = {}  # 筛选条件
@@ -17,6 +18,7 @@ class ExportRequest(BaseModel):
     """导出请求模型"""
     report_request: ReportRequest
     format: str = "xlsx"  # xlsx, csv
+    background: bool = False  # 为 True 时提交后台导出任务,通过任务接口查询进度并下载
 
 class DashboardData(BaseModel):
     """仪表板数据模型"""
@@ -30,3 +32,4 @@ class ReportSummary(BaseModel):
     summary: Dict[str, Any]
     data: List[Dict[str, Any]]
     sql: str
+    dataset: str
@@ -0,0 +1,431 @@
+"""
+持久化 Agent Memory - PostgreSQL + pgvector
+
+替代 vanna 自带的 DemoAgentMemory (进程内列表,重启丢失、多 worker 不共享):
+1. 问答对 (tool usage) 与文本记忆存入 PostgreSQL,所有 worker 共享
+2. 向量列建立 HNSW 索引 (余弦距离),记忆增长到十万级时检索仍为毫秒级
+3. 向量由本地字符 n-gram 哈希生成,不依赖外部 Embedding 接口,相同文本结果稳定
+4. 按内容哈希去重,重复训练/批量导入是幂等的
+"""
+import asyncio
+import hashlib
+import json
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import text
+
+from vanna.capabilities.agent_memory import (
+    AgentMemory,
+    TextMemory,
+    TextMemorySearchResult,
+    ToolMemory,
+    ToolMemorySearchResult,
+)
+from vanna.core.tool import ToolContext
+
+from app.db.session import engine
+
+
+TOOL_MEMORY_TABLE = "ai_tool_memory"
+TEXT_MEMORY_TABLE = "ai_text_memory"
+
+# n-gram 长度及权重 (单字权重较低,避免常见字主导相似度)
+_NGRAM_WEIGHTS = {1: 0.5, 2: 1.0, 3: 1.0}
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def embed_text(content: str, dim: int = 256) -> np.ndarray:
+    """
+    字符 n-gram 哈希向量 (L2 归一化)
+
+    对中文问题按字切分天然有效,不需要分词;使用带符号哈希降低桶冲突的影响
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    normalized = _NON_WORD.sub("", content.lower())
+    for n, weight in _NGRAM_WEIGHTS.items():
+        for i in range(len(normalized) - n + 1):
+            digest = hashlib.blake2b(normalized[i:i + n].encode("utf-8"), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            vector[h % dim] += weight if h >> 63 else -weight
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def to_pgvector(vector: np.ndarray) -> str:
+    """转换为 pgvector 文本格式 '[0.1,0.2,...]'"""
+    return "[" + ",".join(f"{x:.6f}" for x in vector.tolist()) + "]"
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.md5("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _tool_dedupe_key(question: str, tool_name: str, args: Dict[str, Any]) -> str:
+    return _hash(question.strip(), tool_name, json.dumps(args, sort_keys=True, ensure_ascii=False))
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+class PgVectorAgentMemory(AgentMemory):
+    """基于 PostgreSQL + pgvector 的 AgentMemory 实现"""
+
+    def __init__(self, dim: int = 256, bulk_chunk_size: int = 1000):
+        """
+        Args:
+            dim: 向量维度 (表创建后修改需重建表)
+            bulk_chunk_size: 批量导入时每个事务写入的条数
+        """
+        self.dim = dim
+        self.bulk_chunk_size = bulk_chunk_size
+        self._schema_ready = False
+        self._schema_lock = asyncio.Lock()
+
+    # ==================== 表结构 ====================
+
+    async def ensure_schema(self):
+        """创建扩展、表与索引 (每个进程只执行一次,多 worker 通过 advisory lock 串行)"""
+        if self._schema_ready:
+            return
+        async with self._schema_lock:
+            if self._schema_ready:
+                return
+            statements = [
+                "SELECT pg_advisory_xact_lock(hashtext('ai_agent_memory_schema'))",
+                "CREATE EXTENSION IF NOT EXISTS vector",
+                f"""
+                CREATE TABLE IF NOT EXISTS {TOOL_MEMORY_TABLE} (
+                    id UUID PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    tool_name VARCHAR(100) NOT NULL,
+                    args JSONB NOT NULL,
+                    success BOOLEAN NOT NULL DEFAULT TRUE,
+                    metadata JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+                    dedupe_key CHAR(32) NOT NULL UNIQUE,
+                    embedding vector({self.dim}) NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """,
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{TOOL_MEMORY_TABLE}_embedding
+                ON {TOOL_MEMORY_TABLE} USING hnsw (embedding vector_cosine_ops)
+                """,
+                f"CREATE INDEX IF NOT EXISTS ix_{TOOL_MEMORY_TABLE}_created_at ON {TOOL_MEMORY_TABLE} (created_at DESC)",
+                f"""
+                CREATE TABLE IF NOT EXISTS {TEXT_MEMORY_TABLE} (
+                    id UUID PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    content_hash CHAR(32) NOT NULL UNIQUE,
+                    embedding vector({self.dim}) NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """,
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{TEXT_MEMORY_TABLE}_embedding
+                ON {TEXT_MEMORY_TABLE} USING hnsw (embedding vector_cosine_ops)
+                """,
+                f"CREATE INDEX IF NOT EXISTS ix_{TEXT_MEMORY_TABLE}_created_at ON {TEXT_MEMORY_TABLE} (created_at DESC)",
+            ]
+            async with engine.begin() as conn:
+                for statement in statements:
+                    await conn.execute(text(statement))
+            self._schema_ready = True
+            logger.info(f"✅ Agent Memory 表已就绪 (pgvector, dim={self.dim})")
+
+    def _embed(self, content: str) -> str:
+        return to_pgvector(embed_text(content, self.dim))
+
+    # ==================== 写入 ====================
+
+    def _tool_row(
+        self,
+        question: str,
+        tool_name: str,
+        args: Dict[str, Any],
+        success: bool = True,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid4()),
+            "question": question,
+            "tool_name": tool_name,
+            "args": json.dumps(args, ensure_ascii=False),
+            "success": success,
+            "metadata": json.dumps(metadata or {}, ensure_ascii=False),
+            "dedupe_key": _tool_dedupe_key(question, tool_name, args),
+            "embedding": self._embed(question),
+        }
+
+    _INSERT_TOOL_SQL = f"""
+        INSERT INTO {TOOL_MEMORY_TABLE}
+            (id, question, tool_name, args, success, metadata, dedupe_key, embedding)
+        VALUES
+            (CAST(:id AS uuid), :question, :tool_name, CAST(:args AS jsonb), :success,
+             CAST(:metadata AS jsonb), :dedupe_key, CAST(CAST(:embedding AS text) AS vector))
+        ON CONFLICT (dedupe_key) DO NOTHING
+    """
+
+    async def save_tool_usage(
+        self,
+        question: str,
+        tool_name: str,
+        args: Dict[str, Any],
+        context: ToolContext,
+        success: bool = True,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """保存一次工具调用 (相同问题 + 参数只保存一次)"""
+        await self.ensure_schema()
+        row = self._tool_row(question, tool_name, args, success, metadata)
+        async with engine.begin() as conn:
+            await conn.execute(text(self._INSERT_TOOL_SQL), row)
+
+    async def save_tool_usages(self, examples: Iterable[Dict[str, Any]]) -> int:
+        """
+        批量导入问答对
+
+        Args:
+            examples: [{"question": str, "tool_name": str, "args": dict, "metadata": dict?}, ...]
+
+        Returns:
+            提交的条数 (已存在的记录会被跳过)
+        """
+        await self.ensure_schema()
+        total = 0
+        chunk: List[Dict[str, Any]] = []
+
+        async def flush():
+            async with engine.begin() as conn:
+                await conn.execute(text(self._INSERT_TOOL_SQL), chunk)
+
+        for example in examples:
+            chunk.append(self._tool_row(
+                example["question"],
+                example["tool_name"],
+                example["args"],
+                example.get("success", True),
+                example.get("metadata"),
+            ))
+            if len(chunk) >= self.bulk_chunk_size:
+                await flush()
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            await flush()
+            total += len(chunk)
+
+        logger.info(f"💾 批量导入 {total} 条问答对到 Agent Memory")
+        return total
+
+    async def save_text_memory(self, content: str, context: ToolContext) -> TextMemory:
+        """保存文本记忆 (相同内容只保存一次)"""
+        await self.ensure_schema()
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(f"""
+                    INSERT INTO {TEXT_MEMORY_TABLE} (id, content, content_hash, embedding)
+                    VALUES (CAST(:id AS uuid), :content, :content_hash, CAST(CAST(:embedding AS text) AS vector))
+                    ON CONFLICT (content_hash) DO UPDATE SET content = EXCLUDED.content
+                    RETURNING id, created_at
+                """),
+                {
+                    "id": str(uuid.uuid4()),
+                    "content": content,
+                    "content_hash": _hash(content),
+                    "embedding": self._embed(content),
+                },
+            )
+            row = result.one()
+        return TextMemory(memory_id=str(row.id), content=content, timestamp=_iso(row.created_at))
+
+    # ==================== 检索 ====================
+
+    async def search_similar_usage(
+        self,
+        question: str,
+        context: ToolContext,
+        *,
+        limit: int = 10,
+        similarity_threshold: float = 0.7,
+        tool_name_filter: Optional[str] = None,
+    ) -> List[ToolMemorySearchResult]:
+        """按问题相似度检索成功的工具调用 (HNSW 近似最近邻)"""
+        await self.ensure_schema()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT id, question, tool_name, args, success, metadata, created_at,
+                           1 - (embedding <=> CAST(CAST(:embedding AS text) AS vector)) AS score
+                    FROM {TOOL_MEMORY_TABLE}
+                    WHERE success
+                      AND (CAST(:tool_name AS text) IS NULL OR tool_name = CAST(:tool_name AS text))
+                    ORDER BY embedding <=> CAST(CAST(:embedding AS text) AS vector)
+                    LIMIT :limit
+                """),
+                {"embedding": self._embed(question), "tool_name": tool_name_filter, "limit": limit},
+            )
+            rows = result.all()
+
+        out: List[ToolMemorySearchResult] = []
+        for row in rows:
+            score = min(float(row.score), 1.0)
+            if score < similarity_threshold:
+                continue
+            out.append(ToolMemorySearchResult(
+                memory=self._to_tool_memory(row),
+                similarity_score=score,
+                rank=len(out) + 1,
+            ))
+        return out
+
+    async def search_text_memories(
+        self,
+        query: str,
+        context: ToolContext,
+        *,
+        limit: int = 10,
+        similarity_threshold: float = 0.7,
+    ) -> List[TextMemorySearchResult]:
+        """按相似度检索文本记忆"""
+        await self.ensure_schema()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT id, content, created_at,
+                           1 - (embedding <=> CAST(CAST(:embedding AS text) AS vector)) AS score
+                    FROM {TEXT_MEMORY_TABLE}
+                    ORDER BY embedding <=> CAST(CAST(:embedding AS text) AS vector)
+                    LIMIT :limit
+                """),
+                {"embedding": self._embed(query), "limit": limit},
+            )
+            rows = result.all()
+
+        out: List[TextMemorySearchResult] = []
+        for row in rows:
+            score = min(float(row.score), 1.0)
+            if score < similarity_threshold:
+                continue
+            out.append(TextMemorySearchResult(
+                memory=self._to_text_memory(row),
+                similarity_score=score,
+                rank=len(out) + 1,
+            ))
+        return out
+
+    async def get_recent_memories(self, context: ToolContext, limit: int = 10) -> List[ToolMemory]:
+        """最近保存的工具调用 (新的在前)"""
+        await self.ensure_schema()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT id, question, tool_name, args, success, metadata, created_at
+                    FROM {TOOL_MEMORY_TABLE}
+                    ORDER BY created_at DESC
+                    LIMIT :limit
+                """),
+                {"limit": limit},
+            )
+            return [self._to_tool_memory(row) for row in result.all()]
+
+    async def get_recent_text_memories(self, context: ToolContext, limit: int = 10) -> List[TextMemory]:
+        """最近保存的文本记忆 (新的在前)"""
+        await self.ensure_schema()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT id, content, created_at
+                    FROM {TEXT_MEMORY_TABLE}
+                    ORDER BY created_at DESC
+                    LIMIT :limit
+                """),
+                {"limit": limit},
+            )
+            return [self._to_text_memory(row) for row in result.all()]
+
+    # ==================== 删除 ====================
+
+    async def _delete_by_id(self, table: str, memory_id: str) -> bool:
+        try:
+            uuid.UUID(memory_id)
+        except ValueError:
+            return False
+        await self.ensure_schema()
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(f"DELETE FROM {table} WHERE id = CAST(:id AS uuid)"),
+                {"id": memory_id},
+            )
+            return result.rowcount > 0
+
+    async def delete_by_id(self, context: ToolContext, memory_id: str) -> bool:
+        """按 ID 删除工具调用记忆"""
+        return await self._delete_by_id(TOOL_MEMORY_TABLE, memory_id)
+
+    async def delete_text_memory(self, context: ToolContext, memory_id: str) -> bool:
+        """按 ID 删除文本记忆"""
+        return await self._delete_by_id(TEXT_MEMORY_TABLE, memory_id)
+
+    async def clear_memories(
+        self,
+        context: ToolContext,
+        tool_name: Optional[str] = None,
+        before_date: Optional[str] = None,
+    ) -> int:
+        """
+        清理记忆,返回删除条数
+
+        与 DemoAgentMemory 语义一致: 指定 tool_name 时只清理该工具的记忆,不清理文本记忆
+        """
+        await self.ensure_schema()
+        params = {
+            "tool_name": tool_name,
+            "before_date": datetime.fromisoformat(before_date) if before_date else None,
+        }
+        date_filter = "(CAST(:before_date AS timestamptz) IS NULL OR created_at < CAST(:before_date AS timestamptz))"
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(f"""
+                    DELETE FROM {TOOL_MEMORY_TABLE}
+                    WHERE (CAST(:tool_name AS text) IS NULL OR tool_name = CAST(:tool_name AS text))
+                      AND {date_filter}
+                """),
+                params,
+            )
+            deleted = result.rowcount
+            if tool_name is None:
+                result = await conn.execute(
+                    text(f"DELETE FROM {TEXT_MEMORY_TABLE} WHERE {date_filter}"),
+                    params,
+                )
+                deleted += result.rowcount
+        return deleted
+
+    # ==================== 转换 ====================
+
+    @staticmethod
+    def _to_tool_memory(row) -> ToolMemory:
+        args = row.args if isinstance(row.args, dict) else json.loads(row.args)
+        metadata = row.metadata if isinstance(row.metadata, dict) else json.loads(row.metadata or "{}")
+        return ToolMemory(
+            memory_id=str(row.id),
+            question=row.question,
+            tool_name=row.tool_name,
+            args=args,
+            timestamp=_iso(row.created_at),
+            success=row.success,
+            metadata=metadata,
+        )
+
+    @staticmethod
+    def _to_text_memory(row) -> TextMemory:
+        return TextMemory(memory_id=str(row.id), content=row.content, timestamp=_iso(row.created_at))
@@ -0,0 +1,484 @@
+"""
+聚合导航 - 把 AI 生成的聚合查询改写到汇总物化视图
+
+大多数问答 ("各分公司的销售业绩排名"、"本月销售额"、"商品类别销售占比") 都是对
+view_bi_sales_analysis 的分组聚合,按日 / 按月的汇总表即可回答:
+1. ROLLUPS 定义若干物化视图 (维度列 + row_count + 可加指标的 SUM),由 scripts/init_db.py 按
+   create_statements 建表 (应用只在 advisory lock 下刷新,不在启动时执行 DDL)
+2. rewrite 解析 SQL: 单表查询 view_bi_sales_analysis、含 GROUP BY 或聚合函数,
+   WHERE / GROUP BY / 非聚合表达式只引用汇总表的维度列,聚合函数只有
+   SUM(指标) / AVG(指标) / COUNT(*) / COUNT(DISTINCT 维度) / MIN、MAX(维度) 时改写,
+   选择行数最少的可用汇总表:
+   - SUM(x) → SUM(x)                         (汇总表中 x 已是明细的和)
+   - COUNT(*) → CAST(SUM(row_count) AS BIGINT) (保持 bigint 类型)
+   - AVG(x) → (SUM(x) / SUM(row_count))      (PostgreSQL 的 numeric AVG 即 sum / count,结果一致)
+   未加别名的改写结果补上 PostgreSQL 默认列名 (count / avg),返回的列名不变
+3. 新鲜度: 刷新时把 biz_order 的水位 (MAX(updated_at), COUNT(*)) 一起写入 mv_sales_rollup_watermark,
+   与实时水位不一致时不改写 (每 AI_ROLLUP_FRESHNESS_CHECK_SECONDS 秒探测一次);
+   维度表变更 (商品改名 / 停用等) 不影响水位,由定时刷新与下面的结果对比兜底
+4. 每 AI_ROLLUP_VERIFY_EVERY 次改写在后台线程中分别执行原查询与改写后的查询 (去掉 LIMIT),
+   对比结果并记录耗时: 结果不一致时停用该汇总表直到下次刷新;耗时差用于估算节省的时间
+
+统计 (改写次数、未改写原因、估算节省的时间) 见 /api/v1/ai-queries/rollups,按进程统计
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import psycopg2
+import sqlglot
+from loguru import logger
+from sqlalchemy.engine import make_url
+from sqlglot import exp
+
+from app.core.config import settings
+from app.core.metrics import observe_rollup, observe_rollup_verify
+
+
+SOURCE_VIEW = "view_bi_sales_analysis"
+WATERMARK_VIEW = "mv_sales_rollup_watermark"
+ROW_COUNT = "row_count"
+# 可加指标 (视图中均为 NOT NULL,COUNT(x) 与 COUNT(*) 相同)
+MEASURES = ("quantity", "sales_amount", "cost_amount", "gross_profit")
+# 刷新时的 advisory lock,多个 worker 同时只有一个刷新
+REFRESH_LOCK_ID = 4907301
+
+WATERMARK_SQL = "SELECT MAX(updated_at) AS watermark, COUNT(*) AS order_count FROM biz_order"
+PROBE_SQL = f"""
+    SELECT w.watermark IS NOT DISTINCT FROM live.watermark AND w.order_count = live.order_count
+    FROM {WATERMARK_VIEW} w, ({WATERMARK_SQL}) live
+"""
+SIZE_SQL = "SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)"
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """一个汇总物化视图: 按 dimensions 分组的 row_count 与各指标之和"""
+    name: str
+    dimensions: Tuple[str, ...]
+
+    def select_sql(self) -> str:
+        dims = ", ".join(self.dimensions)
+        measures = ", ".join(f"SUM({m}) AS {m}" for m in MEASURES)
+        return f"SELECT {dims}, COUNT(*) AS {ROW_COUNT}, {measures} FROM {SOURCE_VIEW} GROUP BY {dims}"
+
+    def create_statements(self) -> List[str]:
+        # 唯一索引用于 REFRESH MATERIALIZED VIEW CONCURRENTLY (刷新期间不阻塞查询)
+        return [
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {self.name} AS {self.select_sql()}",
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{self.name} ON {self.name} ({', '.join(self.dimensions)})",
+        ]
+
+
+# 按预期行数从少到多排列 (未 ANALYZE 时按此顺序选择)
+ROLLUPS: Tuple[Rollup, ...] = (
+    Rollup("mv_sales_monthly", ("year", "month", "company_name", "region", "category")),
+    Rollup("mv_sales_product_monthly", ("year", "month", "category", "product_name")),
+    Rollup("mv_sales_partner_monthly", ("year", "month", "region", "partner_type", "partner_name")),
+    Rollup("mv_sales_daily", (
+        "order_date", "year", "month", "order_status", "company_name", "dept_name", "salesman_name",
+        "region", "category", "warehouse_name",
+    )),
+)
+
+
+def create_statements(rollups: Tuple[Rollup, ...] = ROLLUPS) -> List[str]:
+    """建立汇总物化视图与水位视图的 DDL (IF NOT EXISTS,可重复执行)"""
+    statements = [
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {WATERMARK_VIEW} AS {WATERMARK_SQL}",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{WATERMARK_VIEW} ON {WATERMARK_VIEW} (order_count)",
+    ]
+    for rollup in rollups:
+        statements.extend(rollup.create_statements())
+    return statements
+
+
+def default_dsn() -> str:
+    """DATABASE_URL_SYNC 对应的 libpq 连接串 (刷新汇总表使用)"""
+    return make_url(settings.database_url_sync).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class NotRoutable(Exception):
+    """查询不能由汇总表回答 (args[0] 为原因,用于统计)"""
+
+
+@dataclass
+class RoutedSql:
+    """改写结果"""
+    sql: str  # 查询汇总表的 SQL
+    original: str  # 原 SQL
+    rollup: str
+
+
+@dataclass
+class _RollupStats:
+    rewrites: int = 0
+    rollup_ms: float = 0.0
+    # 后台对比的样本: 原查询与改写后查询的耗时
+    verified: int = 0
+    mismatches: int = 0
+    raw_ms: float = 0.0
+    verified_rollup_ms: float = 0.0
+
+    def estimated_saved_ms(self) -> Optional[float]:
+        """改写次数 × 对比样本的平均耗时差"""
+        if not self.verified:
+            return None
+        return self.rewrites * (self.raw_ms - self.verified_rollup_ms) / self.verified
+
+
+@dataclass
+class _Analysis:
+    table: exp.Table
+    dimensions: Set[str] = field(default_factory=set)
+    # (聚合节点, 改写后的节点;None 表示不变)
+    aggregates: List[Tuple[exp.AggFunc, Optional[exp.Expression]]] = field(default_factory=list)
+
+
+def _is_window_function(node: exp.AggFunc) -> bool:
+    return isinstance(node.parent, exp.Window) and node.arg_key == "this"
+
+
+def _measure(node: exp.Expression) -> Optional[str]:
+    if isinstance(node, exp.Column) and node.name.lower() in MEASURES:
+        return node.name.lower()
+    return None
+
+
+def _sum(column: str) -> exp.Sum:
+    return exp.Sum(this=exp.column(column))
+
+
+def _rewrite_aggregate(node: exp.AggFunc) -> Optional[exp.Expression]:
+    """
+    聚合函数在汇总表上的等价表达式 (None 表示原样保留)
+
+    Raises:
+        NotRoutable: 聚合函数无法由汇总表回答
+    """
+    arg = node.this
+    if isinstance(node, exp.Count):
+        if isinstance(arg, exp.Distinct):
+            return None  # COUNT(DISTINCT 维度): 维度列在汇总表中保留
+        if isinstance(arg, (exp.Star, exp.Literal)) or _measure(arg):
+            return exp.cast(_sum(ROW_COUNT), "BIGINT")
+        raise NotRoutable("count_column")
+    if isinstance(arg, exp.Distinct):
+        raise NotRoutable("distinct_aggregate")
+    if isinstance(node, exp.Sum) and _measure(arg):
+        return None
+    if isinstance(node, exp.Avg) and _measure(arg):
+        return exp.paren(exp.Div(this=_sum(_measure(arg)), expression=_sum(ROW_COUNT), typed=True), copy=False)
+    if isinstance(node, (exp.Min, exp.Max)) and isinstance(arg, exp.Column) and not _measure(arg):
+        return None
+    raise NotRoutable(f"aggregate_{node.key}")
+
+
+def _analyze(query: exp.Expression) -> _Analysis:
+    """
+    检查查询是否可由汇总表回答,收集引用的维度列与需要改写的聚合函数
+
+    Raises:
+        NotRoutable: 不能改写 (原因用于统计)
+    """
+    if not isinstance(query, exp.Select):
+        raise NotRoutable("not_select")
+    if query.args.get("with") or query.args.get("joins") or query.args.get("distinct"):
+        raise NotRoutable("structure")
+    source = query.args.get("from")
+    table = source.this if source is not None else None
+    if not isinstance(table, exp.Table) or table.name.lower() != SOURCE_VIEW or table.catalog:
+        raise NotRoutable("source")
+    if table.db and table.db.lower() != "public":
+        raise NotRoutable("source")
+    if any(node is not query for node in query.find_all(exp.Select)) or query.find(exp.Subquery):
+        raise NotRoutable("subquery")
+    group = query.args.get("group")
+    if group is not None and any(group.args.get(key) for key in ("rollup", "cube", "grouping_sets")):
+        raise NotRoutable("grouping_sets")
+
+    analysis = _Analysis(table=table)
+    measure_columns = set()
+    for node in query.find_all(exp.AggFunc):
+        if _is_window_function(node):
+            continue
+        replacement = _rewrite_aggregate(node)
+        if replacement is not None and isinstance(node.parent, exp.Filter):
+            raise NotRoutable("aggregate_filter")
+        if _measure(node.this):
+            measure_columns.add(id(node.this))
+        analysis.aggregates.append((node, replacement))
+    if group is None and not analysis.aggregates:
+        raise NotRoutable("not_aggregate")
+
+    aliases = {e.alias.lower() for e in query.expressions if isinstance(e, exp.Alias)}
+    table_names = {SOURCE_VIEW, table.alias_or_name.lower()}
+    for column in query.find_all(exp.Column):
+        if id(column) in measure_columns:
+            continue
+        if column.table and column.table.lower() not in table_names:
+            raise NotRoutable("source")
+        name = column.name.lower()
+        if name in MEASURES or name == ROW_COUNT:
+            raise NotRoutable(f"column_{name}")
+        if not column.table and name in aliases and not any(name in r.dimensions for r in ROLLUPS):
+            continue  # ORDER BY / HAVING 引用输出列别名
+        analysis.dimensions.add(name)
+    if any(not isinstance(star.parent, exp.Count) for star in query.find_all(exp.Star)):
+        raise NotRoutable("star")
+    return analysis
+
+
+class AggregateNavigator:
+    """聚合查询改写 + 汇总表新鲜度探测 / 刷新 + 结果对比与统计"""
+
+    def __init__(self, rollups: Tuple[Rollup, ...] = ROLLUPS, connect=psycopg2.connect):
+        self.rollups = rollups
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        # 汇总表行数估算 (pg_class.reltuples),用于选择最小的汇总表
+        self.sizes: Dict[str, float] = {}
+        self._fresh = False
+        self._checked_at = 0.0
+        # 结果对比不一致的汇总表,下次刷新前不再使用
+        self.disabled: Set[str] = set()
+        self.queries = 0
+        self.skipped: Counter = Counter()
+        self.stats: Dict[str, _RollupStats] = {r.name: _RollupStats() for r in rollups}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rollup-verify")
+            return self._executor
+
+    def _by_size(self) -> List[Rollup]:
+        # 未统计行数的汇总表排在后面,同等情况下保持声明顺序
+        return sorted(self.rollups, key=lambda r: self.sizes.get(r.name, float("inf")))
+
+    def rewrite(self, sql: str, exclude: Set[str] = frozenset()) -> RoutedSql:
+        """
+        改写为查询最小的可用汇总表 (只解析,不访问数据库)
+
+        Raises:
+            NotRoutable: 不能改写
+        """
+        try:
+            query = sqlglot.parse_one(sql, read="postgres")
+        except sqlglot.errors.ParseError:
+            raise NotRoutable("parse_error")
+        analysis = _analyze(query)
+        rollup = next(
+            (r for r in self._by_size() if r.name not in exclude and analysis.dimensions <= set(r.dimensions)),
+            None,
+        )
+        if rollup is None:
+            missing = analysis.dimensions - set().union(*(r.dimensions for r in self.rollups))
+            raise NotRoutable(f"column_{sorted(missing)[0]}" if missing else "no_covering_rollup")
+
+        for node, replacement in analysis.aggregates:
+            if replacement is None:
+                continue
+            if node.parent is query and node.arg_key == "expressions":
+                # 未加别名的输出列: 保持 PostgreSQL 默认列名
+                replacement = exp.alias_(replacement, node.key)
+            node.replace(replacement)
+        table = analysis.table
+        qualified = any(c.table.lower() == table.name.lower() for c in query.find_all(exp.Column) if c.table)
+        if qualified and not table.alias:
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(table.name)))
+        table.set("this", exp.to_identifier(rollup.name))
+        table.set("db", None)
+        return RoutedSql(sql=query.sql(dialect="postgres"), original=sql, rollup=rollup.name)
+
+    def _probe(self, conn) -> bool:
+        """汇总表是否与 biz_order 的实时水位一致 (结果缓存 AI_ROLLUP_FRESHNESS_CHECK_SECONDS 秒)"""
+        with self._probe_lock:
+            if time.monotonic() - self._checked_at < settings.ai_rollup_freshness_check_seconds:
+                return self._fresh
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(PROBE_SQL)
+                    row = cursor.fetchone()
+                    cursor.execute(SIZE_SQL, ([r.name for r in self.rollups],))
+                    self.sizes = {name: tuples for name, tuples in cursor.fetchall() if tuples > 0}
+                self._fresh = bool(row and row[0])
+            except Exception as e:
+                conn.rollback()
+                logger.warning(f"⚠️  汇总表新鲜度探测失败 (未创建汇总表?): {e}")
+                self._fresh = False
+            self._checked_at = time.monotonic()
+            return self._fresh
+
+    def route(self, conn, sql: str) -> Optional[RoutedSql]:
+        """
+        在执行前尝试改写 (conn 为即将执行查询的连接,用于探测新鲜度)
+
+        Returns:
+            改写结果;不能改写或汇总表已过期时返回 None
+        """
+        with self._lock:
+            self.queries += 1
+            disabled = set(self.disabled)
+        try:
+            routed = self.rewrite(sql, exclude=disabled)
+            if not self._probe(conn):
+                raise NotRoutable("stale")
+        except NotRoutable as e:
+            with self._lock:
+                self.skipped[e.args[0]] += 1
+            observe_rollup(None)
+            return None
+        return routed
+
+    def record(self, connection_string: str, routed: RoutedSql, elapsed_ms: float):
+        """记录一次改写后的执行,按 AI_ROLLUP_VERIFY_EVERY 提交后台对比"""
+        with self._lock:
+            stats = self.stats[routed.rollup]
+            stats.rewrites += 1
+            stats.rollup_ms += elapsed_ms
+            every = settings.ai_rollup_verify_every
+            verify = every > 0 and (stats.rewrites - 1) % every == 0
+        observe_rollup(routed.rollup)
+        if verify:
+            self.executor.submit(self.verify, connection_string, routed)
+
+    @staticmethod
+    def _unlimited(sql: str) -> str:
+        query = sqlglot.parse_one(sql, read="postgres")
+        query.set("limit", None)
+        query.set("offset", None)
+        return query.sql(dialect="postgres")
+
+    def _timed_fetch(self, cursor, sql: str) -> Tuple[Counter, float]:
+        started = time.perf_counter()
+        cursor.execute(sql)
+        rows = Counter(tuple(row) for row in cursor.fetchall())
+        return rows, (time.perf_counter() - started) * 1000
+
+    def verify(self, connection_string: str, routed: RoutedSql) -> Optional[bool]:
+        """在只读事务中分别执行原查询与改写后的查询,对比结果并记录耗时 (后台线程,失败只记录日志)"""
+        try:
+            conn = self._connect(connection_string)
+        except Exception as e:
+            logger.warning(f"⚠️  汇总表结果对比失败: {e}")
+            return None
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SET LOCAL statement_timeout = %s", (settings.ai_rollup_verify_timeout_ms,))
+                rollup_rows, rollup_ms = self._timed_fetch(cursor, self._unlimited(routed.sql))
+                raw_rows, raw_ms = self._timed_fetch(cursor, self._unlimited(routed.original))
+        except Exception as e:
+            logger.warning(f"⚠️  汇总表结果对比失败: {e}")
+            return None
+        finally:
+            conn.rollback()
+            conn.close()
+        return self.record_verification(routed, raw_rows == rollup_rows, raw_ms, rollup_ms)
+
+    def record_verification(self, routed: RoutedSql, matched: bool, raw_ms: float, rollup_ms: float) -> bool:
+        with self._lock:
+            stats = self.stats[routed.rollup]
+            if matched:
+                stats.verified += 1
+                stats.raw_ms += raw_ms
+                stats.verified_rollup_ms += rollup_ms
+            else:
+                stats.mismatches += 1
+                self.disabled.add(routed.rollup)
+        if matched:
+            observe_rollup_verify(routed.rollup, raw_ms / 1000, rollup_ms / 1000)
+        else:
+            logger.error(f"❌ 汇总表 {routed.rollup} 的结果与原查询不一致,已停用至下次刷新: {routed.original}")
+        return matched
+
+    def rewrite_to(self, sql: str, rollup: str) -> str:
+        """改写到指定的汇总表 (截断后统计总行数时与实际执行的查询使用同一张汇总表);不能改写时返回原 SQL"""
+        try:
+            return self.rewrite(sql, exclude={r.name for r in self.rollups if r.name != rollup}).sql
+        except NotRoutable:
+            return sql
+
+    def refresh(self, connection_string: str, force: bool = False) -> bool:
+        """
+        数据有变更 (或 force) 时刷新全部汇总表,返回是否执行了刷新
+
+        先刷新水位视图再刷新汇总表: 期间写入的数据会使水位过期,不会出现水位新于汇总表的情况;
+        汇总表尚未创建 (未运行 scripts/init_db.py) 时跳过
+        """
+        conn = self._connect(connection_string)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (REFRESH_LOCK_ID,))
+                if not cursor.fetchone()[0]:
+                    return False  # 其他 worker 正在刷新
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (WATERMARK_VIEW,))
+                if not cursor.fetchone()[0]:
+                    logger.warning("⚠️  汇总物化视图未创建,跳过刷新 (运行 scripts/init_db.py 创建)")
+                    return False
+                cursor.execute(PROBE_SQL)
+                row = cursor.fetchone()
+                if row and row[0] and not force and not self.disabled:
+                    return False
+                started = time.perf_counter()
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {WATERMARK_VIEW}")
+                for rollup in self.rollups:
+                    cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {rollup.name}")
+                    cursor.execute(f"ANALYZE {rollup.name}")
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.close()
+        with self._lock:
+            self.disabled.clear()
+            self._checked_at = 0.0
+        logger.info(f"🔄 汇总表已刷新 ({(time.perf_counter() - started) * 1000:.0f}ms)")
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        """改写次数、未改写原因与估算节省的时间"""
+        with self._lock:
+            rewrites = sum(s.rewrites for s in self.stats.values())
+            saved = [s.estimated_saved_ms() for s in self.stats.values()]
+            return {
+                "queries": self.queries,
+                "rewrites": rewrites,
+                "rewrite_rate": round(rewrites / self.queries, 4) if self.queries else None,
+                "fresh": self._fresh,
+                "estimated_saved_ms": round(sum(s for s in saved if s is not None), 1),
+                "skipped": dict(self.skipped.most_common()),
+                "rollups": [
+                    {
+                        "name": rollup.name,
+                        "dimensions": list(rollup.dimensions),
+                        "rows": self.sizes.get(rollup.name),
+                        "disabled": rollup.name in self.disabled,
+                        "rewrites": stats.rewrites,
+                        "avg_ms": round(stats.rollup_ms / stats.rewrites, 1) if stats.rewrites else None,
+                        "verified": stats.verified,
+                        "mismatches": stats.mismatches,
+                        "avg_raw_ms": round(stats.raw_ms / stats.verified, 1) if stats.verified else None,
+                        "avg_rollup_ms": round(stats.verified_rollup_ms / stats.verified, 1) if stats.verified else None,
+                        "estimated_saved_ms": None if saved_ms is None else round(saved_ms, 1),
+                    }
+                    for rollup, stats, saved_ms in (
+                        (r, self.stats[r.name], self.stats[r.name].estimated_saved_ms()) for r in self.rollups
+                    )
+                ],
+            }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# 全局实例
+aggregate_navigator = AggregateNavigator()
@@ -0,0 +1,202 @@
+"""
+AI 查询日志 (慢查询日志)
+
+每条由 Agent 执行的 SQL 记录到 sys_ai_query_log (记录实际执行的语句,即补充 LIMIT、改写到汇总表之后的 SQL;
+与 Agent 生成的原始 SQL 不同时另存 original_sql):
+- 指纹: 去掉注释、字面量替换为 ?、IN 列表折叠后的 SQL 哈希,同一类问题生成的 SQL 归为一组
+- 耗时、返回行数、总行数 / 截断标记、错误信息
+- 耗时超过 AI_QUERY_EXPLAIN_MS 的 SELECT 额外采集 EXPLAIN (ANALYZE, BUFFERS),并提取全表扫描的表
+  (EXPLAIN ANALYZE 会重新执行查询: 在只读事务中执行并回滚,受 statement_timeout 限制,同一指纹按间隔只采集一次)
+
+写入在单独的后台线程中完成,不增加问答的响应时间;排行见 /api/v1/ai-queries
+"""
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+from loguru import logger
+
+from app.core.config import settings
+
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+INSERT_SQL = """
+    INSERT INTO sys_ai_query_log (
+        fingerprint, normalized_sql, sql_text, duration_ms, row_count, total_count,
+        truncated, error, explain_plan, seq_scans, created_at, original_sql
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def normalize_sql(sql: str) -> str:
+    """去掉注释,字符串 / 数字字面量替换为 ?,IN 列表折叠为 (?),合并空白"""
+    normalized = _COMMENT.sub(" ", sql)
+    normalized = _STRING.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _IN_LIST.sub("(?)", normalized)
+    return _SPACE.sub(" ", normalized).strip().rstrip(";").strip()
+
+
+def sql_fingerprint(normalized_sql: str) -> str:
+    return hashlib.md5(normalized_sql.lower().encode("utf-8")).hexdigest()[:16]
+
+
+def seq_scan_tables(plan: str) -> List[str]:
+    """执行计划中全表扫描的表 (去重,保持出现顺序)"""
+    return list(dict.fromkeys(_SEQ_SCAN.findall(plan)))
+
+
+def _is_select(sql: str) -> bool:
+    head = sql.lstrip().split(None, 1)
+    return bool(head) and head[0].upper() in ("SELECT", "WITH")
+
+
+class AiQueryLog:
+    """后台写入 AI 查询日志 (单线程,复用一个数据库连接)"""
+
+    def __init__(self, connect=psycopg2.connect):
+        self._connect = connect
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._conn = None
+        self._conn_string: Optional[str] = None
+        # 指纹 → 最近一次采集 EXPLAIN 的时间 (monotonic)
+        self._explained: Dict[str, float] = {}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-query-log")
+            return self._executor
+
+    def submit(
+        self,
+        connection_string: str,
+        sql: str,
+        duration_ms: float,
+        stats: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        original_sql: Optional[str] = None,
+    ):
+        """
+        提交一条记录 (立即返回)
+
+        Args:
+            sql: 实际执行的 SQL (指纹、执行计划均基于它)
+            original_sql: Agent 生成的原始 SQL (与 sql 相同时不记录)
+        """
+        if not settings.ai_query_log_enabled:
+            return
+        if duration_ms >= settings.ai_query_slow_ms > 0:
+            logger.warning(f"🐢 AI 慢查询 {duration_ms:.0f}ms: {_SPACE.sub(' ', sql)}")
+        if original_sql is not None and original_sql.strip() == sql.strip():
+            original_sql = None
+        self.executor.submit(self.write, connection_string, sql, duration_ms, stats or {}, error, original_sql)
+
+    def flush(self):
+        """等待已提交的记录写完 (测试与关闭时使用)"""
+        self.executor.submit(lambda: None).result()
+
+    def _connection(self, connection_string: str):
+        if self._conn is None or self._conn.closed or self._conn_string != connection_string:
+            if self._conn is not None and not self._conn.closed:
+                self._conn.close()
+            self._conn = self._connect(connection_string)
+            self._conn_string = connection_string
+        return self._conn
+
+    def _explain_due(self, fingerprint: str, sql: str, duration_ms: float, error: Optional[str]) -> bool:
+        threshold = settings.ai_query_explain_ms
+        if error is not None or threshold <= 0 or duration_ms < threshold or not _is_select(sql):
+            return False
+        last = self._explained.get(fingerprint)
+        return last is None or time.monotonic() - last >= settings.ai_query_explain_interval_seconds
+
+    def _explain(self, conn, sql: str) -> Optional[str]:
+        """在只读事务中执行 EXPLAIN (ANALYZE, BUFFERS) 并回滚"""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SET LOCAL statement_timeout = %s", (settings.ai_query_explain_timeout_ms,))
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql.strip().rstrip(';')}")
+                return "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            logger.warning(f"⚠️  采集执行计划失败: {e}")
+            return None
+        finally:
+            conn.rollback()
+
+    def write(
+        self,
+        connection_string: str,
+        sql: str,
+        duration_ms: float,
+        stats: Dict[str, Any],
+        error: Optional[str],
+        original_sql: Optional[str] = None,
+    ):
+        """写入一条记录 (在后台线程中执行,失败只记录日志)"""
+        try:
+            conn = self._connection(connection_string)
+            normalized = normalize_sql(sql)
+            fingerprint = sql_fingerprint(normalized)
+
+            plan = None
+            if self._explain_due(fingerprint, sql, duration_ms, error):
+                self._explained[fingerprint] = time.monotonic()
+                plan = self._explain(conn, sql)
+            scans = seq_scan_tables(plan) if plan else []
+
+            with conn.cursor() as cursor:
+                cursor.execute(INSERT_SQL, (
+                    fingerprint, normalized, sql, round(duration_ms, 1),
+                    stats.get("row_count"), stats.get("total_count"), bool(stats.get("truncated")),
+                    error, plan, ",".join(scans)[:500] or None, datetime.now(), original_sql,
+                ))
+            conn.commit()
+            if scans:
+                logger.warning(f"🐢 AI 查询 {fingerprint} 全表扫描: {', '.join(scans)}")
+        except Exception as e:
+            logger.warning(f"⚠️  写入 AI 查询日志失败: {e}")
+            if self._conn is not None and not self._conn.closed:
+                try:
+                    self._conn.rollback()
+                except Exception:
+                    self._conn.close()
+
+    async def prune(self) -> int:
+        """删除超过保留天数的记录,返回删除行数"""
+        from sqlalchemy import delete
+
+        from app.db.session import AsyncSessionLocal
+        from app.models.bi_schema import SysAiQueryLog
+
+        cutoff = datetime.now() - timedelta(days=settings.ai_query_log_retention_days)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(delete(SysAiQueryLog).where(SysAiQueryLog.created_at < cutoff))
+            await session.commit()
+        return result.rowcount
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+
+# 全局实例
+ai_query_log = AiQueryLog()
@@ -0,0 +1,140 @@
+"""
+Redis 缓存值编解码
+
+存储格式: 4 字节头 + payload
+    magic(2) = b"DP" | version(1) | flags(1)
+    flags 低 4 位: 压缩算法 (0=无, 1=zstd, 2=zlib)
+    flags 高 4 位: 编码格式 (0=JSON, 1=msgpack)
+
+- payload 超过 cache_compress_min_bytes 时才压缩,小值不付出压缩开销
+- 默认编码为 JSON (即 orjson 生成的响应体),命中时只需解压即可直接作为响应返回
+- 没有文件头的旧缓存值按原始 JSON 处理
+"""
+import zlib
+from typing import Any, Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_cache_value
+from app.core.serialization import dumps, loads, json_default
+
+try:
+    import zstandard
+except ImportError:  # 未安装时回退到 zlib
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # 未安装时回退到 JSON
+    msgpack = None
+
+
+MAGIC = b"DP"
+FORMAT_VERSION = 1
+HEADER_SIZE = 4
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZSTD = 1
+COMPRESSION_ZLIB = 2
+
+COMPRESSION_NAMES = {COMPRESSION_NONE: "none", COMPRESSION_ZSTD: "zstd", COMPRESSION_ZLIB: "zlib"}
+
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+
+_zstd_compressor = zstandard.ZstdCompressor(level=3) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def _compression_code() -> int:
+    """根据配置选择压缩算法"""
+    name = settings.cache_compression.lower()
+    if name == "zstd":
+        return COMPRESSION_ZSTD if zstandard else COMPRESSION_ZLIB
+    if name == "zlib":
+        return COMPRESSION_ZLIB
+    return COMPRESSION_NONE
+
+
+def _encoding_code() -> int:
+    """根据配置选择编码格式"""
+    if settings.cache_encoding.lower() == "msgpack" and msgpack:
+        return ENCODING_MSGPACK
+    return ENCODING_JSON
+
+
+def _compress(payload: bytes, code: int) -> bytes:
+    if code == COMPRESSION_ZSTD:
+        return _zstd_compressor.compress(payload)
+    if code == COMPRESSION_ZLIB:
+        return zlib.compress(payload, 6)
+    return payload
+
+
+def _decompress(payload: bytes, code: int) -> bytes:
+    if code == COMPRESSION_ZSTD:
+        if not zstandard:
+            raise ValueError("缓存值使用 zstd 压缩,但未安装 zstandard")
+        return _zstd_decompressor.decompress(payload)
+    if code == COMPRESSION_ZLIB:
+        return zlib.decompress(payload)
+    return payload
+
+
+def pack(obj: Any, json_body: Optional[bytes] = None) -> bytes:
+    """
+    编码缓存值
+
+    Args:
+        obj: 要缓存的对象
+        json_body: obj 已序列化的 JSON (可选,避免重复编码)
+    """
+    encoding = _encoding_code()
+    if encoding == ENCODING_MSGPACK:
+        payload = msgpack.packb(obj, default=json_default, use_bin_type=True)
+    else:
+        payload = json_body if json_body is not None else dumps(obj)
+
+    compression = COMPRESSION_NONE
+    if len(payload) >= settings.cache_compress_min_bytes:
+        compression = _compression_code()
+
+    data = _compress(payload, compression)
+    flags = (encoding << 4) | compression
+    packed = MAGIC + bytes((FORMAT_VERSION, flags)) + data
+
+    raw_size = len(json_body) if json_body is not None else len(payload)
+    observe_cache_value(COMPRESSION_NAMES[compression], raw_size, len(packed))
+    return packed
+
+
+def _unpack_payload(data: bytes):
+    """解析文件头并解压,返回 (编码格式, payload)"""
+    if not data.startswith(MAGIC) or len(data) < HEADER_SIZE:
+        return ENCODING_JSON, data  # 旧格式: 原始 JSON
+    version, flags = data[2], data[3]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的缓存格式版本: {version}")
+    return flags >> 4, _decompress(data[HEADER_SIZE:], flags & 0x0F)
+
+
+def unpack(data: bytes) -> Any:
+    """解码缓存值为对象"""
+    encoding, payload = _unpack_payload(data)
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.unpackb(payload, raw=False)
+    return loads(payload)
+
+
+def unpack_json(data: bytes) -> bytes:
+    """解码缓存值为 JSON bytes (JSON 编码时只解压,不做反序列化)"""
+    encoding, payload = _unpack_payload(data)
+    if encoding == ENCODING_MSGPACK:
+        return dumps(msgpack.unpackb(payload, raw=False))
+    return payload
+
+
+def describe(packed: bytes, raw_size: int) -> str:
+    """用于日志的体积描述"""
+    ratio = raw_size / len(packed) if packed else 0
+    return f"{raw_size / 1024:.1f}KB → {len(packed) / 1024:.1f}KB, {ratio:.1f}x"
+
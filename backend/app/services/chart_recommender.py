@@ -0,0 +1,242 @@
+"""
+图表推荐
+
+根据结果集的列元数据 (数据库游标 description 中的类型 OID) 与少量统计量推荐图表类型:
+- 行数、第一列基数 (去重值个数,超过上限后不再精确统计)、各数值列的最大绝对值
+- 统计量由 ResultProfiler 在执行器逐批读取结果时累计,不需要构造 DataFrame
+
+推荐规则为可插拔的规则表 (CHART_RULES),按顺序匹配,第一条命中的规则决定图表类型;
+可通过 register_chart_rule 插入自定义规则
+"""
+import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from loguru import logger
+
+
+TEMPORAL = "temporal"
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+
+# PostgreSQL 内置类型 OID → 列类别
+_PG_TYPE_KINDS = {
+    20: NUMERIC, 21: NUMERIC, 23: NUMERIC, 26: NUMERIC,  # int8 / int2 / int4 / oid
+    700: NUMERIC, 701: NUMERIC, 790: NUMERIC, 1700: NUMERIC,  # float4 / float8 / money / numeric
+    1082: TEMPORAL, 1083: TEMPORAL, 1114: TEMPORAL, 1184: TEMPORAL, 1266: TEMPORAL,  # date / time / timestamp
+}
+
+# 文本列的列名包含这些关键词时视为时间维度 (如 TO_CHAR(order_date, 'YYYY-MM') AS month);
+# 第一列 (维度) 不论类型都按列名判断,视图的 year / month 由 EXTRACT 得到,是数值列
+TIME_KEYWORDS = ('date', 'time', 'day', 'month', 'year', 'week', 'quarter', '日期', '时间', '月份', '年份', '季度')
+RATIO_KEYWORDS = ('占比', '比例', '分布', '份额', 'percentage', 'ratio')
+COMPOSITION_KEYWORDS = ('构成', '组成', '结构', '占比', '比例', '堆叠')
+TREND_KEYWORDS = ('趋势', '变化', '增长', 'trend', 'change')
+COMPARE_KEYWORDS = ('排名', '对比', 'top', '前几', '最多', '最少', '最高', '最低')
+
+# 第一列基数的精确统计上限 (超过后只记录 "大于上限")
+CARDINALITY_LIMIT = 1000
+# 柱状图 / 饼图可容纳的最大分类数
+MAX_BAR_CATEGORIES = 15
+MAX_PIE_CATEGORIES = 10
+# 两个指标量级相差超过该倍数时使用双 Y 轴
+DUAL_AXIS_MAGNITUDE_RATIO = 10.0
+
+
+def _kind_of_value(value: Any) -> str:
+    """按 Python 取值推断列类别 (无类型 OID 时使用)"""
+    if isinstance(value, bool):
+        return CATEGORICAL
+    if isinstance(value, (int, float, Decimal)):
+        return NUMERIC
+    if isinstance(value, (datetime.date, datetime.time)):
+        return TEMPORAL
+    return CATEGORICAL
+
+
+class ResultProfiler:
+    """逐批累计结果集统计量"""
+
+    def __init__(self, columns: Sequence[str], type_codes: Optional[Sequence[Optional[int]]] = None):
+        """
+        Args:
+            columns: 列名
+            type_codes: 各列的 PostgreSQL 类型 OID (cursor.description 的 type_code),未知时为 None
+        """
+        self.columns = [str(col) for col in columns]
+        type_codes = list(type_codes) if type_codes is not None else [None] * len(self.columns)
+        self.kinds: List[Optional[str]] = [_PG_TYPE_KINDS.get(code) if code is not None else None for code in type_codes]
+        # 未识别的 OID (text / varchar 等) 直接视为分类列
+        for i, code in enumerate(type_codes):
+            if code is not None and self.kinds[i] is None:
+                self.kinds[i] = CATEGORICAL
+        self.row_count = 0
+        self.max_abs: List[Optional[float]] = [None] * len(self.columns)
+        self._first_values: set = set()
+        self._cardinality_capped = False
+
+    @classmethod
+    def from_description(cls, description) -> "ResultProfiler":
+        """由 DB-API cursor.description 创建"""
+        description = description or []
+        return cls([desc[0] for desc in description], [desc[1] for desc in description])
+
+    def update(self, rows: Iterable[Sequence[Any]]):
+        """累计一批行"""
+        for row in rows:
+            self.row_count += 1
+            for i, value in enumerate(row):
+                if value is None:
+                    continue
+                kind = self.kinds[i]
+                if kind is None:
+                    kind = self.kinds[i] = _kind_of_value(value)
+                if kind == NUMERIC:
+                    try:
+                        magnitude = abs(float(value))
+                    except (TypeError, ValueError):
+                        continue
+                    if self.max_abs[i] is None or magnitude > self.max_abs[i]:
+                        self.max_abs[i] = magnitude
+            if row and not self._cardinality_capped:
+                self._first_values.add(row[0])
+                if len(self._first_values) > CARDINALITY_LIMIT:
+                    self._cardinality_capped = True
+                    self._first_values.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可序列化的统计结果 (写入 QueryCapture)"""
+        columns = []
+        for i, (name, kind, max_abs) in enumerate(zip(self.columns, self.kinds, self.max_abs)):
+            kind = kind or CATEGORICAL
+            if (i == 0 or kind == CATEGORICAL) and any(kw in name.lower() for kw in TIME_KEYWORDS):
+                kind = TEMPORAL
+            columns.append({"name": name, "kind": kind, "max_abs": max_abs})
+        return {
+            "row_count": self.row_count,
+            "columns": columns,
+            "first_cardinality": None if self._cardinality_capped else len(self._first_values),
+        }
+
+
+def profile_frame(df) -> Dict[str, Any]:
+    """由 DataFrame 计算统计量 (执行器未提供统计时的回退路径)"""
+    import pandas as pd
+
+    type_codes: List[Optional[int]] = []
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            type_codes.append(16)  # bool → 分类
+        elif pd.api.types.is_numeric_dtype(dtype):
+            type_codes.append(701)
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            type_codes.append(1114)
+        else:
+            type_codes.append(None)  # object 列按取值推断
+    profiler = ResultProfiler(list(df.columns), type_codes)
+    profiler.update(df.itertuples(index=False, name=None))
+    return profiler.to_dict()
+
+
+class ChartRule:
+    """图表推荐规则: predicate(question, profile) 为真时推荐 chart_type"""
+
+    def __init__(self, name: str, chart_type: str, predicate: Callable[[str, Dict[str, Any]], bool]):
+        self.name = name
+        self.chart_type = chart_type
+        self.predicate = predicate
+
+    def __repr__(self) -> str:
+        return f"ChartRule({self.name!r} → {self.chart_type!r})"
+
+
+def _kinds(profile: Dict[str, Any]) -> List[str]:
+    return [col["kind"] for col in profile["columns"]]
+
+
+def _metrics(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """第一列之后的数值列 (指标)"""
+    return [col for col in profile["columns"][1:] if col["kind"] == NUMERIC]
+
+
+def _dimension_is(profile: Dict[str, Any], kind: str) -> bool:
+    """第一列为维度且其余列均为数值指标"""
+    kinds = _kinds(profile)
+    return len(kinds) >= 2 and kinds[0] == kind and all(k == NUMERIC for k in kinds[1:])
+
+
+def _categories_within(profile: Dict[str, Any], limit: int) -> bool:
+    cardinality = profile.get("first_cardinality")
+    return cardinality is not None and 0 < cardinality <= limit
+
+
+def _mentions(question: str, keywords: Sequence[str]) -> bool:
+    question = question.lower()
+    return any(kw in question for kw in keywords)
+
+
+def _magnitudes_differ(profile: Dict[str, Any]) -> bool:
+    """指标之间量级相差较大 (如销售额与订单数),共用一个 Y 轴时较小的指标会被压扁"""
+    magnitudes = [col["max_abs"] for col in _metrics(profile) if col["max_abs"]]
+    return len(magnitudes) >= 2 and max(magnitudes) / min(magnitudes) >= DUAL_AXIS_MAGNITUDE_RATIO
+
+
+CHART_RULES: List[ChartRule] = [
+    # 时间维度 + 多个量级不同的指标 → 双 Y 轴折线图
+    ChartRule(
+        "dual_axis_trend", "dual_axis_line",
+        lambda q, p: p["row_count"] > 1 and _dimension_is(p, TEMPORAL)
+        and len(_metrics(p)) >= 2 and _magnitudes_differ(p),
+    ),
+    # 含时间列 → 折线图
+    ChartRule("time_series", "line", lambda q, p: p["row_count"] > 1 and TEMPORAL in _kinds(p)),
+    # 分类维度 + 多个指标 + 构成类问题 → 堆叠柱状图
+    ChartRule(
+        "composition", "stacked_bar",
+        lambda q, p: _dimension_is(p, CATEGORICAL) and len(_metrics(p)) >= 2
+        and _categories_within(p, MAX_BAR_CATEGORIES) and _mentions(q, COMPOSITION_KEYWORDS),
+    ),
+    # 分类维度 + 多个指标 → 分组柱状图
+    ChartRule(
+        "multi_metric_compare", "grouped_bar",
+        lambda q, p: _dimension_is(p, CATEGORICAL) and len(_metrics(p)) >= 2
+        and _categories_within(p, MAX_BAR_CATEGORIES),
+    ),
+    # 分类维度 + 单个指标 + 占比类问题 → 饼图
+    ChartRule(
+        "share", "pie",
+        lambda q, p: len(p["columns"]) == 2 and _dimension_is(p, CATEGORICAL)
+        and _categories_within(p, MAX_PIE_CATEGORIES) and _mentions(q, RATIO_KEYWORDS),
+    ),
+    # 分类维度 + 单个指标 → 柱状图
+    ChartRule(
+        "category_compare", "bar",
+        lambda q, p: len(p["columns"]) == 2 and _dimension_is(p, CATEGORICAL)
+        and _categories_within(p, MAX_BAR_CATEGORIES),
+    ),
+    # 语义判断: 趋势/变化 → 折线图,排名/对比 → 柱状图
+    ChartRule("trend_question", "line", lambda q, p: _mentions(q, TREND_KEYWORDS)),
+    ChartRule("compare_question", "bar", lambda q, p: _mentions(q, COMPARE_KEYWORDS)),
+]
+
+
+def register_chart_rule(rule: ChartRule, index: Optional[int] = None):
+    """注册推荐规则 (默认追加到末尾;index=0 表示最高优先级)"""
+    if index is None:
+        CHART_RULES.append(rule)
+    else:
+        CHART_RULES.insert(index, rule)
+
+
+def recommend_chart(question: str, profile: Dict[str, Any], rules: Optional[Sequence[ChartRule]] = None) -> str:
+    """按规则表推荐图表类型,均未命中时返回 table"""
+    if not profile or not profile.get("row_count"):
+        return "table"
+    for rule in CHART_RULES if rules is None else rules:
+        try:
+            if rule.predicate(question, profile):
+                return rule.chart_type
+        except Exception as e:
+            logger.debug(f"⚠️  图表规则 {rule.name} 判断失败: {e}")
+    return "table"
@@ -0,0 +1,305 @@
+"""
+报表异步导出任务
+
+大数据量导出会长时间占用一个 HTTP worker,改为后台任务:
+1. 任务 ID 由 (格式, ReportRequest) 的哈希决定,相同请求在产物有效期内直接复用已有任务与文件
+2. 任务状态与进度 (已写行数 / 总行数) 保存在 Redis,多个 API worker 与导出 worker 共享
+3. 执行方式 (EXPORT_JOB_MODE):
+   - inprocess: 在 API 进程内以 asyncio 任务执行,EXPORT_JOB_CONCURRENCY 控制并发
+   - redis: 任务 ID 推入 Redis 队列,由独立进程 scripts/export_worker.py 消费
+4. 产物保存在 EXPORT_JOB_DIR,保留 EXPORT_JOB_TTL_SECONDS 秒,下载支持 HTTP Range
+5. 状态与进度更新时记录 updated_at (排队等待时定期刷新),状态变化时刷新记录的有效期;
+   排队 / 执行中的任务超过 EXPORT_JOB_STALE_SECONDS 没有更新时视为已中断 (执行进程已退出),
+   查询时返回 failed,相同请求重新执行
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.report_engine import ReportEngine, report_engine
+from app.services.report_arrow import ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE, write_arrow, write_parquet
+from app.services.report_export import CSV_MEDIA_TYPE, XLSX_MEDIA_TYPE, write_csv, write_xlsx
+
+
+QUEUE_KEY = "export_jobs:queue"
+JOB_KEY_PREFIX = "export_job:"
+
+MEDIA_TYPES = {
+    "csv": CSV_MEDIA_TYPE,
+    "xlsx": XLSX_MEDIA_TYPE,
+    "arrow": ARROW_MEDIA_TYPE,
+    "parquet": PARQUET_MEDIA_TYPE,
+}
+
+# 状态: queued → running → done / failed
+ACTIVE_STATUSES = ("queued", "running")
+_INT_FIELDS = ("rows_written", "total_rows", "size")
+_FLOAT_FIELDS = ("created_at", "updated_at", "finished_at")
+INTERRUPTED_ERROR = "任务已中断 (执行进程已退出)"
+
+
+def job_id_for(report_request, export_format: str) -> str:
+    """相同请求 (字段顺序无关) 得到相同的任务 ID"""
+    payload = json.dumps(
+        {"format": export_format, "request": report_request.model_dump()},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _decode(record: Dict[str, str]) -> Dict[str, Any]:
+    job: Dict[str, Any] = dict(record)
+    for field in _INT_FIELDS:
+        if job.get(field) not in (None, ""):
+            job[field] = int(job[field])
+    for field in _FLOAT_FIELDS:
+        if job.get(field) not in (None, ""):
+            job[field] = float(job[field])
+    job.pop("request", None)
+    if job.get("status") in ACTIVE_STATUSES and _is_stale(job):
+        job["status"] = "failed"
+        job["error"] = INTERRUPTED_ERROR
+    total = job.get("total_rows")
+    job["progress"] = round(min(1.0, job.get("rows_written", 0) / total), 4) if total else (
+        1.0 if job.get("status") == "done" else 0.0
+    )
+    return job
+
+
+def _is_stale(job: Dict[str, Any]) -> bool:
+    """进行中的任务超过 EXPORT_JOB_STALE_SECONDS 没有更新"""
+    updated_at = job.get("updated_at") or job.get("created_at") or 0
+    return time.time() - updated_at > settings.export_job_stale_seconds
+
+
+async def _count_rows(batches: AsyncIterator[List[Any]], on_rows) -> AsyncIterator[List[Any]]:
+    """透传数据批次,同时回调已读取的行数"""
+    try:
+        async for rows in batches:
+            yield rows
+            await on_rows(len(rows))
+    finally:
+        await batches.aclose()
+
+
+class ExportJobManager:
+    """导出任务的提交、执行与查询"""
+
+    def __init__(self, redis_client=None, engine: Optional[ReportEngine] = None, directory: str = ""):
+        """
+        Args:
+            redis_client: redis.asyncio 客户端 (decode_responses=True),默认按 REDIS_URL 创建
+            engine: 报表引擎,默认使用全局 report_engine
+            directory: 产物目录,默认 EXPORT_JOB_DIR 或系统临时目录下的 bi_exports
+        """
+        self._redis = redis_client
+        self.engine = engine or report_engine
+        self.directory = directory or settings.export_job_dir or os.path.join(tempfile.gettempdir(), "bi_exports")
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.Redis.from_url(settings.redis_url, decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"{JOB_KEY_PREFIX}{job_id}"
+
+    def artifact_path(self, job_id: str, export_format: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.{export_format}")
+
+    async def _update(self, key: str, status: Optional[str] = None, **fields):
+        """更新任务记录并记录 updated_at;状态变化时刷新有效期"""
+        mapping = {**fields, "updated_at": time.time()}
+        if status is not None:
+            mapping["status"] = status
+        await self.redis.hset(key, mapping=mapping)
+        if status is not None:
+            await self.redis.expire(key, settings.export_job_ttl_seconds)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态,不存在 (或已过期) 时返回 None"""
+        record = await self.redis.hgetall(self._key(job_id))
+        return _decode(record) if record else None
+
+    async def submit(self, export_request) -> Dict[str, Any]:
+        """
+        提交导出任务
+
+        相同请求的任务正在执行或产物仍在有效期内时直接返回已有任务;
+        已中断 (长时间没有更新) 的任务按失败处理,重新执行
+        """
+        export_format = export_request.format.lower()
+        job_id = job_id_for(export_request.report_request, export_format)
+        key = self._key(job_id)
+
+        job = await self.get(job_id)
+        if job is not None:
+            if job["status"] in ACTIVE_STATUSES:
+                return job
+            if job["status"] == "done" and os.path.exists(self.artifact_path(job_id, export_format)):
+                logger.info(f"♻️  复用导出产物: {job_id}")
+                return job
+            if job.get("error") == INTERRUPTED_ERROR:
+                logger.warning(f"⚠️  导出任务 {job_id} 超过 {settings.export_job_stale_seconds} 秒没有进度,重新执行")
+            await self.redis.delete(key)  # 失败、已中断或产物已清理: 重新执行
+
+        # HSETNX 保证多个 worker 同时提交相同请求时只入队一次
+        if await self.redis.hsetnx(key, "status", "queued"):
+            now = time.time()
+            await self.redis.hset(key, mapping={
+                "job_id": job_id,
+                "format": export_format,
+                "request": export_request.report_request.model_dump_json(),
+                "filename": f"report_{time.strftime('%Y%m%d_%H%M%S', time.localtime(now))}_{job_id[:6]}.{export_format}",
+                "rows_written": 0,
+                "created_at": now,
+                "updated_at": now,
+            })
+            await self.redis.expire(key, settings.export_job_ttl_seconds)
+            await self._enqueue(job_id)
+            logger.info(f"📤 导出任务已提交: {job_id} ({export_format})")
+        return await self.get(job_id)
+
+    async def _enqueue(self, job_id: str):
+        if settings.export_job_mode == "redis":
+            await self.redis.lpush(QUEUE_KEY, job_id)
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, settings.export_job_concurrency))
+        task = asyncio.create_task(self._run_limited(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_limited(self, job_id: str):
+        key = self._key(job_id)
+        heartbeat = max(1.0, settings.export_job_stale_seconds / 3)
+        while True:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=heartbeat)
+                break
+            except asyncio.TimeoutError:
+                # 排队等待中: 刷新 updated_at 与有效期,避免被视为已中断或过期
+                if await self.redis.exists(key):
+                    await self._update(key)
+                    await self.redis.expire(key, settings.export_job_ttl_seconds)
+        try:
+            await self.run(job_id)
+        finally:
+            self._semaphore.release()
+
+    async def run(self, job_id: str):
+        """执行导出任务: 统计总行数 → 逐批写入临时文件 → 原子移动到产物路径"""
+        from app.schemas.report import ReportRequest
+
+        key = self._key(job_id)
+        record = await self.redis.hgetall(key)
+        if not record:
+            logger.warning(f"⚠️  导出任务不存在或已过期: {job_id}")
+            return
+        if record.get("status") == "done":
+            return  # 已中断后重新提交的任务在队列中可能重复
+        export_format = record["format"]
+        request = ReportRequest.model_validate_json(record["request"])
+
+        try:
+            await self._update(key, status="running")
+            total = await self.engine.count_export(request)
+            await self._update(key, total_rows=total)
+
+            written = 0
+
+            async def on_rows(count: int):
+                nonlocal written
+                written += count
+                await self._update(key, rows_written=written)
+
+            os.makedirs(self.directory, exist_ok=True)
+            batches = self.engine.stream(request, settings.report_export_batch_size)
+            columns = await batches.__anext__()
+            tracked = _count_rows(batches, on_rows)
+            if export_format == "csv":
+                tmp_path = await write_csv(columns, tracked, self.directory)
+            elif export_format == "xlsx":
+                tmp_path = await write_xlsx(columns, tracked, self.directory)
+            else:
+                writer = write_parquet if export_format == "parquet" else write_arrow
+                tmp_path = await writer(columns, tracked, self.directory, self.engine.output_types(request))
+            path = self.artifact_path(job_id, export_format)
+            os.replace(tmp_path, path)
+
+            # 产物有效期从完成时开始计算
+            await self._update(
+                key, status="done", rows_written=written, size=os.path.getsize(path), finished_at=time.time()
+            )
+            logger.info(f"✅ 导出任务完成: {job_id}, {written} 行")
+        except Exception as e:
+            logger.error(f"❌ 导出任务失败: {job_id}: {e}")
+            await self._update(key, status="failed", error=str(e), finished_at=time.time())
+
+    async def work(self, concurrency: int = 2, poll_timeout: int = 5):
+        """消费 Redis 队列 (独立 worker 进程使用)"""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        running: Set[asyncio.Task] = set()
+
+        async def run_one(job_id: str):
+            try:
+                await self.run(job_id)
+            finally:
+                semaphore.release()
+
+        while True:
+            await semaphore.acquire()
+            item = await self.redis.brpop(QUEUE_KEY, timeout=poll_timeout)
+            if item is None:
+                semaphore.release()
+                continue
+            task = asyncio.create_task(run_one(item[1]))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+    def prune_artifacts(self, max_age_seconds: Optional[float] = None) -> Tuple[int, int]:
+        """
+        删除超过有效期的产物与遗留的临时文件
+
+        Returns:
+            (删除的文件数, 释放的字节数)
+        """
+        max_age = settings.export_job_ttl_seconds if max_age_seconds is None else max_age_seconds
+        if not os.path.isdir(self.directory):
+            return 0, 0
+        removed = freed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > max_age:
+                    os.remove(path)
+                    removed += 1
+                    freed += stat.st_size
+            except FileNotFoundError:
+                continue
+        return removed, freed
+
+    async def close(self):
+        """取消进程内未完成的任务并关闭 Redis 连接"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._redis is not None:
+            await self._redis.close()
+
+
+# 全局实例 (轻量,首次使用时才连接 Redis)
+export_jobs = ExportJobManager()
@@ -0,0 +1,375 @@
+"""
+问题模板快速通道 - 常见问题直接生成 SQL,不调用 LLM
+
+训练示例与 /chat/suggestions 覆盖的高频问题 (总量、排名、趋势、占比) 句式固定,
+却每次都要花数秒调用 LLM。IntentMatcher 按顺序用正则识别问题中的槽位:
+- 时间范围: 今天 / 昨天 / 本周 / 上周 / 本月 / 上个月 / 本季度 / 上季度 / 今年 / 去年 /
+  2024年 / 2024年3月 / 最近N天 / 最近N个月 / 最近N年
+- 筛选: 地区 (华东...)、分公司 (上海分公司)、商品类别 (电子产品)、业务员 (张三业务员)
+- 分组维度: 分公司 / 业务员 / 部门 / 地区 / 商品类别 / 商品 / 客户 / 仓库
+- 指标: 销售额 / 毛利 / 毛利率 / 销量
+- 意图词: 排名 / 最高 / 前N (排名)、趋势 / 每月 / 每天 (趋势)、占比 / 构成 (占比)
+识别出的片段移除后,剩余文字必须全部是虚词 (的 / 是 / 多少 ...),否则视为未识别交给 Agent:
+宁可多调用一次 LLM,也不对没有完全识别的问题给出错误的答案。
+没有意图词时问题还必须含明确的指标词 (销售额 / 金额 / 毛利 ...) 或汇总词 (总 / 合计 / 多少):
+"查询销售数据" 这类只提到 "销售" 的问题可能是要明细,交给 Agent。
+"客户数量" / "有多少个业务员" 是计数而不是销量,"数量" 不单独作为指标,这类问题交给 Agent。
+人名 / 公司名筛选的取值只按句式识别,快速通道执行后没有数据时交给 Agent (可能是不存在的名称)
+
+生成的 SQL 与 Agent 的 SQL 一样由 BoundedPostgresRunner 执行 (执行前检查、汇总表改写、查询日志)
+"""
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.metrics import observe_fast_path
+
+
+SALES_VIEW = "view_bi_sales_analysis"
+REGIONS = ("华东", "华北", "华南", "华中", "西北", "西南", "东北")
+CATEGORIES = ("电子产品", "家居用品", "食品饮料")
+
+_NUMBER = r"[\d零一二两三四五六七八九十百]+"
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+# 人名 / 公司名前缀中出现这些字时不是名称 (如 "各业务员"、"最高的分公司")
+_NOT_NAME = set("的各每哪个所全有总")
+_PUNCTUATION = re.compile(r"[\s?？。!！,，、:：;；\"'“”‘’]+")
+_SEPARATOR = "|"
+_FILLER = re.compile(
+    "请问|请|帮我|给我|查询|查看|看看|看一下|统计|一下|显示|列出|分别|总共|一共|合计|总计|整体|全部|所有|"
+    "如何|怎么样|怎样|情况|表现|数据|多少|是|为|有|共|总|的|各|在|中|里|了|吗|呢|和|及|与|以及|哪些"
+)
+# 人名 / 公司名筛选列 (取值来自问题,未经校验)
+NAME_COLUMNS = ("company_name", "salesman_name")
+# 汇总词: 问题明确要汇总值
+_AGGREGATE = re.compile("总|合计|多少|一共|共计")
+# 单独出现时不算明确指标的词 ("销售数据" 可能是要明细)
+_VAGUE_MEASURES = {"销售"}
+
+
+def parse_number(text: str) -> int:
+    """阿拉伯数字或中文数字 (一 / 十五 / 二十 / 一百)"""
+    if text.isdigit():
+        return int(text)
+    total = current = 0
+    for char in text:
+        if char == "百":
+            total, current = total + (current or 1) * 100, 0
+        elif char == "十":
+            total, current = total + (current or 1) * 10, 0
+        else:
+            current = _CN_DIGITS[char]
+    return total + current
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+@dataclass(frozen=True)
+class Measure:
+    """指标: 输出列名与聚合表达式 (additive 为 False 时不能计算占比)"""
+    alias: str
+    expression: str
+    additive: bool = True
+
+
+MEASURES: Dict[str, Measure] = {
+    "sales": Measure("total_sales", "SUM(sales_amount)"),
+    "profit": Measure("total_profit", "SUM(gross_profit)"),
+    "quantity": Measure("total_quantity", "SUM(quantity)"),
+    "rate": Measure(
+        "gross_profit_rate", "ROUND(SUM(gross_profit) * 100.0 / NULLIF(SUM(sales_amount), 0), 2)", additive=False
+    ),
+}
+
+
+@dataclass(frozen=True)
+class TimeRange:
+    """时间范围条件 (daily: 跨度不超过约两个月,趋势按天展示)"""
+    predicate: str
+    daily: bool
+
+
+_PREVIOUS_MONTH = TimeRange(
+    "order_date >= date_trunc('month', CURRENT_DATE - interval '1 month') AND order_date < date_trunc('month', CURRENT_DATE)",
+    True,
+)
+_PREVIOUS_QUARTER = TimeRange(
+    "order_date >= date_trunc('quarter', CURRENT_DATE) - interval '3 months' "
+    "AND order_date < date_trunc('quarter', CURRENT_DATE)",
+    False,
+)
+_PREVIOUS_WEEK = TimeRange(
+    "order_date >= date_trunc('week', CURRENT_DATE) - interval '7 days' AND order_date < date_trunc('week', CURRENT_DATE)",
+    True,
+)
+
+
+@dataclass
+class _Slots:
+    time: Optional[TimeRange] = None
+    filters: Dict[str, str] = field(default_factory=dict)
+    dimension: Optional[str] = None
+    measures: List[str] = field(default_factory=list)
+    intent: Optional[str] = None  # rank / trend / share
+    granularity: Optional[str] = None  # month / day
+    top_n: Optional[int] = None
+    order: Optional[str] = None  # DESC / ASC
+    single: Optional[bool] = None  # "哪个业务员..." 只取第一名
+    explicit: bool = False  # 含明确的指标词或汇总词
+
+    def set(self, name: str, value: Any) -> Optional[bool]:
+        """填充单值槽位;已有不同的值时返回 False (问题超出模板能力,如两个时间范围)"""
+        current = getattr(self, name)
+        if current is not None and current != value:
+            return False
+        setattr(self, name, value)
+        return True
+
+    def add_filter(self, column: str, value: str) -> Optional[bool]:
+        if self.filters.get(column, value) != value:
+            return False
+        self.filters[column] = value
+        return True
+
+    def add_measure(self, measure: str) -> bool:
+        if measure not in self.measures:
+            self.measures.append(measure)
+        return True
+
+
+def _time(predicate: str, daily: bool) -> Callable[[_Slots, re.Match], Optional[bool]]:
+    return lambda slots, match: slots.set("time", TimeRange(predicate, daily))
+
+
+def _year_month(slots: _Slots, match: re.Match) -> Optional[bool]:
+    month = int(match.group(2))
+    if not 1 <= month <= 12:
+        return False
+    return slots.set("time", TimeRange(f"year = {int(match.group(1))} AND month = {month}", True))
+
+
+def _recent(unit: str) -> Callable[[_Slots, re.Match], Optional[bool]]:
+    def handler(slots: _Slots, match: re.Match) -> Optional[bool]:
+        n = parse_number(match.group(1))
+        if n <= 0:
+            return False
+        if unit == "day":
+            return slots.set("time", TimeRange(f"order_date >= CURRENT_DATE - {n}", n <= 62))
+        plural = "months" if unit == "month" else "years"
+        return slots.set("time", TimeRange(f"order_date >= CURRENT_DATE - interval '{n} {plural}'", unit == "month" and n <= 2))
+    return handler
+
+
+def _name_filter(column: str, suffix: bool) -> Callable[[_Slots, re.Match], Optional[bool]]:
+    """人名 / 公司名筛选: 前缀含 "各"、"的" 等字时不是名称,留给后面的维度规则"""
+    def handler(slots: _Slots, match: re.Match) -> Optional[bool]:
+        prefix = match.group(1)
+        if _NOT_NAME & set(prefix):
+            return None
+        return slots.add_filter(column, match.group(0) if suffix else prefix)
+    return handler
+
+
+def _dimension(column: str) -> Callable[[_Slots, re.Match], Optional[bool]]:
+    return lambda slots, match: slots.set("dimension", column)
+
+
+def _measure(slots: _Slots, match: re.Match) -> Optional[bool]:
+    """指标按问题中出现的顺序输出 (命名分组即指标名)"""
+    if match.group(0) not in _VAGUE_MEASURES:
+        slots.explicit = True
+    return slots.add_measure(match.lastgroup)
+
+
+def _intent(intent: str, **values) -> Callable[[_Slots, re.Match], Optional[bool]]:
+    def handler(slots: _Slots, match: re.Match) -> Optional[bool]:
+        if slots.set("intent", intent) is False:
+            return False
+        return all(slots.set(name, value) is not False for name, value in values.items())
+    return handler
+
+
+def _top_n(slots: _Slots, match: re.Match) -> Optional[bool]:
+    n = parse_number(match.group(1))
+    if n <= 0 or slots.set("intent", "rank") is False:
+        return False
+    return slots.set("top_n", n)
+
+
+# (正则, 处理函数) 按顺序匹配: 处理函数返回 True 消耗该片段,None 跳过,False 表示问题无法用模板回答
+RULES = [(re.compile(pattern), handler) for pattern, handler in (
+    # 时间范围 (具体的在前)
+    (r"(\d{4})年(\d{1,2})月份?", _year_month),
+    (r"(\d{4})年度?", lambda slots, match: slots.set("time", TimeRange(f"year = {int(match.group(1))}", False))),
+    (r"今年|本年度?", _time("year = EXTRACT(YEAR FROM CURRENT_DATE)", False)),
+    (r"去年|上一?年度?", _time("year = EXTRACT(YEAR FROM CURRENT_DATE) - 1", False)),
+    (r"本季度?|这个?季度", _time("order_date >= date_trunc('quarter', CURRENT_DATE)", False)),
+    (r"上个?季度", lambda slots, match: slots.set("time", _PREVIOUS_QUARTER)),
+    (r"本月|这个?月|当月", _time("order_date >= date_trunc('month', CURRENT_DATE)", True)),
+    (r"上个?月", lambda slots, match: slots.set("time", _PREVIOUS_MONTH)),
+    (r"本周|这周|本星期|这个?星期", _time("order_date >= date_trunc('week', CURRENT_DATE)", True)),
+    (r"上周|上个?星期", lambda slots, match: slots.set("time", _PREVIOUS_WEEK)),
+    (r"今天|今日", _time("order_date = CURRENT_DATE", True)),
+    (r"昨天|昨日", _time("order_date = CURRENT_DATE - 1", True)),
+    (rf"(?:最近|近|过去)({_NUMBER})(?:天|日)", _recent("day")),
+    (rf"(?:最近|近|过去)({_NUMBER})个?月", _recent("month")),
+    (rf"(?:最近|近|过去)({_NUMBER})年", _recent("year")),
+    # 趋势粒度
+    (r"每天|每日|按天|按日|逐日|日度", _intent("trend", granularity="day")),
+    (r"每个?月|按月|逐月|月度|各月", _intent("trend", granularity="month")),
+    (r"趋势|走势|变化|变动", _intent("trend")),
+    # 筛选条件
+    (r"(华东|华北|华南|华中|西北|西南|东北)(?:地区|区域|大区)?",
+     lambda slots, match: slots.add_filter("region", match.group(1))),
+    (r"(电子产品|家居用品|食品饮料)(?:类别|品类|类)?",
+     lambda slots, match: slots.add_filter("category", match.group(1))),
+    (r"([一-龥]{2})(?:总公司|分公司)", _name_filter("company_name", suffix=True)),
+    (r"([一-龥]{2,3})(?:业务员|销售员)", _name_filter("salesman_name", suffix=False)),
+    # 排名 / 占比
+    (rf"(?:前|top)({_NUMBER})(?:名|个|位|家|款|种|大)?", _top_n),
+    (r"排名|排行|排序|名次", _intent("rank")),
+    (r"最高|最多|最好|最大|最佳|领先", _intent("rank", order="DESC")),
+    (r"最低|最少|最差|最小|垫底", _intent("rank", order="ASC")),
+    (r"占比|比例|比重|份额|构成|分布", _intent("share")),
+    (r"哪一?个|哪一?家|哪一?位|谁", lambda slots, match: slots.set("single", True)),
+    # 分组维度
+    (r"(?:各个?|每个|每家|按)?(?:分公司|公司)", _dimension("company_name")),
+    (r"(?:各个?|每个|每位|每名|按)?(?:业务员|销售员|销售人员)", _dimension("salesman_name")),
+    (r"(?:各个?|每个|按)?部门", _dimension("dept_name")),
+    (r"(?:各个?|每个|按)?(?:地区|区域|大区)", _dimension("region")),
+    (r"(?:各个?|每个|按)?(?:商品|产品)?(?:类别|分类|品类|类目)", _dimension("category")),
+    (r"(?:各个?|每个|每款|按)?(?:商品|产品)", _dimension("product_name")),
+    (r"(?:各个?|每个|每家|按)?客户", _dimension("partner_name")),
+    (r"(?:各个?|每个|按)?仓库", _dimension("warehouse_name")),
+    # 指标 (同一位置先尝试更长的词,如 "毛利率" 优先于 "毛利")
+    (r"(?P<rate>毛利率|利润率)|(?P<profit>毛利润?|毛利额|利润)|(?P<quantity>销量|销售数量|销售量|件数)"
+     r"|(?P<sales>销售业绩|销售额|销售总额|销售金额|营业额|营收|收入|业绩|成交额|销售)", _measure),
+)]
+
+
+@dataclass
+class TemplateMatch:
+    """模板识别结果"""
+    template: str  # total / rank / trend / share
+    sql: str
+    named: bool = False  # 含人名 / 公司名筛选
+
+
+def _where(slots: _Slots) -> str:
+    conditions = [slots.time.predicate] if slots.time else []
+    conditions.extend(f"{column} = {_literal(value)}" for column, value in slots.filters.items())
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _build(slots: _Slots) -> Optional[TemplateMatch]:
+    """按槽位生成 SQL;槽位组合不属于任何模板时返回 None"""
+    if not slots.measures:
+        return None
+    measures = [MEASURES[name] for name in slots.measures]
+    selected = ", ".join(f"{m.expression} AS {m.alias}" for m in measures)
+    where = _where(slots)
+    dimension = slots.dimension
+
+    if slots.intent == "trend":
+        if dimension is not None or slots.top_n is not None:
+            return None
+        granularity = slots.granularity or ("day" if slots.time and slots.time.daily else "month")
+        if granularity == "day":
+            sql = f"SELECT order_date, {selected} FROM {SALES_VIEW}{where} GROUP BY order_date ORDER BY order_date"
+        else:
+            sql = (f"SELECT TO_CHAR(order_date, 'YYYY-MM') AS month, {selected} FROM {SALES_VIEW}{where} "
+                   f"GROUP BY 1 ORDER BY 1")
+        return TemplateMatch("trend", sql)
+
+    if slots.intent == "share":
+        if dimension is None or len(measures) != 1 or not measures[0].additive or slots.top_n is not None:
+            return None
+        measure = measures[0]
+        sql = (f"SELECT {dimension}, {measure.expression} AS {measure.alias}, "
+               f"ROUND({measure.expression} * 100.0 / NULLIF(SUM({measure.expression}) OVER (), 0), 2) AS percentage "
+               f"FROM {SALES_VIEW}{where} GROUP BY {dimension} ORDER BY {measure.alias} DESC")
+        return TemplateMatch("share", sql)
+
+    if slots.intent is None and not slots.explicit:
+        return None  # "查询销售数据" / "各地区的销售" 没有明确要汇总值
+
+    if dimension is not None:
+        sql = (f"SELECT {dimension}, {selected} FROM {SALES_VIEW}{where} GROUP BY {dimension} "
+               f"ORDER BY {measures[0].alias} {slots.order or 'DESC'}")
+        if slots.top_n is not None or (slots.single and slots.order):
+            sql += f" LIMIT {slots.top_n or 1}"
+        return TemplateMatch("rank", sql)
+
+    if slots.intent is not None:
+        return None  # "销售额最高" 却没有分组维度
+    return TemplateMatch("total", f"SELECT {selected} FROM {SALES_VIEW}{where}")
+
+
+class IntentMatcher:
+    """问题模板识别 + 快速通道覆盖率统计 (进程内累计)"""
+
+    def __init__(self, rules=RULES):
+        self.rules = rules
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits: Counter = Counter()
+        self.errors = 0
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        """识别问题;未完全识别时返回 None"""
+        text = _PUNCTUATION.sub(_SEPARATOR, question.strip()).lower()
+        slots = _Slots(explicit=bool(_AGGREGATE.search(text)))
+        for pattern, handler in self.rules:
+            pieces: List[str] = []
+            position = 0
+            for found in pattern.finditer(text):
+                result = handler(slots, found)
+                if result is False:
+                    return None
+                if result:
+                    pieces.append(text[position:found.start()])
+                    position = found.end()
+            pieces.append(text[position:])
+            text = _SEPARATOR.join(pieces)
+        leftover = _FILLER.sub("", text).replace(_SEPARATOR, "")
+        if leftover:
+            return None
+        matched = _build(slots)
+        if matched is not None:
+            matched.named = any(column in slots.filters for column in NAME_COLUMNS)
+        return matched
+
+    def record(self, template: Optional[str], result: str):
+        """
+        记录一次问答的快速通道结果
+
+        Args:
+            template: 命中的模板 (未命中时为空)
+            result: hit (模板 SQL 执行成功) / miss (未识别) / error (执行失败,已交给 Agent)
+        """
+        with self._lock:
+            self.requests += 1
+            if result == "hit":
+                self.hits[template] += 1
+            elif result == "error":
+                self.errors += 1
+        observe_fast_path(template, result)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.hits.values())
+            return {
+                "requests": self.requests,
+                "hits": hits,
+                "errors": self.errors,
+                "coverage": round(hits / self.requests, 4) if self.requests else None,
+                "templates": dict(self.hits.most_common()),
+            }
+
+
+# 全局实例
+intent_matcher = IntentMatcher()
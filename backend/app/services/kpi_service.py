@@ -0,0 +1,287 @@
+"""
+仪表盘 KPI / 图表计算服务
+
+/dashboard/overview、/dashboard/kpi 与 /report/dashboard 共用同一份计算与缓存:
+1. 每个指标 (kpi / trends / inventory_alerts / finance_status) 单独缓存,只依赖自己的数据表
+2. 数据新鲜度水位 = 数据表最近一次变更时间 (MAX(updated_at) 等),每 KPI_FRESHNESS_CHECK_SECONDS 秒探测一次
+3. 缓存命中条件: 水位未变化 + 未超过 KPI_CACHE_TTL_SECONDS + 仍是同一天 (本月 / 近 30 天的区间随日期变化)
+4. 同一指标的并发请求只计算一次 (按指标加锁)
+5. last_updated 返回数据的实际变更时间,而不是接口调用时间
+
+缓存保存在进程内 (计算结果很小),多个 worker 各自缓存
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+from sqlalchemy import and_, func, select
+
+from app.core.config import settings
+from app.core.metrics import observe_cache
+from app.models.bi_schema import (
+    BaseProduct,
+    BaseWarehouse,
+    BizOrder,
+    BizOrderItem,
+    FactFinance,
+    FinanceRecordType,
+    InvCurrentStock,
+    OrderStatus,
+    OrderType,
+)
+
+
+# 数据表 → 最近变更时间的表达式
+SOURCE_WATERMARKS = {
+    "biz_order": func.max(BizOrder.updated_at),
+    "inv_current_stock": func.max(InvCurrentStock.last_updated),
+    "fact_finance": func.max(FactFinance.created_at),
+}
+
+EFFECTIVE_SALES = (OrderStatus.CONFIRMED, OrderStatus.COMPLETED)
+
+
+def _to_float(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _sales_filter(since: date):
+    return and_(
+        BizOrder.type == OrderType.SALES,
+        BizOrder.order_date >= since,
+        BizOrder.status.in_(EFFECTIVE_SALES),
+    )
+
+
+async def _compute_kpi(session, today: date) -> Dict[str, Any]:
+    """本月销售额、订单数、毛利估算 (销售额 - 明细数量 × 商品成本价)"""
+    first_day = today.replace(day=1)
+    sales = await session.execute(
+        select(
+            func.coalesce(func.sum(BizOrder.total_amount), 0),
+            func.count(BizOrder.id),
+        ).where(_sales_filter(first_day))
+    )
+    total_sales, order_count = sales.one()
+    cost = await session.execute(
+        select(func.coalesce(func.sum(BizOrderItem.quantity * BaseProduct.cost_price), 0))
+        .select_from(BizOrder)
+        .join(BizOrderItem, BizOrderItem.order_id == BizOrder.id)
+        .join(BaseProduct, BaseProduct.id == BizOrderItem.product_id)
+        .where(_sales_filter(first_day))
+    )
+    total_sales = total_sales or Decimal("0")
+    gross_profit = total_sales - (cost.scalar() or Decimal("0"))
+    return {
+        "total_sales": total_sales,
+        "gross_profit": gross_profit,
+        "order_count": order_count or 0,
+        "gross_profit_rate": float(gross_profit / total_sales * 100) if total_sales > 0 else None,
+    }
+
+
+async def _compute_trends(session, today: date) -> List[Dict[str, Any]]:
+    """过去 30 天每日销售额 (毛利按 20% 估算)"""
+    result = await session.execute(
+        select(
+            func.to_char(BizOrder.order_date, "YYYY-MM-DD").label("date_str"),
+            func.coalesce(func.sum(BizOrder.total_amount), 0).label("sales"),
+        )
+        .where(_sales_filter(today - timedelta(days=30)))
+        .group_by(BizOrder.order_date)
+        .order_by(BizOrder.order_date.asc())
+    )
+    return [
+        {
+            "date": row.date_str,
+            "sales": _to_float(row.sales),
+            "profit": _to_float(row.sales * Decimal("0.2")),
+        }
+        for row in result
+    ]
+
+
+async def _compute_inventory_alerts(session, today: date) -> List[Dict[str, Any]]:
+    """库存低于最低库存的商品 (前 10 个)"""
+    result = await session.execute(
+        select(
+            BaseProduct.name.label("product_name"),
+            InvCurrentStock.quantity.label("current_stock"),
+            BaseProduct.min_stock.label("min_stock"),
+            BaseWarehouse.name.label("warehouse_name"),
+        )
+        .select_from(InvCurrentStock)
+        .join(BaseProduct, BaseProduct.id == InvCurrentStock.product_id)
+        .join(BaseWarehouse, BaseWarehouse.id == InvCurrentStock.warehouse_id)
+        .where(and_(BaseProduct.min_stock.isnot(None), InvCurrentStock.quantity < BaseProduct.min_stock))
+        .order_by(InvCurrentStock.quantity.asc())
+        .limit(10)
+    )
+    return [
+        {
+            "product_name": row.product_name,
+            "current_stock": _to_float(row.current_stock),
+            "min_stock": _to_float(row.min_stock) if row.min_stock else None,
+            "warehouse_name": row.warehouse_name,
+            "stock_status": "缺货" if row.current_stock == 0 else "库存不足",
+        }
+        for row in result
+    ]
+
+
+async def _compute_finance_status(session, today: date) -> Dict[str, Any]:
+    """应收 / 应付余额与本月费用 (一次扫描,按类型条件聚合)"""
+    positive = FactFinance.balance > 0
+    result = await session.execute(
+        select(
+            func.coalesce(func.sum(FactFinance.balance).filter(
+                and_(FactFinance.type == FinanceRecordType.RECEIVABLE, positive)), 0),
+            func.coalesce(func.sum(FactFinance.balance).filter(
+                and_(FactFinance.type == FinanceRecordType.PAYABLE, positive)), 0),
+            func.coalesce(func.sum(FactFinance.amount).filter(
+                and_(FactFinance.type == FinanceRecordType.EXPENSE, FactFinance.trans_date >= today.replace(day=1))), 0),
+        )
+    )
+    receivable, payable, expense = result.one()
+    return {"total_receivable": receivable, "total_payable": payable, "total_expense": expense}
+
+
+@dataclass(frozen=True)
+class KpiMetric:
+    """一个可缓存的仪表盘指标: 计算函数及其依赖的数据表"""
+    name: str
+    sources: tuple
+    compute: Callable[[Any, date], Awaitable[Any]]
+
+
+METRICS: Dict[str, KpiMetric] = {
+    metric.name: metric
+    for metric in (
+        KpiMetric("kpi", ("biz_order",), _compute_kpi),
+        KpiMetric("trends", ("biz_order",), _compute_trends),
+        KpiMetric("inventory_alerts", ("inv_current_stock",), _compute_inventory_alerts),
+        KpiMetric("finance_status", ("fact_finance",), _compute_finance_status),
+    )
+}
+
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    watermark: Optional[datetime]
+    day: date
+    computed_at: float
+
+
+class KpiService:
+    """按指标缓存的仪表盘数据计算"""
+
+    def __init__(self, session_factory=None, metrics: Optional[Dict[str, KpiMetric]] = None):
+        """
+        Args:
+            session_factory: 返回 AsyncSession 的工厂,默认使用 AsyncSessionLocal
+            metrics: 指标定义,默认 METRICS
+        """
+        self._session_factory = session_factory
+        self.metrics = metrics or METRICS
+        self._cache: Dict[str, _CacheEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._watermarks: Dict[str, Optional[datetime]] = {}
+        self._watermarks_checked_at = 0.0
+        self._watermark_lock = asyncio.Lock()
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    async def watermarks(self) -> Dict[str, Optional[datetime]]:
+        """各数据表的最近变更时间 (一条 SQL 查询,探测结果缓存 KPI_FRESHNESS_CHECK_SECONDS 秒)"""
+        async with self._watermark_lock:
+            if time.monotonic() - self._watermarks_checked_at >= settings.kpi_freshness_check_seconds:
+                statement = select(*[
+                    select(expr).scalar_subquery().label(name) for name, expr in SOURCE_WATERMARKS.items()
+                ])
+                async with self.session_factory() as session:
+                    row = (await session.execute(statement)).one()
+                self._watermarks = dict(row._mapping)
+                self._watermarks_checked_at = time.monotonic()
+            return dict(self._watermarks)
+
+    @staticmethod
+    def _latest(values: Iterable[Optional[datetime]]) -> Optional[datetime]:
+        present = [value for value in values if value is not None]
+        return max(present) if present else None
+
+    def _fresh(self, entry: Optional[_CacheEntry], watermark: Optional[datetime], today: date) -> bool:
+        return (
+            entry is not None
+            and entry.watermark == watermark
+            and entry.day == today
+            and time.monotonic() - entry.computed_at < settings.kpi_cache_ttl_seconds
+        )
+
+    async def get(self, name: str) -> Dict[str, Any]:
+        """
+        获取单个指标
+
+        Returns:
+            {"value": 指标值, "last_updated": 依赖数据表的最近变更时间}
+        """
+        metric = self.metrics[name]
+        watermarks = await self.watermarks()
+        watermark = self._latest(watermarks.get(source) for source in metric.sources)
+        today = date.today()
+
+        started = time.perf_counter()
+        entry = self._cache.get(name)
+        hit = self._fresh(entry, watermark, today)
+        if not hit:
+            async with self._locks.setdefault(name, asyncio.Lock()):
+                entry = self._cache.get(name)
+                if not self._fresh(entry, watermark, today):
+                    computing = time.perf_counter()
+                    async with self.session_factory() as session:
+                        value = await metric.compute(session, today)
+                    entry = _CacheEntry(value, watermark, today, time.monotonic())
+                    self._cache[name] = entry
+                    logger.info(f"📊 指标已计算: {name} ({(time.perf_counter() - computing) * 1000:.0f}ms)")
+        # 未命中的耗时包含等待锁与计算
+        observe_cache("kpi", "get", time.perf_counter() - started, "hit" if hit else "miss")
+        return {"value": entry.value, "last_updated": watermark}
+
+    async def get_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        并发获取多个指标 (每个指标使用独立会话)
+
+        Returns:
+            {指标名: 指标值, ..., "last_updated": 所有依赖数据表中最近的变更时间}
+        """
+        names = list(names)
+        results = await asyncio.gather(*(self.get(name) for name in names))
+        data: Dict[str, Any] = {name: result["value"] for name, result in zip(names, results)}
+        data["last_updated"] = self._latest(result["last_updated"] for result in results)
+        return data
+
+    async def overview(self) -> Dict[str, Any]:
+        return await self.get_many(self.metrics)
+
+    def invalidate(self, name: Optional[str] = None):
+        """清除缓存 (name 为空时清除全部),下次请求重新探测水位"""
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+        self._watermarks_checked_at = 0.0
+
+
+# 全局实例
+kpi_service = KpiService()
@@ -0,0 +1,80 @@
+"""
+LLM 后端
+
+- dashscope: 通义千问 (OpenAI 兼容接口),需要 DASHSCOPE_API_KEY
+- openai: 任意 OpenAI 兼容服务 (如本地 scripts/mock_llm_server.py),使用 LLM_BASE_URL / LLM_API_KEY
+
+vanna 自带的 OpenAILlmService 在 async 方法中调用同步客户端,一次 LLM 调用会阻塞整个事件循环,
+这里改用 AsyncOpenAI,并发请求之间互不阻塞
+"""
+import os
+from typing import Dict, Optional
+
+from loguru import logger
+
+from vanna.core.llm import LlmRequest, LlmResponse
+from vanna.integrations.openai import OpenAILlmService
+
+from app.core.config import settings
+
+
+class AsyncOpenAILlmService(OpenAILlmService):
+    """使用 AsyncOpenAI 客户端的 OpenAILlmService"""
+
+    def __init__(self, model: str, api_key: str, base_url: Optional[str] = None, timeout: float = 60.0):
+        from openai import AsyncOpenAI
+
+        super().__init__(model=model, api_key=api_key, base_url=base_url, timeout=timeout)
+        self._async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+
+    async def send_request(self, request: LlmRequest) -> LlmResponse:
+        """非流式请求 (不阻塞事件循环)"""
+        payload = self._build_payload(request)
+        resp = await self._async_client.chat.completions.create(**payload, stream=False)
+
+        if not resp.choices:
+            return LlmResponse(content=None, tool_calls=None, finish_reason=None)
+
+        choice = resp.choices[0]
+        tool_calls = self._extract_tool_calls_from_message(choice.message)
+
+        usage: Dict[str, int] = {}
+        if getattr(resp, "usage", None):
+            usage = {
+                "prompt_tokens": int(getattr(resp.usage, "prompt_tokens", 0) or 0),
+                "completion_tokens": int(getattr(resp.usage, "completion_tokens", 0) or 0),
+                "total_tokens": int(getattr(resp.usage, "total_tokens", 0) or 0),
+            }
+
+        return LlmResponse(
+            content=getattr(choice.message, "content", None),
+            tool_calls=tool_calls or None,
+            finish_reason=getattr(choice, "finish_reason", None),
+            usage=usage or None,
+        )
+
+
+def build_llm_service() -> AsyncOpenAILlmService:
+    """按 LLM_BACKEND 配置创建 LLM 服务"""
+    backend = settings.llm_backend.lower()
+
+    if backend == "dashscope":
+        # === 从环境变量读取 API Key (符合安全规范) ===
+        api_key = os.getenv("DASHSCOPE_API_KEY")
+        if not api_key:
+            raise ValueError("❌ 未配置 DASHSCOPE_API_KEY 环境变量")
+        logger.info(f"✅ API Key 已从环境变量读取: {api_key[:10]}***")
+    elif backend == "openai":
+        # 本地/自建服务通常不校验 Key,但 openai 客户端要求非空
+        api_key = settings.llm_api_key or "not-needed"
+    else:
+        raise ValueError(f"❌ 不支持的 LLM_BACKEND: {settings.llm_backend} (可选 dashscope / openai)")
+
+    llm = AsyncOpenAILlmService(
+        model=settings.llm_model,
+        api_key=api_key,
+        base_url=settings.llm_base_url,
+        timeout=settings.llm_timeout_seconds,
+    )
+    logger.info(f"✅ LLM 配置成功: {backend} ({settings.llm_model} @ {settings.llm_base_url})")
+    return llm
@@ -0,0 +1,106 @@
+"""
+LLM 调用指标 - 作为 vanna LlmMiddleware 挂到 Agent 上
+
+每次请求记录: LLM 调用次数、prompt/completion tokens、累计耗时
+(模型未返回 usage 时 prompt tokens 使用本地估算值)
+"""
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from vanna.core.middleware.base import LlmMiddleware
+
+from app.core.config import settings
+from app.core.metrics import observe_llm
+from app.core.tracing import record_span
+from app.services.prompt_builder import estimate_tokens
+
+
+# 当前请求的 LLM 指标 (由 VannaService 在驱动 Agent 前创建)
+_llm_capture: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_capture", default=None)
+
+
+def start_llm_capture() -> Dict[str, Any]:
+    """
+    为当前请求开启 LLM 指标统计
+
+    Returns:
+        可变字典: llm_calls / prompt_tokens / completion_tokens / llm_ms
+    """
+    capture: Dict[str, Any] = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_ms": 0.0}
+    _llm_capture.set(capture)
+    return capture
+
+
+def _estimate_request_tokens(request) -> int:
+    tokens = estimate_tokens(request.system_prompt or "")
+    for message in request.messages:
+        tokens += estimate_tokens(message.content or "")
+    return tokens
+
+
+class LlmStats:
+    """LLM 调用统计 (进程内累计)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_ms = 0.0
+
+    def record(self, capture: Dict[str, Any]):
+        self.requests += 1
+        self.llm_calls += capture["llm_calls"]
+        self.prompt_tokens += capture["prompt_tokens"]
+        self.completion_tokens += capture["completion_tokens"]
+        self.llm_ms += capture["llm_ms"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests) if self.requests else None,
+            "avg_llm_ms": round(self.llm_ms / self.requests, 1) if self.requests else None,
+        }
+
+
+llm_stats = LlmStats()
+
+
+class LlmMetricsMiddleware(LlmMiddleware):
+    """记录每次 LLM 调用的 token 用量与耗时"""
+
+    async def before_llm_request(self, request):
+        capture = _llm_capture.get()
+        if capture is not None:
+            capture["_started"] = time.perf_counter()
+            capture["_started_ns"] = time.time_ns()
+            capture["_estimated"] = _estimate_request_tokens(request)
+        return request
+
+    async def after_llm_response(self, request, response):
+        capture = _llm_capture.get()
+        if capture is None or "_started" not in capture:
+            return response
+
+        elapsed = time.perf_counter() - capture.pop("_started")
+        started_ns = capture.pop("_started_ns")
+        estimated = capture.pop("_estimated", 0)
+        usage = response.usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or estimated
+        completion_tokens = usage.get("completion_tokens") or 0
+        capture["llm_calls"] += 1
+        capture["llm_ms"] += elapsed * 1000
+        capture["prompt_tokens"] += prompt_tokens
+        capture["completion_tokens"] += completion_tokens
+        observe_llm(elapsed, prompt_tokens, completion_tokens)
+        # 中间件以回调方式触发,无法包裹调用本身: 按开始时间补记 span
+        record_span(
+            "llm.request", started_ns,
+            **{"llm.backend": settings.llm_backend, "llm.model": settings.llm_model,
+               "llm.prompt_tokens": prompt_tokens, "llm.completion_tokens": completion_tokens},
+        )
+        return response
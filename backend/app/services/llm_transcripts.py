@@ -0,0 +1,84 @@
+"""
+LLM 问答记录 (transcript) 的录制与读取
+
+记录格式 (JSONL,每行一个问题):
+    {"question": "...", "turns": [{"tool_calls": [{"name": "run_sql", "arguments": {"sql": "..."}}]},
+                                  {"content": "..."}]}
+也支持简写: {"question": "...", "sql": "...", "answer": "..."}
+
+配置 LLM_RECORD_PATH 后,真实 LLM 的每次完整问答会追加到该文件,
+scripts/mock_llm_server.py 可按问题回放,用于离线压测
+"""
+import json
+import threading
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from vanna.core.middleware.base import LlmMiddleware
+
+from app.services.prompt_builder import QUESTION_MARKER
+
+
+def extract_question(content: str) -> str:
+    """从 PromptBuilder 生成的消息中取出原始问题"""
+    if QUESTION_MARKER in content:
+        content = content.rsplit(QUESTION_MARKER, 1)[1]
+    return content.strip()
+
+
+def _expand(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "turns" in item:
+        return item["turns"]
+    turns = []
+    if item.get("sql"):
+        turns.append({"tool_calls": [{"name": "run_sql", "arguments": {"sql": item["sql"]}}]})
+    turns.append({"content": item.get("answer") or "查询完成,结果见下方数据。"})
+    return turns
+
+
+def load_transcripts(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """读取记录文件,返回 {问题: turns} (同一问题以最后一条为准)"""
+    transcripts: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                transcripts[item["question"].strip()] = _expand(item)
+    return transcripts
+
+
+class TranscriptRecorderMiddleware(LlmMiddleware):
+    """在一次问答结束 (LLM 不再调用工具) 时把完整的 turns 追加到记录文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    async def after_llm_response(self, request, response):
+        if response.tool_calls:
+            return response
+
+        # 最后一条 user 消息之后的 assistant 消息即为本次问答已完成的 turns
+        last_user = max((i for i, m in enumerate(request.messages) if m.role == "user"), default=None)
+        if last_user is None:
+            return response
+
+        turns: List[Dict[str, Any]] = []
+        for message in request.messages[last_user + 1:]:
+            if message.role != "assistant":
+                continue
+            turn: Dict[str, Any] = {"content": message.content or None}
+            if message.tool_calls:
+                turn["tool_calls"] = [{"name": tc.name, "arguments": tc.arguments} for tc in message.tool_calls]
+            turns.append(turn)
+        turns.append({"content": response.content})
+
+        record = {"question": extract_question(request.messages[last_user].content), "turns": turns}
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"⚠️  写入 LLM 记录失败: {e}")
+        return response
@@ -0,0 +1,326 @@
+"""
+AI 问答 Prompt 构建
+
+原先每个问题都附带一整段硬编码提示词 (全部表结构 + 规则 + 示例),
+Agent 还会把训练时保存的 Schema 大段文本追加到系统提示词中。现在拆分为:
+1. 静态前缀 (STATIC_SYSTEM_PROMPT): 规则与视图清单,所有请求完全一致,
+   可命中模型服务端的前缀缓存
+2. 动态部分: 按问题挑选相关视图的相关字段 + 最相似的 top-k 已保存示例,
+   受 token 预算约束
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from vanna.core.enhancer.base import LlmContextEnhancer
+from vanna.core.system_prompt.base import SystemPromptBuilder
+
+
+_REGION_KEYWORDS = ("地区", "区域", "华东", "华北", "华南", "华中", "西北", "西南", "东北")
+
+# 视图字段目录: (字段名, 类型, 说明, 触发关键词)
+# core 字段总会带上,其他字段在问题 (或示例 SQL) 命中时才加入
+VIEW_CATALOG: Dict[str, Dict[str, Any]] = {
+    "view_bi_sales_analysis": {
+        "description": "销售明细 (已确认/已完成的销售订单,每行一个订单明细)",
+        "keywords": ("销售", "销量", "卖", "业绩", "毛利", "客户", "营收", "收入", "成交"),
+        "core": ("order_date", "year", "month", "product_name", "sales_amount"),
+        "columns": (
+            ("order_id", "integer", "订单ID", ()),
+            ("order_no", "text", "订单编号", ("订单号", "订单编号", "单号")),
+            ("order_date", "date", "订单日期", ()),
+            ("year", "integer", "年份", ()),
+            ("month", "integer", "月份", ()),
+            ("order_status", "text", "订单状态 CONFIRMED/COMPLETED", ("状态",)),
+            ("company_name", "text", "分公司", ("分公司", "公司")),
+            ("dept_name", "text", "部门", ("部门",)),
+            ("salesman_name", "text", "业务员", ("业务员", "销售员", "员工", "人员")),
+            ("salesman_id", "integer", "业务员ID", ()),
+            ("partner_name", "text", "客户名称", ("客户",)),
+            ("region", "text", "客户地区 华东/华北/华南/华中/西北/西南/东北", _REGION_KEYWORDS),
+            ("partner_type", "text", "往来单位类型", ()),
+            ("product_name", "text", "商品名称", ()),
+            ("category", "text", "商品分类", ("类别", "分类", "品类", "类目")),
+            ("specification", "text", "规格型号", ("规格", "型号")),
+            ("unit", "text", "计量单位", ("单位",)),
+            ("warehouse_name", "text", "发货仓库", ("仓库",)),
+            ("warehouse_location", "text", "仓库位置", ("位置",)),
+            ("quantity", "numeric", "销售数量", ("数量", "销量", "件")),
+            ("unit_price", "numeric", "成交单价", ("单价", "价格")),
+            ("sales_amount", "numeric", "销售额", ()),
+            ("cost_price", "numeric", "成本单价", ("成本",)),
+            ("cost_amount", "numeric", "成本金额", ("成本",)),
+            ("gross_profit", "numeric", "毛利额", ("毛利", "利润")),
+            ("gross_profit_rate", "numeric", "毛利率(%)", ("毛利率", "利润率")),
+            ("item_remark", "text", "明细备注", ("备注",)),
+            ("created_at", "timestamp", "创建时间", ()),
+            ("updated_at", "timestamp", "更新时间", ()),
+        ),
+    },
+    "view_bi_purchase_analysis": {
+        "description": "采购明细 (已确认/已完成的采购订单)",
+        "keywords": ("采购", "进货", "供应商", "采买"),
+        "core": ("order_date", "year", "month", "supplier_name", "product_name", "purchase_amount"),
+        "columns": (
+            ("order_id", "integer", "订单ID", ()),
+            ("order_no", "text", "订单编号", ("订单号", "订单编号", "单号")),
+            ("order_date", "date", "订单日期", ()),
+            ("year", "integer", "年份", ()),
+            ("month", "integer", "月份", ()),
+            ("order_status", "text", "订单状态 CONFIRMED/COMPLETED", ("状态",)),
+            ("company_name", "text", "分公司", ("分公司", "公司")),
+            ("dept_name", "text", "部门", ("部门",)),
+            ("buyer_name", "text", "采购员", ("采购员", "采购人员", "员工")),
+            ("buyer_id", "integer", "采购员ID", ()),
+            ("supplier_name", "text", "供应商名称", ()),
+            ("supplier_region", "text", "供应商地区", _REGION_KEYWORDS),
+            ("contact_person", "text", "供应商联系人", ("联系人",)),
+            ("product_name", "text", "商品名称", ()),
+            ("category", "text", "商品分类", ("类别", "分类", "品类", "类目")),
+            ("specification", "text", "规格型号", ("规格", "型号")),
+            ("unit", "text", "计量单位", ("单位",)),
+            ("warehouse_name", "text", "入库仓库", ("仓库",)),
+            ("warehouse_location", "text", "仓库位置", ("位置",)),
+            ("purchase_quantity", "numeric", "采购数量", ("数量", "采购量")),
+            ("unit_price", "numeric", "采购单价", ("单价", "价格")),
+            ("purchase_amount", "numeric", "采购金额", ()),
+            ("item_remark", "text", "明细备注", ("备注",)),
+            ("created_at", "timestamp", "创建时间", ()),
+            ("updated_at", "timestamp", "更新时间", ()),
+        ),
+    },
+    "view_bi_inventory_alert": {
+        "description": "当前库存与预警状态 (每行一个仓库的一个商品)",
+        "keywords": ("库存", "存货", "缺货", "预警", "积压", "滞销", "安全库存"),
+        "core": ("warehouse_name", "product_name", "current_stock", "stock_status"),
+        "columns": (
+            ("stock_id", "integer", "库存记录ID", ()),
+            ("warehouse_name", "text", "仓库名称", ()),
+            ("warehouse_location", "text", "仓库位置", ("位置",)),
+            ("warehouse_manager", "text", "仓库负责人", ("负责人", "管理员")),
+            ("product_name", "text", "商品名称", ()),
+            ("category", "text", "商品分类", ("类别", "分类", "品类", "类目")),
+            ("specification", "text", "规格型号", ("规格", "型号")),
+            ("unit", "text", "计量单位", ("单位",)),
+            ("current_stock", "numeric", "当前库存数量", ()),
+            ("min_stock", "numeric", "最低库存预警线", ("预警线", "最低库存", "安全库存", "低于")),
+            ("stock_diff", "numeric", "库存差额 (当前库存 - 预警线)", ("差额", "低于")),
+            ("stock_status", "text", "库存状态 缺货/库存不足/正常/库存充足", ()),
+            ("cost_price", "numeric", "成本单价", ("成本",)),
+            ("total_stock_value", "numeric", "库存总价值", ("价值", "金额", "资金占用")),
+            ("last_updated", "timestamp", "库存更新时间", ("更新",)),
+            ("is_active", "boolean", "商品是否启用", ()),
+        ),
+    },
+    "view_bi_finance_monitor": {
+        "description": "应收/应付/费用记录",
+        "keywords": ("财务", "应收", "应付", "欠款", "费用", "支出", "余额", "账款", "资金", "报销"),
+        "core": ("record_type", "trans_date", "year", "month", "company_name", "trans_amount"),
+        "columns": (
+            ("finance_id", "integer", "财务记录ID", ()),
+            ("record_type", "text", "记录类型 RECEIVABLE(应收)/PAYABLE(应付)/EXPENSE(费用)", ()),
+            ("trans_date", "date", "交易日期", ()),
+            ("year", "integer", "年份", ()),
+            ("month", "integer", "月份", ()),
+            ("company_name", "text", "分公司", ()),
+            ("dept_name", "text", "部门", ("部门",)),
+            ("salesman_name", "text", "经办业务员", ("业务员", "经办", "员工")),
+            ("salesman_id", "integer", "业务员ID", ()),
+            ("partner_name", "text", "往来单位名称", ("客户", "供应商", "往来单位")),
+            ("region", "text", "往来单位地区", _REGION_KEYWORDS),
+            ("partner_type", "text", "往来单位类型 CUSTOMER/SUPPLIER", ("客户", "供应商")),
+            ("trans_amount", "numeric", "交易金额 (统计费用支出)", ()),
+            ("current_balance", "numeric", "当前余额 (统计应收应付欠款)", ("余额", "欠款", "未收", "未付")),
+            ("expense_category", "text", "费用科目 (仅 EXPENSE)", ("科目", "差旅", "房租", "水电", "办公")),
+            ("description", "text", "说明", ("说明", "备注")),
+            ("created_at", "timestamp", "创建时间", ()),
+        ),
+    },
+}
+
+DEFAULT_VIEW = "view_bi_sales_analysis"
+MAX_VIEWS = 2
+# 用户问题在消息中的标记 (问题始终位于消息末尾)
+QUESTION_MARKER = "## 用户问题\n"
+
+STATIC_SYSTEM_PROMPT = """你是进销存 BI 系统的 PostgreSQL 查询助手,根据用户问题调用 run_sql 工具执行一条 SQL。
+
+## 可用视图 (已扁平化,无需 JOIN)
+""" + "\n".join(f"- {name}: {spec['description']}" for name, spec in VIEW_CATALOG.items()) + """
+基础表 base_product / biz_order / biz_order_item 仅在视图无法满足时使用。
+
+## 规则
+1. 直接生成一条完整可执行的 PostgreSQL SELECT 并调用 run_sql,不要探索数据库结构
+2. 禁止 PRAGMA / sqlite_master / SHOW TABLES / pg_* 系统表等非 PostgreSQL 业务查询
+3. 优先使用用户消息中"相关字段"列出的字段;聚合指标使用 SUM/AVG 等并起别名
+4. 时间过滤 (以 order_date 为例,财务视图为 trans_date):
+   本月 order_date >= date_trunc('month', CURRENT_DATE)
+   上个月 order_date >= date_trunc('month', CURRENT_DATE - interval '1 month') AND order_date < date_trunc('month', CURRENT_DATE)
+   本年 year = EXTRACT(YEAR FROM CURRENT_DATE)
+5. 排名/前 N 使用 ORDER BY ... DESC LIMIT N
+6. "参考示例"与问题相似时优先沿用其写法
+7. 查询结果会直接展示给用户,执行后只需用一两句中文总结
+"""
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+_IDENTIFIER = re.compile(r"[a-z_][a-z0-9_]*")
+
+
+def estimate_tokens(content: str) -> int:
+    """
+    估算 token 数 (不依赖分词器)
+
+    中文约 1 字 1 token,其余字符约 4 个 1 token
+    """
+    if not content:
+        return 0
+    cjk = len(_CJK.findall(content))
+    return cjk + (len(content) - cjk + 3) // 4
+
+
+STATIC_PROMPT_TOKENS = estimate_tokens(STATIC_SYSTEM_PROMPT)
+
+
+def render_schema_overview() -> str:
+    """完整字段目录 (训练时作为文本记忆保存)"""
+    lines = ["# 数据库 Schema 信息", ""]
+    for name, spec in VIEW_CATALOG.items():
+        lines.append(f"## {name} - {spec['description']}")
+        lines.extend(f"- {col} ({col_type}): {desc}" for col, col_type, desc, _ in spec["columns"])
+        lines.append("")
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    """按问题构建精简的 Agent 输入"""
+
+    def __init__(
+        self,
+        agent_memory=None,
+        max_examples: int = 3,
+        token_budget: int = 1200,
+        min_example_score: float = 0.5,
+    ):
+        """
+        Args:
+            agent_memory: 用于检索相似示例的 AgentMemory (为空时不带示例)
+            max_examples: 最多附带的示例数
+            token_budget: 动态部分 (字段 + 示例 + 问题) 的 token 上限
+            min_example_score: 示例的最低相似度
+        """
+        self.agent_memory = agent_memory
+        self.max_examples = max_examples
+        self.token_budget = token_budget
+        self.min_example_score = min_example_score
+
+    @staticmethod
+    def select_views(question: str, hint_sql: str = "") -> List[str]:
+        """按关键词命中数挑选相关视图 (最多 MAX_VIEWS 个)"""
+        scores = []
+        for name, spec in VIEW_CATALOG.items():
+            score = sum(1 for kw in spec["keywords"] if kw in question)
+            if name in hint_sql:
+                score += 1
+            if score:
+                scores.append((score, name))
+        if not scores:
+            return [DEFAULT_VIEW]
+        scores.sort(key=lambda item: -item[0])
+        return [name for _, name in scores[:MAX_VIEWS]]
+
+    @staticmethod
+    def select_columns(view: str, question: str, hint_sql: str = "") -> List[Tuple[str, str, str]]:
+        """挑选视图中与问题相关的字段: core + 关键词命中 + 示例 SQL 中用到的字段"""
+        spec = VIEW_CATALOG[view]
+        used = set(_IDENTIFIER.findall(hint_sql.lower())) if view in hint_sql else set()
+        selected = []
+        for col, col_type, desc, keywords in spec["columns"]:
+            if (
+                col in spec["core"]
+                or col in used
+                or col in question
+                or any(kw in question for kw in keywords)
+            ):
+                selected.append((col, col_type, desc))
+        return selected
+
+    async def find_examples(self, question: str, context) -> List[Dict[str, Any]]:
+        """检索最相似的已保存问答对"""
+        if self.agent_memory is None or self.max_examples <= 0:
+            return []
+        try:
+            results = await self.agent_memory.search_similar_usage(
+                question=question,
+                context=context,
+                limit=self.max_examples,
+                similarity_threshold=self.min_example_score,
+                tool_name_filter="run_sql",
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  检索相似示例失败: {e}")
+            return []
+        return [
+            {"question": r.memory.question, "sql": r.memory.args.get("sql", ""), "score": r.similarity_score}
+            for r in results
+            if r.memory.args.get("sql")
+        ]
+
+    @staticmethod
+    def _render(question: str, columns: Dict[str, List[Tuple[str, str, str]]], examples: List[Dict[str, Any]]) -> str:
+        parts = ["## 相关字段"]
+        for view, cols in columns.items():
+            parts.append(f"{view}: " + ", ".join(f"{col} {col_type} {desc}" for col, col_type, desc in cols))
+        if examples:
+            parts.append("\n## 参考示例")
+            for ex in examples:
+                parts.append(f"问: {ex['question']}\nSQL: {ex['sql']}")
+        parts.append(f"\n{QUESTION_MARKER}{question}")
+        return "\n".join(parts)
+
+    async def build(self, question: str, context=None) -> Dict[str, Any]:
+        """
+        构建发送给 Agent 的消息
+
+        Returns:
+            {"prompt": str, "tokens": int, "views": [...], "columns": int, "examples": int}
+        """
+        examples = await self.find_examples(question, context)
+
+        while True:
+            hint_sql = " ".join(ex["sql"] for ex in examples)
+            views = self.select_views(question, hint_sql)
+            columns = {view: self.select_columns(view, question, hint_sql) for view in views}
+            prompt = self._render(question, columns, examples)
+            tokens = estimate_tokens(prompt)
+            # 超出预算时从相似度最低的示例开始丢弃
+            if tokens <= self.token_budget or not examples:
+                break
+            examples = examples[:-1]
+
+        return {
+            "prompt": prompt,
+            "tokens": tokens,
+            "views": views,
+            "columns": sum(len(cols) for cols in columns.values()),
+            "examples": len(examples),
+        }
+
+
+class StaticSystemPromptBuilder(SystemPromptBuilder):
+    """固定的系统提示词 (不含日期等可变内容,保证前缀可缓存)"""
+
+    async def build_system_prompt(self, user, tools) -> Optional[str]:
+        return STATIC_SYSTEM_PROMPT
+
+
+class PassthroughContextEnhancer(LlmContextEnhancer):
+    """
+    不修改系统提示词
+
+    vanna 默认的 DefaultLlmContextEnhancer 会把检索到的文本记忆 (训练时保存的整段 Schema)
+    追加到系统提示词,既破坏前缀缓存又重复了 PromptBuilder 已挑选的字段
+    """
+
+    async def enhance_system_prompt(self, system_prompt: str, user_message: str, user) -> str:
+        return system_prompt
@@ -0,0 +1,189 @@
+"""
+报表的 Apache Arrow / Parquet 输出
+
+- 每个数据库批次按列直接构造一个 Arrow RecordBatch (不经过 DataFrame 或行字典)
+- Arrow IPC stream: 每批编码后立即发送,客户端可边收边读 (pyarrow.ipc.open_stream)
+- Parquet: 每批写为一个 row group 到临时文件 (文件尾部需要元数据,不能边写边发)
+
+pyarrow 为可选依赖,未安装时 arrow_available() 返回 False,接口返回 501;
+导入 pyarrow 较慢,首次使用时才导入,不拖慢应用启动
+"""
+import asyncio
+import os
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+# 首次调用 arrow_available() 时导入
+pa = None
+pq = None
+
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# numeric 列 (金额等 numeric(15,2) 的聚合) 的 decimal128 精度与小数位
+NUMERIC_PRECISION = 38
+NUMERIC_SCALE = 6
+
+
+def arrow_available() -> bool:
+    """是否安装了 pyarrow (首次调用时导入)"""
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:  # 未安装时不支持 Arrow / Parquet 格式
+            return False
+        pa, pq = pyarrow, pyarrow.parquet
+    return True
+
+
+def _arrow_type(col_type: str):
+    """VIEW_CATALOG 类型名 → Arrow 类型 (金额等 numeric 聚合为 decimal128,不经过浮点数)"""
+    return {
+        "integer": pa.int64(),
+        "numeric": pa.decimal128(NUMERIC_PRECISION, NUMERIC_SCALE),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "boolean": pa.bool_(),
+    }.get(col_type, pa.string())
+
+
+def arrow_schema(columns: Sequence[str], types: Dict[str, str], metadata: Optional[Dict[str, str]] = None):
+    if not arrow_available():
+        raise RuntimeError("未安装 pyarrow,不支持 Arrow / Parquet 格式")
+    return pa.schema([pa.field(col, _arrow_type(types.get(col, "text"))) for col in columns], metadata=metadata)
+
+
+def record_batch(schema, rows: Sequence[Sequence[Any]]):
+    """
+    一批行元组按列转置后构造 RecordBatch (先按取值推断,再转换为 schema 类型)
+
+    安全转换: 小数位超过 NUMERIC_SCALE 等会丢失精度的取值直接报错,而不是静默截断
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = []
+    for values, field in zip(columns, schema):
+        array = pa.array(values)
+        if array.type != field.type:
+            array = array.cast(field.type)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """收集 IPC writer 输出的内存 sink,每批取走后清空"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def iter_arrow(
+    columns: Sequence[str],
+    batches: AsyncIterator[List[Sequence[Any]]],
+    types: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[bytes]:
+    """逐批编码 Arrow IPC stream"""
+    schema = arrow_schema(columns, types or {})
+    sink = _ChunkSink()
+    try:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+        yield sink.take()
+        async for rows in batches:
+            batch = await asyncio.to_thread(record_batch, schema, rows)
+            writer.write_batch(batch)
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+    finally:
+        await batches.aclose()
+
+
+async def write_arrow(
+    columns: Sequence[str],
+    batches: AsyncIterator[List[Sequence[Any]]],
+    directory: str = "",
+    types: Optional[Dict[str, str]] = None,
+) -> str:
+    """逐批写入 Arrow IPC 临时文件,返回路径"""
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".arrow", dir=directory or None)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in iter_arrow(columns, batches, types):
+                await asyncio.to_thread(f.write, chunk)
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+async def write_parquet(
+    columns: Sequence[str],
+    batches: AsyncIterator[List[Sequence[Any]]],
+    directory: str = "",
+    types: Optional[Dict[str, str]] = None,
+) -> str:
+    """逐批写入 Parquet 临时文件 (每批一个 row group,zstd 压缩),返回路径"""
+    schema = arrow_schema(columns, types or {})
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".parquet", dir=directory or None)
+    os.close(fd)
+    try:
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+        try:
+            async for rows in batches:
+                batch = await asyncio.to_thread(record_batch, schema, rows)
+                await asyncio.to_thread(writer.write_batch, batch)
+        finally:
+            writer.close()
+            await batches.aclose()
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+def table_bytes(
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    types: Optional[Dict[str, str]] = None,
+    metadata: Optional[Dict[str, str]] = None,
+    file_format: str = "arrow",
+) -> bytes:
+    """
+    小结果集一次性编码 (/report/query 使用,汇总信息放在 schema 元数据中)
+
+    Args:
+        file_format: arrow (Arrow IPC stream) / parquet
+    """
+    schema = arrow_schema(columns, types or {}, metadata)
+    batch = record_batch(schema, rows)
+    sink = pa.BufferOutputStream()
+    if file_format == "parquet":
+        pq.write_table(pa.Table.from_batches([batch], schema=schema), sink, compression="zstd")
+    else:
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
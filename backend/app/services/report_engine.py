@@ -0,0 +1,384 @@
+"""
+报表查询引擎
+
+把 ReportRequest (维度 / 指标 / 筛选 / 排序 / 条数) 编译为基于 view_bi_* 视图的参数化 SQL:
+1. 语义层 (SEMANTIC_LAYER) 白名单: 只允许目录中的数据集、维度、指标与筛选字段,
+   请求中的字段名不会拼进 SQL,筛选值全部走绑定参数
+2. 汇总在同一条查询中通过 GROUPING SETS 计算: 明细分组、按第一个维度的小计、总计
+3. 编译结果按请求 "形状" (字段、运算符,不含取值) 缓存,相同形状的请求只编译一次
+4. 在 SQLAlchemy 异步连接池上执行;导出 (stream) 使用服务端游标逐批读取
+"""
+import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import bindparam, func, select, text
+
+from app.core.config import settings
+
+
+# 数据集 → 视图与指标定义 (指标表达式为聚合 SQL,维度与筛选字段取自 VIEW_CATALOG)
+SEMANTIC_LAYER: Dict[str, Dict[str, Any]] = {
+    "sales": {
+        "view": "view_bi_sales_analysis",
+        "metrics": {
+            "sales_amount": "SUM(sales_amount)",
+            "quantity": "SUM(quantity)",
+            "cost_amount": "SUM(cost_amount)",
+            "gross_profit": "SUM(gross_profit)",
+            "gross_profit_rate": "ROUND(SUM(gross_profit) / NULLIF(SUM(sales_amount), 0) * 100, 2)",
+            "order_count": "COUNT(DISTINCT order_id)",
+        },
+    },
+    "purchase": {
+        "view": "view_bi_purchase_analysis",
+        "metrics": {
+            "purchase_amount": "SUM(purchase_amount)",
+            "purchase_quantity": "SUM(purchase_quantity)",
+            "order_count": "COUNT(DISTINCT order_id)",
+        },
+    },
+    "inventory": {
+        "view": "view_bi_inventory_alert",
+        "metrics": {
+            "current_stock": "SUM(current_stock)",
+            "total_stock_value": "SUM(total_stock_value)",
+            "product_count": "COUNT(DISTINCT product_name)",
+        },
+    },
+    "finance": {
+        "view": "view_bi_finance_monitor",
+        "metrics": {
+            "trans_amount": "SUM(trans_amount)",
+            "current_balance": "SUM(current_balance)",
+            "record_count": "COUNT(*)",
+        },
+    },
+}
+
+# 数值列不作为维度 (应通过指标聚合)
+_MEASURE_TYPES = ("numeric",)
+
+# 筛选运算符 → SQL 片段 ({col} 字段, {param} 参数)
+FILTER_OPERATORS = {
+    "eq": "{col} = :{param}",
+    "ne": "{col} <> :{param}",
+    "gt": "{col} > :{param}",
+    "gte": "{col} >= :{param}",
+    "lt": "{col} < :{param}",
+    "lte": "{col} <= :{param}",
+    "like": "{col} LIKE :{param}",
+    "in": "{col} IN :{param}",
+    "not_in": "{col} NOT IN :{param}",
+}
+
+
+class ReportQueryError(ValueError):
+    """报表请求不合法 (字段不在白名单、运算符不支持等)"""
+
+
+def _column_types(dataset: str) -> Dict[str, str]:
+    # prompt_builder 依赖 vanna,延迟导入,报表接口不必在启动时加载 Agent 相关模块
+    from app.services.prompt_builder import VIEW_CATALOG
+
+    view = SEMANTIC_LAYER[dataset]["view"]
+    return {name: col_type for name, col_type, _, _ in VIEW_CATALOG[view]["columns"]}
+
+
+def dimensions_of(dataset: str) -> List[str]:
+    """数据集可用的维度字段"""
+    return [name for name, col_type in _column_types(dataset).items() if col_type not in _MEASURE_TYPES]
+
+
+def _quote(name: str) -> str:
+    return f'"{name}"'
+
+
+def resolve_dataset(request) -> str:
+    """确定数据集: 请求指定时校验,否则取第一个包含全部维度与指标的数据集"""
+    dataset = getattr(request, "dataset", None)
+    if dataset:
+        if dataset not in SEMANTIC_LAYER:
+            raise ReportQueryError(f"未知的数据集: {dataset} (可选 {', '.join(SEMANTIC_LAYER)})")
+        return dataset
+    fields = set(request.dimensions) | set(request.group_by)
+    for name, spec in SEMANTIC_LAYER.items():
+        if set(request.metrics) <= set(spec["metrics"]) and fields <= set(dimensions_of(name)):
+            return name
+    raise ReportQueryError("没有同时包含所请求维度与指标的数据集,请检查字段名或指定 dataset")
+
+
+def _parse_order_by(order_by: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析排序: "field" / "field desc" / "-field" """
+    if not order_by:
+        return None
+    parts = order_by.strip().split()
+    field = parts[0]
+    direction = "ASC"
+    if field.startswith("-"):
+        field, direction = field[1:], "DESC"
+    if len(parts) > 1:
+        direction = parts[1].upper()
+    if direction not in ("ASC", "DESC") or len(parts) > 2:
+        raise ReportQueryError(f"不支持的排序: {order_by}")
+    return field, direction
+
+
+def _normalize_filters(filters: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """
+    筛选条件展开为 (字段, 运算符, 取值)
+
+    支持 {"region": "华东"} / {"region": ["华东", "华南"]} /
+    {"order_date": {"gte": "2024-01-01", "lt": "2024-07-01"}}
+    """
+    normalized = []
+    for field, condition in sorted(filters.items()):
+        if isinstance(condition, dict):
+            for op, value in sorted(condition.items()):
+                normalized.append((field, op, value))
+        elif isinstance(condition, (list, tuple)):
+            normalized.append((field, "in", list(condition)))
+        else:
+            normalized.append((field, "eq", condition))
+    return normalized
+
+
+def _coerce(value: Any, col_type: str) -> Any:
+    """按字段类型转换筛选值 (asyncpg 要求参数类型与列类型一致)"""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_coerce(v, col_type) for v in value]
+    try:
+        if col_type == "date" and isinstance(value, str):
+            return datetime.date.fromisoformat(value[:10])
+        if col_type == "timestamp" and isinstance(value, str):
+            return datetime.datetime.fromisoformat(value)
+        if col_type == "integer":
+            return int(value)
+        if col_type == "numeric":
+            return Decimal(str(value))
+        if col_type == "boolean" and isinstance(value, str):
+            return value.lower() in ("1", "true", "yes")
+    except (ValueError, InvalidOperation):
+        raise ReportQueryError(f"筛选值 {value!r} 与字段类型 {col_type} 不匹配")
+    return value
+
+
+@lru_cache(maxsize=256)
+def compile_report(
+    dataset: str,
+    keys: Tuple[str, ...],
+    metrics: Tuple[str, ...],
+    filter_shape: Tuple[Tuple[str, str], ...],
+    order: Optional[Tuple[str, str]],
+    detail_only: bool = False,
+):
+    """
+    按请求形状编译 SQL (结果缓存)
+
+    detail_only 为真时 (导出) 只生成明细分组,不计算小计与总计
+
+    Returns:
+        (可执行语句, SQL 文本)
+    """
+    spec = SEMANTIC_LAYER[dataset]
+    column_types = _column_types(dataset)
+    dimensions = set(dimensions_of(dataset))
+
+    for key in keys:
+        if key not in dimensions:
+            raise ReportQueryError(f"数据集 {dataset} 不支持维度: {key}")
+    for metric in metrics:
+        if metric not in spec["metrics"]:
+            raise ReportQueryError(f"数据集 {dataset} 不支持指标: {metric}")
+    if not keys and not metrics:
+        raise ReportQueryError("至少需要一个维度或指标")
+
+    select = [_quote(key) for key in keys]
+    select += [f"{spec['metrics'][metric]} AS {_quote(metric)}" for metric in metrics]
+
+    where = []
+    expanding = []
+    for i, (field, op) in enumerate(filter_shape):
+        if field not in column_types:
+            raise ReportQueryError(f"数据集 {dataset} 不支持筛选字段: {field}")
+        if op not in FILTER_OPERATORS:
+            raise ReportQueryError(f"不支持的筛选运算符: {op}")
+        param = f"f{i}"
+        if op in ("in", "not_in"):
+            expanding.append(param)
+        where.append(FILTER_OPERATORS[op].format(col=_quote(field), param=param))
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+    if order is not None and order[0] not in keys and order[0] not in metrics:
+        raise ReportQueryError(f"排序字段必须是所选维度或指标: {order[0]}")
+    if order is None:
+        order = (metrics[0], "DESC") if metrics else (keys[0], "ASC")
+    order_sql = f"{_quote(order[0])} {order[1]} NULLS LAST"
+
+    if detail_only:
+        group_sql = f" GROUP BY {', '.join(_quote(k) for k in keys)} ORDER BY {order_sql} LIMIT :limit" if keys else ""
+        sql = f"SELECT {', '.join(select)} FROM {spec['view']}{where_sql}{group_sql}"
+    elif keys:
+        # 明细分组 + 第一个维度的小计 + 总计
+        # 行数上限只作用于明细;小计行数不超过第一个维度的取值数,总计排在最前,不会被截掉
+        sets = [keys]
+        if len(keys) > 1:
+            sets.append(keys[:1])
+        sets.append(())
+        grouping_sets = ", ".join("(" + ", ".join(_quote(k) for k in s) + ")" for s in sets)
+        key_list = ", ".join(_quote(k) for k in keys)
+        sql = (
+            f"WITH agg AS (\n"
+            f"    SELECT {', '.join(select)}, GROUPING({key_list}) AS _grouping\n"
+            f"    FROM {spec['view']}{where_sql}\n"
+            f"    GROUP BY GROUPING SETS ({grouping_sets})\n"
+            f")\n"
+            f"(SELECT *, COUNT(*) OVER () AS _total_count FROM agg WHERE _grouping = 0\n"
+            f" ORDER BY {order_sql} LIMIT :limit)\n"
+            f"UNION ALL\n"
+            f"(SELECT *, NULL::bigint AS _total_count FROM agg WHERE _grouping <> 0\n"
+            f" ORDER BY _grouping DESC, {order_sql})"
+        )
+    else:
+        # 只有指标: 结果即总计
+        sql = f"SELECT {', '.join(select)}, 0 AS _grouping, 1 AS _total_count FROM {spec['view']}{where_sql}"
+
+    statement = text(sql)
+    if expanding:
+        statement = statement.bindparams(*(bindparam(name, expanding=True) for name in expanding))
+    logger.debug(f"📐 编译报表 SQL: dataset={dataset}, keys={keys}, metrics={metrics}")
+    return statement, sql
+
+
+class ReportEngine:
+    """报表查询: 编译 → 执行 → 拆分明细 / 小计 / 总计"""
+
+    def __init__(self, engine=None):
+        """
+        Args:
+            engine: SQLAlchemy AsyncEngine,默认使用 app.db.session.engine
+        """
+        self._engine = engine
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.db.session import engine
+            self._engine = engine
+        return self._engine
+
+    def build(self, request, export: bool = False) -> Tuple[Any, str, Dict[str, Any], Dict[str, Any]]:
+        """
+        编译请求 (export 为真时只查询明细,行数上限为 REPORT_EXPORT_MAX_ROWS)
+
+        Returns:
+            (可执行语句, SQL 文本, 绑定参数, 编译信息)
+        """
+        dataset = resolve_dataset(request)
+        keys = tuple(dict.fromkeys(list(request.dimensions) + list(request.group_by)))
+        metrics = tuple(dict.fromkeys(request.metrics))
+        filters = _normalize_filters(request.filters or {})
+        order = _parse_order_by(request.order_by)
+
+        statement, sql = compile_report(
+            dataset, keys, metrics, tuple((field, op) for field, op, _ in filters), order, export
+        )
+
+        column_types = _column_types(dataset)
+        params: Dict[str, Any] = {
+            f"f{i}": _coerce(value, column_types[field]) for i, (field, _, value) in enumerate(filters)
+        }
+        for i, (_, op, value) in enumerate(filters):
+            if op in ("in", "not_in") and not isinstance(params[f"f{i}"], list):
+                params[f"f{i}"] = [params[f"f{i}"]]
+        if keys:
+            max_rows = settings.report_export_max_rows if export else settings.report_max_rows
+            params["limit"] = max(1, min(request.limit or max_rows, max_rows))
+        return statement, sql, params, {"dataset": dataset, "keys": keys, "metrics": metrics}
+
+    async def query(self, request) -> Dict[str, Any]:
+        """
+        执行报表查询
+
+        Returns:
+            {"data": 明细行, "summary": {"total": 总计, "subtotals": 按第一个维度的小计},
+             "total_count": 明细分组总数 (不受 limit 影响), "sql": SQL 文本, "dataset": 数据集}
+        """
+        statement, sql, params, info = self.build(request)
+        async with self.engine.connect() as conn:
+            result = await conn.execute(statement, params)
+            rows = [dict(row) for row in result.mappings()]
+        return self.split_rows(rows, info, sql)
+
+    async def stream(self, request, batch_size: int = 5000) -> AsyncIterator[List[Any]]:
+        """
+        以服务端游标逐批读取导出明细,内存占用与总行数无关
+
+        Yields:
+            第一项为列名列表,之后每项为一批行 (元组列表)
+        """
+        statement, _, params, _ = self.build(request, export=True)
+        async with self.engine.connect() as conn:
+            result = await conn.stream(statement, params)
+            yield list(result.keys())
+            async for partition in result.partitions(batch_size):
+                yield [tuple(row) for row in partition]
+
+    def output_types(self, request) -> Dict[str, str]:
+        """
+        结果列的类型 (VIEW_CATALOG 中的类型名),供 Arrow / Parquet 导出构造 schema
+
+        维度取视图字段类型;COUNT 指标为 integer,其余聚合指标为 numeric
+        """
+        _, _, _, info = self.build(request, export=True)
+        column_types = _column_types(info["dataset"])
+        metrics = SEMANTIC_LAYER[info["dataset"]]["metrics"]
+        types = {key: column_types[key] for key in info["keys"]}
+        for metric in info["metrics"]:
+            types[metric] = "integer" if metrics[metric].upper().startswith("COUNT") else "numeric"
+        return types
+
+    async def count_export(self, request) -> int:
+        """导出的总行数 (用于计算导出任务进度)"""
+        statement, _, params, _ = self.build(request, export=True)
+        count = select(func.count()).select_from(statement.columns().subquery("_export"))
+        async with self.engine.connect() as conn:
+            return int((await conn.execute(count, params)).scalar() or 0)
+
+    @staticmethod
+    def split_rows(rows: List[Dict[str, Any]], info: Dict[str, Any], sql: str) -> Dict[str, Any]:
+        """按 GROUPING() 位图把结果拆为明细、小计与总计"""
+        keys, metrics = info["keys"], info["metrics"]
+        full_mask = (1 << len(keys)) - 1
+        first_key_mask = (1 << (len(keys) - 1)) - 1 if keys else 0
+
+        data: List[Dict[str, Any]] = []
+        subtotals: List[Dict[str, Any]] = []
+        total: Dict[str, Any] = {}
+        total_count = 0
+        for row in rows:
+            grouping = row.pop("_grouping")
+            row_total = row.pop("_total_count")
+            if grouping == 0:
+                data.append(row)
+                total_count = row_total or total_count
+            if grouping == full_mask:
+                total = {metric: row[metric] for metric in metrics}
+            elif grouping == first_key_mask and len(keys) > 1:
+                subtotals.append({keys[0]: row[keys[0]], **{metric: row[metric] for metric in metrics}})
+
+        return {
+            "data": data,
+            "summary": {"total": total, "subtotals": subtotals},
+            "total_count": total_count,
+            "sql": sql,
+            "dataset": info["dataset"],
+        }
+
+
+# 全局实例
+report_engine = ReportEngine()
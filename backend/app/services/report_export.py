@@ -0,0 +1,138 @@
+"""
+报表导出
+
+数据来自 ReportEngine.stream (服务端游标逐批读取),全程不构造 DataFrame:
+- CSV: 每批编码后直接写入响应 (StreamingResponse)
+- XLSX: openpyxl write-only 模式逐行写入临时文件 (内存占用恒定),发送后删除
+- 导出任务的产物通过 ranged_file_response 下载,支持 HTTP Range 断点续传
+"""
+import asyncio
+import csv
+import io
+import os
+import re
+import tempfile
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+async def iter_csv(columns: Sequence[str], batches: AsyncIterator[List[Sequence[Any]]]) -> AsyncIterator[bytes]:
+    """逐批编码 CSV (带 BOM,Excel 可直接打开中文)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    try:
+        writer.writerow(columns)
+        yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+        async for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        await batches.aclose()
+
+
+def _append_rows(worksheet, rows: List[Sequence[Any]]):
+    for row in rows:
+        worksheet.append(row)
+
+
+async def write_xlsx(columns: Sequence[str], batches: AsyncIterator[List[Sequence[Any]]], directory: str = "") -> str:
+    """
+    逐批写入 XLSX 临时文件
+
+    Returns:
+        临时文件路径 (由调用方在发送后删除)
+    """
+    from openpyxl import Workbook  # 导入较慢,只在导出 XLSX 时加载
+
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".xlsx", dir=directory or None)
+    os.close(fd)
+    try:
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet("report")
+        worksheet.append(list(columns))
+        try:
+            async for rows in batches:
+                # 写入是同步 CPU 操作,放到线程中执行,不阻塞事件循环
+                await asyncio.to_thread(_append_rows, worksheet, rows)
+        finally:
+            await batches.aclose()
+        await asyncio.to_thread(workbook.save, path)
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+async def write_csv(columns: Sequence[str], batches: AsyncIterator[List[Sequence[Any]]], directory: str = "") -> str:
+    """
+    逐批写入 CSV 临时文件
+
+    Returns:
+        临时文件路径 (由调用方负责删除或移动)
+    """
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".csv", dir=directory or None)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in iter_csv(columns, batches):
+                await asyncio.to_thread(f.write, chunk)
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+def _iter_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    """读取文件的 [start, end] 字节区间 (同步生成器,由 Starlette 在线程池中迭代)"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(path: str, range_header: Optional[str], media_type: str, filename: str) -> Response:
+    """
+    支持 HTTP Range (单区间) 的文件下载响应,用于断点续传
+
+    - 无 Range 头: 200 + 完整文件
+    - bytes=start-end / bytes=start- / bytes=-suffix: 206 + Content-Range
+    - 区间不合法: 416
+    """
+    size = os.path.getsize(path)
+    disposition = f"attachment; filename=\"{filename}\""
+    if not range_header:
+        return FileResponse(path, media_type=media_type, filename=filename, headers={"Accept-Ranges": "bytes"})
+
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if match.group(1) == "":
+        start, end = max(0, size - int(match.group(2))), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": disposition,
+        },
+    )
@@ -0,0 +1,144 @@
+"""
+AI SQL 执行前检查
+
+Agent 生成的 SQL 在执行前:
+1. 用 sqlglot 解析: 只允许单条 SELECT (含 WITH / UNION);INSERT / UPDATE / DELETE / DDL、
+   数据修改型 CTE、危险函数 (pg_sleep 等) 一律拒绝
+2. 外层缺少 LIMIT 或 LIMIT 超过行数上限时改写为 LIMIT max_rows + 1 (多 1 行用于判断截断),
+   规划器可以据此选择 top-N 排序等更便宜的计划
+3. 执行前 EXPLAIN (FORMAT JSON) 读取规划器的代价估算 (补充的 LIMIT 不计入,读取 Limit 下节点的代价),
+   超过 AI_SQL_MAX_COST 时拒绝执行
+   (错误信息返回给 LLM,由 Agent 加过滤条件或改为聚合后重试)
+"""
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlglot
+from sqlglot import exp
+
+from app.core.config import settings
+
+
+# 可以阻塞或影响数据库的函数
+FORBIDDEN_FUNCTIONS = {
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_terminate_backend", "pg_cancel_backend",
+    "pg_reload_conf", "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "lo_import", "lo_export",
+    "dblink", "dblink_exec", "set_config",
+}
+
+_WRITE_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.AlterTable,
+    exp.Command, exp.Into,
+)
+
+
+class SqlGuardError(ValueError):
+    """SQL 未通过执行前检查"""
+
+
+@dataclass
+class GuardedSql:
+    """检查后的 SQL"""
+    sql: str  # 实际执行的 SQL (可能已改写 LIMIT)
+    original: str  # 原始 SQL (统计总行数时使用)
+    limit_applied: bool = False
+    cost: Optional[float] = None
+
+
+def _limit_value(query: exp.Expression) -> Optional[int]:
+    """外层 LIMIT 的常量值;没有 LIMIT 或不是常量时返回 None"""
+    limit = query.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.expression
+    if isinstance(value, exp.Literal) and value.is_int:
+        return int(value.this)
+    return None
+
+
+def _function_name(node: exp.Func) -> str:
+    if isinstance(node, exp.Anonymous):
+        return str(node.this).lower()
+    return node.sql_name().lower()
+
+
+def check_sql(sql: str, max_rows: int) -> GuardedSql:
+    """
+    解析并检查 SQL,必要时改写 LIMIT
+
+    Args:
+        sql: Agent 生成的 SQL
+        max_rows: 单次查询最多返回的行数
+
+    Raises:
+        SqlGuardError: 无法解析、多条语句、非 SELECT 或使用了禁止的函数
+    """
+    original = sql.strip().rstrip(";").strip()
+    try:
+        statements = [s for s in sqlglot.parse(original, read="postgres") if s is not None]
+    except sqlglot.errors.ParseError as e:
+        raise SqlGuardError(f"SQL 无法解析: {e}") from e
+
+    if len(statements) != 1:
+        raise SqlGuardError("一次只能执行一条 SQL 语句")
+    query = statements[0]
+    if not isinstance(query, (exp.Select, exp.Union)):
+        raise SqlGuardError(f"只允许执行 SELECT 查询,拒绝 {query.key.upper()} 语句")
+
+    write = next(query.find_all(*_WRITE_NODES), None)
+    if write is not None:
+        raise SqlGuardError(f"查询中包含写操作 ({write.key.upper()}),拒绝执行")
+    for func in query.find_all(exp.Func):
+        if _function_name(func) in FORBIDDEN_FUNCTIONS:
+            raise SqlGuardError(f"不允许调用函数 {_function_name(func)}")
+    if query.find(exp.Lock) is not None:
+        raise SqlGuardError("不允许加锁查询 (FOR UPDATE / FOR SHARE)")
+
+    # 多取 1 行判断截断;已有更小的常量 LIMIT 时保留原 SQL 文本
+    cap = max_rows + 1
+    limit = _limit_value(query)
+    if limit is not None and limit <= cap:
+        return GuardedSql(sql=original, original=original)
+    return GuardedSql(sql=query.limit(cap).sql(dialect="postgres"), original=original, limit_applied=True)
+
+
+def explain_cost(conn, sql: str, under_limit: bool = False) -> float:
+    """
+    规划器估算的总代价 (只 EXPLAIN,不执行)
+
+    Args:
+        under_limit: 读取外层 Limit 节点下的代价。Limit 节点的代价按取回行数占比缩小,
+            补充的 LIMIT 会让无过滤条件的大查询 (如笛卡尔积) 看起来很便宜
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):  # 未注册 json 类型转换时为字符串
+        plan = json.loads(plan)
+    node = plan[0]["Plan"]
+    if under_limit:
+        while node.get("Node Type") == "Limit" and node.get("Plans"):
+            node = node["Plans"][0]
+    return float(node["Total Cost"])
+
+
+def check_cost(conn, guarded: GuardedSql, max_cost: Optional[float] = None) -> GuardedSql:
+    """
+    按 EXPLAIN 代价估算检查 (max_cost 为 0 时跳过)
+
+    LIMIT 由检查补充 / 收紧时按不限行数的代价计算: 截断后统计总行数的 COUNT(*) 会完整执行原查询
+
+    Raises:
+        SqlGuardError: 估算代价超过上限
+    """
+    max_cost = settings.ai_sql_max_cost if max_cost is None else max_cost
+    if max_cost <= 0:
+        return guarded
+    guarded.cost = explain_cost(conn, guarded.sql, under_limit=guarded.limit_applied)
+    if guarded.cost > max_cost:
+        raise SqlGuardError(
+            f"查询代价估算为 {guarded.cost:,.0f},超过上限 {max_cost:,.0f}。"
+            f"请增加过滤条件 (如日期范围)、先聚合再返回,或避免无关联条件的多表连接后重试"
+        )
+    return guarded
@@ -0,0 +1,358 @@
+"""
+有界 SQL 执行器 - 供 Vanna RunSqlTool 使用
+
+相比 vanna 自带的 PostgresRunner:
+1. 使用服务端游标,最多读取 max_rows 行,避免无 LIMIT 的查询把整张视图拉进内存
+2. 结果被截断时通过 COUNT(*) 统计总行数 (受 CHAT_COUNT_TIMEOUT_MS 限制)
+3. 阻塞的 psycopg2 调用放到线程中执行,不阻塞事件循环
+4. 执行统计 (含图表推荐所需的列类型与统计量) 写入当前请求的 QueryCapture,供 VannaService 读取
+5. 实际执行的 SQL (补充 LIMIT、改写到汇总表之后) 的指纹、耗时与行数写入 AI 查询日志
+   (慢查询附带执行计划,原始 SQL 另存,见 ai_query_log)
+6. 执行前检查 (见 sql_guard): 只允许单条 SELECT,自动补充 / 收紧 LIMIT,按 EXPLAIN 代价估算拒绝过大的查询
+7. 可由汇总物化视图回答的聚合查询改写为查询汇总表 (见 aggregate_navigator)
+
+InMemoryRunSqlTool 替代 vanna 的 RunSqlTool: 结果帧经 QueryCapture 直接交给 VannaService,
+不再为每次查询写一个 CSV 文件再读回;只有配置了 SQL_SPILL_DIR 时才落盘,由 prune_spill_dir 定期清理
+"""
+import asyncio
+import os
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import psycopg2
+from loguru import logger
+
+from vanna.capabilities.sql_runner import SqlRunner, RunSqlToolArgs
+from vanna.components import (
+    ComponentType, DataFrameComponent, NotificationComponent, SimpleTextComponent, UiComponent
+)
+from vanna.core.tool import ToolContext, ToolResult
+from vanna.tools import RunSqlTool
+
+from app.core.config import settings
+from app.core.tracing import span
+from app.services.aggregate_navigator import AggregateNavigator
+from app.services.ai_query_log import ai_query_log
+from app.services.chart_recommender import ResultProfiler
+from app.services.sql_guard import check_cost, check_sql
+
+
+# 当前请求的查询统计 (由 VannaService 在驱动 Agent 前创建)
+_query_capture: ContextVar[Optional[Dict[str, Any]]] = ContextVar("query_capture", default=None)
+
+
+def start_query_capture() -> Dict[str, Any]:
+    """
+    为当前请求开启查询统计
+
+    Returns:
+        可变字典,执行器会在每次查询后写入:
+        row_count / total_count / truncated / profile (图表推荐统计量),以及结果帧 dataframe
+    """
+    capture: Dict[str, Any] = {}
+    _query_capture.set(capture)
+    return capture
+
+
+class BoundedPostgresRunner(SqlRunner):
+    """带行数上限的 PostgreSQL SqlRunner 实现"""
+
+    def __init__(
+        self,
+        connection_string: str,
+        max_rows: int = 5000,
+        count_total: bool = True,
+        fetch_size: int = 1000,
+        guard: bool = True,
+        navigator: Optional[AggregateNavigator] = None,
+    ):
+        """
+        Args:
+            connection_string: PostgreSQL 连接串
+            max_rows: 单次查询最多返回的行数
+            count_total: 结果被截断时是否执行 COUNT(*) 统计总行数
+            fetch_size: 服务端游标每批读取的行数
+            guard: 是否在执行前检查 SQL (只读、LIMIT、代价上限)
+            navigator: 聚合导航,为空时不改写到汇总表
+        """
+        self.connection_string = connection_string
+        self.max_rows = max_rows
+        self.count_total = count_total
+        self.fetch_size = max(1, fetch_size)
+        self.guard = guard
+        self.navigator = navigator
+
+    async def run_sql(self, args: RunSqlToolArgs, context: ToolContext) -> pd.DataFrame:
+        """执行 SQL,返回最多 max_rows 行的 DataFrame"""
+        started = time.perf_counter()
+        attempt: Dict[str, Any] = {}
+        with span("sql_runner.run_sql", **{"db.system": "postgresql", "db.statement": args.sql}) as current:
+            try:
+                df, stats = await asyncio.to_thread(self._run_sql_sync, args.sql, attempt)
+            except Exception as e:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                ai_query_log.submit(
+                    self.connection_string, attempt.get("sql", args.sql), elapsed_ms,
+                    error=str(e), original_sql=args.sql,
+                )
+                raise
+            if current is not None:
+                current.set_attribute("db.row_count", stats.get("row_count", len(df)))
+                current.set_attribute("db.truncated", bool(stats.get("truncated")))
+
+        ai_query_log.submit(
+            self.connection_string, attempt.get("sql", args.sql), (time.perf_counter() - started) * 1000,
+            stats, original_sql=args.sql,
+        )
+
+        capture = _query_capture.get()
+        if capture is not None:
+            capture.update(stats)
+
+        if stats.get("truncated"):
+            logger.warning(
+                f"⚠️  查询结果已截断: 返回 {stats['row_count']} / 共 {stats.get('total_count')} 行"
+            )
+        return df
+
+    def _run_sql_sync(self, sql: str, attempt: Optional[Dict[str, Any]] = None):
+        """
+        同步执行查询 (在线程中运行)
+
+        Args:
+            attempt: 执行前写入实际执行的 SQL (sql),执行失败时 AI 查询日志也记录实际执行的语句
+        """
+        # 解析失败或非只读查询直接拒绝,不建立连接
+        guarded = check_sql(sql, self.max_rows) if self.guard else None
+        executed = guarded.sql if guarded is not None else sql
+        conn = psycopg2.connect(self.connection_string)
+        try:
+            query_type = sql.strip().upper().split()[0]
+
+            routed = self.navigator.route(conn, executed) if self.navigator is not None else None
+            if routed is not None:
+                executed = routed.sql
+                if guarded is not None:
+                    guarded.sql = executed
+
+            if guarded is not None:
+                with span("sql_guard.check_cost"):
+                    check_cost(conn, guarded)
+                if guarded.limit_applied:
+                    logger.info(f"🛡️  已补充 LIMIT {self.max_rows + 1} (代价估算 {guarded.cost})")
+            elif query_type not in ("SELECT", "WITH"):
+                # 非查询语句: 与 PostgresRunner 行为保持一致
+                with conn.cursor() as cursor:
+                    cursor.execute(sql)
+                    conn.commit()
+                    return pd.DataFrame({"rows_affected": [cursor.rowcount]}), {}
+
+            # 服务端游标: 只传输需要的行 (多取 1 行用于判断是否截断)
+            # 逐批读取,同时累计图表推荐所需的统计量
+            if attempt is not None:
+                attempt["sql"] = executed
+            rows: List[tuple] = []
+            profiler = None
+            started = time.perf_counter()
+            with conn.cursor(name=f"vanna_{uuid.uuid4().hex[:12]}") as cursor:
+                cursor.execute(executed)
+                while len(rows) <= self.max_rows:
+                    chunk = cursor.fetchmany(min(self.fetch_size, self.max_rows + 1 - len(rows)))
+                    if profiler is None:
+                        profiler = ResultProfiler.from_description(cursor.description)
+                    if not chunk:
+                        break
+                    profiler.update(chunk[:self.max_rows - len(rows)])
+                    rows.extend(chunk)
+                columns = profiler.columns if profiler else []
+            if routed is not None:
+                self.navigator.record(self.connection_string, routed, (time.perf_counter() - started) * 1000)
+
+            truncated = len(rows) > self.max_rows
+            if truncated:
+                rows = rows[:self.max_rows]
+
+            total_count = len(rows)
+            if truncated and self.count_total:
+                # 改写到汇总表时在同一张汇总表上统计 (原 SQL 改写,不含执行前检查补充的 LIMIT)
+                count_sql = self.navigator.rewrite_to(sql, routed.rollup) if routed is not None else sql
+                total_count = self._count_total(conn, count_sql)
+            elif truncated:
+                total_count = None
+
+            df = pd.DataFrame.from_records(rows, columns=columns) if rows else pd.DataFrame()
+            stats = {
+                "row_count": len(rows),
+                "total_count": total_count,
+                "truncated": truncated,
+                "profile": profiler.to_dict() if profiler else None,
+                "rollup": routed.rollup if routed is not None else None,
+            }
+            return df, stats
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count_total(conn, sql: str) -> Optional[int]:
+        """统计原始查询的总行数 (受 statement_timeout 限制),失败或超时时返回 None"""
+        try:
+            conn.rollback()  # 结束服务端游标所在的事务
+            with span("sql_runner.count_total"), conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", (settings.chat_count_timeout_ms,))
+                cursor.execute(f"SELECT COUNT(*) FROM ({sql.strip().rstrip(';')}) AS _total")
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.warning(f"⚠️  统计总行数失败: {e}")
+            return None
+
+
+class InMemoryRunSqlTool(RunSqlTool):
+    """
+    run_sql 工具 (结果不落盘)
+
+    - 完整结果帧写入 QueryCapture["dataframe"],由 VannaService 直接使用
+    - 返回给 LLM 与 UI 组件的只是前 preview_rows 行预览
+    - 配置 spill_dir 时额外把结果写成 CSV (供需要文件的下游工具使用)
+    """
+
+    def __init__(self, sql_runner: SqlRunner, spill_dir: str = "", preview_rows: int = 20):
+        """
+        Args:
+            sql_runner: SQL 执行器
+            spill_dir: CSV 落盘目录,为空时不落盘
+            preview_rows: 返回给 LLM 的预览行数
+        """
+        super().__init__(sql_runner=sql_runner)
+        self.spill_dir = spill_dir
+        self.preview_rows = preview_rows
+
+    async def execute(self, context: ToolContext, args: RunSqlToolArgs) -> ToolResult:
+        """执行 SQL,结果帧在内存中传递"""
+        try:
+            df = await self.sql_runner.run_sql(args, context)
+            query_type = args.sql.strip().upper().split()[0]
+
+            if query_type not in ("SELECT", "WITH"):
+                rows_affected = len(df) if not df.empty else 0
+                result = f"Query executed successfully. {rows_affected} row(s) affected."
+                return ToolResult(
+                    success=True,
+                    result_for_llm=result,
+                    ui_component=UiComponent(
+                        rich_component=NotificationComponent(
+                            type=ComponentType.NOTIFICATION, level="success", message=result
+                        ),
+                        simple_component=SimpleTextComponent(text=result),
+                    ),
+                    metadata={"rows_affected": rows_affected, "query_type": query_type},
+                )
+
+            capture = _query_capture.get()
+            if capture is not None:
+                capture["dataframe"] = df
+
+            if df.empty:
+                result = "Query executed successfully. No rows returned."
+                return ToolResult(
+                    success=True,
+                    result_for_llm=result,
+                    ui_component=UiComponent(
+                        rich_component=DataFrameComponent(
+                            rows=[], columns=[], title="Query Results", description="No rows returned"
+                        ),
+                        simple_component=SimpleTextComponent(text=result),
+                    ),
+                    metadata={"row_count": 0, "columns": [], "query_type": query_type},
+                )
+
+            preview = df.head(self.preview_rows)
+            result = preview.to_csv(index=False)
+            if len(result) > 1000:
+                result = result[:1000] + "\n..."
+            result += f"\n\n共 {len(df)} 行 (以上为预览,完整结果已直接展示给用户,无需复述数据)"
+
+            metadata: Dict[str, Any] = {
+                "row_count": len(df),
+                "columns": df.columns.tolist(),
+                "query_type": query_type,
+            }
+            if self.spill_dir:
+                metadata["output_file"] = await asyncio.to_thread(self._spill, df)
+
+            return ToolResult(
+                success=True,
+                result_for_llm=result,
+                ui_component=UiComponent(
+                    rich_component=DataFrameComponent.from_records(
+                        records=preview.to_dict("records"),
+                        title="Query Results",
+                        description=f"SQL query returned {len(df)} rows with {len(df.columns)} columns",
+                    ),
+                    simple_component=SimpleTextComponent(text=result),
+                ),
+                metadata=metadata,
+            )
+
+        except Exception as e:
+            error_message = f"Error executing query: {str(e)}"
+            return ToolResult(
+                success=False,
+                result_for_llm=error_message,
+                ui_component=UiComponent(
+                    rich_component=NotificationComponent(
+                        type=ComponentType.NOTIFICATION, level="error", message=error_message
+                    ),
+                    simple_component=SimpleTextComponent(text=error_message),
+                ),
+                error=str(e),
+                metadata={"error_type": "sql_error"},
+            )
+
+    def _spill(self, df: pd.DataFrame) -> str:
+        """结果写入落盘目录,返回文件路径"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"query_results_{uuid.uuid4().hex[:8]}.csv")
+        df.to_csv(path, index=False)
+        return path
+
+
+def prune_spill_dir(spill_dir: str, max_age_seconds: float, max_bytes: int) -> Tuple[int, int]:
+    """
+    清理落盘目录: 先删除超过 max_age_seconds 的文件,再按从旧到新删除直到总大小不超过 max_bytes
+
+    Returns:
+        (删除的文件数, 释放的字节数)
+    """
+    if not spill_dir or not os.path.isdir(spill_dir):
+        return 0, 0
+
+    files: List[Tuple[float, int, str]] = []
+    for root, _, names in os.walk(spill_dir):
+        for name in names:
+            if not name.startswith("query_results_"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    files.sort()
+    now = time.time()
+    total = sum(size for _, size, _ in files)
+    removed = freed = 0
+    for mtime, size, path in files:
+        if now - mtime <= max_age_seconds and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
@@ -2,42 +2,30 @@
 Vanna AI 服务模块 - 基于 Vanna 2.0 + 通义千问的 Text-to-SQL
 符合技术栈规范: Vanna.ai + 阿里百炼(DashScope)
 安全规范: API Key 必须从环境变量读取,禁止硬编码
+
+启动性能: vanna / pandas / redis 等重量级依赖延迟到首次使用时导入,
+Agent 在首次请求 (或应用 lifespan 预热) 时构建,导入本模块不会建立任何连接
 """
+from __future__ import annotations
+
 import os
 import json
+import asyncio
 import hashlib
-from datetime import datetime, date
+import time
 from decimal import Decimal
-from typing import Dict, Any, List, Optional
-import pandas as pd
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
 
-# Vanna 2.0 核心导入
-from vanna import Agent
-from vanna.core.registry import ToolRegistry
-from vanna.core.user import UserResolver, User, RequestContext
-from vanna.tools import RunSqlTool
-from vanna.tools.agent_memory import SaveQuestionToolArgsTool, SearchSavedCorrectToolUsesTool, SaveTextMemoryTool
-from vanna.integrations.local.agent_memory import DemoAgentMemory
-from vanna.integrations.openai import OpenAILlmService
-from vanna.integrations.postgres import PostgresRunner
-
-import redis.asyncio as redis
 from loguru import logger
 
 from app.core.config import settings
+from app.core.metrics import observe_cache
+from app.core.tracing import record_span, span
+from app.core.serialization import dumps
+from app.services import cache_codec
 
-
-def json_serializer(obj):
-    """
-    自定义 JSON 序列化函数，处理 Decimal, datetime, date 类型
-    """
-    if isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    elif pd.isna(obj):
-        return None
-    raise TypeError(f"Type {type(obj)} not serializable")
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class VannaService:
@@ -59,48 +47,93 @@ class VannaService:
         self.agent = None
         self.redis_client = None
         self.agent_memory = None
+        self.prompt_builder = None
+        self.sql_runner = None
         
-        # 初始化连接
-        self._initialize_connections()
+        # 延迟初始化: 首次使用时 (或 lifespan 预热时) 才构建 Agent
+        self._ready = False
+        self._init_lock = asyncio.Lock()
+    
+    @property
+    def is_ready(self) -> bool:
+        """Agent 是否已初始化完成"""
+        return self._ready
+    
+    async def ensure_ready(self):
+        """
+        确保 Agent 已初始化 (并发调用只会初始化一次)
+        
+        初始化过程包含阻塞的导入和连接构建,放到线程中执行,不阻塞事件循环
+        """
+        if self._ready:
+            return
+        async with self._init_lock:
+            if self._ready:
+                return
+            await asyncio.to_thread(self._initialize_connections)
+            self._ready = True
     
     def _initialize_connections(self):
         """初始化 Vanna 2.0 Agent"""
         try:
-            # === 从环境变量读取 API Key (符合安全规范) ===
-            dashscope_key = os.getenv('DASHSCOPE_API_KEY')
-            if not dashscope_key:
-                raise ValueError("❌ 未配置 DASHSCOPE_API_KEY 环境变量")
-            
-            logger.info(f"✅ API Key 已从环境变量读取: {dashscope_key[:10]}***")
+            # Vanna 2.0 核心导入 (延迟导入,避免拖慢应用启动)
+            import redis.asyncio as redis
+            from vanna import Agent, AgentConfig
+            from vanna.core.registry import ToolRegistry
+            from vanna.core.user import UserResolver, User, RequestContext
+            from vanna.tools.agent_memory import SaveQuestionToolArgsTool, SearchSavedCorrectToolUsesTool, SaveTextMemoryTool
+            from vanna.integrations.local.agent_memory import DemoAgentMemory
+            from app.services.aggregate_navigator import aggregate_navigator
+            from app.services.sql_runner import BoundedPostgresRunner, InMemoryRunSqlTool
+            from app.services.llm_backend import build_llm_service
+            from app.services.llm_metrics import LlmMetricsMiddleware
+            from app.services.llm_transcripts import TranscriptRecorderMiddleware
+            from app.services.prompt_builder import (
+                PromptBuilder, StaticSystemPromptBuilder, PassthroughContextEnhancer
+            )
             
             # 初始化 Redis（使用连接池）
             redis_pool = redis.ConnectionPool.from_url(
                 settings.redis_url,
                 max_connections=20,
-                decode_responses=True  # 自动解码为字符串
+                decode_responses=False  # 缓存值为二进制编码 (见 cache_codec)
             )
             self.redis_client = redis.Redis(connection_pool=redis_pool)
             logger.info(f"✅ Redis 连接池初始化成功: {settings.redis_url}")
             
-            # === 1. 配置 LLM (通义千问 - 通过 OpenAI 兼容接口) ===
-            llm = OpenAILlmService(
-                model="qwen-plus",
-                api_key=dashscope_key,  # 从环境变量读取
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"  # 使用 base_url 而不是 api_base
-            )
-            logger.info("✅ LLM 配置成功: 通义千问 (qwen-plus)")
+            # === 1. 配置 LLM (默认通义千问,可通过 LLM_BACKEND 切换为本地 OpenAI 兼容服务) ===
+            llm = build_llm_service()
             
             # === 2. 配置数据库工具 (PostgreSQL) ===
             db_url = f"postgresql://{os.getenv('DATABASE_USER', 'postgres')}:{os.getenv('DATABASE_PASSWORD', 'postgres123')}@{os.getenv('DATABASE_HOST', 'localhost')}:{os.getenv('DATABASE_PORT', '5432')}/{os.getenv('DATABASE_NAME', 'inventory_bi')}"
             
-            db_tool = RunSqlTool(
-                sql_runner=PostgresRunner(connection_string=db_url)
+            # 结果帧经 QueryCapture 在内存中传递,不再为每次查询写 CSV
+            # 问题模板快速通道直接使用同一个执行器 (同样经过执行前检查与汇总表改写)
+            self.sql_runner = BoundedPostgresRunner(
+                connection_string=db_url,
+                max_rows=settings.chat_max_rows,
+                count_total=settings.chat_count_total,
+                guard=settings.ai_sql_guard_enabled,
+                navigator=aggregate_navigator if settings.ai_rollup_enabled else None
             )
-            logger.info("✅ 数据库工具配置成功: PostgreSQL")
+            db_tool = InMemoryRunSqlTool(sql_runner=self.sql_runner, spill_dir=settings.sql_spill_dir)
+            logger.info(f"✅ 数据库工具配置成功: PostgreSQL (单次查询上限 {settings.chat_max_rows} 行)")
             
             # === 3. 配置 Agent Memory (学习机制) ===
-            self.agent_memory = DemoAgentMemory(max_items=1000)
-            logger.info("✅ Agent Memory 初始化成功")
+            if settings.agent_memory_backend == "pgvector":
+                from app.services.agent_memory import PgVectorAgentMemory
+                self.agent_memory = PgVectorAgentMemory(dim=settings.agent_memory_embedding_dim)
+            else:
+                self.agent_memory = DemoAgentMemory(max_items=1000)
+            logger.info(f"✅ Agent Memory 初始化成功: {type(self.agent_memory).__name__}")
+            
+            # 按问题挑选相关字段与相似示例,替代整段硬编码提示词
+            self.prompt_builder = PromptBuilder(
+                agent_memory=self.agent_memory,
+                max_examples=settings.prompt_max_examples,
+                token_budget=settings.prompt_token_budget,
+                min_example_score=settings.prompt_example_min_score
+            )
             
             # === 4. 配置用户认证 (简化版本) ===
             class SimpleUserResolver(UserResolver):
@@ -121,11 +154,21 @@ class VannaService:
             tools.register_local_tool(SaveTextMemoryTool(), access_groups=['admin', 'user'])
             
             # === 6. 创建 Agent ===
+            llm_middlewares = [LlmMetricsMiddleware()]
+            if settings.llm_record_path:
+                llm_middlewares.append(TranscriptRecorderMiddleware(settings.llm_record_path))
+                logger.info(f"🎙️  LLM 问答记录写入: {settings.llm_record_path}")
+            
+            # 非流式调用才能拿到 usage (prompt/completion tokens)
             self.agent = Agent(
                 llm_service=llm,
                 tool_registry=tools,
                 user_resolver=user_resolver,
-                agent_memory=self.agent_memory
+                agent_memory=self.agent_memory,
+                config=AgentConfig(stream_responses=False),
+                system_prompt_builder=StaticSystemPromptBuilder(),
+                llm_context_enhancer=PassthroughContextEnhancer(),
+                llm_middlewares=llm_middlewares
             )
             logger.info("✅ Vanna AI 2.0 Agent 初始化成功")
             
@@ -135,107 +178,60 @@ class VannaService:
             traceback.print_exc()
             raise
     
-    async def train_system(self):
+    def _system_tool_context(self, conversation_id: str = "training"):
+        """以系统用户身份访问 Agent Memory 使用的 ToolContext"""
+        import uuid
+        from vanna.core.tool import ToolContext
+        from vanna.core.user import User
+        
+        return ToolContext(
+            user=User(
+                id="system_user",
+                email="system@inventory-bi.com",
+                group_memberships=["admin", "user"]
+            ),
+            conversation_id=conversation_id,
+            request_id=str(uuid.uuid4()),
+            agent_memory=self.agent_memory
+        )
+    
+    async def _save_examples(self, examples: List[Dict[str, Any]], context) -> int:
+        """批量保存问答对,Agent Memory 不支持批量时逐条保存"""
+        if hasattr(self.agent_memory, "save_tool_usages"):
+            return await self.agent_memory.save_tool_usages(examples)
+        for example in examples:
+            await self.agent_memory.save_tool_usage(
+                question=example["question"],
+                tool_name=example["tool_name"],
+                args=example["args"],
+                context=context,
+                metadata=example.get("metadata")
+            )
+        return len(examples)
+    
+    async def train_system(self, extra_examples: Optional[List[Dict[str, Any]]] = None):
         """
         训练 Vanna AI 系统
         
         添加示例问答对到 Agent Memory,让 AI 学习如何将自然语言转换为 SQL
+        
+        Args:
+            extra_examples: 额外的问答对 [{"question": str, "sql": str}, ...] (批量导入)
         """
         logger.info("🤖 开始训练 Vanna AI 2.0 系统...")
+        await self.ensure_ready()
+        context = self._system_tool_context()
         
         try:
-            # === 1. 使用 SaveTextMemoryTool 保存数据库 Schema 信息 ===
-            database_context = """
-# 数据库 Schema 信息
-
-## 主要表和视图
-
-### 1. view_bi_sales_analysis (销售分析视图) - **主要用于销售相关查询**
-关键字段:
-- order_id: 订单ID
-- order_no: 订单编号
-- order_date: 订单日期
-- year: 年份
-- month: 月份
-- order_status: 订单状态 (DRAFT/CONFIRMED/COMPLETED/CANCELLED)
-- company_name: 分公司名称
-- dept_name: 部门名称  
-- salesman_name: 业务员姓名
-- salesman_id: 业务员ID
-- partner_name: 客户/供应商名称
-- region: 地区 (华南/华北/华东/华中/西北/西南/东北)
-- partner_type: 伙伴类型 (CUSTOMER/SUPPLIER)
-- product_name: 商品名称
-- category: 商品类别
-- specification: 规格
-- unit: 单位
-- warehouse_name: 仓库名称
-- warehouse_location: 仓库位置
-- quantity: 数量
-- unit_price: 单价
-- sales_amount: 销售金额 (**重要**)
-- cost_price: 成本价
-- cost_amount: 成本金额
-- gross_profit: 毛利额
-- gross_profit_rate: 毛利率
-- created_at: 创建时间
-- updated_at: 更新时间
-
-### 2. view_bi_inventory_alert (库存预警视图)
-关键字段:
-- product_name: 商品名称
-- warehouse_name: 仓库名称
-- current_stock: 当前库存
-- min_stock: 最小库存
-- max_stock: 最大库存
-- stock_status: 库存状态 (缺货/库存不足/正常/库存过高)
-
-### 3. view_bi_finance_monitor (财务监控视图)
-关键字段:
-- company_name: 分公司
-- partner_name: 客户/供应商
-- finance_type: 类型 (RECEIVABLE/PAYABLE)
-- amount: 金额
-- balance: 余额
-
-### 4. base_product (商品表)
-关键字段:
-- name: 商品名称
-- category: 商品类别
-- specification: 规格
-- unit: 单位
-
-### 5. biz_order (订单表)
-关键字段:
-- order_no: 订单编号
-- order_date: 订单日期
-- type: 订单类型 (SALES/PURCHASE)
-- status: 状态
-- total_amount: 总金额
-
-### 6. biz_order_item (订单明细表)
-关键字段:
-- order_id: 订单ID
-- product_id: 商品ID  
-- quantity: 数量
-- price: 单价
-- subtotal: 小计
-
-## 查询注意事项
-1. **销售相关查询请使用 view_bi_sales_analysis 视图**
-2. 日期过滤: 使用 order_date, year, month 字段
-3. 金额统计: 使用 SUM(sales_amount) 计算销售额
-4. 商品统计: 按 product_name 分组
-5. PostgreSQL 数据库,不是 SQLite,不要使用 sqlite_master 表
-6. 不要使用 PRAGMA 命令
-"""
+            # === 1. 保存数据库 Schema 信息 (完整字段目录) ===
+            from app.services.prompt_builder import render_schema_overview
+            database_context = render_schema_overview()
             
             logger.info("📚 正在保存数据库 Schema 信息...")
             try:
                 await self.agent_memory.save_text_memory(
-                    key="database_schema",
-                    value=database_context,
-                    category="database_info"
+                    content=database_context,
+                    context=context
                 )
                 logger.info("  ✅ 数据库 Schema 信息已保存")
             except Exception as e:
@@ -295,17 +291,21 @@ class VannaService:
                 },
             ]
             
-            # === 2. 保存到 Agent Memory ===
-            logger.info(f"📚 正在添加 {len(training_examples)} 个示例到 Agent Memory...")
-            
-            # 为了简化,我们直接向 Agent 发送问题,让它学习
-            # Vanna 2.0 的学习机制是自动的,不需要手动训练
-            logger.info("👉 Vanna 2.0 使用内置的学习机制")
-            logger.info("👉 AI 将通过实际查询来学习数据库结构")
+            # === 3. 批量保存到 Agent Memory ===
+            examples = [
+                {"question": ex["question"], "tool_name": ex["tool"], "args": ex["args"]}
+                for ex in training_examples
+            ]
+            examples.extend(
+                {"question": ex["question"], "tool_name": "run_sql", "args": {"sql": ex["sql"]}}
+                for ex in extra_examples or []
+            )
+            logger.info(f"📚 正在添加 {len(examples)} 个示例到 Agent Memory...")
+            saved = await self._save_examples(examples, context)
             
             logger.info("")
             logger.info("🎉 Vanna AI 2.0 训练完成!")
-            logger.info(f"💾 Agent Memory 包含 {len(training_examples)} 个示例")
+            logger.info(f"💾 已提交 {saved} 个示例 (重复的问答对会自动跳过)")
             logger.info("💡 AI 将使用这些示例来理解如何生成 SQL")
             
         except Exception as e:
@@ -314,6 +314,355 @@ class VannaService:
             traceback.print_exc()
             raise
     
+    def _build_cache_key(self, question: str, context: Optional[Dict[str, Any]]) -> str:
+        """生成缓存 Key（使用 MD5）"""
+        question_hash = hashlib.md5(question.encode('utf-8')).hexdigest()
+        context_str = json.dumps(context or {}, sort_keys=True)
+        context_hash = hashlib.md5(context_str.encode('utf-8')).hexdigest()
+        return f"vanna_cache:{question_hash}:{context_hash}"
+    
+    async def _read_cache_raw(self, cache_key: str, question: str) -> Optional[bytes]:
+        """Read-Through: 读取缓存中的原始编码值，未命中或读取失败时返回 None"""
+        started = time.perf_counter()
+        try:
+            with span("redis.get", **{"db.system": "redis", "cache.key": cache_key}) as current:
+                cached = await self.redis_client.get(cache_key)
+                if current is not None:
+                    current.set_attribute("cache.hit", bool(cached))
+            observe_cache("vanna", "get", time.perf_counter() - started, "hit" if cached else "miss")
+            if cached:
+                logger.info(f"🚀 Cache Hit! Key: {cache_key[:50]}...")
+                logger.info(f"📝 问题: {question}")
+                return cached
+        except Exception as e:
+            observe_cache("vanna", "get", time.perf_counter() - started, "error")
+            logger.warning(f"⚠️  读取缓存失败: {e}，继续执行查询")
+        return None
+    
+    async def _read_cache_json(self, cache_key: str, question: str) -> Optional[bytes]:
+        """Read-Through: 检查缓存并返回 JSON bytes (可直接作为响应体)"""
+        cached = await self._read_cache_raw(cache_key, question)
+        if not cached:
+            return None
+        try:
+            return cache_codec.unpack_json(cached)
+        except Exception as e:
+            logger.warning(f"⚠️  缓存解码失败: {e}，继续执行查询")
+            return None
+    
+    async def _read_cache(self, cache_key: str, question: str) -> Optional[Dict[str, Any]]:
+        """Read-Through: 检查缓存并解码为字典"""
+        cached = await self._read_cache_raw(cache_key, question)
+        if not cached:
+            return None
+        try:
+            return cache_codec.unpack(cached)
+        except Exception as e:
+            logger.warning(f"⚠️  缓存解码失败: {e}，继续执行查询")
+            return None
+    
+    async def _write_cache(self, cache_key: str, response: Dict[str, Any]) -> bytes:
+        """
+        Write-Through: 写入缓存 (按 cache_codec 格式编码/压缩)
+        
+        Returns:
+            序列化后的 JSON bytes (可直接作为响应体)
+        """
+        body = dumps(response)
+        try:
+            cache_value = cache_codec.pack(response, json_body=body)
+            started = time.perf_counter()
+            with span("redis.setex", **{"db.system": "redis", "cache.key": cache_key, "cache.bytes": len(cache_value)}):
+                await self.redis_client.setex(
+                    cache_key,
+                    300,  # 5分钟过期
+                    cache_value
+                )
+            observe_cache("vanna", "set", time.perf_counter() - started)
+            logger.info(
+                f"💾 缓存已写入 (TTL: 300s, {cache_codec.describe(cache_value, len(body))}): "
+                f"{cache_key[:50]}..."
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  写入缓存失败: {e}")
+        return body
+    
+    async def _run_fast_path(self, question: str):
+        """
+        问题模板快速通道: 识别出的常见问题直接执行模板 SQL,不调用 LLM
+        
+        Returns:
+            (TemplateMatch, DataFrame);未识别、执行失败或名称筛选没有数据时返回 None,由 Agent 回答
+        """
+        from vanna.capabilities.sql_runner import RunSqlToolArgs
+        from app.services.intent_templates import intent_matcher
+        
+        matched = intent_matcher.match(question)
+        if matched is None:
+            intent_matcher.record(None, "miss")
+            return None
+        try:
+            with span("vanna.fast_path", template=matched.template):
+                df = await self.sql_runner.run_sql(
+                    RunSqlToolArgs(sql=matched.sql), self._system_tool_context("chat")
+                )
+        except Exception as e:
+            logger.warning(f"⚠️  模板 SQL 执行失败,改由 Agent 回答: {e}")
+            intent_matcher.record(matched.template, "error")
+            return None
+        if matched.named and (df.empty or df.isna().all().all()):
+            # 人名 / 公司名可能不存在 (如 "北京分公司" 实为 "北京总公司"),交给 Agent 查找
+            logger.info(f"⚠️  问题模板的名称筛选没有数据,改由 Agent 回答: {question}")
+            intent_matcher.record(matched.template, "miss")
+            return None
+        intent_matcher.record(matched.template, "hit")
+        logger.info(f"⚡ 问题模板命中 ({matched.template}): {matched.sql[:100]}")
+        return matched, df
+    
+    async def _iter_agent_results(self, question: str, context: Optional[Dict[str, Any]]):
+        """
+        驱动 Agent 执行问题，并在组件到达时立即产出解析结果
+        
+        Yields:
+            ("sql", str) - 找到生成的 SQL
+            ("dataframe", pd.DataFrame) - 找到查询结果
+            ("stats", dict) - 结束时产出查询统计 (row_count / total_count / truncated;
+                              由问题模板回答时含 fast_path 模板名)
+        
+        常见问题先尝试问题模板快速通道 (见 intent_templates),未识别时才调用 Agent
+        """
+        import pandas as pd
+        from vanna.core.user import RequestContext
+        from app.services.sql_runner import start_query_capture
+        from app.services.llm_metrics import start_llm_capture, llm_stats
+        from app.services.prompt_builder import STATIC_PROMPT_TOKENS
+        
+        await self.ensure_ready()
+        capture = start_query_capture()
+        if settings.chat_fast_path_enabled:
+            answered = await self._run_fast_path(question)
+            if answered is not None:
+                matched, df = answered
+                yield "sql", matched.sql
+                yield "dataframe", df
+                yield "stats", {**capture, "fast_path": matched.template}
+                return
+        llm_capture = start_llm_capture()
+
+        # 只附带相关字段与相似示例 (规则在可缓存的静态系统提示词中)
+        built = await self.prompt_builder.build(question, self._system_tool_context("chat"))
+        
+        # 创建 RequestContext
+        request_context = RequestContext(
+            cookies={},
+            headers={},
+            remote_addr="127.0.0.1",
+            metadata=context or {}
+        )
+        
+        idx = 0
+        # 组件由 Agent 逐个产出: 每个组件的 span 覆盖从上一个组件到达到它到达的时间
+        component_started_ns = time.time_ns()
+        async for component in self.agent.send_message(
+            request_context=request_context,
+            message=built["prompt"]
+        ):
+            idx += 1
+            logger.info(f"📦 收到组件: {type(component).__name__}")
+            record_span(
+                "vanna.agent.component", component_started_ns,
+                **{"vanna.component": type(component).__name__, "vanna.component_index": idx},
+            )
+            component_started_ns = time.time_ns()
+            
+            # 尝试获取 model_dump
+            try:
+                dump = component.model_dump()
+            except Exception as e:
+                logger.debug(f"[{idx}] model_dump() 解析失败: {e}")
+                continue
+            
+            if 'rich_component' in dump and dump['rich_component'] is not None:
+                rich = dump['rich_component']
+                component_type = rich.get('type', 'unknown')
+                
+                # 查找 SQL (在 content 字段中)
+                if 'content' in rich and isinstance(rich['content'], str):
+                    if 'SELECT' in rich['content'].upper():
+                        logger.info(f"✅ [{idx}] 找到 SQL: {rich['content'][:100]}")
+                        yield "sql", rich['content']
+                
+                # 查找 SQL (工具执行状态卡片的 metadata 中携带 run_sql 参数)
+                metadata = rich.get('metadata')
+                if isinstance(metadata, dict) and isinstance(metadata.get('sql'), str):
+                    logger.info(f"✅ [{idx}] 找到 SQL: {metadata['sql'][:100]}")
+                    yield "sql", metadata['sql']
+                
+                # 查找 DataFrame (在 dataframe 字段中)
+                if 'dataframe' in rich and rich['dataframe'] is not None:
+                    with span("vanna.build_dataframe", source="dataframe"):
+                        data_df = pd.DataFrame(rich['dataframe'])
+                    logger.info(f"✅ [{idx}] 找到 DataFrame, shape: {data_df.shape}")
+                    yield "dataframe", data_df
+                
+                # 查找 DataFrame (在 rows + columns 字段中 - Vanna 2.0 新格式)
+                if 'rows' in rich and 'columns' in rich and rich['rows']:
+                    try:
+                        # 组件中只有预览行,优先使用执行器留在 QueryCapture 中的完整结果帧
+                        data_df = capture.pop('dataframe', None)
+                        if data_df is None or data_df.empty:
+                            with span("vanna.build_dataframe", source="rows"):
+                                data_df = pd.DataFrame(rich['rows'], columns=rich['columns'])
+                        logger.info(f"✅ [{idx}] 从 rows+columns 找到 DataFrame, shape: {data_df.shape}")
+                        yield "dataframe", data_df
+                    except Exception as e:
+                        logger.warning(f"⚠️  [{idx}] 构造 DataFrame 失败: {e}")
+                
+                # 如果是 DATA_FRAME 类型,记录详细信息
+                if str(component_type) == 'data_frame' or 'dataframe' in str(component_type).lower():
+                    logger.debug(f"📊 [{idx}] DataFrameComponent 详情: {rich}")
+            
+            # 从 simple_component 中提取文本结果
+            # 中间过程文本（错误、调试信息、工具输出）只记录日志，不添加到 answer_text
+            if 'simple_component' in dump and dump['simple_component'] is not None:
+                text = dump['simple_component'].get('text')
+                if text and '\n' in text and len(text) > 50:
+                    logger.debug(f"📝 [{idx}] 文本内容(前200字符): {text[:200]}")
+        
+        llm_stats.record(llm_capture)
+        logger.info(
+            f"🧮 Prompt ≈{built['tokens']} tokens (静态前缀 ≈{STATIC_PROMPT_TOKENS}, "
+            f"视图 {','.join(built['views'])}, {built['columns']} 个字段, {built['examples']} 个示例) | "
+            f"LLM {llm_capture['llm_calls']} 次调用, prompt_tokens={llm_capture['prompt_tokens']}, "
+            f"completion_tokens={llm_capture['completion_tokens']}, 耗时 {llm_capture['llm_ms']:.0f}ms"
+        )
+        capture.pop('dataframe', None)
+        yield "stats", dict(capture)
+    
+    def _bound_dataframe(self, df: pd.DataFrame, stats: Dict[str, Any]):
+        """
+        对结果施加行数上限,并汇总总行数与截断标记
+        
+        Returns:
+            (截断后的 DataFrame, total_count, truncated)
+        """
+        max_rows = settings.chat_max_rows
+        total_count = stats.get("total_count")
+        truncated = bool(stats.get("truncated"))
+        
+        if len(df) > max_rows:
+            df = df.iloc[:max_rows]
+            truncated = True
+        if total_count is None and not truncated:
+            total_count = len(df)
+        return df, total_count, truncated
+    
+    @staticmethod
+    def _column_values(series: pd.Series) -> List[Any]:
+        """
+        按列向量化转换为可 JSON 序列化的值列表
+        
+        每列只判断一次类型,再整列转换 (Decimal → float, 日期 → 字符串, NaN/NaT → None)
+        """
+        import pandas as pd
+        
+        mask = series.notna()
+        if not mask.any():
+            return [None] * len(series)
+        
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.astype(str)
+        elif series.dtype == object:
+            sample = series[mask].iloc[0]
+            if isinstance(sample, Decimal):
+                series = series.astype(float)  # Decimal 转 float
+            elif hasattr(sample, 'isoformat'):
+                series = series.astype(str)  # datetime 转字符串
+        
+        return series.astype(object).where(mask, None).tolist()
+    
+    def _to_columnar(self, df: pd.DataFrame) -> List[List[Any]]:
+        """将 DataFrame 转换为列式数据 (每列一个数组)"""
+        with span("vanna.to_columnar", rows=len(df), columns=df.shape[1]):
+            return [self._column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+    
+    def _build_data(self, df: pd.DataFrame, total_count: Optional[int], truncated: bool) -> Dict[str, Any]:
+        """构造列式响应数据"""
+        return {
+            "columns": [str(col) for col in df.columns],
+            "values": self._to_columnar(df),
+            "row_count": len(df),
+            "total_count": total_count,
+            "truncated": truncated
+        }
+    
+    def _empty_response(self, sql: str, answer_text: str = "") -> Dict[str, Any]:
+        """无数据时的标准响应"""
+        return {
+            "answer_text": answer_text or "未找到符合条件的数据",
+            "sql": sql,
+            "chart_type": "empty",
+            "data": {"columns": [], "values": [], "row_count": 0, "total_count": 0, "truncated": False}
+        }
+    
+    def _error_response(self, e: Exception) -> Dict[str, Any]:
+        """查询失败时的标准响应"""
+        response = self._empty_response("", f"查询失败: {str(e)}")
+        response["chart_type"] = "error"
+        return response
+    
+    async def _answer_question(
+        self,
+        question: str,
+        context: Optional[Dict[str, Any]],
+        cache_key: str
+    ) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """
+        使用 Agent 回答问题并写入缓存
+        
+        Returns:
+            (响应字典, 已序列化的响应 bytes; 未写缓存时为 None)
+        """
+        # === 1. 使用 Agent 执行查询 (Vanna 2.0) ===
+        logger.info(f"🤔 处理问题: {question}")
+        
+        sql = ""
+        data_df = None
+        stats: Dict[str, Any] = {}
+        async for kind, value in self._iter_agent_results(question, context):
+            if kind == "sql":
+                sql = value
+            elif kind == "dataframe":
+                data_df = value
+            elif kind == "stats":
+                stats = value
+        
+        if data_df is None or data_df.empty:
+            return self._empty_response(sql), None
+        
+        # === 2. 行数上限 + 列式转换 ===
+        data_df, total_count, truncated = self._bound_dataframe(data_df, stats)
+        data = self._build_data(data_df, total_count, truncated)
+        
+        # === 3. 推荐图表 ===
+        chart_type = self._recommend_chart_type(question, data_df, stats.get("profile"))
+        
+        # === 4. 生成回答 ===
+        answer_text = self._generate_answer_text(question, data_df, chart_type, total_count, truncated)
+        
+        response = {
+            "answer_text": answer_text.strip(),
+            "sql": sql,
+            "chart_type": chart_type,
+            "data": data
+        }
+        
+        # === 5. Write-Through: 写入缓存 ===
+        body = await self._write_cache(cache_key, response)
+        
+        logger.info(f"✅ 查询成功,返回 {data['row_count']} 条数据 (共 {total_count} 条)")
+        return response, body
+    
     async def ask_question(self, question: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         处理用户自然语言问题（带 Redis 缓存）
@@ -326,328 +675,209 @@ class VannaService:
             {"answer_text": str, "sql": str, "chart_type": str, "data": {...}}
         """
         try:
-            # === 1. 生成缓存 Key（使用 MD5）===
-            question_hash = hashlib.md5(question.encode('utf-8')).hexdigest()
-            context_str = json.dumps(context or {}, sort_keys=True)
-            context_hash = hashlib.md5(context_str.encode('utf-8')).hexdigest()
-            cache_key = f"vanna_cache:{question_hash}:{context_hash}"
+            await self.ensure_ready()
             
-            # === 2. Read-Through: 检查缓存 ===
-            try:
-                cached = await self.redis_client.get(cache_key)
-                if cached:
-                    logger.info(f"🚀 Cache Hit! Key: {cache_key[:50]}...")
-                    logger.info(f"📝 问题: {question}")
-                    return json.loads(cached)
-            except Exception as e:
-                logger.warning(f"⚠️  读取缓存失败: {e}，继续执行查询")
+            # Read-Through: 检查缓存
+            cache_key = self._build_cache_key(question, context)
+            cached = await self._read_cache(cache_key, question)
+            if cached:
+                return cached
             
-            # === 2. 使用 Agent 执行查询 (Vanna 2.0) ===
-            logger.info(f"🤔 处理问题: {question}")
+            response, _ = await self._answer_question(question, context, cache_key)
+            return response
             
-            # 添加强力数据库上下文到问题中
-            enhanced_question = f"""
-你是一个PostgreSQL数据库查询助手。**严格遵守以下规则：**
-
-## 数据库类型
-PostgreSQL 14+ (不是 SQLite！禁止使用 SQLite 命令)
-
-## 可用的表和视图（只能使用这些表）
-
-### 主要视图（优先使用）：
-1. **view_bi_sales_analysis** - 销售分析宽表视图 ⭐ 销售相关查询必须用这个
-   核心字段:
-   - product_name (text) - 商品名称
-   - sales_amount (numeric) - 销售金额
-   - order_date (date) - 订单日期
-   - year (integer) - 年份
-   - month (integer) - 月份
-   - company_name (text) - 分公司
-   - salesman_name (text) - 业务员
-   - category (text) - 商品类别
-   - region (text) - 地区
-
-2. **view_bi_inventory_alert** - 库存预警视图
-   字段: product_name, warehouse_name, current_stock, stock_status
-
-### 基础表（仅在必要时使用）：
-- base_product - 商品信息
-- biz_order - 订单主表
-- biz_order_item - 订单明细
-
-## SQL 生成规则（必须严格遵守）
-
-1. **禁止使用的命令和表**：
-   ❌ 禁止: PRAGMA, sqlite_master, SHOW TABLES
-   ❌ 禁止: 任何 SQLite 特有的语法
-   ❌ 禁止: 查询 pg_* 系统表（如 pg_class, pg_statistic）
-
-2. **销售查询标准模式**：
-   - 计算销售额: `SUM(sales_amount) as total_sales`
-   - 按商品分组: `GROUP BY product_name`
-   - 排序: `ORDER BY total_sales DESC`
-   - 限制数量: `LIMIT N`
-
-3. **日期过滤**：
-   - 上个月: `WHERE order_date >= date_trunc('month', CURRENT_DATE - interval '1 month') AND order_date < date_trunc('month', CURRENT_DATE)`
-   - 本月: `WHERE order_date >= date_trunc('month', CURRENT_DATE)`
-   - 本年: `WHERE year = EXTRACT(YEAR FROM CURRENT_DATE)`
-
-4. **示例查询（参考）**：
-```sql
--- 销售额最高的前5个商品
-SELECT product_name, SUM(sales_amount) as total_sales 
-FROM view_bi_sales_analysis 
-GROUP BY product_name 
-ORDER BY total_sales DESC 
-LIMIT 5;
-
--- 上个月销售额最高的前5个商品
-SELECT product_name, SUM(sales_amount) as total_sales 
-FROM view_bi_sales_analysis 
-WHERE order_date >= date_trunc('month', CURRENT_DATE - interval '1 month') 
-  AND order_date < date_trunc('month', CURRENT_DATE)
-GROUP BY product_name 
-ORDER BY total_sales DESC 
-LIMIT 5;
-```
-
-## 用户问题
-{question}
-
-## 要求
-1. 直接生成SQL，不要尝试探索数据库结构
-2. 只使用上面列出的表和视图
-3. 如果不确定，优先使用 view_bi_sales_analysis
-4. 生成的SQL必须是完整可执行的
-"""
+        except Exception as e:
+            logger.error(f"❌ 查询失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return self._error_response(e)
+    
+    async def ask_question_json(self, question: str, context: Dict[str, Any] = None) -> Tuple[bytes, bool]:
+        """
+        处理用户问题并返回已序列化的 JSON 响应
+        
+        缓存命中时直接返回 Redis 中的 bytes,跳过解码与重新编码
+        
+        Returns:
+            (JSON bytes, 是否命中缓存)
+        """
+        try:
+            await self.ensure_ready()
+            cache_key = self._build_cache_key(question, context)
+            cached = await self._read_cache_json(cache_key, question)
+            if cached:
+                return cached, True
             
-            # 创建 RequestContext
-            from vanna.core.user import RequestContext
-            request_context = RequestContext(
-                cookies={},
-                headers={},
-                remote_addr="127.0.0.1",
-                metadata=context or {}
-            )
+            response, body = await self._answer_question(question, context, cache_key)
+            return body if body is not None else dumps(response), False
             
-            # 发送消息并收集结果
-            result_components = []
-            async for component in self.agent.send_message(
-                request_context=request_context,
-                message=enhanced_question  # 使用增强后的问题
-            ):
-                result_components.append(component)
-                logger.info(f"📦 收到组件: {type(component).__name__}")
+        except Exception as e:
+            logger.error(f"❌ 查询失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return dumps(self._error_response(e)), False
+    
+    async def stream_question(self, question: str, context: Dict[str, Any] = None):
+        """
+        流式处理用户自然语言问题
+        
+        在 Agent 产出组件的同时逐步推送事件，而不是等待全部完成后一次返回:
+        status → sql → rows (分批) → chart → answer → done
+        
+        查询结果一到达就分批推送 rows,不等待 Agent 最后一轮 LLM 调用 (总结);回答文本最后推送。
+        Agent 重新查询时新结果再次从 offset 0 开始推送,客户端收到 offset 为 0 的 rows 时替换之前的行
+        
+        Yields:
+            (event, payload) 事件名与可 JSON 序列化的数据
+        """
+        batch_size = max(1, settings.chat_stream_batch_size)
+        try:
+            yield "status", {"stage": "thinking"}
+            await self.ensure_ready()
+            
+            # === 1. 缓存命中时直接按相同事件顺序回放 ===
+            cache_key = self._build_cache_key(question, context)
+            cached = await self._read_cache(cache_key, question)
+            if cached:
+                data = cached.get("data", {})
+                values = data.get("values", [])
+                row_count = data.get("row_count", 0)
+                yield "sql", {"sql": cached.get("sql", "")}
+                for offset in range(0, row_count, batch_size):
+                    yield "rows", {
+                        "columns": data.get("columns", []),
+                        "offset": offset,
+                        "values": [col[offset:offset + batch_size] for col in values]
+                    }
+                yield "chart", {"chart_type": cached.get("chart_type", "table")}
+                yield "answer", {"answer_text": cached.get("answer_text", "")}
+                yield "done", {
+                    "row_count": row_count,
+                    "total_count": data.get("total_count"),
+                    "truncated": data.get("truncated", False),
+                    "cached": True
+                }
+                return
             
-            # === 3. 解析结果 ===
+            # === 2. 边执行边推送: 结果到达即分批推送 (列式) ===
+            logger.info(f"🤔 (stream) 处理问题: {question}")
             sql = ""
             data_df = None
-            answer_text = ""
-            
-            # 从 components 中提取信息
-            for idx, component in enumerate(result_components, 1):
-                # 尝试获取 model_dump
-                try:
-                    dump = component.model_dump()
-                    
-                    # 从 dump 中提取 SQL
-                    if 'rich_component' in dump:
-                        rich = dump['rich_component']
-                        component_type = rich.get('type', 'unknown')
-                        
-                        # 查找 SQL (在 content 字段中)
-                        if 'content' in rich and isinstance(rich['content'], str):
-                            if 'SELECT' in rich['content'].upper():
-                                sql = rich['content']
-                                logger.info(f"✅ [{idx}] 找到 SQL: {sql[:100]}")
-                        
-                        # 查找 DataFrame (在 dataframe 字段中)
-                        if 'dataframe' in rich and rich['dataframe'] is not None:
-                            data_df = pd.DataFrame(rich['dataframe'])
-                            logger.info(f"✅ [{idx}] 找到 DataFrame, shape: {data_df.shape}")
-                        
-                        # 查找 DataFrame (在 rows + columns 字段中 - Vanna 2.0 新格式)
-                        if 'rows' in rich and 'columns' in rich and rich['rows']:
-                            try:
-                                # 使用 rows 和 columns 构造 DataFrame
-                                data_df = pd.DataFrame(rich['rows'], columns=rich['columns'])
-                                logger.info(f"✅ [{idx}] 从 rows+columns 找到 DataFrame, shape: {data_df.shape}")
-                            except Exception as e:
-                                logger.warning(f"⚠️  [{idx}] 构造 DataFrame 失败: {e}")
-                        
-                        # 如果是 DATA_FRAME 类型,记录详细信息
-                        if str(component_type) == 'data_frame' or 'dataframe' in str(component_type).lower():
-                            logger.info(f"📊 [{idx}] DataFrameComponent 详情: {rich}")
-                    
-                    # 从 simple_component 中提取文本结果
-                    if 'simple_component' in dump and dump['simple_component'] is not None:
-                        simple = dump['simple_component']
-                        if 'text' in simple and simple['text']:
-                            text = simple['text']
-                            
-                            # 强力过滤：跳过所有包含错误、调试信息的文本
-                            skip_patterns = [
-                                'Tool failed', 'Error executing', 'does not exist',
-                                'LINE 1:', 'syntax error', 'PRAGMA', 'sqlite_master',
-                                'Tool completed successfully', 'Results saved to file',
-                                'IMPORTANT: FOR VISUALIZE_DATA', 'Tool limit reached',
-                                'table_name\n', 'column_name,data_type',
-                                'pg_statistic', 'pg_type', 'pg_class'  # PostgreSQL 系统表
-                            ]
-                            
-                            should_skip = any(pattern in text for pattern in skip_patterns)
-                            
-                            # 只记录日志，不添加到 answer_text
-                            if '\n' in text and len(text) > 50:
-                                logger.debug(f"📝 [{idx}] 文本内容(前200字符): {text[:200]}")
-                            
-                            # 完全跳过所有中间过程文本，不添加任何内容到 answer_text
-                except Exception as e:
-                    logger.debug(f"[{idx}] model_dump() 解析失败: {e}")
+            columns: List[str] = []
+            values: List[List[Any]] = []
+            stats: Dict[str, Any] = {}
+            async for kind, value in self._iter_agent_results(question, context):
+                if kind == "sql" and value != sql:
+                    sql = value
+                    yield "sql", {"sql": sql}
+                elif kind == "dataframe":
+                    data_df = value
+                    yield "status", {"stage": "querying"}
+                    bounded, _, _ = self._bound_dataframe(data_df, {})
+                    columns = [str(col) for col in bounded.columns]
+                    values = [[] for _ in columns]
+                    for offset in range(0, len(bounded), batch_size):
+                        batch = self._to_columnar(bounded.iloc[offset:offset + batch_size])
+                        for col_values, batch_values in zip(values, batch):
+                            col_values.extend(batch_values)
+                        yield "rows", {"columns": columns, "offset": offset, "values": batch}
+                elif kind == "stats":
+                    stats = value
             
             if data_df is None or data_df.empty:
-                return {
-                    "answer_text": answer_text or "未找到符合条件的数据",
-                    "sql": sql,
-                    "chart_type": "empty",
-                    "data": {"columns": [], "rows": []}
-                }
-            
-            # === 4. 转换数据格式 ===
-            columns = data_df.columns.tolist()
-            rows = data_df.to_dict('records')
-            
-            # 处理特殊类型 (包括 Decimal, datetime, NaN 等)
-            from decimal import Decimal
-            for row in rows:
-                for key, value in row.items():
-                    if pd.isna(value):
-                        row[key] = None
-                    elif isinstance(value, Decimal):
-                        row[key] = float(value)  # Decimal 转 float
-                    elif hasattr(value, 'isoformat'):
-                        row[key] = str(value)  # datetime 转字符串
-            
-            # === 5. 推荐图表 ===
-            chart_type = self._recommend_chart_type(question, data_df)
-            
-            # === 6. 生成回答 ===
-            if not answer_text:
-                answer_text = self._generate_answer_text(question, data_df, chart_type)
-            
-            response = {
-                "answer_text": answer_text.strip(),
+                response = self._empty_response(sql)
+                yield "chart", {"chart_type": response["chart_type"]}
+                yield "answer", {"answer_text": response["answer_text"]}
+                yield "done", {"row_count": 0, "total_count": 0, "truncated": False, "cached": False}
+                return
+            
+            # === 3. 图表推荐与回答 (总行数与截断标记来自结束时的查询统计) ===
+            data_df, total_count, truncated = self._bound_dataframe(data_df, stats)
+            chart_type = self._recommend_chart_type(question, data_df, stats.get("profile"))
+            yield "chart", {"chart_type": chart_type}
+            answer_text = self._generate_answer_text(
+                question, data_df, chart_type, total_count, truncated
+            ).strip()
+            yield "answer", {"answer_text": answer_text}
+            
+            # === 4. 写入缓存（与非流式接口共享）===
+            await self._write_cache(cache_key, {
+                "answer_text": answer_text,
                 "sql": sql,
                 "chart_type": chart_type,
-                "data": {"columns": columns, "rows": rows}
+                "data": {
+                    "columns": columns,
+                    "values": values,
+                    "row_count": len(data_df),
+                    "total_count": total_count,
+                    "truncated": truncated
+                }
+            })
+            
+            logger.info(f"✅ (stream) 查询成功,返回 {len(data_df)} 条数据 (共 {total_count} 条)")
+            yield "done", {
+                "row_count": len(data_df),
+                "total_count": total_count,
+                "truncated": truncated,
+                "cached": False
             }
             
-            # === 7. Write-Through: 写入缓存 ===
-            try:
-                # 使用自定义序列化器处理 Decimal 和 datetime
-                cache_value = json.dumps(response, ensure_ascii=False, default=json_serializer)
-                await self.redis_client.setex(
-                    cache_key,
-                    300,  # 5分钟过期
-                    cache_value
-                )
-                logger.info(f"💾 缓存已写入 (TTL: 300s): {cache_key[:50]}...")
-            except Exception as e:
-                logger.warning(f"⚠️  写入缓存失败: {e}")
-            
-            logger.info(f"✅ 查询成功,返回 {len(rows)} 条数据")
-            return response
-            
         except Exception as e:
-            logger.error(f"❌ 查询失败: {e}")
+            logger.error(f"❌ (stream) 查询失败: {e}")
             import traceback
             traceback.print_exc()
-            return {
-                "answer_text": f"查询失败: {str(e)}",
-                "sql": "",
-                "chart_type": "error",
-                "data": {"columns": [], "rows": []}
-            }
+            yield "error", {"message": f"查询失败: {str(e)}"}
     
-    def _recommend_chart_type(self, question: str, df: pd.DataFrame) -> str:
+
+    def _recommend_chart_type(
+        self, question: str, df: pd.DataFrame, profile: Optional[Dict[str, Any]] = None
+    ) -> str:
         """
-        智能推荐图表类型
+        智能推荐图表类型 (规则见 chart_recommender.CHART_RULES)
         
-        优先级:
-        1. 基于数据结构的启发式判断 (Heuristics)
-        2. 基于问题关键词的语义判断
+        优先使用执行器读取结果时累计的列类型与统计量;
+        统计量缺失或与结果行数不一致时 (如结果来自组件回退),才从 DataFrame 计算
         """
+        from app.services.chart_recommender import profile_frame, recommend_chart
+        
         if df.empty:
             return "table"
-        
-        row_count = len(df)
-        col_count = len(df.columns)
-        columns = df.columns.tolist()
-        
-        # === 启发式 1: 趋势图 (Line Chart) ===
-        # 条件: 列名包含时间关键词, 且数据行数 > 1
-        time_keywords = ['date', 'time', 'day', 'month', 'year', '日期', '时间', '月份']
-        has_time_col = any(
-            any(kw in str(col).lower() for kw in time_keywords) 
-            for col in columns
-        )
-        
-        if has_time_col and row_count > 1:
-            return "line"
-        
-        # === 启发式 2: 柱状图 (Bar Chart) ===
-        # 条件: 2列数据, 0 < 行数 <= 15, 第1列字符串/第2列数字
-        if col_count == 2 and 0 < row_count <= 15:
-            try:
-                first_col = df.iloc[:, 0]
-                second_col = df.iloc[:, 1]
-                
-                # 判断第1列是否为字符串/日期类型
-                is_first_categorical = pd.api.types.is_string_dtype(first_col) or \
-                                      pd.api.types.is_categorical_dtype(first_col) or \
-                                      pd.api.types.is_datetime64_any_dtype(first_col)
-                
-                # 判断第2列是否为数值类型
-                is_second_numeric = pd.api.types.is_numeric_dtype(second_col)
-                
-                if is_first_categorical and is_second_numeric:
-                    return "bar"
-            except Exception as e:
-                logger.debug(f"⚠️  柱状图启发式判断失败: {e}")
-        
-        # === 启发式 3: 饼图 (Pie Chart) ===
-        # 条件: 2列数据, 行数 <= 10, 问题包含占比关键词
-        question_lower = question.lower()
-        ratio_keywords = ['占比', '比例', '分布', '份额', 'percentage', 'ratio']
-        if any(kw in question_lower for kw in ratio_keywords) and col_count == 2 and row_count <= 10:
-            return "pie"
-        
-        # === 语义判断: 基于问题关键词 ===
-        # 趋势/变化 -> 折线图
-        trend_keywords = ['趋势', '变化', '增长', 'trend', 'change']
-        if any(kw in question_lower for kw in trend_keywords):
-            return "line"
-        
-        # 排名/对比/Top -> 柱状图
-        compare_keywords = ['排名', '对比', 'top', '前几', '最多', '最少', '最高', '最低']
-        if any(kw in question_lower for kw in compare_keywords):
-            return "bar"
-        
-        # === 默认返回表格 ===
-        return "table"
+        with span("vanna.recommend_chart", rows=len(df), profiled=bool(profile)) as current:
+            if not profile or profile.get("row_count") != len(df):
+                profile = profile_frame(df)
+            chart_type = recommend_chart(question, profile)
+            if current is not None:
+                current.set_attribute("chart_type", chart_type)
+        return chart_type
     
-    def _generate_answer_text(self, question: str, df: pd.DataFrame, chart_type: str) -> str:
+    def _generate_answer_text(
+        self,
+        question: str,
+        df: pd.DataFrame,
+        chart_type: str,
+        total_count: Optional[int] = None,
+        truncated: bool = False
+    ) -> str:
         """生成自然语言回答"""
         row_count = len(df)
-        answer = f"根据您的问题「{question}」,查询到 {row_count} 条数据。"
+        if truncated:
+            total_text = f"共 {total_count} 条" if total_count is not None else "数据量较大"
+            answer = f"根据您的问题「{question}」,查询结果{total_text},仅展示前 {row_count} 条。"
+        else:
+            answer = f"根据您的问题「{question}」,查询到 {row_count} 条数据。"
         
         if chart_type == "line":
             answer += "数据呈现为时间趋势,建议查看折线图。"
+        elif chart_type == "dual_axis_line":
+            answer += "数据呈现为多个指标的时间趋势,建议查看双轴折线图。"
         elif chart_type == "pie":
             answer += "数据呈现为占比分布,建议查看饼图。"
         elif chart_type == "bar":
             answer += "数据呈现为对比排名,建议查看柱状图。"
+        elif chart_type == "grouped_bar":
+            answer += "数据包含多个指标的对比,建议查看分组柱状图。"
+        elif chart_type == "stacked_bar":
+            answer += "数据呈现为构成对比,建议查看堆叠柱状图。"
         else:
             answer += "详细数据请查看表格。"
         
@@ -659,5 +889,5 @@ LIMIT 5;
             await self.redis_client.close()
 
 
-# 创建全局单例实例
+# 创建全局单例实例 (轻量,不建立连接)
 vanna_service = VannaService()
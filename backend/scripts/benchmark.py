@@ -0,0 +1,458 @@
+"""
+接口基准测试
+
+1. seed:    按固定规模重建数据库并生成数据 (scripts/synth_data.py),相同 --scale/--seed 得到相同数据集
+2. run:     逐个场景以固定并发 (闭环) 请求接口,记录 p50/p95/p99 延迟、吞吐与每请求数据库查询数,写入 JSON
+3. compare: 对比基线与本次结果,超过阈值的退化以非零退出码返回 (可作为 CI 门禁)
+
+运行方式 (Chat 场景配合 scripts/mock_llm_server.py 完全离线)：
+    python -m scripts.benchmark seed --scale 1
+    python -m scripts.mock_llm_server --latency-ms 0 &
+    LLM_BACKEND=openai LLM_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app &
+    python -m scripts.benchmark run --concurrency 16 --requests 300 --output benchmarks/baseline.json
+    python -m scripts.benchmark compare benchmarks/baseline.json benchmarks/current.json --threshold 0.15
+
+仓库不附带基线 (延迟取决于机器): 在目标机器上用主分支代码按上面的步骤 run 一次得到 benchmarks/baseline.json,
+需要作为 CI 门禁时再提交该文件;之后每次改动 run 到 benchmarks/current.json 再 compare
+
+每请求查询数优先取响应头 X-DB-Queries (DEBUG 模式),没有时用 pg_stat_statements 的调用次数增量估算
+"""
+import sys
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+
+from app.db.query_stats import QUERY_COUNT_HEADER
+from scripts.load_test import DEFAULT_TRANSCRIPTS, _latency_summary
+
+
+
+# 越大越差的指标;吞吐越小越差
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+LOWER_IS_WORSE = ("throughput_rps",)
+
+
+@dataclass
+class Scenario:
+    """一个压测场景: 请求方法、路径与按序号生成的请求体"""
+    name: str
+    method: str
+    path: str
+    body: Optional[Callable[[int, Dict[str, Any]], Any]] = None
+
+
+def _inbound(i: int, fx: Dict[str, Any]) -> Dict[str, Any]:
+    product = fx["products"][i % len(fx["products"])]
+    return {
+        "supplier_id": fx["suppliers"][i % len(fx["suppliers"])]["id"],
+        "warehouse_id": fx["warehouses"][0]["id"],
+        "salesman_id": fx["salesmen"][i % len(fx["salesmen"])]["id"],
+        "items": [{"product_id": product["id"], "quantity": 10, "price": product["cost_price"]}],
+        "remark": "benchmark",
+    }
+
+
+def _outbound(i: int, fx: Dict[str, Any]) -> Dict[str, Any]:
+    # 与 _inbound 使用相同的仓库与商品序列,入库场景先执行,保证库存充足
+    product = fx["products"][i % len(fx["products"])]
+    return {
+        "customer_id": fx["customers"][i % len(fx["customers"])]["id"],
+        "warehouse_id": fx["warehouses"][0]["id"],
+        "salesman_id": fx["salesmen"][i % len(fx["salesmen"])]["id"],
+        "items": [{"product_id": product["id"], "quantity": 1, "price": round(product["cost_price"] * 1.3, 2)}],
+        "remark": "benchmark",
+    }
+
+
+_REPORT_REGIONS = ["华东", "华北", "华南", "华中", "西南"]
+
+
+def _report_query(i: int, fx: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "dimensions": ["company_name", "category"],
+        "metrics": ["sales_amount", "gross_profit_rate"],
+        "filters": {"region": _REPORT_REGIONS[i % len(_REPORT_REGIONS)]},
+        "order_by": "-sales_amount",
+        "limit": 100,
+    }
+
+
+def _chat(i: int, fx: Dict[str, Any]) -> Dict[str, Any]:
+    question = fx["questions"][i % len(fx["questions"])]
+    if fx["rng"].random() < fx["chat_miss_ratio"]:
+        question = f"{question} #{i}"  # 唯一问题,强制缓存未命中
+    return {"question": question}
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("dashboard_overview", "GET", "/api/v1/dashboard/overview"),
+    Scenario("dashboard_kpi", "GET", "/api/v1/dashboard/kpi"),
+    Scenario("products", "GET", "/api/v1/business/products"),
+    Scenario("warehouses", "GET", "/api/v1/business/warehouses"),
+    Scenario("partners", "GET", "/api/v1/business/partners"),
+    Scenario("salesmen", "GET", "/api/v1/business/salesmen"),
+    Scenario("inbound", "POST", "/api/v1/business/inbound", _inbound),
+    Scenario("outbound", "POST", "/api/v1/business/outbound", _outbound),
+    Scenario("report_query", "POST", "/api/v1/report/query", _report_query),
+    Scenario("chat", "POST", "/api/v1/chat/", _chat),
+]
+
+
+# ==================== 数据库统计 ====================
+
+def _db_query(db_url: Optional[str], sql: str):
+    """执行一条只读统计查询,失败 (未配置 / 扩展未安装) 时返回 None"""
+    if not db_url:
+        return None
+    try:
+        import psycopg2
+
+        conn = psycopg2.connect(db_url)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+                return cursor.fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        return None
+
+
+def statement_calls(db_url: Optional[str]) -> Optional[int]:
+    """pg_stat_statements 中当前数据库的累计语句执行次数"""
+    row = _db_query(db_url, """
+        SELECT SUM(calls) FROM pg_stat_statements
+        WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    """)
+    return int(row[0]) if row and row[0] is not None else None
+
+
+def dataset_fingerprint(db_url: Optional[str]) -> Optional[Dict[str, int]]:
+    """数据集规模指纹 (比较两次结果前确认使用的是同一数据集)"""
+    row = _db_query(db_url, """
+        SELECT (SELECT COUNT(*) FROM biz_order), (SELECT COUNT(*) FROM biz_order_item),
+               (SELECT COUNT(*) FROM base_product), (SELECT COUNT(*) FROM base_partner)
+    """)
+    if not row:
+        return None
+    return dict(zip(("orders", "order_items", "products", "partners"), (int(v) for v in row)))
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# ==================== 压测 ====================
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> Dict[str, str]:
+    resp = await client.post("/api/v1/auth/login", json={"username": username, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+async def load_fixtures(client: httpx.AsyncClient, headers: Dict[str, str], args) -> Dict[str, Any]:
+    """读取主数据,用于构造入库 / 出库请求"""
+    from app.services.llm_transcripts import load_transcripts
+
+    async def get(path: str, **params):
+        resp = await client.get(path, headers=headers, params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    return {
+        "products": await get("/api/v1/business/products"),
+        "warehouses": await get("/api/v1/business/warehouses"),
+        "customers": await get("/api/v1/business/partners", type="customer"),
+        "suppliers": await get("/api/v1/business/partners", type="supplier"),
+        "salesmen": await get("/api/v1/business/salesmen"),
+        "questions": list(load_transcripts(args.transcripts)),
+        "chat_miss_ratio": args.chat_miss_ratio,
+        "rng": random.Random(args.seed),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    headers: Dict[str, str],
+    fixtures: Dict[str, Any],
+    concurrency: int,
+    requests: int,
+    warmup: int,
+    db_url: Optional[str] = None,
+) -> Dict[str, Any]:
+    """以固定并发 (每个 worker 收到响应后立即发下一个请求) 执行一个场景"""
+    latencies: List[float] = []
+    header_counts: List[int] = []
+    statuses: Counter = Counter()
+    sequence = iter(range(warmup, warmup + requests))
+
+    async def send(i: int, record: bool):
+        body = scenario.body(i, fixtures) if scenario.body else None
+        started = time.perf_counter()
+        try:
+            resp = await client.request(scenario.method, scenario.path, json=body, headers=headers)
+        except httpx.HTTPError as e:
+            if record:
+                statuses[type(e).__name__] += 1
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        if not record:
+            return
+        statuses[resp.status_code] += 1
+        if resp.is_success:
+            latencies.append(elapsed)
+            if QUERY_COUNT_HEADER in resp.headers:
+                header_counts.append(int(resp.headers[QUERY_COUNT_HEADER]))
+
+    async def worker():
+        for i in sequence:
+            await send(i, record=True)
+
+    for i in range(warmup):
+        await send(i, record=False)
+
+    calls_before = statement_calls(db_url)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    calls_after = statement_calls(db_url)
+
+    queries = None
+    if header_counts:
+        queries = sum(header_counts) / len(header_counts)
+    elif calls_before is not None and calls_after is not None and requests:
+        # 扣除两次统计查询自身 (估算值,包含同时段后台任务的查询)
+        queries = max(0, calls_after - calls_before - 1) / requests
+
+    summary = {k: None if v is None else round(v, 2) for k, v in _latency_summary(latencies).items()}
+    errors = requests - len(latencies)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"],
+        "max_ms": summary["max_ms"],
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "queries_per_request": None if queries is None else round(queries, 2),
+        "queries_source": "header" if header_counts else ("pg_stat_statements" if queries is not None else None),
+    }
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    selected = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results: Dict[str, Any] = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        headers = await login(client, args.username, args.password)
+        fixtures = await load_fixtures(client, headers, args)
+        for scenario in selected:
+            print(f"▶ {scenario.name} ({args.concurrency} 并发 × {args.requests} 请求)...")
+            result = await run_scenario(
+                client, scenario, headers, fixtures,
+                args.concurrency, args.requests, args.warmup, args.db_url,
+            )
+            results[scenario.name] = result
+            print(f"  p50 {result['p50_ms']}ms | p95 {result['p95_ms']}ms | p99 {result['p99_ms']}ms | "
+                  f"{result['throughput_rps']} req/s | 查询/请求 {result['queries_per_request']} | "
+                  f"错误 {result['errors']}")
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "chat_miss_ratio": args.chat_miss_ratio,
+            "dataset": dataset_fingerprint(args.db_url),
+        },
+        "scenarios": results,
+    }
+
+
+# ==================== 对比 ====================
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.1,
+    min_delta_ms: float = 2.0,
+) -> List[Dict[str, Any]]:
+    """
+    找出相对基线退化超过阈值的指标
+
+    Args:
+        threshold: 相对变化阈值 (0.1 = 10%)
+        min_delta_ms: 延迟的绝对变化小于该值时不计为退化 (过滤毫秒级抖动)
+
+    Returns:
+        [{"scenario", "metric", "baseline", "current", "change"}, ...]
+    """
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        cur = current.get("scenarios", {}).get(name)
+        if cur is None:
+            continue
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            before, after = base.get(metric), cur.get(metric)
+            if before is None or after is None:
+                continue
+            if metric in HIGHER_IS_WORSE:
+                worse = after - before
+                if metric.endswith("_ms") and worse < min_delta_ms:
+                    continue
+            else:
+                worse = before - after
+            if worse <= 0:
+                continue
+            change = worse / before if before else float("inf")
+            if change > threshold:
+                regressions.append({
+                    "scenario": name, "metric": metric,
+                    "baseline": before, "current": after, "change": round(change, 4),
+                })
+        if cur.get("error_rate", 0) > base.get("error_rate", 0):
+            regressions.append({
+                "scenario": name, "metric": "error_rate",
+                "baseline": base.get("error_rate", 0), "current": cur["error_rate"], "change": None,
+            })
+    return regressions
+
+
+def _print_comparison(baseline: Dict[str, Any], current: Dict[str, Any], regressions: List[Dict[str, Any]]):
+    flagged = {(r["scenario"], r["metric"]) for r in regressions}
+    metrics = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "queries_per_request")
+    print(f"{'场景':<20}" + "".join(f"{m:>26}" for m in metrics))
+    for name, base in baseline.get("scenarios", {}).items():
+        cur = current.get("scenarios", {}).get(name)
+        if cur is None:
+            print(f"{name:<20}  (本次未执行)")
+            continue
+        cells = []
+        for metric in metrics:
+            mark = " ❌" if (name, metric) in flagged else "  "
+            cells.append(f"{base.get(metric)!s:>10} → {cur.get(metric)!s:<10}{mark}")
+        print(f"{name:<20}" + "".join(f"{cell:>26}" for cell in cells))
+    if baseline.get("meta", {}).get("dataset") != current.get("meta", {}).get("dataset"):
+        print("⚠️  两次结果的数据集不同,对比结果仅供参考")
+
+
+# ==================== 命令行 ====================
+
+def cmd_seed(args):
+    """重建数据库并按规模生成数据集"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.config import settings
+    from scripts.init_db import create_ai_views, create_database_tables, create_test_users
+    from scripts.synth_data import bulk_load
+
+    engine = create_engine(settings.database_url_sync, echo=False)
+    create_database_tables(engine)
+    create_ai_views(engine)
+    with sessionmaker(bind=engine)() as session:
+        create_test_users(session)
+    bulk_load(engine, settings.database_url_sync, args.scale, workers=args.workers, seed=args.seed)
+
+
+def cmd_run(args):
+    report = asyncio.run(run_benchmark(args))
+    report["meta"]["scale"] = args.scale
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 结果已写入 {args.output}")
+
+
+def cmd_compare(args) -> int:
+    if not os.path.exists(args.baseline):
+        print(f"❌ 基线文件不存在: {args.baseline} (先用主分支代码 run --output {args.baseline} 生成)")
+        return 2
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare_reports(baseline, current, args.threshold, args.min_delta_ms)
+    _print_comparison(baseline, current, regressions)
+    if regressions:
+        print(f"\n❌ {len(regressions)} 项指标退化超过 {args.threshold:.0%}:")
+        for r in regressions:
+            change = "" if r["change"] is None else f" (+{r['change']:.0%})"
+            print(f"  - {r['scenario']}.{r['metric']}: {r['baseline']} → {r['current']}{change}")
+        return 1
+    print("\n✅ 未发现超过阈值的退化")
+    return 0
+
+
+def main():
+    from scripts.synth_data import psycopg2_dsn
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(description="接口基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed = sub.add_parser("seed", help="重建数据库并生成固定规模的数据集 (会清空现有数据)")
+    seed.add_argument("--scale", type=float, default=1)
+    seed.add_argument("--workers", type=int, default=0)
+    seed.add_argument("--seed", type=int, default=42)
+
+    run = sub.add_parser("run", help="执行压测并写入 JSON 结果")
+    run.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run.add_argument("--scenarios", nargs="*", help=f"只执行指定场景: {', '.join(s.name for s in SCENARIOS)}")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--requests", type=int, default=200, help="每个场景的计时请求数")
+    run.add_argument("--warmup", type=int, default=5, help="每个场景不计时的预热请求数")
+    run.add_argument("--username", default="admin")
+    run.add_argument("--password", default="admin123")
+    run.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS, help="Chat 场景的问题来源")
+    run.add_argument("--chat-miss-ratio", type=float, default=1.0, help="Chat 场景强制缓存未命中的比例")
+    run.add_argument("--db-url", default=psycopg2_dsn(settings.database_url_sync),
+                     help="读取 pg_stat_statements 与数据集指纹的连接串")
+    run.add_argument("--scale", type=float, help="数据集规模 (仅记录到结果中)")
+    run.add_argument("--timeout", type=float, default=120)
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--output", default=os.path.join("benchmarks", "current.json"))
+
+    compare = sub.add_parser("compare", help="对比基线与本次结果")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1, help="相对退化阈值 (0.1 = 10%%)")
+    compare.add_argument("--min-delta-ms", type=float, default=2.0, help="忽略小于该值的延迟变化")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        cmd_seed(args)
+    elif args.command == "run":
+        cmd_run(args)
+    else:
+        sys.exit(cmd_compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+报表导出 worker
+
+EXPORT_JOB_MODE=redis 时 API 只把导出任务推入 Redis 队列,由本进程消费执行,
+长时间运行的导出不占用 API worker
+
+运行方式：
+    EXPORT_JOB_MODE=redis python -m scripts.export_worker --concurrency 4
+"""
+import sys
+import os
+import asyncio
+import argparse
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.export_jobs import export_jobs
+
+
+async def prune_loop():
+    """定期清理过期产物"""
+    while True:
+        removed, _ = await asyncio.to_thread(export_jobs.prune_artifacts)
+        if removed:
+            logger.info(f"🧹 清理导出产物 {removed} 个文件")
+        await asyncio.sleep(max(60, settings.export_job_ttl_seconds / 4))
+
+
+async def main(concurrency: int):
+    logger.info(f"📦 导出 worker 启动: 并发 {concurrency}, 产物目录 {export_jobs.directory}")
+    pruner = asyncio.create_task(prune_loop())
+    try:
+        await export_jobs.work(concurrency=concurrency)
+    finally:
+        pruner.cancel()
+        await export_jobs.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="报表导出 worker")
+    parser.add_argument("--concurrency", type=int, default=settings.export_job_concurrency, help="同时执行的导出任务数")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
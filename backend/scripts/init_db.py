@@ -6,10 +6,13 @@
 2. 创建 AI 分析视图
 3. 填充基础维度数据（分公司、部门、人员、仓库、往来单位、商品）
 4. 生成核心业务数据（销售订单、库存、财务流水）
+5. 创建销售汇总物化视图（AI 聚合查询改写使用）
 
 使用方法：
     python -m scripts.init_db
+    python -m scripts.init_db --scale 30 --workers 8   # 约 1000 万条订单明细 (见 scripts/synth_data.py)
 """
+import argparse
 import os
 import sys
 import random
@@ -152,11 +155,24 @@ def _create_views_with_sqlalchemy(engine, views_sql_path):
     print("✅ 视图创建完成")
 
 
-def populate_dimensions(session):
-    """步骤3: 填充基础维度数据"""
-    print_step(3, "填充基础维度数据")
-    
-    # 3.0 创建测试用户（用于登录）
+def create_rollups(engine):
+    """步骤5: 创建销售汇总物化视图 (数据导入后创建,见 app/services/aggregate_navigator.py)"""
+    from app.services.aggregate_navigator import ROLLUPS, create_statements
+
+    print_step(5, "创建销售汇总物化视图")
+    with engine.begin() as conn:
+        for statement in create_statements():
+            conn.execute(text(statement))
+        for rollup in ROLLUPS:
+            # 统计行数,供聚合导航选择最小的汇总表
+            conn.execute(text(f"ANALYZE {rollup.name}"))
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM {rollup.name}")).scalar()
+            print(f"  ✓ {rollup.name}: {rows:,} 行")
+    print("✅ 汇总物化视图创建完成！")
+
+
+def create_test_users(session):
+    """创建测试用户（用于登录）"""
     print("\n👤 创建测试用户...")
     test_users = [
         SysUser(
@@ -178,6 +194,14 @@ def populate_dimensions(session):
     print(f"  ✓ 创建了 {len(test_users)} 个测试用户")
     print("    - admin/admin123 (管理员)")
     print("    - user/user123 (普通用户)")
+
+
+def populate_dimensions(session):
+    """步骤3: 填充基础维度数据"""
+    print_step(3, "填充基础维度数据")
+    
+    # 3.0 创建测试用户（用于登录）
+    create_test_users(session)
     
     # 3.1 创建分公司和部门
     print("\n🏢 创建分公司和部门...")
@@ -454,7 +478,7 @@ def generate_finance_records(session, data_dict):
 
 def print_summary(session):
     """打印数据统计摘要"""
-    print_step(5, "数据统计摘要")
+    print_step(6, "数据统计摘要")
     
     stats = {
         "测试用户": session.query(SysUser).count(),
@@ -502,8 +526,20 @@ def print_summary(session):
     print(f"  view_bi_finance_monitor: {finance_count} 条记录")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="进销存 BI 系统 - 数据库初始化与数据填充")
+    parser.add_argument(
+        "--scale", type=float, default=0,
+        help="按规模生成合成数据并通过 COPY 批量导入 (每单位约 10 万订单);不指定时生成少量演示数据",
+    )
+    parser.add_argument("--workers", type=int, default=0, help="--scale 模式的并行导入进程数 (默认 CPU 核数)")
+    parser.add_argument("--seed", type=int, default=42, help="--scale 模式的随机种子")
+    return parser.parse_args()
+
+
 def main():
     """主函数"""
+    args = parse_args()
     print("=" * 70)
     print("进销存 BI 系统 - 数据库初始化与数据填充")
     print("=" * 70)
@@ -520,15 +556,26 @@ def main():
         # 步骤2: 创建 AI 视图
         create_ai_views(engine)
         
-        # 步骤3: 填充基础维度
-        data_dict = populate_dimensions(session)
+        if args.scale > 0:
+            # 步骤3/4: 按规模生成维度与业务数据,COPY 并行导入
+            from scripts.synth_data import bulk_load
+
+            print_step(3, f"按规模 {args.scale} 生成并批量导入数据")
+            create_test_users(session)
+            bulk_load(engine, settings.database_url_sync, args.scale, workers=args.workers, seed=args.seed)
+        else:
+            # 步骤3: 填充基础维度
+            data_dict = populate_dimensions(session)
+            
+            # 步骤4: 生成核心业务数据
+            generate_sales_orders(session, data_dict)
+            generate_inventory(session, data_dict)
+            generate_finance_records(session, data_dict)
         
-        # 步骤4: 生成核心业务数据
-        generate_sales_orders(session, data_dict)
-        generate_inventory(session, data_dict)
-        generate_finance_records(session, data_dict)
+        # 步骤5: 创建汇总物化视图
+        create_rollups(engine)
         
-        # 步骤5: 打印统计摘要
+        # 步骤6: 打印统计摘要
         print_summary(session)
         
         print("\n" + "=" * 70)
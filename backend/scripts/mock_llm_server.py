@@ -0,0 +1,153 @@
+"""
+本地 OpenAI 兼容 LLM 模拟服务
+
+用途：离线测量 Chat 接口的延迟与吞吐 (不访问外网、不消耗 token)
+按问题回放录制的问答记录 (见 app/services/llm_transcripts.py),并模拟模型延迟
+
+运行方式：
+    python -m scripts.mock_llm_server --port 8001 --latency-ms 800 --jitter-ms 200
+
+后端接入：
+    LLM_BACKEND=openai LLM_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app
+
+录制真实问答 (之后可用 --transcripts 回放)：
+    LLM_RECORD_PATH=transcripts.jsonl uvicorn app.main:app
+"""
+import sys
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+from typing import Any, Dict, List
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from loguru import logger
+
+from app.services.agent_memory import embed_text
+from app.services.llm_transcripts import extract_question, load_transcripts
+from app.services.prompt_builder import estimate_tokens
+
+
+DEFAULT_TRANSCRIPTS = os.path.join(os.path.dirname(__file__), "llm_transcripts.jsonl")
+
+
+class TranscriptReplayer:
+    """按问题匹配录制记录: 完全一致优先,否则取向量最相近的一条 (结果确定)"""
+
+    def __init__(self, transcripts: Dict[str, List[Dict[str, Any]]], latency_ms: float, jitter_ms: float):
+        if not transcripts:
+            raise ValueError("问答记录为空")
+        self.transcripts = transcripts
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._questions = list(transcripts)
+        self._vectors = [embed_text(q) for q in self._questions]
+
+    def match(self, question: str) -> List[Dict[str, Any]]:
+        if question in self.transcripts:
+            return self.transcripts[question]
+        query = embed_text(question)
+        best = max(range(len(self._questions)), key=lambda i: float(self._vectors[i] @ query))
+        return self.transcripts[self._questions[best]]
+
+    def delay(self, question: str, turn: int) -> float:
+        """模拟延迟 (秒);抖动由问题与轮次决定,与并发顺序无关"""
+        if not self.jitter_ms:
+            return self.latency_ms / 1000
+        digest = hashlib.md5(f"{question}\x1f{turn}".encode("utf-8")).digest()
+        fraction = int.from_bytes(digest[:4], "little") / 0xFFFFFFFF  # [0, 1]
+        return max(0.0, self.latency_ms + (fraction * 2 - 1) * self.jitter_ms) / 1000
+
+
+def _completion(model: str, message: Dict[str, Any], finish_reason: str, prompt_tokens: int) -> Dict[str, Any]:
+    completion_tokens = estimate_tokens(message.get("content") or "") + estimate_tokens(
+        json.dumps(message.get("tool_calls") or [], ensure_ascii=False)
+    )
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def create_app(replayer: TranscriptReplayer) -> FastAPI:
+    app = FastAPI(title="Mock LLM (OpenAI compatible)")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any]):
+        if body.get("stream"):
+            raise HTTPException(status_code=400, detail="mock server only supports stream=false")
+
+        messages = body.get("messages") or []
+        user_indexes = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+        if not user_indexes:
+            raise HTTPException(status_code=400, detail="no user message")
+
+        last_user = user_indexes[-1]
+        question = extract_question(messages[last_user].get("content") or "")
+        # 当前轮次 = 最后一条 user 消息之后已有的 assistant 消息数
+        turn_index = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant")
+
+        turns = replayer.match(question)
+        turn = turns[min(turn_index, len(turns) - 1)]
+        await asyncio.sleep(replayer.delay(question, turn_index))
+
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        model = body.get("model", "mock")
+
+        if turn.get("tool_calls") and turn_index < len(turns) - 1:
+            message = {
+                "role": "assistant",
+                "content": turn.get("content"),
+                "tool_calls": [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:16]}",
+                        "type": "function",
+                        "function": {"name": tc["name"], "arguments": json.dumps(tc["arguments"], ensure_ascii=False)},
+                    }
+                    for tc in turn["tool_calls"]
+                ],
+            }
+            return _completion(model, message, "tool_calls", prompt_tokens)
+
+        message = {"role": "assistant", "content": turn.get("content") or ""}
+        return _completion(model, message, "stop", prompt_tokens)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 LLM 模拟服务")
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS, help="问答记录文件 (JSONL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=800, help="每次调用的模拟延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="延迟抖动范围 (±)")
+    args = parser.parse_args()
+
+    transcripts = load_transcripts(args.transcripts)
+    replayer = TranscriptReplayer(transcripts, args.latency_ms, args.jitter_ms)
+    logger.info(f"🤖 Mock LLM: {len(transcripts)} 条问答记录, 延迟 {args.latency_ms}±{args.jitter_ms}ms")
+    uvicorn.run(create_app(replayer), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
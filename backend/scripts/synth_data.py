@@ -0,0 +1,488 @@
+"""
+大规模合成数据生成与批量导入 (init_db --scale N)
+
+逐个 add ORM 对象 + flush 取 ID 的方式只适合几百个订单,生成生产量级数据需要数小时。这里:
+1. 维度与事实数据都用 NumPy 按批向量化生成,ID 预先分配 (不需要回查数据库)
+2. 通过 COPY FROM STDIN 导入;订单与明细按日期区间切分,由多个进程并行生成并导入
+3. 导入前删除事实表的二级索引与外键,导入后重建,最后校正自增序列并 ANALYZE
+
+规模: 每 1 个单位约 SCALE_UNIT_ORDERS 个订单 (每单 2~5 条明细,平均 3.5 条),
+--scale 30 约 300 万订单 / 1000 万条订单明细
+"""
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from faker import Faker
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+
+# 每个规模单位的订单数
+SCALE_UNIT_ORDERS = 100_000
+# 订单覆盖的天数 (截止到今天)
+ORDER_DAYS = 365
+# 采购订单占比
+PURCHASE_RATIO = 0.15
+# 每批生成 / COPY 的订单数 (控制单个进程的内存占用)
+ORDER_BATCH_SIZE = 50_000
+
+FACT_TABLES = ("biz_order", "biz_order_item", "fact_finance", "inv_current_stock")
+
+CATEGORIES = {
+    "电子产品": ["笔记本电脑", "台式机", "显示器", "键盘", "鼠标", "耳机", "音箱", "摄像头", "路由器", "硬盘"],
+    "家居用品": ["办公椅", "办公桌", "书柜", "沙发", "茶几", "台灯", "挂钟", "地毯", "窗帘", "抱枕"],
+    "食品饮料": ["咖啡", "茶叶", "矿泉水", "零食", "水果", "饼干", "糖果", "巧克力", "果汁", "牛奶"],
+}
+REGIONS = ["华东", "华北", "华南", "华中", "西南"]
+UNITS = ["件", "台", "个", "盒", "瓶"]
+EXPENSE_CATEGORIES = ["差旅费", "房租", "招待费", "办公费", "水电费", "通讯费"]
+
+
+def plan_for(scale: float) -> Dict[str, int]:
+    """按规模计算各表的行数 (维度表按规模线性增长,保持基数与事实表的比例)"""
+    scale = max(scale, 0.01)
+    return {
+        "companies": 3 + int(scale // 5),
+        "employees": 20 + int(20 * scale),
+        "warehouses": 3 + int(scale // 5),
+        "customers": max(20, int(200 * scale)),
+        "suppliers": max(10, int(50 * scale)),
+        "product_variants": max(1, int(scale)),
+        "orders": int(SCALE_UNIT_ORDERS * scale),
+        "receivables": max(50, int(500 * scale)),
+        "payables": max(20, int(200 * scale)),
+        "expenses": max(100, int(1000 * scale)),
+    }
+
+
+def psycopg2_dsn(database_url: str) -> str:
+    """SQLAlchemy URL (postgresql+psycopg2://...) → libpq 连接串"""
+    return make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def copy_frame(cursor, table: str, frame: pd.DataFrame) -> int:
+    """DataFrame 以 CSV 编码后 COPY 导入 (空值写为未加引号的空串,即 NULL)"""
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False, float_format="%.2f")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(frame)
+
+
+def _timestamps(rng: np.random.Generator, days: np.ndarray) -> np.ndarray:
+    """日期 + 工作时间内的随机时刻"""
+    seconds = rng.integers(8 * 3600, 20 * 3600, size=len(days))
+    return days.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+
+
+def _pool(factory, size: int) -> np.ndarray:
+    """Faker 只生成一个小的取值池,再按需向量化抽样"""
+    return np.array([factory() for _ in range(size)], dtype=object)
+
+
+def generate_dimensions(plan: Dict[str, int], seed: int) -> Dict[str, pd.DataFrame]:
+    """生成维度表 (ID 从 1 开始连续分配)"""
+    rng = np.random.default_rng([seed, 0])
+    fake = Faker("zh_CN")
+    fake.seed_instance(seed)
+    names = _pool(fake.name, 500)
+    companies = _pool(fake.company, 500)
+    now = np.datetime64(datetime.now().replace(microsecond=0), "s")
+
+    company_names = ["北京总公司", "上海分公司", "广州分公司"] + [
+        f"第{i}分公司" for i in range(4, plan["companies"] + 1)
+    ]
+    departments = pd.DataFrame({
+        "name": np.tile(["销售一部", "销售二部"], len(company_names)),
+        "company_name": np.repeat(company_names, 2),
+    })
+    departments.insert(0, "id", np.arange(1, len(departments) + 1))
+    departments["created_at"] = now
+
+    n = plan["employees"]
+    employee_ids = np.arange(1, n + 1)
+    employees = pd.DataFrame({
+        "id": employee_ids,
+        "name": rng.choice(names, n),
+        "dept_id": rng.integers(1, len(departments) + 1, n),
+        "email": [f"emp{i}@example.com" for i in employee_ids],
+        "phone": rng.integers(13_000_000_000, 19_000_000_000, n).astype(str),
+        "is_active": True,
+        "created_at": now,
+    })
+
+    n = plan["warehouses"]
+    warehouses = pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "name": [f"{REGIONS[i % len(REGIONS)]}{i + 1}仓" for i in range(n)],
+        "location": rng.choice(REGIONS, n),
+        "manager": rng.choice(names, n),
+        "is_active": True,
+        "created_at": now,
+    })
+
+    n_customers, n_suppliers = plan["customers"], plan["suppliers"]
+    n = n_customers + n_suppliers
+    partner_ids = np.arange(1, n + 1)
+    is_supplier = partner_ids > n_customers
+    credit = np.where(is_supplier, rng.integers(50_000, 500_000, n), rng.integers(100_000, 1_000_000, n))
+    partners = pd.DataFrame({
+        "id": partner_ids,
+        "name": [
+            f"{company}{'供应商' if supplier else ''}{pid}"
+            for company, supplier, pid in zip(rng.choice(companies, n), is_supplier, partner_ids)
+        ],
+        "type": np.where(is_supplier, "SUPPLIER", "CUSTOMER"),
+        "region": rng.choice(REGIONS, n),
+        "contact_person": rng.choice(names, n),
+        "phone": rng.integers(13_000_000_000, 19_000_000_000, n).astype(str),
+        "credit_limit": credit,
+        "created_at": now,
+    })
+
+    base = [(category, name) for category, items in CATEGORIES.items() for name in items]
+    variants = plan["product_variants"]
+    n = len(base) * variants
+    min_stock = rng.integers(10, 51, n)
+    products = pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "name": [f"{name}{'' if v == 0 else f' V{v + 1}'}" for v in range(variants) for _, name in base],
+        "category": [category for _ in range(variants) for category, _ in base],
+        "specification": [f"{v + 1}号" for v in rng.integers(0, 5, n)],
+        "unit": rng.choice(UNITS, n),
+        "cost_price": rng.integers(50, 5001, n),
+        "min_stock": min_stock,
+        "is_active": True,
+        "created_at": now,
+    })
+
+    return {
+        "sys_department": departments,
+        "sys_employee": employees,
+        "base_warehouse": warehouses,
+        "base_partner": partners,
+        "base_product": products,
+    }
+
+
+def plan_orders(plan: Dict[str, int], seed: int, chunks: int):
+    """
+    预分配订单与明细 ID,并按日期区间切分为多个导入任务
+
+    Returns:
+        [(日期数组, 每天订单数, 每单明细数, 首个订单 ID, 首个明细 ID), ...]
+    """
+    rng = np.random.default_rng([seed, 1])
+    start = date.today() - timedelta(days=ORDER_DAYS - 1)
+    days = np.arange(np.datetime64(start), np.datetime64(date.today()) + 1)
+    # 周末订单量约为工作日的两倍
+    weights = np.where(pd.DatetimeIndex(days).weekday >= 5, 2.0, 1.0)
+    per_day = rng.multinomial(plan["orders"], weights / weights.sum())
+    items_per_order = rng.integers(2, 6, plan["orders"]).astype(np.int8)
+
+    tasks = []
+    order_id, item_id = 1, 1
+    for day_index in np.array_split(np.arange(len(days)), max(1, chunks)):
+        if len(day_index) == 0:
+            continue
+        counts = per_day[day_index]
+        n_orders = int(counts.sum())
+        first = order_id - 1
+        item_counts = items_per_order[first:first + n_orders]
+        tasks.append((days[day_index], counts, item_counts, order_id, item_id))
+        order_id += n_orders
+        item_id += int(item_counts.sum(dtype=np.int64))
+    return tasks
+
+
+def generate_orders(
+    rng: np.random.Generator,
+    order_dates: np.ndarray,
+    item_counts: np.ndarray,
+    first_order_id: int,
+    first_item_id: int,
+    dims: Dict[str, np.ndarray],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """向量化生成一批订单与明细 (金额由明细汇总得到)"""
+    n = len(order_dates)
+    order_ids = np.arange(first_order_id, first_order_id + n)
+    is_purchase = rng.random(n) < PURCHASE_RATIO
+    partner_ids = np.where(
+        is_purchase, rng.choice(dims["suppliers"], n), rng.choice(dims["customers"], n)
+    )
+
+    order_index = np.repeat(np.arange(n), item_counts)
+    m = len(order_index)
+    product_index = rng.integers(0, len(dims["cost_price"]), m)
+    cost = dims["cost_price"][product_index]
+    # 销售价 = 成本价 × (1.2 ~ 1.5);采购价 = 成本价 × (0.9 ~ 1.0)
+    markup = np.where(is_purchase[order_index], rng.uniform(0.9, 1.0, m), rng.uniform(1.2, 1.5, m))
+    price = np.round(cost * markup, 2)
+    quantity = rng.integers(1, 21, m)
+    subtotal = np.round(quantity * price, 2)
+
+    items = pd.DataFrame({
+        "id": np.arange(first_item_id, first_item_id + m),
+        "order_id": order_ids[order_index],
+        "product_id": product_index + 1,
+        "quantity": quantity,
+        "price": price,
+        "subtotal": subtotal,
+    })
+
+    created_at = _timestamps(rng, order_dates)
+    date_str = pd.DatetimeIndex(order_dates).strftime("%Y%m%d")
+    orders = pd.DataFrame({
+        "id": order_ids,
+        "order_no": pd.Series(np.where(is_purchase, "PO", "SO")) + date_str + pd.Series(order_ids).astype(str).str.zfill(10),
+        "type": np.where(is_purchase, "PURCHASE", "SALES"),
+        "order_date": order_dates,
+        "status": rng.choice(["CONFIRMED", "COMPLETED"], n),
+        "salesman_id": rng.integers(1, dims["employees"] + 1, n),
+        "partner_id": partner_ids,
+        "warehouse_id": rng.integers(1, dims["warehouses"] + 1, n),
+        "total_amount": np.round(np.bincount(order_index, weights=subtotal, minlength=n), 2),
+        "created_at": created_at,
+        "updated_at": created_at,
+    })
+    return orders, items
+
+
+def load_order_chunk(dsn: str, seed: int, task, dims: Dict[str, np.ndarray]) -> Tuple[int, int]:
+    """
+    导入进程: 生成并 COPY 一个日期区间内的订单与明细 (单个事务)
+
+    Returns:
+        (订单行数, 明细行数)
+    """
+    import psycopg2
+
+    days, per_day, item_counts, order_id, item_id = task
+    rng = np.random.default_rng([seed, 2, order_id])
+    order_dates = np.repeat(days, per_day)
+    orders_loaded = items_loaded = 0
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET synchronous_commit = off")
+            for start in range(0, len(order_dates), ORDER_BATCH_SIZE):
+                end = start + ORDER_BATCH_SIZE
+                counts = item_counts[start:end]
+                orders, items = generate_orders(
+                    rng, order_dates[start:end], counts, order_id + start, item_id + items_loaded, dims
+                )
+                orders_loaded += copy_frame(cursor, "biz_order", orders)
+                items_loaded += copy_frame(cursor, "biz_order_item", items)
+        conn.commit()
+    finally:
+        conn.close()
+    return orders_loaded, items_loaded
+
+
+def generate_inventory(dimensions: Dict[str, pd.DataFrame], seed: int) -> pd.DataFrame:
+    """每个仓库 × 商品 70% 有库存,其中 30% 低于最低库存"""
+    rng = np.random.default_rng([seed, 3])
+    products = dimensions["base_product"]
+    n_warehouses = len(dimensions["base_warehouse"])
+    warehouse_ids = np.repeat(np.arange(1, n_warehouses + 1), len(products))
+    product_pos = np.tile(np.arange(len(products)), n_warehouses)
+    keep = rng.random(len(product_pos)) < 0.7
+    warehouse_ids, product_pos = warehouse_ids[keep], product_pos[keep]
+
+    min_stock = products["min_stock"].to_numpy()[product_pos]
+    low = rng.random(len(product_pos)) < 0.3
+    quantity = np.where(
+        low,
+        np.floor(rng.random(len(min_stock)) * (min_stock + 1)),
+        min_stock + np.floor(rng.random(len(min_stock)) * (min_stock * 4 + 1)),
+    ).astype(np.int64)
+    return pd.DataFrame({
+        "id": np.arange(1, len(quantity) + 1),
+        "warehouse_id": warehouse_ids,
+        "product_id": product_pos + 1,
+        "quantity": quantity,
+        "last_updated": np.datetime64(datetime.now().replace(microsecond=0), "s"),
+    })
+
+
+def generate_finance(plan: Dict[str, int], dimensions: Dict[str, pd.DataFrame], seed: int) -> pd.DataFrame:
+    """应收 (客户)、应付 (供应商) 与费用流水"""
+    rng = np.random.default_rng([seed, 4])
+    partners = dimensions["base_partner"]
+    customers = partners.loc[partners["type"] == "CUSTOMER", "id"].to_numpy()
+    suppliers = partners.loc[partners["type"] == "SUPPLIER", "id"].to_numpy()
+    n_depts = len(dimensions["sys_department"])
+    n_employees = len(dimensions["sys_employee"])
+
+    frames = []
+    for kind, n, partner_pool in (
+        ("RECEIVABLE", plan["receivables"], customers),
+        ("PAYABLE", plan["payables"], suppliers),
+        ("EXPENSE", plan["expenses"], None),
+    ):
+        is_expense = partner_pool is None
+        frame = pd.DataFrame({
+            "type": kind,
+            "trans_date": np.datetime64(date.today()) - rng.integers(1, ORDER_DAYS, n).astype("timedelta64[D]"),
+            "amount": rng.integers(1_000, 20_001, n) if is_expense else rng.integers(10_000, 100_001, n),
+            "balance": None if is_expense else rng.integers(0, 50_001, n),
+            "expense_category": rng.choice(EXPENSE_CATEGORIES, n) if is_expense else None,
+            "partner_id": None if is_expense else rng.choice(partner_pool, n),
+            "dept_id": rng.integers(1, n_depts + 1, n),
+            "salesman_id": rng.integers(1, n_employees + 1, n),
+        })
+        if is_expense:
+            # 约 30% 的费用不关联业务员
+            frame["salesman_id"] = frame["salesman_id"].where(rng.random(n) > 0.3).astype("Int64")
+            frame["description"] = frame["expense_category"] + " - 日常支出"
+        else:
+            frame["description"] = "销售回款" if kind == "RECEIVABLE" else "采购付款"
+        frames.append(frame)
+
+    finance = pd.concat(frames, ignore_index=True)
+    finance.insert(0, "id", np.arange(1, len(finance) + 1))
+    finance["created_at"] = _timestamps(rng, finance["trans_date"].to_numpy())
+    return finance
+
+
+def drop_fact_constraints(engine, tables: Sequence[str] = FACT_TABLES) -> List[Tuple[str, str]]:
+    """
+    删除事实表的二级索引与外键 (主键保留),返回用于重建的 DDL
+
+    外键按行检查、索引按行维护,都会显著拖慢 COPY;导入后一次性重建更快
+    """
+    with engine.begin() as conn:
+        foreign_keys = conn.execute(text("""
+            SELECT c.conrelid::regclass::text AS table_name, c.conname, pg_get_constraintdef(c.oid)
+            FROM pg_constraint c
+            WHERE c.contype = 'f' AND c.conrelid::regclass::text = ANY(:tables)
+        """), {"tables": list(tables)}).fetchall()
+        indexes = conn.execute(text("""
+            SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            WHERE i.indrelid::regclass::text = ANY(:tables)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        """), {"tables": list(tables)}).fetchall()
+
+        restore = []
+        for table, name, definition in foreign_keys:
+            conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+            restore.append((name, f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'))
+        for name, definition in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+            restore.insert(0, (name, definition))  # 先建索引,再加外键
+    return restore
+
+
+def restore_fact_constraints(engine, restore: List[Tuple[str, str]]):
+    """按 drop_fact_constraints 返回的 DDL 重建索引与外键"""
+    with engine.begin() as conn:
+        conn.execute(text("SET maintenance_work_mem = '512MB'"))
+        for name, ddl in restore:
+            started = time.perf_counter()
+            conn.execute(text(ddl))
+            print(f"  ✓ 重建 {name} ({time.perf_counter() - started:.1f}s)")
+
+
+def _report(label: str, rows: int, seconds: float):
+    print(f"  ✓ {label:<18}: {rows:>12,} 行, {seconds:6.1f}s, {rows / max(seconds, 1e-6):>12,.0f} 行/秒")
+
+
+def bulk_load(engine, database_url: str, scale: float, workers: int = 0, seed: int = 42) -> Dict[str, int]:
+    """
+    按规模生成并导入全部维度与事实数据 (表需已创建且为空)
+
+    Returns:
+        {表名: 导入行数}
+    """
+    workers = workers or os.cpu_count() or 1
+    plan = plan_for(scale)
+    dsn = psycopg2_dsn(database_url)
+    loaded: Dict[str, int] = {}
+    total_started = time.perf_counter()
+    print(f"📐 规模 {scale}: {plan['orders']:,} 个订单, 约 {int(plan['orders'] * 3.5):,} 条明细, {workers} 个导入进程")
+
+    print("\n🧩 生成并导入维度数据...")
+    dimensions = generate_dimensions(plan, seed)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            for table, frame in dimensions.items():
+                started = time.perf_counter()
+                loaded[table] = copy_frame(cursor, table, frame)
+                _report(table, loaded[table], time.perf_counter() - started)
+        raw.commit()
+    finally:
+        raw.close()
+
+    print("\n🔧 删除事实表索引与外键...")
+    restore = drop_fact_constraints(engine)
+    print(f"  ✓ 删除 {len(restore)} 个索引 / 外键")
+
+    print("\n📊 并行生成并导入订单...")
+    partners = dimensions["base_partner"]
+    dims = {
+        "customers": partners.loc[partners["type"] == "CUSTOMER", "id"].to_numpy(),
+        "suppliers": partners.loc[partners["type"] == "SUPPLIER", "id"].to_numpy(),
+        "cost_price": dimensions["base_product"]["cost_price"].to_numpy(dtype=np.float64),
+        "employees": len(dimensions["sys_employee"]),
+        "warehouses": len(dimensions["base_warehouse"]),
+    }
+    # 切分为进程数的 4 倍,避免个别日期区间拖慢整体
+    tasks = plan_orders(plan, seed, workers * 4)
+    started = time.perf_counter()
+    orders = items = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(load_order_chunk, dsn, seed, task, dims) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            chunk_orders, chunk_items = future.result()
+            orders += chunk_orders
+            items += chunk_items
+            elapsed = time.perf_counter() - started
+            print(f"  进度: {done}/{len(tasks)} 个日期区间, {orders + items:,} 行, {(orders + items) / elapsed:,.0f} 行/秒")
+    elapsed = time.perf_counter() - started
+    loaded["biz_order"], loaded["biz_order_item"] = orders, items
+    _report("biz_order", orders, elapsed)
+    _report("biz_order_item", items, elapsed)
+
+    print("\n📦 生成并导入库存与财务流水...")
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            for table, frame in (
+                ("inv_current_stock", generate_inventory(dimensions, seed)),
+                ("fact_finance", generate_finance(plan, dimensions, seed)),
+            ):
+                started = time.perf_counter()
+                loaded[table] = copy_frame(cursor, table, frame)
+                _report(table, loaded[table], time.perf_counter() - started)
+        raw.commit()
+    finally:
+        raw.close()
+
+    print("\n🔧 重建索引与外键...")
+    started = time.perf_counter()
+    restore_fact_constraints(engine, restore)
+    print(f"  ✓ 重建完成 ({time.perf_counter() - started:.1f}s)")
+
+    # ID 是预先分配的,需要把自增序列推进到当前最大值之后
+    with engine.begin() as conn:
+        for table in list(dimensions) + list(FACT_TABLES):
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            ))
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("ANALYZE"))
+
+    total_rows = sum(loaded.values())
+    _report("合计", total_rows, time.perf_counter() - total_started)
+    return loaded
+
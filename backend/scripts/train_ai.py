@@ -8,10 +8,15 @@ Vanna AI 训练脚本
     
 或使用异步运行：
     python scripts/train_ai.py
+
+批量导入问答对 (JSONL,每行 {"question": "...", "sql": "..."})：
+    python -m scripts.train_ai --examples examples.jsonl
 """
 import sys
 import os
+import json
 import asyncio
+import argparse
 
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -21,14 +26,29 @@ from app.services.vanna_service import vanna_service
 from app.core.config import settings
 
 
-async def main():
+def load_examples(path: str) -> list:
+    """读取 JSONL 格式的问答对"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if not item.get("question") or not item.get("sql"):
+                raise ValueError(f"{path}:{line_no} 缺少 question 或 sql 字段")
+            examples.append({"question": item["question"], "sql": item["sql"]})
+    return examples
+
+
+async def main(examples_path: str = None):
     """主函数"""
     logger.info("=" * 80)
     logger.info("🚀 Vanna AI 训练脚本启动")
     logger.info("=" * 80)
     
-    # 检查必要的环境变量
-    if not settings.dashscope_api_key:
+    # 检查必要的环境变量 (本地 OpenAI 兼容服务不需要)
+    if settings.llm_backend == "dashscope" and not settings.dashscope_api_key:
         logger.error("❌ 错误: 未配置 DASHSCOPE_API_KEY 环境变量")
         logger.error("   请在 .env 文件或环境变量中设置 DASHSCOPE_API_KEY")
         sys.exit(1)
@@ -36,12 +56,16 @@ async def main():
     logger.info(f"✅ 配置检查通过")
     logger.info(f"   - 数据库: {settings.database_url_sync}")
     logger.info(f"   - Redis: {settings.redis_url}")
-    logger.info(f"   - API Key: {settings.dashscope_api_key[:10]}***")
+    logger.info(f"   - LLM: {settings.llm_backend} ({settings.llm_model})")
     logger.info("")
     
     try:
+        extra_examples = load_examples(examples_path) if examples_path else None
+        if extra_examples:
+            logger.info(f"📄 从 {examples_path} 读取 {len(extra_examples)} 个问答对")
+        
         # 执行训练
-        await vanna_service.train_system()
+        await vanna_service.train_system(extra_examples=extra_examples)
         
         logger.info("")
         logger.info("=" * 80)
@@ -65,5 +89,9 @@ async def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vanna AI 训练脚本")
+    parser.add_argument("--examples", help="批量导入的问答对文件 (JSONL)")
+    args = parser.parse_args()
+    
     # Python 3.7+ 推荐写法
-    asyncio.run(main())
+    asyncio.run(main(args.examples))
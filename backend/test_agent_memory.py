@@ -0,0 +1,50 @@
+"""
+测试 Agent Memory 向量与训练数据导入
+"""
+import asyncio
+
+import numpy as np
+from vanna.integrations.local.agent_memory import DemoAgentMemory
+
+from app.services.agent_memory import embed_text, to_pgvector, _tool_dedupe_key
+from app.services.vanna_service import vanna_service
+
+
+def test_embedding_is_normalized_and_stable():
+    """向量 L2 归一化,同一文本结果一致"""
+    a = embed_text("各分公司的销售业绩排名?", 256)
+    assert a.shape == (256,)
+    assert abs(float(np.linalg.norm(a)) - 1.0) < 1e-5
+    assert np.array_equal(a, embed_text("各分公司的销售业绩排名?", 256))
+    assert not embed_text("?!", 256).any()
+
+
+def test_similar_questions_score_higher():
+    """相近问题的余弦相似度高于无关问题"""
+    q = embed_text("各分公司的销售业绩排名?")
+    similar = embed_text("各分公司销售业绩排名")
+    unrelated = embed_text("哪些商品的库存低于预警线?")
+    assert float(q @ similar) > 0.7
+    assert float(q @ unrelated) < 0.3
+
+
+def test_pgvector_literal_and_dedupe_key():
+    """pgvector 文本格式;参数顺序不影响去重键"""
+    literal = to_pgvector(np.array([0.5, -0.25], dtype=np.float32))
+    assert literal == "[0.500000,-0.250000]"
+    assert _tool_dedupe_key("q", "run_sql", {"sql": "x", "a": 1}) == \
+        _tool_dedupe_key("q ", "run_sql", {"a": 1, "sql": "x"})
+
+
+def test_train_system_saves_examples(monkeypatch):
+    """训练会保存 Schema 文本与示例问答对"""
+    memory = DemoAgentMemory(max_items=1000)
+    monkeypatch.setattr(vanna_service, "agent_memory", memory)
+    monkeypatch.setattr(vanna_service, "_ready", True)
+
+    extra = [{"question": "各仓库的库存总量", "sql": "SELECT warehouse_name, SUM(current_stock) FROM view_bi_inventory_alert GROUP BY warehouse_name"}]
+    asyncio.run(vanna_service.train_system(extra_examples=extra))
+
+    assert len(memory._text_memories) == 1
+    assert len(memory._memories) == 11
+    assert memory._memories[-1].args == {"sql": extra[0]["sql"]}
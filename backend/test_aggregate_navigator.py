@@ -0,0 +1,283 @@
+"""
+测试聚合导航: 聚合查询改写到汇总表 (结果与原视图一致)、不能改写的查询、新鲜度与改写统计
+"""
+import random
+import sqlite3
+
+import pytest
+
+from app.services import aggregate_navigator as navigator_module
+from app.services.aggregate_navigator import ROLLUPS, AggregateNavigator, NotRoutable
+
+DIMENSIONS = sorted({d for rollup in ROLLUPS for d in rollup.dimensions})
+
+
+@pytest.fixture
+def db():
+    """SQLite 中的明细视图 (表) 与各汇总表"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE view_bi_sales_analysis ({', '.join(DIMENSIONS)}, "
+                 "quantity, sales_amount, cost_amount, gross_profit, unit_price)")
+    values = {
+        "company_name": ["北京分公司", "上海分公司", "广州分公司"],
+        "dept_name": ["销售一部", "销售二部"],
+        "salesman_name": ["张三", "李四", "王五", "赵六"],
+        "region": ["华东", "华北", "华南", None],
+        "category": ["电子产品", "办公用品", "原材料"],
+        "product_name": [f"商品{i}" for i in range(8)],
+        "partner_name": [f"客户{i}" for i in range(6)],
+        "partner_type": ["CUSTOMER"],
+        "warehouse_name": ["一号仓", "二号仓"],
+        "order_status": ["CONFIRMED", "COMPLETED"],
+    }
+    rows = []
+    for _ in range(600):
+        day = rng.randint(1, 28)
+        month = rng.randint(1, 12)
+        year = rng.choice([2023, 2024])
+        row = {d: rng.choice(values[d]) for d in values}
+        row.update(year=year, month=month, order_date=f"{year}-{month:02d}-{day:02d}")
+        quantity = rng.randint(1, 20) + 0.5
+        price = rng.randint(10, 500) + 0.25
+        cost = quantity * (price * 0.7)
+        rows.append([row[d] for d in DIMENSIONS] + [quantity, quantity * price, cost, quantity * price - cost, price])
+    conn.executemany(f"INSERT INTO view_bi_sales_analysis VALUES ({', '.join('?' * (len(DIMENSIONS) + 5))})", rows)
+    for rollup in ROLLUPS:
+        conn.execute(f"CREATE TABLE {rollup.name} AS {rollup.select_sql()}")
+    yield conn
+    conn.close()
+
+
+QUERIES = [
+    "SELECT company_name, SUM(sales_amount) AS total_sales FROM view_bi_sales_analysis "
+    "GROUP BY company_name ORDER BY total_sales DESC",
+    "SELECT SUM(sales_amount) AS total FROM view_bi_sales_analysis WHERE year = 2024 AND month = 10",
+    "SELECT category, SUM(sales_amount) AS total_sales, "
+    "ROUND(SUM(sales_amount) * 100.0 / SUM(SUM(sales_amount)) OVER (), 2) AS percentage "
+    "FROM view_bi_sales_analysis GROUP BY category ORDER BY total_sales DESC",
+    "SELECT region, COUNT(*), AVG(gross_profit), MAX(month) FROM view_bi_sales_analysis "
+    "WHERE region IS NOT NULL GROUP BY region HAVING COUNT(*) > 10",
+    "SELECT v.salesman_name, SUM(v.gross_profit) AS profit, COUNT(DISTINCT v.category) AS categories "
+    "FROM view_bi_sales_analysis v WHERE v.order_date >= '2024-06-01' GROUP BY v.salesman_name",
+    "SELECT view_bi_sales_analysis.product_name, SUM(view_bi_sales_analysis.quantity) "
+    "FROM view_bi_sales_analysis GROUP BY 1 ORDER BY 2 DESC LIMIT 3",
+]
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_rewritten_queries_return_identical_results(db, sql):
+    routed = AggregateNavigator().rewrite(sql)
+    assert f"FROM {routed.rollup}" in routed.sql
+
+    raw = sorted(db.execute(sql).fetchall(), key=repr)
+    rewritten = sorted(db.execute(routed.sql).fetchall(), key=repr)
+    assert len(raw) == len(rewritten) > 0
+    for expected, actual in zip(raw, rewritten):
+        assert actual == pytest.approx(expected)
+
+
+def test_rewrite_picks_smallest_rollup_and_keeps_column_names():
+    navigator = AggregateNavigator()
+    sql = "SELECT category, COUNT(*), AVG(sales_amount) FROM view_bi_sales_analysis GROUP BY category"
+    assert navigator.rewrite(sql).sql == (
+        "SELECT category, CAST(SUM(row_count) AS BIGINT) AS count, "
+        "(SUM(sales_amount) / SUM(row_count)) AS avg FROM mv_sales_monthly GROUP BY category"
+    )
+    # 有行数统计时按行数选择
+    navigator.sizes = {"mv_sales_monthly": 5000, "mv_sales_product_monthly": 800, "mv_sales_daily": 90000}
+    assert navigator.rewrite(sql).rollup == "mv_sales_product_monthly"
+    assert navigator.rewrite(sql, exclude={"mv_sales_product_monthly"}).rollup == "mv_sales_monthly"
+
+
+@pytest.mark.parametrize("sql, reason", [
+    ("SELECT * FROM view_bi_sales_analysis LIMIT 10", "not_aggregate"),
+    ("SELECT product_name, SUM(quantity * unit_price) FROM view_bi_sales_analysis GROUP BY 1", "aggregate_sum"),
+    ("SELECT AVG(gross_profit_rate) FROM view_bi_sales_analysis", "aggregate_avg"),
+    ("SELECT COUNT(DISTINCT order_id) FROM view_bi_sales_analysis", "column_order_id"),
+    ("SELECT MAX(sales_amount) FROM view_bi_sales_analysis", "aggregate_max"),
+    ("SELECT SUM(DISTINCT sales_amount) FROM view_bi_sales_analysis", "distinct_aggregate"),
+    ("SELECT category, SUM(sales_amount) FROM view_bi_sales_analysis WHERE sales_amount > 100 GROUP BY 1",
+     "column_sales_amount"),
+    ("SELECT product_name, region, SUM(sales_amount) FROM view_bi_sales_analysis GROUP BY 1, 2",
+     "no_covering_rollup"),
+    ("SELECT p.category, SUM(v.sales_amount) FROM view_bi_sales_analysis v "
+     "JOIN base_product p ON p.name = v.product_name GROUP BY 1", "structure"),
+    ("SELECT company_name, SUM(sales_amount) FROM view_bi_sales_analysis "
+     "WHERE category IN (SELECT category FROM base_product) GROUP BY 1", "subquery"),
+    ("SELECT region, COUNT(*) FILTER (WHERE year = 2024) FROM view_bi_sales_analysis GROUP BY 1",
+     "aggregate_filter"),
+    ("SELECT company_name, SUM(sales_amount) FROM view_bi_sales_analysis GROUP BY ROLLUP (company_name)",
+     "grouping_sets"),
+])
+def test_queries_that_cannot_use_rollups(sql, reason):
+    with pytest.raises(NotRoutable) as error:
+        AggregateNavigator().rewrite(sql)
+    assert error.value.args[0] == reason
+
+
+class ProbeConnection:
+    """新鲜度探测: 第一个查询返回水位是否一致,第二个查询返回汇总表行数"""
+
+    def __init__(self, fresh):
+        self.fresh = fresh
+        self.results = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        if "pg_class" in sql:
+            self.results = [("mv_sales_monthly", 120.0), ("mv_sales_daily", -1.0)]
+        else:
+            self.results = [(self.fresh,)]
+
+    def fetchone(self):
+        return self.results[0]
+
+    def fetchall(self):
+        return self.results
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_route_checks_freshness_and_reports_savings(monkeypatch):
+    monkeypatch.setattr(navigator_module.settings, "ai_rollup_verify_every", 0)
+    sql = "SELECT company_name, SUM(sales_amount) FROM view_bi_sales_analysis GROUP BY 1"
+
+    stale = AggregateNavigator()
+    assert stale.route(ProbeConnection(fresh=False), sql) is None
+    assert stale.report()["skipped"] == {"stale": 1}
+
+    navigator = AggregateNavigator()
+    conn = ProbeConnection(fresh=True)
+    assert navigator.route(conn, "SELECT * FROM view_bi_sales_analysis") is None
+    for _ in range(10):
+        routed = navigator.route(conn, sql)
+        navigator.record("postgresql://test", routed, elapsed_ms=4.0)
+    assert routed.rollup == "mv_sales_monthly" and navigator.sizes == {"mv_sales_monthly": 120.0}
+    navigator.record_verification(routed, True, raw_ms=800.0, rollup_ms=5.0)
+
+    report = navigator.report()
+    assert report["queries"] == 11 and report["rewrites"] == 10 and report["rewrite_rate"] == 0.9091
+    assert report["skipped"] == {"not_aggregate": 1}
+    monthly = next(r for r in report["rollups"] if r["name"] == "mv_sales_monthly")
+    assert monthly["avg_ms"] == 4.0 and monthly["avg_raw_ms"] == 800.0
+    assert monthly["estimated_saved_ms"] == report["estimated_saved_ms"] == 7950.0
+
+    # 结果不一致时停用该汇总表,改用其他覆盖查询的汇总表
+    navigator.record_verification(routed, False, raw_ms=800.0, rollup_ms=5.0)
+    assert navigator.route(conn, sql).rollup == "mv_sales_daily"
+
+
+class RefreshConnection:
+    """刷新: advisory lock 是否拿到、汇总表是否已创建"""
+
+    def __init__(self, locked=True, exists=True):
+        self.locked = locked
+        self.exists = exists
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql.strip())
+
+    def fetchone(self):
+        last = self.executed[-1]
+        if "advisory" in last:
+            return (self.locked,)
+        if "to_regclass" in last:
+            return (self.exists,)
+        return (False,)  # 水位已过期
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_refresh_runs_under_advisory_lock_and_never_creates():
+    for conn, refreshed in (
+        (RefreshConnection(locked=False), False),
+        (RefreshConnection(exists=False), False),
+        (RefreshConnection(), True),
+    ):
+        navigator = AggregateNavigator(connect=lambda dsn, conn=conn: conn)
+        assert navigator.refresh("postgresql://test") is refreshed
+        assert conn.executed[0].startswith("SELECT pg_try_advisory_xact_lock")
+        assert not any(s.startswith("CREATE") for s in conn.executed)
+        assert any(s.startswith("REFRESH") for s in conn.executed) is refreshed
+
+
+class RunnerConnection:
+    """执行器: 服务端游标返回超出上限的行,记录 COUNT(*) 语句"""
+
+    description = [("company_name", 25), ("total", 1700)]
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self, name=None):
+        return self
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def fetchmany(self, size):
+        rows, self.rows = getattr(self, "rows", [("北京", 1), ("上海", 2), ("广州", 3)]), []
+        return rows[:size]
+
+    def fetchone(self):
+        return (3,)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_truncated_rollup_query_counts_on_the_same_rollup(monkeypatch):
+    from app.services import sql_runner
+
+    monkeypatch.setattr(navigator_module.settings, "ai_rollup_verify_every", 0)
+    monkeypatch.setattr(sql_runner.settings, "ai_sql_max_cost", 0)
+    conn = RunnerConnection()
+    monkeypatch.setattr(sql_runner.psycopg2, "connect", lambda dsn: conn)
+    navigator = AggregateNavigator()
+    monkeypatch.setattr(navigator, "_probe", lambda conn: True)
+
+    runner = sql_runner.BoundedPostgresRunner("postgresql://test", max_rows=2, navigator=navigator)
+    df, stats = runner._run_sql_sync(
+        "SELECT company_name, SUM(sales_amount) AS total FROM view_bi_sales_analysis GROUP BY 1"
+    )
+    assert stats["truncated"] and stats["total_count"] == 3 and stats["rollup"] == "mv_sales_monthly"
+    assert conn.executed[0].endswith("FROM mv_sales_monthly GROUP BY 1 LIMIT 3")
+    count_sql = conn.executed[-1]
+    assert count_sql.startswith("SELECT COUNT(*)") and "FROM mv_sales_monthly GROUP BY 1)" in count_sql
+    assert "view_bi_sales_analysis" not in count_sql and "LIMIT" not in count_sql
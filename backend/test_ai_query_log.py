@@ -0,0 +1,162 @@
+"""
+测试 AI 查询日志: SQL 指纹归一化、慢查询执行计划采集 (按间隔去重) 与执行器记录
+"""
+import asyncio
+
+import pandas as pd
+from vanna.capabilities.sql_runner import RunSqlToolArgs
+
+from app.services import ai_query_log as ai_query_log_module
+from app.services.ai_query_log import AiQueryLog, normalize_sql, seq_scan_tables, sql_fingerprint
+from app.services.sql_runner import BoundedPostgresRunner
+
+PLAN = [
+    ("Hash Join  (cost=1.0..99.0 rows=10 width=8) (actual time=0.1..850.0 rows=10 loops=1)",),
+    ("  ->  Seq Scan on biz_order  (cost=0.0..50.0 rows=1000 width=8)",),
+    ("  ->  Seq Scan on base_product  (cost=0.0..10.0 rows=100 width=8)",),
+    ("  Buffers: shared hit=120 read=4000",),
+]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(sql.strip())
+        if params and "INSERT INTO sys_ai_query_log" in sql:
+            self.conn.inserted.append(params)
+
+    def fetchall(self):
+        return PLAN
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.statements = []
+        self.inserted = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.statements.append("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+
+
+def test_fingerprint_ignores_literals_comments_and_in_lists():
+    a = normalize_sql("SELECT 产品名称, SUM(销售额) FROM view_bi_sales_analysis -- 本月\n"
+                      "WHERE 日期 >= '2024-01-01' AND 仓库ID IN (1, 2, 3) GROUP BY 1 LIMIT 100;")
+    b = normalize_sql("select 产品名称, sum(销售额)  from view_bi_sales_analysis "
+                      "where 日期 >= '2024-02-01' and 仓库ID in (7) group by 1 limit 20")
+    assert a == "SELECT 产品名称, SUM(销售额) FROM view_bi_sales_analysis WHERE 日期 >= ? AND 仓库ID IN (?) GROUP BY ? LIMIT ?"
+    assert sql_fingerprint(a) == sql_fingerprint(b)
+    # 标识符中的数字保留
+    assert normalize_sql("SELECT t1.col2 FROM t1 WHERE x = 3.5") == "SELECT t1.col2 FROM t1 WHERE x = ?"
+    assert seq_scan_tables("\n".join(row[0] for row in PLAN)) == ["biz_order", "base_product"]
+
+
+def test_slow_select_captures_plan_once_per_interval(monkeypatch):
+    monkeypatch.setattr(ai_query_log_module.settings, "ai_query_explain_ms", 500)
+    monkeypatch.setattr(ai_query_log_module.settings, "ai_query_explain_interval_seconds", 600)
+    conn = FakeConnection()
+    log = AiQueryLog(connect=lambda dsn: conn)
+    try:
+        slow = "SELECT * FROM biz_order o, base_product p WHERE o.id = 42"
+        log.write("dsn", slow, 900.0, {"row_count": 10, "total_count": 10}, None)
+        log.write("dsn", slow.replace("42", "43"), 950.0, {"row_count": 8}, None)
+        log.write("dsn", "SELECT 1", 5.0, {"row_count": 1}, None)
+        log.write("dsn", "SELECT * FROM missing", 800.0, {}, "relation does not exist")
+    finally:
+        log.close()
+
+    explains = [s for s in conn.statements if s.startswith("EXPLAIN")]
+    assert explains == ["EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM biz_order o, base_product p WHERE o.id = 42"]
+    assert conn.statements[:2] == ["SET TRANSACTION READ ONLY", "SET LOCAL statement_timeout = %s"]
+    assert conn.statements[conn.statements.index(explains[0]) + 1] == "ROLLBACK"
+
+    first, second, fast, failed = conn.inserted
+    assert first[0] == second[0] and first[0] != fast[0]
+    assert first[3:7] == (900.0, 10, 10, False)
+    assert "Seq Scan on biz_order" in first[8] and first[9] == "biz_order,base_product"
+    assert second[8] is None and fast[8] is None
+    assert failed[7] == "relation does not exist" and failed[8] is None
+
+
+def test_runner_submits_every_query(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(
+        ai_query_log_module.ai_query_log, "submit",
+        lambda dsn, sql, duration_ms, stats=None, error=None, original_sql=None:
+            submitted.append((sql, stats, error, original_sql)),
+    )
+    runner = BoundedPostgresRunner("postgresql://test")
+    stats = {"row_count": 2, "total_count": 2, "truncated": False}
+    monkeypatch.setattr(runner, "_run_sql_sync", lambda sql, attempt=None: (pd.DataFrame({"v": [1, 2]}), stats))
+    asyncio.run(runner.run_sql(RunSqlToolArgs(sql="SELECT v FROM t"), None))
+
+    def fail(sql, attempt=None):
+        raise RuntimeError("syntax error")
+
+    monkeypatch.setattr(runner, "_run_sql_sync", fail)
+    try:
+        asyncio.run(runner.run_sql(RunSqlToolArgs(sql="SELEC v"), None))
+    except RuntimeError:
+        pass
+    assert submitted == [
+        ("SELECT v FROM t", stats, None, "SELECT v FROM t"), ("SELEC v", None, "syntax error", "SELEC v"),
+    ]
+
+
+def test_runner_logs_the_executed_statement(monkeypatch):
+    """日志与执行计划基于实际执行的 SQL (补充 LIMIT、改写到汇总表),原始 SQL 另存"""
+    submitted = []
+    monkeypatch.setattr(
+        ai_query_log_module.ai_query_log, "submit",
+        lambda dsn, sql, duration_ms, stats=None, error=None, original_sql=None:
+            submitted.append((sql, error, original_sql)),
+    )
+    runner = BoundedPostgresRunner("postgresql://test")
+    original = "SELECT company_name, SUM(sales_amount) FROM view_bi_sales_analysis GROUP BY 1"
+    executed = "SELECT company_name, SUM(sales_amount) FROM mv_sales_monthly GROUP BY 1 LIMIT 5001"
+
+    def run(sql, attempt=None):
+        attempt["sql"] = executed
+        if sql.startswith("SELECT *"):
+            raise RuntimeError("canceling statement due to statement timeout")
+        return pd.DataFrame({"v": [1]}), {"row_count": 1}
+
+    monkeypatch.setattr(runner, "_run_sql_sync", run)
+    asyncio.run(runner.run_sql(RunSqlToolArgs(sql=original), None))
+    try:
+        asyncio.run(runner.run_sql(RunSqlToolArgs(sql="SELECT * FROM view_bi_sales_analysis"), None))
+    except RuntimeError:
+        pass
+    assert submitted == [
+        (executed, None, original),
+        (executed, "canceling statement due to statement timeout", "SELECT * FROM view_bi_sales_analysis"),
+    ]
+
+    # 与实际执行的 SQL 相同时不重复记录原始 SQL
+    conn = FakeConnection()
+    log = AiQueryLog(connect=lambda dsn: conn)
+    try:
+        log.submit("dsn", executed, 5.0, {"row_count": 1}, original_sql=original)
+        log.submit("dsn", original, 5.0, {"row_count": 1}, original_sql=original + "  ")
+    finally:
+        log.close()
+    assert [params[2] for params in conn.inserted] == [executed, original]
+    assert [params[11] for params in conn.inserted] == [original, None]
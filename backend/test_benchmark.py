@@ -0,0 +1,60 @@
+"""
+测试基准测试脚本: 固定并发执行场景、统计分位数与每请求查询数、基线对比门禁
+"""
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Response
+
+from scripts.benchmark import QUERY_COUNT_HEADER, Scenario, compare_reports, run_scenario
+
+
+def test_run_scenario_records_latency_queries_and_errors():
+    app = FastAPI()
+    seen = []
+
+    @app.post("/echo")
+    async def echo(body: dict, response: Response):
+        seen.append(body["i"])
+        if body["i"] % 10 == 0:
+            response.status_code = 500
+        response.headers[QUERY_COUNT_HEADER] = "3"
+        return body
+
+    scenario = Scenario("echo", "POST", "/echo", lambda i, fx: {"i": i})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await run_scenario(client, scenario, {}, {}, concurrency=4, requests=20, warmup=2)
+
+    result = asyncio.run(run())
+
+    # 预热请求不计入结果,每个序号只请求一次
+    assert sorted(seen) == list(range(22))
+    assert result["requests"] == 20 and result["errors"] == 2
+    assert result["statuses"] == {"200": 18, "500": 2}
+    assert result["queries_per_request"] == 3 and result["queries_source"] == "header"
+    assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {"scenarios": {
+        "kpi": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "throughput_rps": 500.0,
+                "queries_per_request": 4.0, "error_rate": 0.0},
+        "fast": {"p50_ms": 1.0, "p95_ms": 1.5, "p99_ms": 2.0, "throughput_rps": 2000.0,
+                 "queries_per_request": None, "error_rate": 0.0},
+    }}
+    current = {"scenarios": {
+        "kpi": {"p50_ms": 10.5, "p95_ms": 30.0, "p99_ms": 31.0, "throughput_rps": 400.0,
+                "queries_per_request": 9.0, "error_rate": 0.01},
+        # 延迟翻倍但绝对变化不足 2ms: 视为抖动
+        "fast": {"p50_ms": 2.0, "p95_ms": 3.0, "p99_ms": 3.5, "throughput_rps": 1950.0,
+                 "queries_per_request": 1.0, "error_rate": 0.0},
+    }}
+
+    regressions = compare_reports(baseline, current, threshold=0.1)
+
+    assert {(r["scenario"], r["metric"]) for r in regressions} == {
+        ("kpi", "p95_ms"), ("kpi", "throughput_rps"), ("kpi", "queries_per_request"), ("kpi", "error_rate"),
+    }
+    assert compare_reports(baseline, baseline) == []
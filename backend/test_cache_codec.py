@@ -0,0 +1,62 @@
+"""
+测试 Redis 缓存值编解码
+"""
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.services import cache_codec
+
+
+def _sample_response(rows: int):
+    return {
+        "answer_text": "根据您的问题「各分公司的销售业绩排名?」,查询到数据。",
+        "sql": "SELECT company_name, SUM(sales_amount) FROM view_bi_sales_analysis GROUP BY company_name",
+        "chart_type": "table",
+        "data": {
+            "columns": ["company_name", "product_name", "sales_amount"],
+            "values": [
+                ["北京总公司", "上海分公司", "广州分公司"] * (rows // 3),
+                ["笔记本电脑", "显示器", "咖啡"] * (rows // 3),
+                [round(i * 13.7, 2) for i in range(rows // 3 * 3)],
+            ],
+            "row_count": rows // 3 * 3,
+            "total_count": rows // 3 * 3,
+            "truncated": False,
+        },
+    }
+
+
+def test_json_roundtrip_and_passthrough():
+    """JSON 编码: unpack_json 返回与原始响应体一致的 bytes"""
+    response = _sample_response(3000)
+    body = dumps(response)
+    packed = cache_codec.pack(response, json_body=body)
+
+    assert packed[:2] == cache_codec.MAGIC
+    assert len(packed) * 5 < len(body)  # 重复维度值压缩比应远大于 5 倍
+    assert cache_codec.unpack_json(packed) == body
+    assert cache_codec.unpack(packed) == response
+
+
+def test_small_values_are_not_compressed():
+    """低于阈值的值不压缩"""
+    packed = cache_codec.pack({"a": 1})
+    assert packed[3] & 0x0F == cache_codec.COMPRESSION_NONE
+    assert cache_codec.unpack(packed) == {"a": 1}
+
+
+def test_msgpack_roundtrip(monkeypatch):
+    """msgpack 编码: unpack_json 重新编码为 JSON"""
+    monkeypatch.setattr(settings, "cache_encoding", "msgpack")
+    response = _sample_response(300)
+    packed = cache_codec.pack(response)
+
+    assert packed[3] >> 4 == cache_codec.ENCODING_MSGPACK
+    assert cache_codec.unpack(packed) == response
+    assert cache_codec.unpack_json(packed) == dumps(response)
+
+
+def test_legacy_plain_json():
+    """没有文件头的旧缓存值按原始 JSON 处理"""
+    legacy = dumps({"answer_text": "ok"})
+    assert cache_codec.unpack(legacy) == {"answer_text": "ok"}
+    assert cache_codec.unpack_json(legacy) == legacy
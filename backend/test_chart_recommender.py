@@ -0,0 +1,78 @@
+"""
+测试基于列元数据与统计量的图表推荐
+"""
+import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from app.services.chart_recommender import (
+    CHART_RULES, ChartRule, ResultProfiler, profile_frame, recommend_chart, register_chart_rule
+)
+
+# cursor.description 形如 (name, type_code, ...)
+TEXT, NUMERIC, INT8, DATE = 25, 1700, 20, 1082
+
+
+def _profile(description, rows):
+    profiler = ResultProfiler.from_description([(name, code) for name, code in description])
+    # 分两批累计,与执行器逐批读取一致
+    profiler.update(rows[: len(rows) // 2])
+    profiler.update(rows[len(rows) // 2:])
+    return profiler.to_dict()
+
+
+def test_profile_from_cursor_metadata():
+    """列类别来自类型 OID;文本列名含时间关键词时视为时间维度;第一列基数超过上限后记为 None"""
+    profile = _profile(
+        [("month", TEXT), ("company", TEXT), ("sales", NUMERIC)],
+        [("2024-01", "A", Decimal("10.5")), ("2024-02", "A", Decimal("-30"))],
+    )
+    assert [c["kind"] for c in profile["columns"]] == ["temporal", "categorical", "numeric"]
+    assert profile["columns"][2]["max_abs"] == 30.0
+    assert profile["first_cardinality"] == 2
+
+    big = ResultProfiler(["id"], [INT8])
+    big.update((i,) for i in range(2000))
+    assert big.to_dict()["first_cardinality"] is None
+
+
+def test_rule_table():
+    dates = [datetime.date(2024, m, 1) for m in range(1, 7)]
+    dual = _profile([("day", DATE), ("sales", NUMERIC), ("orders", INT8)], [(d, 100000 * i, i) for i, d in enumerate(dates, 1)])
+    line = _profile([("day", DATE), ("sales", NUMERIC), ("cost", NUMERIC)], [(d, 10 * i, 8 * i) for i, d in enumerate(dates, 1)])
+    multi = _profile([("company", TEXT), ("sales", NUMERIC), ("cost", NUMERIC)], [("A", 1, 2), ("B", 3, 4)])
+    single = _profile([("company", TEXT), ("sales", NUMERIC)], [("A", 1), ("B", 3)])
+
+    assert recommend_chart("每月销售额和订单数", dual) == "dual_axis_line"
+    assert recommend_chart("每月销售额和成本", line) == "line"
+    assert recommend_chart("各分公司销售与成本的构成", multi) == "stacked_bar"
+    assert recommend_chart("各分公司销售与成本", multi) == "grouped_bar"
+    assert recommend_chart("各分公司销售占比", single) == "pie"
+    assert recommend_chart("各分公司销售额", single) == "bar"
+    assert recommend_chart("随便看看", {"row_count": 0, "columns": []}) == "table"
+
+
+def test_numeric_month_dimension_is_temporal():
+    """视图的 month 由 EXTRACT 得到 (numeric),作为第一列时仍是时间维度,不计入指标"""
+    profile = _profile([("month", NUMERIC), ("total_sales", NUMERIC)], [(Decimal(m), Decimal(100 * m)) for m in range(1, 13)])
+    assert [c["kind"] for c in profile["columns"]] == ["temporal", "numeric"]
+    assert recommend_chart("2024年每月销售额", profile) == "line"
+    # 非第一列的数值列不按列名改变类别
+    other = _profile([("company", TEXT), ("year", NUMERIC)], [("A", 2024)])
+    assert [c["kind"] for c in other["columns"]] == ["categorical", "numeric"]
+
+
+def test_register_rule_and_frame_fallback():
+    """自定义规则可插入最高优先级;DataFrame 回退路径得到相同的统计量"""
+    df = pd.DataFrame({"company": ["A", "B"], "sales": [Decimal("1"), Decimal("3")]})
+    profile = profile_frame(df)
+    assert [c["kind"] for c in profile["columns"]] == ["categorical", "numeric"]
+
+    rule = ChartRule("always_table", "table", lambda q, p: "明细" in q)
+    register_chart_rule(rule, index=0)
+    try:
+        assert recommend_chart("各分公司销售明细", profile) == "table"
+        assert recommend_chart("各分公司销售额", profile) == "bar"
+    finally:
+        CHART_RULES.remove(rule)
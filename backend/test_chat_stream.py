@@ -0,0 +1,110 @@
+"""
+测试流式问答: 查询结果到达即分批推送 rows,回答最后推送;Agent 重新查询时 rows 从 offset 0 重新开始
+"""
+import asyncio
+import json
+
+import httpx
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+
+from app.api.v1.endpoints import chat
+from app.core.config import settings
+from app.services.vanna_service import vanna_service
+
+
+@pytest.fixture
+def stream_env(monkeypatch):
+    """替换 Agent 与缓存;返回已推送的事件与写入缓存的响应"""
+    state = {"events": [], "cached": []}
+
+    async def ready():
+        return None
+
+    async def no_cache(*args):
+        return None
+
+    async def write_cache(cache_key, response):
+        state["cached"].append(response)
+
+    monkeypatch.setattr(vanna_service, "ensure_ready", ready)
+    monkeypatch.setattr(vanna_service, "_read_cache", no_cache)
+    monkeypatch.setattr(vanna_service, "_write_cache", write_cache)
+    monkeypatch.setattr(settings, "chat_stream_batch_size", 2)
+    return state
+
+
+def _collect(question, state):
+    async def run():
+        async for event in vanna_service.stream_question(question, None):
+            state["events"].append(event)
+
+    asyncio.run(run())
+    return state["events"]
+
+
+def test_rows_are_pushed_before_agent_finishes(stream_env, monkeypatch):
+    events = stream_env["events"]
+
+    async def agent_results(question, context):
+        yield "sql", "SELECT company_name, total_sales FROM t"
+        yield "dataframe", pd.DataFrame({"company_name": ["上海分公司", "广州分公司", "北京总公司"], "total_sales": [3.0, 2.0, 1.0]})
+        # Agent 最后一轮 LLM 调用 (总结) 之前结果已推送,回答尚未推送
+        assert [event for event, _ in events][-2:] == ["rows", "rows"]
+        yield "stats", {"total_count": 3}
+
+    monkeypatch.setattr(vanna_service, "_iter_agent_results", agent_results)
+
+    _collect("各分公司的销售额", stream_env)
+    assert [event for event, _ in events] == ["status", "sql", "status", "rows", "rows", "chart", "answer", "done"]
+    assert [payload for event, payload in events if event == "rows"] == [
+        {"columns": ["company_name", "total_sales"], "offset": 0, "values": [["上海分公司", "广州分公司"], [3.0, 2.0]]},
+        {"columns": ["company_name", "total_sales"], "offset": 2, "values": [["北京总公司"], [1.0]]},
+    ]
+    assert events[-1][1] == {"row_count": 3, "total_count": 3, "truncated": False, "cached": False}
+
+
+def test_requery_restarts_rows_at_offset_zero(stream_env, monkeypatch):
+    async def agent_results(question, context):
+        yield "sql", "SELECT region FROM t"
+        yield "dataframe", pd.DataFrame({"region": ["华东", "华北", "华南"]})
+        yield "sql", "SELECT region, total_sales FROM t"
+        yield "dataframe", pd.DataFrame({"region": ["华东"], "total_sales": [5.0]})
+        yield "stats", {"total_count": 1}
+
+    monkeypatch.setattr(vanna_service, "_iter_agent_results", agent_results)
+
+    events = _collect("各地区的销售额", stream_env)
+    assert [event for event, _ in events] == [
+        "status", "sql", "status", "rows", "rows", "sql", "status", "rows", "chart", "answer", "done",
+    ]
+    rows = [payload for event, payload in events if event == "rows"]
+    assert [payload["offset"] for payload in rows] == [0, 2, 0]
+    assert rows[-1] == {"columns": ["region", "total_sales"], "offset": 0, "values": [["华东"], [5.0]]}
+    # 回答与缓存只使用最后一次查询的结果
+    assert events[-1][1]["row_count"] == 1
+    assert stream_env["cached"][0]["data"]["values"] == [["华东"], [5.0]]
+
+
+def test_sse_endpoint_keeps_event_order(stream_env, monkeypatch):
+    async def agent_results(question, context):
+        yield "sql", "SELECT 1 AS total_sales"
+        yield "dataframe", pd.DataFrame({"total_sales": [1.0]})
+        yield "stats", {"total_count": 1}
+
+    monkeypatch.setattr(vanna_service, "_iter_agent_results", agent_results)
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/chat")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/chat/stream", json={"question": "销售额是多少"})
+
+    response = asyncio.run(run())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    messages = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in messages] == [
+        "event: status", "event: sql", "event: status", "event: rows", "event: chart", "event: answer", "event: done",
+    ]
+    assert json.loads(messages[3][1][len("data: "):]) == {"columns": ["total_sales"], "offset": 0, "values": [[1.0]]}
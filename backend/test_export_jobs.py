@@ -0,0 +1,140 @@
+"""
+测试后台导出任务: 进度、相同请求复用产物、Range 断点续传、已中断任务重新执行
+"""
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.api.v1.endpoints import report
+from app.schemas.report import ExportRequest, ReportRequest
+from app.core.config import settings
+from app.services.export_jobs import INTERRUPTED_ERROR, ExportJobManager, job_id_for
+from app.services.report_engine import ReportEngine
+
+
+class FakeRedis:
+    """测试用的最小 Redis 哈希实现"""
+
+    def __init__(self):
+        self.data = {}
+        self.expired = []
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def hsetnx(self, key, field, value):
+        record = self.data.setdefault(key, {})
+        if field in record:
+            return False
+        record[field] = str(value)
+        return True
+
+    async def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    async def expire(self, key, seconds):
+        self.expired.append((key, self.data.get(key, {}).get("status")))
+        return True
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class FakeEngine(ReportEngine):
+    """按批返回固定行的报表引擎,记录执行次数"""
+
+    def __init__(self, rows, batch_size=10):
+        super().__init__(engine=object())
+        self.rows = rows
+        self.batch_size = batch_size
+        self.runs = 0
+
+    async def count_export(self, request):
+        return len(self.rows)
+
+    async def stream(self, request, batch_size=5000):
+        self.runs += 1
+        yield ["category", "sales_amount"]
+        for i in range(0, len(self.rows), self.batch_size):
+            yield self.rows[i:i + self.batch_size]
+
+
+def test_job_reuses_artifact_and_supports_range(tmp_path, monkeypatch):
+    engine = FakeEngine([(f"c{i}", i) for i in range(35)])
+    manager = ExportJobManager(redis_client=FakeRedis(), engine=engine, directory=str(tmp_path))
+    monkeypatch.setattr(report, "export_jobs", manager)
+    app = FastAPI()
+    app.include_router(report.router, prefix="/report")
+    body = {"report_request": {"dimensions": ["category"], "metrics": ["sales_amount"]}, "format": "csv", "background": True}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            submitted = await client.post("/report/export", json=body)
+            await asyncio.gather(*manager._tasks)
+            status = (await client.get(f"/report/export/jobs/{submitted.json()['job_id']}")).json()
+            again = await client.post("/report/export", json=body)
+            url = f"/report/export/jobs/{status['job_id']}/download"
+            full = await client.get(url)
+            part = await client.get(url, headers={"Range": "bytes=10-"})
+            bad = await client.get(url, headers={"Range": "bytes=99999-"})
+            return submitted, status, again, full, part, bad
+
+    submitted, status, again, full, part, bad = asyncio.run(run())
+
+    assert submitted.status_code == 202
+    assert status["status"] == "done"
+    assert (status["rows_written"], status["total_rows"], status["progress"]) == (35, 35, 1.0)
+    # 相同请求复用同一任务与产物,不再重新查询
+    assert again.json()["job_id"] == status["job_id"] and engine.runs == 1
+
+    assert full.status_code == 200 and full.headers["accept-ranges"] == "bytes"
+    assert len(full.content.decode("utf-8-sig").splitlines()) == 36
+    assert part.status_code == 206
+    assert part.headers["content-range"] == f"bytes 10-{len(full.content) - 1}/{len(full.content)}"
+    assert part.content == full.content[10:]
+    assert bad.status_code == 416
+
+
+def test_interrupted_job_is_reported_failed_and_resubmitted(tmp_path, monkeypatch):
+    """执行进程退出后任务停留在 running: 超过 EXPORT_JOB_STALE_SECONDS 没有更新时按失败处理并重新执行"""
+    redis = FakeRedis()
+    engine = FakeEngine([(f"c{i}", i) for i in range(5)])
+    manager = ExportJobManager(redis_client=redis, engine=engine, directory=str(tmp_path))
+    request = ExportRequest(report_request=ReportRequest(dimensions=["category"], metrics=["sales_amount"]), format="csv")
+    job_id = job_id_for(request.report_request, "csv")
+    stale = time.time() - settings.export_job_stale_seconds - 1
+    redis.data[manager._key(job_id)] = {
+        "job_id": job_id, "format": "csv", "request": request.report_request.model_dump_json(),
+        "status": "running", "rows_written": "3", "created_at": str(stale), "updated_at": str(stale),
+    }
+
+    async def run():
+        interrupted = await manager.get(job_id)
+        resubmitted = await manager.submit(request)
+        await asyncio.gather(*manager._tasks)
+        return interrupted, resubmitted, await manager.get(job_id)
+
+    interrupted, resubmitted, finished = asyncio.run(run())
+    assert (interrupted["status"], interrupted["error"]) == ("failed", INTERRUPTED_ERROR)
+    assert resubmitted["status"] == "queued" and resubmitted["rows_written"] == 0
+    assert finished["status"] == "done" and engine.runs == 1
+    # 每次状态变化都刷新有效期
+    assert [status for _, status in redis.expired] == ["queued", "running", "done"]
+
+    # 有最近更新的任务照常返回,不重新执行
+    redis.data[manager._key(job_id)].update(status="running", updated_at=str(time.time()))
+    assert asyncio.run(manager.submit(request))["status"] == "running" and engine.runs == 1
+
+
+def test_job_id_depends_on_request_and_format():
+    request = ReportRequest(dimensions=["category"], metrics=["sales_amount"])
+    same = ReportRequest(metrics=["sales_amount"], dimensions=["category"])
+    assert job_id_for(request, "csv") == job_id_for(same, "csv")
+    assert job_id_for(request, "csv") != job_id_for(request, "xlsx")
+    assert job_id_for(request, "csv") != job_id_for(ReportRequest(dimensions=["region"], metrics=["sales_amount"]), "csv")
+    assert ExportRequest(report_request=request).background is False
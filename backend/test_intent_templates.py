@@ -0,0 +1,163 @@
+"""
+测试问题模板快速通道: 常见问题识别为 SQL、未完全识别的问题交给 Agent、覆盖率统计
+"""
+import asyncio
+
+import pandas as pd
+import pytest
+
+from app.services.aggregate_navigator import AggregateNavigator
+from app.services.intent_templates import IntentMatcher, parse_number
+from app.services.sql_guard import check_sql
+
+V = "view_bi_sales_analysis"
+
+EXPECTED = [
+    ("2024年华东地区的销售额是多少?", "total",
+     f"SELECT SUM(sales_amount) AS total_sales FROM {V} WHERE year = 2024 AND region = '华东'"),
+    ("各分公司的销售业绩排名?", "rank",
+     f"SELECT company_name, SUM(sales_amount) AS total_sales FROM {V} "
+     "GROUP BY company_name ORDER BY total_sales DESC"),
+    ("张三业务员在电子产品类的毛利率是多少?", "total",
+     "SELECT ROUND(SUM(gross_profit) * 100.0 / NULLIF(SUM(sales_amount), 0), 2) AS gross_profit_rate "
+     f"FROM {V} WHERE category = '电子产品' AND salesman_name = '张三'"),
+    ("最近三个月的销售趋势如何?", "trend",
+     f"SELECT TO_CHAR(order_date, 'YYYY-MM') AS month, SUM(sales_amount) AS total_sales FROM {V} "
+     "WHERE order_date >= CURRENT_DATE - interval '3 months' GROUP BY 1 ORDER BY 1"),
+    ("最近7天的销售趋势", "trend",
+     f"SELECT order_date, SUM(sales_amount) AS total_sales FROM {V} "
+     "WHERE order_date >= CURRENT_DATE - 7 GROUP BY order_date ORDER BY order_date"),
+    ("上个月各商品类别的销售占比", "share",
+     "SELECT category, SUM(sales_amount) AS total_sales, "
+     "ROUND(SUM(sales_amount) * 100.0 / NULLIF(SUM(SUM(sales_amount)) OVER (), 0), 2) AS percentage "
+     f"FROM {V} WHERE order_date >= date_trunc('month', CURRENT_DATE - interval '1 month') "
+     "AND order_date < date_trunc('month', CURRENT_DATE) GROUP BY category ORDER BY total_sales DESC"),
+    ("本月销量前5的商品", "rank",
+     f"SELECT product_name, SUM(quantity) AS total_quantity FROM {V} "
+     "WHERE order_date >= date_trunc('month', CURRENT_DATE) "
+     "GROUP BY product_name ORDER BY total_quantity DESC LIMIT 5"),
+    ("哪个业务员销售额最低", "rank",
+     f"SELECT salesman_name, SUM(sales_amount) AS total_sales FROM {V} "
+     "GROUP BY salesman_name ORDER BY total_sales ASC LIMIT 1"),
+    ("今天的销售额和毛利", "total",
+     f"SELECT SUM(sales_amount) AS total_sales, SUM(gross_profit) AS total_profit FROM {V} "
+     "WHERE order_date = CURRENT_DATE"),
+]
+
+
+@pytest.mark.parametrize("question, template, sql", EXPECTED)
+def test_common_questions_map_to_template_sql(question, template, sql):
+    matched = IntentMatcher().match(question)
+    assert matched is not None
+    assert (matched.template, matched.sql) == (template, sql)
+
+
+@pytest.mark.parametrize("question", [
+    "华东和华南的销售额",  # 两个地区
+    "张三的销售额",  # 未识别的 "张三"
+    "为什么销售额下降了",
+    "各地区销售额最低的3个客户",  # 两个维度
+    "2024年去年的销售额",  # 两个时间范围
+    "销售额最高",  # 排名却没有分组维度
+    "各商品类别的毛利率占比",  # 毛利率不能计算占比
+    "库存还有多少",
+    "查询销售数据",  # 没有汇总词或明确的指标词,可能是要明细
+    "各地区的销售",
+    "客户数量",  # 计数,不是按销量排名
+    "商品数量",
+    "分公司数量",
+    "业务员数量是多少",
+    "有多少个客户",
+])
+def test_questions_not_fully_understood_go_to_agent(question):
+    assert IntentMatcher().match(question) is None
+
+
+@pytest.mark.parametrize("question", ["销售总共多少", "华东地区的销售合计", "各地区的销售金额"])
+def test_aggregate_words_make_vague_measures_explicit(question):
+    assert IntentMatcher().match(question) is not None
+
+
+@pytest.mark.parametrize("question, template, sql", EXPECTED)
+def test_template_sql_passes_guard(question, template, sql):
+    assert check_sql(sql, max_rows=5000).sql.startswith("SELECT")
+
+
+def test_filtered_rankings_are_answered_from_rollups():
+    matched = IntentMatcher().match("2024年3月华东地区各分公司的销售额和销量")
+    assert "FROM mv_sales_monthly" in AggregateNavigator().rewrite(matched.sql).sql
+
+
+def test_parse_number():
+    assert [parse_number(t) for t in ("7", "三", "十", "十五", "二十", "两", "一百")] == [7, 3, 10, 15, 20, 2, 100]
+
+
+def test_coverage_snapshot():
+    matcher = IntentMatcher()
+    matcher.record("rank", "hit")
+    matcher.record("rank", "hit")
+    matcher.record("total", "hit")
+    matcher.record(None, "miss")
+    matcher.record("trend", "error")
+    assert matcher.snapshot() == {
+        "requests": 5, "hits": 3, "errors": 1, "coverage": 0.6, "templates": {"rank": 2, "total": 1},
+    }
+
+
+class FakeRunner:
+    def __init__(self, fail=False, df=None):
+        self.fail = fail
+        self.df = df
+        self.sql = []
+
+    async def run_sql(self, args, context):
+        self.sql.append(args.sql)
+        if self.fail:
+            raise RuntimeError("connection refused")
+        if self.df is not None:
+            return self.df
+        return pd.DataFrame({"company_name": ["上海分公司"], "total_sales": [100.0]})
+
+
+def test_fast_path_skips_agent(monkeypatch):
+    from app.services import intent_templates
+    from app.services.vanna_service import vanna_service
+
+    matcher = IntentMatcher()
+    runner = FakeRunner()
+    monkeypatch.setattr(intent_templates, "intent_matcher", matcher)
+    monkeypatch.setattr(vanna_service, "_ready", True)
+    monkeypatch.setattr(vanna_service, "sql_runner", runner)
+    monkeypatch.setattr(vanna_service, "_system_tool_context", lambda conversation_id="chat": None)
+
+    async def collect():
+        return [item async for item in vanna_service._iter_agent_results("各分公司的销售业绩排名", None)]
+
+    results = asyncio.run(collect())
+    assert [kind for kind, _ in results] == ["sql", "dataframe", "stats"]
+    assert results[0][1] == runner.sql[0]
+    assert results[2][1]["fast_path"] == "rank"
+    assert matcher.snapshot()["hits"] == 1
+
+    # 模板 SQL 执行失败时交给 Agent
+    monkeypatch.setattr(vanna_service, "sql_runner", FakeRunner(fail=True))
+    assert asyncio.run(vanna_service._run_fast_path("各分公司的销售业绩排名")) is None
+    assert asyncio.run(vanna_service._run_fast_path("为什么销售额下降了")) is None
+    assert matcher.snapshot() == {
+        "requests": 3, "hits": 1, "errors": 1, "coverage": 0.3333, "templates": {"rank": 1},
+    }
+
+
+def test_unknown_name_filter_goes_to_agent(monkeypatch):
+    """名称筛选没有数据 (可能是不存在的公司) 时交给 Agent;没有名称筛选的空结果照常返回"""
+    from app.services import intent_templates
+    from app.services.vanna_service import vanna_service
+
+    monkeypatch.setattr(intent_templates, "intent_matcher", IntentMatcher())
+    monkeypatch.setattr(vanna_service, "_system_tool_context", lambda conversation_id="chat": None)
+    monkeypatch.setattr(vanna_service, "sql_runner", FakeRunner(df=pd.DataFrame({"total_sales": [None]})))
+
+    assert IntentMatcher().match("北京分公司销售额").named
+    assert asyncio.run(vanna_service._run_fast_path("北京分公司销售额")) is None
+    assert asyncio.run(vanna_service._run_fast_path("华东地区的销售额")) is not None
+
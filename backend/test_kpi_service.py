@@ -0,0 +1,97 @@
+"""
+测试仪表盘指标服务: 按指标缓存、按数据表水位失效、并发请求只计算一次
+"""
+import asyncio
+from datetime import datetime
+
+from app.services import kpi_service as kpi_module
+from app.services.kpi_service import KpiMetric, KpiService
+
+
+class _Row:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+
+class _FakeResult:
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def one(self):
+        return _Row(self.mapping)
+
+
+class _FakeSession:
+    """只响应水位查询;指标计算函数由测试直接提供"""
+
+    def __init__(self, watermarks):
+        self.watermarks = watermarks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        assert "max(biz_order.updated_at)" in str(statement)
+        return _FakeResult(dict(self.watermarks))
+
+
+def _service(watermarks, calls):
+    def metric(name, sources):
+        async def compute(session, today):
+            calls.append(name)
+            await asyncio.sleep(0)
+            return {"name": name, "run": calls.count(name)}
+        return KpiMetric(name, sources, compute)
+
+    metrics = {
+        "kpi": metric("kpi", ("biz_order",)),
+        "inventory_alerts": metric("inventory_alerts", ("inv_current_stock",)),
+    }
+    return KpiService(session_factory=lambda: _FakeSession(watermarks), metrics=metrics)
+
+
+def test_metrics_cached_until_their_source_changes(monkeypatch):
+    monkeypatch.setattr(kpi_module.settings, "kpi_freshness_check_seconds", 0)
+    watermarks = {
+        "biz_order": datetime(2024, 5, 1, 10),
+        "inv_current_stock": datetime(2024, 5, 1, 9),
+        "fact_finance": None,
+    }
+    calls = []
+    service = _service(watermarks, calls)
+
+    async def run():
+        # 并发请求同一指标只计算一次
+        first = await asyncio.gather(service.overview(), service.overview(), service.get("kpi"))
+        watermarks["inv_current_stock"] = datetime(2024, 5, 1, 11)
+        second = await service.overview()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert sorted(calls) == ["inventory_alerts", "inventory_alerts", "kpi"]
+    assert first[0]["last_updated"] == datetime(2024, 5, 1, 10)
+    assert first[2] == {"value": {"name": "kpi", "run": 1}, "last_updated": datetime(2024, 5, 1, 10)}
+    # 只有库存表变化: 库存预警重新计算,KPI 继续复用
+    assert second["kpi"]["run"] == 1 and second["inventory_alerts"]["run"] == 2
+    assert second["last_updated"] == datetime(2024, 5, 1, 11)
+
+
+def test_ttl_and_freshness_probe_interval(monkeypatch):
+    monkeypatch.setattr(kpi_module.settings, "kpi_freshness_check_seconds", 3600)
+    monkeypatch.setattr(kpi_module.settings, "kpi_cache_ttl_seconds", 0)
+    watermarks = {"biz_order": None, "inv_current_stock": None, "fact_finance": None}
+    calls = []
+    service = _service(watermarks, calls)
+
+    async def run():
+        await service.get("kpi")
+        watermarks["biz_order"] = datetime(2024, 5, 2)
+        return await service.get("kpi")
+
+    result = asyncio.run(run())
+    # 水位探测间隔内不重新查询水位;TTL 为 0 时每次重新计算
+    assert result == {"value": {"name": "kpi", "run": 2}, "last_updated": None}
@@ -0,0 +1,91 @@
+"""
+测试 LLM 问答记录的录制与 mock 服务回放
+"""
+import asyncio
+import json
+
+import httpx
+from vanna.core.llm import LlmMessage, LlmRequest, LlmResponse
+from vanna.core.tool import ToolCall
+from vanna.core.user import User
+
+from app.services.llm_transcripts import TranscriptRecorderMiddleware, extract_question, load_transcripts
+from app.services.prompt_builder import QUESTION_MARKER
+from scripts.mock_llm_server import TranscriptReplayer, create_app
+
+
+SQL = "SELECT company_name, SUM(sales_amount) AS total_sales FROM view_bi_sales_analysis GROUP BY company_name"
+
+
+def _write_transcripts(path):
+    path.write_text(
+        json.dumps({"question": "各分公司的销售业绩排名?", "sql": SQL, "answer": "排名如下。"}, ensure_ascii=False) + "\n"
+        + json.dumps({"question": "哪些商品缺货?", "sql": "SELECT 1", "answer": "无"}, ensure_ascii=False) + "\n",
+        encoding="utf-8",
+    )
+
+
+def test_load_and_extract(tmp_path):
+    """简写格式展开为 turns;从 Prompt 中取出原始问题"""
+    path = tmp_path / "t.jsonl"
+    _write_transcripts(path)
+    transcripts = load_transcripts(str(path))
+
+    assert transcripts["各分公司的销售业绩排名?"] == [
+        {"tool_calls": [{"name": "run_sql", "arguments": {"sql": SQL}}]},
+        {"content": "排名如下。"},
+    ]
+    assert extract_question(f"## 相关字段\nx\n\n{QUESTION_MARKER}问题 ") == "问题"
+
+
+def test_mock_server_replays_turns(tmp_path):
+    """第一轮返回 run_sql 工具调用,工具结果返回后给出总结;相近问题匹配到同一记录"""
+    path = tmp_path / "t.jsonl"
+    _write_transcripts(path)
+    replayer = TranscriptReplayer(load_transcripts(str(path)), latency_ms=0, jitter_ms=0)
+    app = create_app(replayer)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://mock") as client:
+            messages = [{"role": "user", "content": f"{QUESTION_MARKER}各分公司销售业绩排名"}]
+            first = (await client.post("/v1/chat/completions", json={"model": "m", "messages": messages})).json()
+            call = first["choices"][0]["message"]["tool_calls"][0]
+            messages += [first["choices"][0]["message"], {"role": "tool", "tool_call_id": call["id"], "content": "ok"}]
+            second = (await client.post("/v1/chat/completions", json={"model": "m", "messages": messages})).json()
+            return first, call, second
+
+    first, call, second = asyncio.run(run())
+    assert first["choices"][0]["finish_reason"] == "tool_calls"
+    assert json.loads(call["function"]["arguments"]) == {"sql": SQL}
+    assert second["choices"][0]["message"]["content"] == "排名如下。"
+    assert first["usage"]["prompt_tokens"] > 0
+
+
+def test_jitter_is_deterministic():
+    replayer = TranscriptReplayer({"q": [{"content": "a"}]}, latency_ms=100, jitter_ms=50)
+    delays = {replayer.delay("q", 0) for _ in range(3)}
+    assert len(delays) == 1
+    assert 0.05 <= delays.pop() <= 0.15
+
+
+def test_recorder_writes_completed_transcript(tmp_path):
+    """问答结束 (不再调用工具) 时写入完整 turns,可被 load_transcripts 读取"""
+    path = tmp_path / "rec.jsonl"
+    recorder = TranscriptRecorderMiddleware(str(path))
+    user = User(id="u", email="u@example.com", group_memberships=["user"])
+    request = LlmRequest(
+        user=user,
+        messages=[
+            LlmMessage(role="user", content=f"{QUESTION_MARKER}各分公司的销售业绩排名?"),
+            LlmMessage(role="assistant", content="", tool_calls=[ToolCall(id="c1", name="run_sql", arguments={"sql": SQL})]),
+            LlmMessage(role="tool", content="ok", tool_call_id="c1"),
+        ],
+    )
+
+    asyncio.run(recorder.after_llm_response(request, LlmResponse(tool_calls=[ToolCall(id="c2", name="x", arguments={})])))
+    assert not path.exists()
+
+    asyncio.run(recorder.after_llm_response(request, LlmResponse(content="排名如下。")))
+    turns = load_transcripts(str(path))["各分公司的销售业绩排名?"]
+    assert turns[0]["tool_calls"] == [{"name": "run_sql", "arguments": {"sql": SQL}}]
+    assert turns[-1] == {"content": "排名如下。"}
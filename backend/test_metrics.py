@@ -0,0 +1,107 @@
+"""
+测试 Prometheus 指标: 每路由请求耗时、SQL 统计、缓存命中、LLM 调用与连接池饱和度
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from app.core import metrics
+from app.db.query_stats import QueryStatsMiddleware, instrument_engine
+
+pytestmark = pytest.mark.skipif(not metrics.metrics_available(), reason="prometheus_client 未安装")
+
+
+def _sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _get(app, path):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path)
+    return asyncio.run(run())
+
+
+def test_route_and_db_metrics_use_route_template():
+    engine = instrument_engine(create_engine("sqlite://"))
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics-test/{item_id}")
+    async def item(item_id: int):
+        with engine.connect() as conn:
+            return {"value": conn.execute(text("SELECT :v"), {"v": item_id}).scalar()}
+
+    route = "/metrics-test/{item_id}"
+    before_http = _sample("http_request_duration_seconds_count", method="GET", route=route, status="200")
+    before_select = _sample("db_statement_duration_seconds_count", operation="SELECT")
+    before_queries = _sample("db_request_queries_sum", route=route)
+
+    assert _get(app, "/metrics-test/1").status_code == 200
+    assert _get(app, "/metrics-test/2").status_code == 200
+    assert _get(app, "/missing").status_code == 404
+
+    assert _sample("http_request_duration_seconds_count", method="GET", route=route, status="200") == before_http + 2
+    assert _sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+    assert _sample("db_statement_duration_seconds_count", operation="SELECT") == before_select + 2
+    assert _sample("db_request_queries_sum", route=route) == before_queries + 2
+
+
+def test_cache_llm_and_pool_metrics_are_exported(monkeypatch):
+    import redis.asyncio as redis
+
+    from app.services.vanna_service import vanna_service
+
+    # 连接池只在 Redis 初始化后出现 (创建连接池不会建立连接)
+    pool = redis.ConnectionPool.from_url("redis://localhost:6379/0", max_connections=20)
+    monkeypatch.setattr(vanna_service, "redis_client", redis.Redis(connection_pool=pool))
+    before_hit = _sample("cache_requests_total", cache="vanna", result="hit")
+    metrics.observe_cache("vanna", "get", 0.002, "hit")
+    metrics.observe_cache("vanna", "set", 0.003)
+    metrics.observe_llm(1.5, prompt_tokens=900, completion_tokens=120)
+
+    assert _sample("cache_requests_total", cache="vanna", result="hit") == before_hit + 1
+    assert _sample("cache_operation_duration_seconds_count", cache="vanna", operation="set") >= 1
+    labels = {"backend": metrics.settings.llm_backend, "model": metrics.settings.llm_model}
+    assert _sample("llm_request_duration_seconds_count", **labels) >= 1
+    assert _sample("llm_request_tokens_sum", **labels, kind="completion") >= 120
+
+    body, content_type = metrics.render_metrics()
+    text_body = body.decode()
+    assert content_type.startswith("text/plain")
+    assert 'connection_pool_saturation{pool="db"}' in text_body
+    assert 'connection_pool_capacity{pool="redis_cache"} 20.0' in text_body
+    assert "llm_request_tokens_bucket" in text_body
+
+
+def test_cache_value_size_and_compression_ratio(monkeypatch):
+    from app.services import cache_codec
+
+    monkeypatch.setattr(cache_codec.settings, "cache_compression", "zlib")
+    monkeypatch.setattr(cache_codec.settings, "cache_encoding", "json")
+    monkeypatch.setattr(cache_codec.settings, "cache_compress_min_bytes", 1024)
+    before = _sample("cache_value_bytes_count", compression="zlib", stage="raw")
+    before_sum = _sample("cache_value_bytes_sum", compression="zlib", stage="raw")
+    before_ratio = _sample("cache_compression_ratio_count", compression="zlib")
+
+    body = b'{"rows":[' + b",".join('"北京"'.encode() for _ in range(2000)) + b"]}"
+    packed = cache_codec.pack(None, json_body=body)
+    cache_codec.pack({"a": 1})  # 小值不压缩
+
+    assert _sample("cache_value_bytes_count", compression="zlib", stage="raw") == before + 1
+    assert _sample("cache_value_bytes_sum", compression="zlib", stage="raw") == before_sum + len(body)
+    assert _sample("cache_compression_ratio_count", compression="zlib") == before_ratio + 1
+    assert _sample("cache_value_bytes_count", compression="none", stage="stored") >= 1
+    assert len(packed) < len(body) / 4
+
+
+def test_metrics_endpoint():
+    from app.main import app
+
+    response = _get(app, "/metrics")
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.text
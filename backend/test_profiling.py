@@ -0,0 +1,85 @@
+"""
+测试按需请求剖析: 管理员请求头触发 (保存 / 内联报告) 与按路由采样合并
+"""
+import asyncio
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.core import profiling
+from app.core.profiling import PROFILE_HEADER, PROFILE_ID_HEADER, ProfileStore, ProfilingMiddleware
+from app.core.security import create_access_token
+
+pytestmark = pytest.mark.skipif(not profiling.profiling_available(), reason="pyinstrument 未安装")
+
+
+def _busy_loop(n: int) -> int:
+    total = 0
+    for i in range(n * 20000):
+        total += i % 7
+    return total
+
+
+def _app(store):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, store=store)
+
+    @app.get("/work/{n}")
+    async def work(n: int):
+        return {"total": _busy_loop(n)}
+
+    return app
+
+
+def _get(app, path, headers=None):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, headers=headers or {})
+    return asyncio.run(run())
+
+
+def _auth(role):
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'u', 'role': role})}"}
+
+
+def test_header_profiles_only_for_admin(tmp_path):
+    store = ProfileStore(str(tmp_path), keep=1)
+    app = _app(store)
+
+    plain = _get(app, "/work/5", {PROFILE_HEADER: "store", **_auth("employee")})
+    assert plain.status_code == 200 and PROFILE_ID_HEADER not in plain.headers and not store.reports
+
+    stored = _get(app, "/work/5", {PROFILE_HEADER: "store", **_auth("admin")})
+    assert stored.json() == {"total": _busy_loop(5)}
+    profile_id = stored.headers[PROFILE_ID_HEADER]
+    entry = store.reports[profile_id]
+    assert entry["route"] == "/work/{n}" and entry["status"] == 200
+    for fmt in profiling.REPORT_FORMATS:
+        assert os.path.getsize(store.path(profile_id, fmt)) > 0
+    with open(store.path(profile_id, "text"), encoding="utf-8") as f:
+        assert "_busy_loop" in f.read()
+
+    # 超出保留数量时删除旧报告
+    newer = _get(app, "/work/1", {PROFILE_HEADER: "1", **_auth("admin")}).headers[PROFILE_ID_HEADER]
+    assert list(store.reports) == [newer] and not os.path.exists(store.path(profile_id, "html"))
+
+    inline = _get(app, "/work/5", {PROFILE_HEADER: "inline", **_auth("admin")})
+    assert inline.headers["content-type"].startswith("text/html") and "<html" in inline.text.lower()
+
+
+def test_sampling_merges_profiles_per_route(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.sample_every = 2
+    app = _app(store)
+
+    for n in (3, 4, 5, 6):
+        assert _get(app, f"/work/{n}").status_code == 200
+
+    [summary] = store.sampled_summary()
+    assert summary["route"] == "/work/{n}" and summary["requests"] == 2
+    assert "_busy_loop" in store.render_sampled("/work/{n}", "text")
+
+    store.reset_sampled()
+    assert store.sampled_summary() == []
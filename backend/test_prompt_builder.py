@@ -0,0 +1,66 @@
+"""
+测试 Prompt 构建: 字段挑选、示例检索与 token 预算
+"""
+import asyncio
+
+from vanna.integrations.local.agent_memory import DemoAgentMemory
+
+from app.services.prompt_builder import (
+    PromptBuilder, VIEW_CATALOG, STATIC_SYSTEM_PROMPT, StaticSystemPromptBuilder, estimate_tokens
+)
+
+
+def _memory_with_examples():
+    memory = DemoAgentMemory(max_items=100)
+    examples = [
+        ("各分公司的销售业绩排名?", "SELECT company_name, SUM(sales_amount) AS total_sales FROM view_bi_sales_analysis GROUP BY company_name ORDER BY total_sales DESC"),
+        ("哪些商品的库存低于预警线?", "SELECT product_name, warehouse_name, current_stock, min_stock FROM view_bi_inventory_alert WHERE stock_status IN ('缺货', '库存不足')"),
+    ]
+    for question, sql in examples:
+        asyncio.run(memory.save_tool_usage(question, "run_sql", {"sql": sql}, context=None))
+    return memory
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("销售额") == 3
+    assert estimate_tokens("SELECT 1") == 2
+
+
+def test_select_views_and_columns():
+    """按关键词挑选视图,只带 core 字段与命中的字段"""
+    assert PromptBuilder.select_views("哪些商品缺货?") == ["view_bi_inventory_alert"]
+    assert PromptBuilder.select_views("你好") == ["view_bi_sales_analysis"]
+
+    columns = [c[0] for c in PromptBuilder.select_columns("view_bi_sales_analysis", "华东地区各业务员的毛利")]
+    assert {"region", "salesman_name", "gross_profit", "sales_amount"} <= set(columns)
+    assert "warehouse_location" not in columns
+    assert len(columns) < len(VIEW_CATALOG["view_bi_sales_analysis"]["columns"])
+
+
+def test_build_includes_similar_examples():
+    """相似示例被带上,示例 SQL 用到的字段也被带上"""
+    builder = PromptBuilder(agent_memory=_memory_with_examples(), max_examples=3, min_example_score=0.5)
+    built = asyncio.run(builder.build("各分公司销售业绩排名"))
+
+    assert built["examples"] == 1
+    assert "company_name" in built["prompt"]
+    assert built["prompt"].rstrip().endswith("各分公司销售业绩排名")
+    assert built["tokens"] == estimate_tokens(built["prompt"])
+
+
+def test_token_budget_drops_examples():
+    """超出预算时丢弃示例,但保留字段与问题"""
+    builder = PromptBuilder(agent_memory=_memory_with_examples(), token_budget=60, min_example_score=0.5)
+    built = asyncio.run(builder.build("各分公司销售业绩排名"))
+
+    assert built["examples"] == 0
+    assert "## 用户问题" in built["prompt"]
+
+
+def test_static_system_prompt_is_constant():
+    """系统提示词不随请求变化 (可命中前缀缓存)"""
+    prompt = asyncio.run(StaticSystemPromptBuilder().build_system_prompt(None, []))
+    assert prompt == STATIC_SYSTEM_PROMPT
+    for view in VIEW_CATALOG:
+        assert view in prompt
@@ -0,0 +1,98 @@
+"""
+测试每请求 SQL 统计: 语句形状归一化、响应头、N+1 告警与查询预算
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from app.db import query_stats
+from app.db.query_stats import (
+    QueryBudgetExceeded,
+    QueryStatsMiddleware,
+    count_queries,
+    instrument_engine,
+    statement_shape,
+)
+
+
+def test_statement_shape_normalizes_params_and_in_lists():
+    assert statement_shape("SELECT * FROM t WHERE id = $1::INTEGER") == "SELECT * FROM t WHERE id = ?"
+    assert statement_shape("SELECT *\n  FROM t WHERE id IN ($1::INTEGER, $2::INTEGER, $3::INTEGER)") == \
+        statement_shape("SELECT * FROM t WHERE id IN ($1::INTEGER)") == "SELECT * FROM t WHERE id IN (?)"
+    assert statement_shape("SELECT * FROM t WHERE name = %(name_1)s") == "SELECT * FROM t WHERE name = ?"
+
+
+def _app(engine):
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware)
+
+    @app.get("/items/{n}")
+    async def items(n: int):
+        with engine.connect() as conn:
+            ids = [row[0] for row in conn.execute(text("SELECT id FROM item"))]
+            # 逐条查询: 典型的 N+1
+            names = [conn.execute(text("SELECT name FROM item WHERE id = :id"), {"id": i}).scalar() for i in ids[:n]]
+        return {"names": names}
+
+    return app
+
+
+def _engine():
+    engine = instrument_engine(create_engine("sqlite://"))
+    instrument_engine(engine)  # 重复注册无副作用
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO item (name) VALUES ('a'), ('b'), ('c'), ('d'), ('e'), ('f'), ('g'), ('h')"))
+    return engine
+
+
+def _get(app, path):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path)
+    return asyncio.run(run())
+
+
+def test_middleware_headers_metrics_and_n_plus_one_warning(monkeypatch):
+    monkeypatch.setattr(query_stats.settings, "debug", True)
+    monkeypatch.setattr(query_stats.settings, "db_query_budget", 30)
+    monkeypatch.setattr(query_stats.settings, "db_query_repeat_threshold", 5)
+    monkeypatch.setattr(query_stats.settings, "db_query_budget_action", "warn")
+    monkeypatch.setattr(query_stats, "query_metrics", query_stats.RouteQueryMetrics())
+    warnings = []
+    monkeypatch.setattr(query_stats.logger, "warning", warnings.append)
+    app = _app(_engine())
+
+    ok = _get(app, "/items/2")
+    assert ok.headers[query_stats.QUERY_COUNT_HEADER] == "3"
+    assert ok.headers["server-timing"].startswith("db;dur=") and '"3 queries"' in ok.headers["server-timing"]
+    assert warnings == []
+
+    noisy = _get(app, "/items/8")
+    assert noisy.status_code == 200 and noisy.headers[query_stats.QUERY_COUNT_HEADER] == "9"
+    assert len(warnings) == 1 and "N+1" in warnings[0] and "/items/{n}" in warnings[0]
+
+    metrics = query_stats.query_metrics.snapshot()["/items/{n}"]
+    assert (metrics["requests"], metrics["queries"], metrics["max_queries"], metrics["n_plus_one"]) == (2, 12, 9, 1)
+
+
+def test_budget_raises_in_strict_mode(monkeypatch):
+    monkeypatch.setattr(query_stats.settings, "debug", False)
+    monkeypatch.setattr(query_stats.settings, "db_query_budget", 4)
+    monkeypatch.setattr(query_stats.settings, "db_query_budget_action", "raise")
+    engine = _engine()
+    app = _app(engine)
+
+    assert query_stats.QUERY_COUNT_HEADER not in _get(app, "/items/1").headers
+    with pytest.raises(QueryBudgetExceeded):
+        _get(app, "/items/5")
+
+    with pytest.raises(QueryBudgetExceeded):
+        with count_queries(budget=1) as stats:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+    assert stats.count == 2
@@ -0,0 +1,230 @@
+"""
+测试报表引擎: 语义层白名单、参数化编译、按形状缓存与 GROUPING SETS 结果拆分
+"""
+import asyncio
+import datetime
+import io
+import os
+from decimal import Decimal
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from openpyxl import load_workbook
+from sqlalchemy.dialects import postgresql
+
+from app.api.v1.endpoints import report
+from app.schemas.report import ReportRequest
+from app.services.report_engine import ReportEngine, ReportQueryError, compile_report, report_engine
+
+
+def test_compile_parameterized_grouping_sets():
+    """字段来自白名单,取值全部为绑定参数;汇总通过 GROUPING SETS 在同一条 SQL 中计算"""
+    request = ReportRequest(
+        dimensions=["company_name", "category"],
+        metrics=["sales_amount", "gross_profit_rate"],
+        filters={"region": ["华东", "华南"], "order_date": {"gte": "2024-01-01"}},
+        order_by="-sales_amount",
+        limit=50,
+    )
+    statement, sql, params, info = report_engine.build(request)
+
+    assert info["dataset"] == "sales"
+    assert 'GROUPING SETS (("company_name", "category"), ("company_name"), ())' in sql
+    assert '"sales_amount" DESC NULLS LAST' in sql
+    assert "华东" not in sql and "2024" not in sql
+    assert params == {"f0": datetime.date(2024, 1, 1), "f1": ["华东", "华南"], "limit": 50}
+
+    compiled = str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+    assert "view_bi_sales_analysis" in compiled
+
+
+def test_whitelist_and_shape_cache():
+    """未知字段 / 指标 / 排序被拒绝;取值不同但形状相同的请求复用编译结果"""
+    with pytest.raises(ReportQueryError):
+        report_engine.build(ReportRequest(dimensions=["company_name; DROP TABLE x"], metrics=["sales_amount"]))
+    with pytest.raises(ReportQueryError):
+        report_engine.build(ReportRequest(dataset="sales", metrics=["purchase_amount"]))
+    with pytest.raises(ReportQueryError):
+        report_engine.build(ReportRequest(dimensions=["company_name"], metrics=["sales_amount"], order_by="region"))
+
+    compile_report.cache_clear()
+    for region in ("华东", "华北", "西南"):
+        report_engine.build(ReportRequest(dimensions=["category"], metrics=["sales_amount"], filters={"region": region}))
+    info = compile_report.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+    # 只有采购指标时自动选择采购数据集
+    _, sql, _, built = report_engine.build(ReportRequest(dimensions=["supplier_name"], metrics=["purchase_amount"]))
+    assert built["dataset"] == "purchase" and "view_bi_purchase_analysis" in sql
+
+
+class _FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def mappings(self):
+        return self._rows
+
+
+class _FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params):
+        return _FakeResult([dict(row) for row in self.rows])
+
+    async def stream(self, statement, params):
+        return _FakeStreamResult(self.rows)
+
+
+class _FakeStreamResult:
+    """模拟服务端游标: 按批返回行"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def keys(self):
+        return list(self.rows[0])
+
+    async def partitions(self, size):
+        for i in range(0, len(self.rows), size):
+            yield [tuple(row.values()) for row in self.rows[i:i + size]]
+
+
+class _FakeEngine:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def connect(self):
+        return _FakeConnection(self.rows)
+
+
+def test_query_splits_detail_subtotals_and_total():
+    """GROUPING() 位图: 0 为明细,01 为第一个维度小计,11 为总计"""
+    rows = [
+        {"company_name": "北京", "category": "电子", "sales_amount": 30, "_grouping": 0, "_total_count": 3},
+        {"company_name": "上海", "category": "电子", "sales_amount": 20, "_grouping": 0, "_total_count": 3},
+        {"company_name": "北京", "category": None, "sales_amount": 40, "_grouping": 1, "_total_count": None},
+        {"company_name": "上海", "category": None, "sales_amount": 20, "_grouping": 1, "_total_count": None},
+        {"company_name": None, "category": None, "sales_amount": 60, "_grouping": 3, "_total_count": None},
+    ]
+    engine = ReportEngine(engine=_FakeEngine(rows))
+    result = asyncio.run(engine.query(ReportRequest(dimensions=["company_name", "category"], metrics=["sales_amount"], limit=2)))
+
+    assert result["data"] == [
+        {"company_name": "北京", "category": "电子", "sales_amount": 30},
+        {"company_name": "上海", "category": "电子", "sales_amount": 20},
+    ]
+    assert result["total_count"] == 3
+    assert result["summary"]["total"] == {"sales_amount": 60}
+    assert result["summary"]["subtotals"] == [
+        {"company_name": "北京", "sales_amount": 40},
+        {"company_name": "上海", "sales_amount": 20},
+    ]
+
+
+def test_subtotals_are_not_cut_by_row_limit():
+    """小计数量超过 limit 时,明细按 limit 截断,小计与总计完整返回"""
+    request = ReportRequest(dimensions=["company_name", "category"], metrics=["sales_amount"], limit=2)
+    _, sql, _, _ = report_engine.build(request)
+    summary = sql.split("UNION ALL")[1]
+    assert "LIMIT" not in summary and "ORDER BY _grouping DESC" in summary
+
+    companies = ["北京", "上海", "广州", "深圳"]
+    rows = [
+        {"company_name": "北京", "category": "电子", "sales_amount": 30, "_grouping": 0, "_total_count": 8},
+        {"company_name": "上海", "category": "电子", "sales_amount": 20, "_grouping": 0, "_total_count": 8},
+        {"company_name": None, "category": None, "sales_amount": 100, "_grouping": 3, "_total_count": None},
+    ] + [
+        {"company_name": name, "category": None, "sales_amount": 40 - 10 * i, "_grouping": 1, "_total_count": None}
+        for i, name in enumerate(companies)
+    ]
+    result = asyncio.run(ReportEngine(engine=_FakeEngine(rows)).query(request))
+    assert len(result["data"]) == 2 and result["total_count"] == 8
+    assert result["summary"]["total"] == {"sales_amount": 100}
+    assert [s["company_name"] for s in result["summary"]["subtotals"]] == companies
+
+
+def test_export_streams_csv_and_xlsx(tmp_path, monkeypatch):
+    """导出按批读取;CSV 流式发送,XLSX 写入临时文件并在发送后删除,工作目录不留文件"""
+    rows = [{"category": f"c{i}", "sales_amount": i} for i in range(25)]
+    monkeypatch.setattr(report, "report_engine", ReportEngine(engine=_FakeEngine(rows)))
+    monkeypatch.setattr(report.settings, "report_export_batch_size", 10)
+    monkeypatch.setattr(report.settings, "report_export_tmp_dir", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    app = FastAPI()
+    app.include_router(report.router, prefix="/report")
+    body = {"dimensions": ["category"], "metrics": ["sales_amount"]}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            csv_resp = await client.post("/report/export", json={"report_request": body, "format": "csv"})
+            xlsx_resp = await client.post("/report/export", json={"report_request": body, "format": "xlsx"})
+            bad_resp = await client.post("/report/export", json={"report_request": {"metrics": ["nope"]}, "format": "csv"})
+            return csv_resp, xlsx_resp, bad_resp
+
+    csv_resp, xlsx_resp, bad_resp = asyncio.run(run())
+
+    assert csv_resp.status_code == 200
+    lines = csv_resp.content.decode("utf-8-sig").splitlines()
+    assert lines[0] == "category,sales_amount" and len(lines) == 26
+
+    assert xlsx_resp.status_code == 200
+    sheet = load_workbook(io.BytesIO(xlsx_resp.content), read_only=True).active
+    assert len(list(sheet.iter_rows(values_only=True))) == 26
+    assert os.listdir(tmp_path) == []
+
+    assert bad_resp.status_code == 400
+
+
+def test_arrow_query_and_parquet_export(tmp_path, monkeypatch):
+    """format=arrow / parquet 返回带汇总元数据的列式结果;金额为 decimal128,不丢失精度"""
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    query_rows = [
+        {"category": "电子", "sales_amount": Decimal("1234567890123.45"), "_grouping": 0, "_total_count": 1},
+        {"category": None, "sales_amount": Decimal("1234567890123.45"), "_grouping": 1, "_total_count": None},
+    ]
+    export_rows = [{"category": f"c{i}", "sales_amount": i} for i in range(25)]
+    monkeypatch.setattr(report.settings, "report_export_batch_size", 10)
+    monkeypatch.setattr(report.settings, "report_export_tmp_dir", str(tmp_path))
+    app = FastAPI()
+    app.include_router(report.router, prefix="/report")
+    body = {"dimensions": ["category"], "metrics": ["sales_amount"]}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            monkeypatch.setattr(report, "report_engine", ReportEngine(engine=_FakeEngine(query_rows)))
+            arrow_resp = await client.post("/report/query?format=arrow", json=body)
+            parquet_query_resp = await client.post("/report/query?format=parquet", json=body)
+            monkeypatch.setattr(report, "report_engine", ReportEngine(engine=_FakeEngine(export_rows)))
+            parquet_resp = await client.post("/report/export", json={"report_request": body, "format": "parquet"})
+            stream_resp = await client.post("/report/export", json={"report_request": body, "format": "arrow"})
+            return arrow_resp, parquet_query_resp, parquet_resp, stream_resp
+
+    arrow_resp, parquet_query_resp, parquet_resp, stream_resp = asyncio.run(run())
+
+    table = pa.ipc.open_stream(arrow_resp.content).read_all()
+    assert table.to_pylist() == [{"category": "电子", "sales_amount": Decimal("1234567890123.45")}]
+    assert table.schema.metadata[b"total_count"] == b"1"
+    assert b'"sales_amount":1234567890123.45' in table.schema.metadata[b"summary"]
+
+    assert parquet_query_resp.headers["content-type"] == "application/vnd.apache.parquet"
+    queried = pq.read_table(io.BytesIO(parquet_query_resp.content))
+    assert queried.to_pylist() == table.to_pylist()
+    assert queried.schema.metadata[b"total_count"] == b"1"
+
+    parquet = pq.read_table(io.BytesIO(parquet_resp.content))
+    assert parquet.num_rows == 25 and parquet.schema.field("sales_amount").type == pa.decimal128(38, 6)
+    assert os.listdir(tmp_path) == []
+
+    streamed = pa.ipc.open_stream(stream_resp.content).read_all()
+    assert streamed.num_rows == 25 and streamed.column("category")[24].as_py() == "c24"
@@ -0,0 +1,108 @@
+"""
+测试 AI SQL 执行前检查: 只读限制、LIMIT 改写与代价上限
+"""
+import pytest
+
+from app.services import sql_runner
+from app.services.sql_guard import SqlGuardError, check_cost, check_sql
+from app.services.sql_runner import BoundedPostgresRunner
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM biz_order",
+    "UPDATE base_product SET cost_price = 0",
+    "DROP VIEW view_bi_sales_analysis",
+    "SELECT 1; DELETE FROM biz_order",
+    "WITH d AS (DELETE FROM biz_order RETURNING *) SELECT * FROM d",
+    "SELECT * INTO tmp_copy FROM biz_order",
+    "SELECT pg_sleep(60)",
+    "SELECT * FROM biz_order FOR UPDATE",
+])
+def test_rejects_non_select_statements(sql):
+    with pytest.raises(SqlGuardError):
+        check_sql(sql, 100)
+
+
+def test_limit_is_injected_or_tightened():
+    missing = check_sql('SELECT 产品名称 AS "产品", SUM(销售额) FROM view_bi_sales_analysis GROUP BY 1 ORDER BY 2 DESC;', 100)
+    assert missing.limit_applied
+    assert missing.sql == 'SELECT 产品名称 AS "产品", SUM(销售额) FROM view_bi_sales_analysis GROUP BY 1 ORDER BY 2 DESC LIMIT 101'
+    assert missing.original.endswith("ORDER BY 2 DESC")
+
+    too_large = check_sql("WITH t AS (SELECT * FROM view_bi_sales_analysis) SELECT * FROM t LIMIT 100000", 100)
+    assert too_large.sql.endswith("LIMIT 101")
+
+    # 已有更小的 LIMIT 时原样执行
+    small = check_sql("SELECT * FROM view_bi_sales_analysis LIMIT 10", 100)
+    assert not small.limit_applied and small.sql == "SELECT * FROM view_bi_sales_analysis LIMIT 10"
+
+
+class PlanConnection:
+    def __init__(self, cost, unlimited_cost=None):
+        self.cost = cost
+        self.unlimited_cost = cost if unlimited_cost is None else unlimited_cost
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql if params is None else (sql, params))
+
+    def fetchone(self):
+        if self.executed[-1].startswith("SELECT COUNT"):
+            return (12345,)
+        scan = {"Node Type": "Nested Loop", "Total Cost": self.unlimited_cost}
+        return ([{"Plan": {"Node Type": "Limit", "Total Cost": self.cost, "Plans": [scan]}}],)
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_cost_guard_refuses_expensive_queries():
+    guarded = check_sql("SELECT * FROM biz_order a, biz_order_item b", 100)
+    conn = PlanConnection(cost=8.5e7)
+    with pytest.raises(SqlGuardError, match="代价估算"):
+        check_cost(conn, guarded, max_cost=1e6)
+    assert conn.executed == ["EXPLAIN (FORMAT JSON) SELECT * FROM biz_order AS a, biz_order_item AS b LIMIT 101"]
+
+    assert check_cost(PlanConnection(cost=120.0), guarded, max_cost=1e6).cost == 120.0
+    # 上限为 0 时不执行 EXPLAIN
+    skipped = PlanConnection(cost=1e9)
+    assert check_cost(skipped, check_sql("SELECT 1", 100), max_cost=0).cost is None and not skipped.executed
+
+
+def test_runner_rejects_before_connecting(monkeypatch):
+    def connect(dsn):
+        raise AssertionError("被拒绝的 SQL 不应建立连接")
+
+    monkeypatch.setattr(sql_runner.psycopg2, "connect", connect)
+    with pytest.raises(SqlGuardError):
+        BoundedPostgresRunner("postgresql://test")._run_sql_sync("TRUNCATE biz_order")
+
+
+def test_cost_guard_ignores_injected_limit():
+    # 笛卡尔积: 只取 101 行时 Limit 节点代价很低,不限行数时远超上限
+    guarded = check_sql("SELECT * FROM biz_order a CROSS JOIN biz_order_item b", 100)
+    with pytest.raises(SqlGuardError, match="代价估算"):
+        check_cost(PlanConnection(cost=3.2, unlimited_cost=8.5e7), guarded, max_cost=1e6)
+
+    # 查询自带的小 LIMIT 保留,按 Limit 节点的代价计算
+    own_limit = check_sql("SELECT * FROM biz_order a CROSS JOIN biz_order_item b LIMIT 10", 100)
+    assert check_cost(PlanConnection(cost=3.2, unlimited_cost=8.5e7), own_limit, max_cost=1e6).cost == 3.2
+
+
+def test_count_total_runs_under_statement_timeout(monkeypatch):
+    monkeypatch.setattr(sql_runner.settings, "chat_count_timeout_ms", 1500)
+    conn = PlanConnection(cost=1.0)
+    assert BoundedPostgresRunner._count_total(conn, "SELECT * FROM biz_order;") == 12345
+    assert conn.executed == [
+        ("SET LOCAL statement_timeout = %s", (1500,)),
+        "SELECT COUNT(*) FROM (SELECT * FROM biz_order) AS _total",
+    ]
@@ -0,0 +1,67 @@
+"""
+测试 AI 查询结果在内存中传递与落盘目录清理
+"""
+import asyncio
+import os
+import time
+
+import pandas as pd
+from vanna.capabilities.sql_runner import RunSqlToolArgs, SqlRunner
+from vanna.core.tool import ToolContext
+from vanna.core.user import User
+from vanna.integrations.local.agent_memory import DemoAgentMemory
+
+from app.services.sql_runner import InMemoryRunSqlTool, prune_spill_dir, start_query_capture
+
+
+class FakeRunner(SqlRunner):
+    def __init__(self, df):
+        self.df = df
+
+    async def run_sql(self, args, context):
+        return self.df
+
+
+def _context():
+    user = User(id="u", email="u@example.com", group_memberships=["user"])
+    return ToolContext(user=user, conversation_id="c", request_id="r", agent_memory=DemoAgentMemory())
+
+
+def test_result_frame_stays_in_memory(tmp_path, monkeypatch):
+    """完整结果帧写入 QueryCapture;LLM 与组件只拿到预览;未配置落盘目录时不写文件"""
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame({"id": range(100), "name": [f"n{i}" for i in range(100)]})
+    tool = InMemoryRunSqlTool(sql_runner=FakeRunner(df), preview_rows=5)
+
+    async def run():
+        capture = start_query_capture()
+        result = await tool.execute(_context(), RunSqlToolArgs(sql="WITH t AS (SELECT 1) SELECT * FROM t"))
+        return capture, result
+
+    capture, result = asyncio.run(run())
+    assert result.success
+    assert capture["dataframe"] is df
+    assert len(result.ui_component.rich_component.rows) == 5
+    assert "共 100 行" in result.result_for_llm
+    assert result.metadata["row_count"] == 100
+    assert "output_file" not in result.metadata
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_and_prune(tmp_path):
+    """配置落盘目录时写 CSV;清理先删过期文件,再从最旧的开始删到总大小达标"""
+    df = pd.DataFrame({"v": range(50)})
+    tool = InMemoryRunSqlTool(sql_runner=FakeRunner(df), spill_dir=str(tmp_path))
+    result = asyncio.run(tool.execute(_context(), RunSqlToolArgs(sql="SELECT v FROM t")))
+    assert os.path.exists(result.metadata["output_file"])
+
+    now = time.time()
+    for i, age in enumerate([7200, 30, 20, 10]):
+        path = tmp_path / f"query_results_{i}.csv"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - age, now - age))
+    os.remove(result.metadata["output_file"])
+
+    removed, freed = prune_spill_dir(str(tmp_path), max_age_seconds=3600, max_bytes=250)
+    assert (removed, freed) == (2, 200)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["query_results_2.csv", "query_results_3.csv"]
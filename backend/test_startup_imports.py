@@ -0,0 +1,16 @@
+"""
+测试应用启动不加载重量级依赖 (Agent 与导出相关模块在首次使用时才导入)
+"""
+import subprocess
+import sys
+
+LAZY_MODULES = ("vanna", "pandas", "sqlglot", "pyarrow", "openpyxl")
+
+
+def test_importing_app_does_not_load_heavy_dependencies():
+    code = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1:] in ([], [""])
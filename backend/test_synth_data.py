@@ -0,0 +1,62 @@
+"""
+测试规模化合成数据: ID 预分配连续、订单金额与明细一致、COPY 数据格式
+"""
+import numpy as np
+
+from scripts import synth_data
+
+
+class _FakeCursor:
+    def __init__(self):
+        self.copies = []
+
+    def copy_expert(self, sql, buffer):
+        self.copies.append((sql, buffer.read()))
+
+
+def test_plan_orders_assigns_contiguous_ids():
+    plan = synth_data.plan_for(0.2)
+    tasks = synth_data.plan_orders(plan, seed=1, chunks=6)
+
+    assert len(tasks) == 6
+    assert sum(int(counts.sum()) for _, counts, _, _, _ in tasks) == plan["orders"]
+    for (_, counts, item_counts, order_id, item_id), nxt in zip(tasks, tasks[1:]):
+        assert len(item_counts) == counts.sum()
+        assert nxt[3] == order_id + counts.sum()
+        assert nxt[4] == item_id + item_counts.sum()
+    # 日期区间互不重叠且按时间顺序排列
+    assert all(a[0][-1] < b[0][0] for a, b in zip(tasks, tasks[1:]))
+
+
+def test_generated_orders_are_consistent():
+    plan = synth_data.plan_for(0.05)
+    dimensions = synth_data.generate_dimensions(plan, seed=1)
+    partners = dimensions["base_partner"]
+    dims = {
+        "customers": partners.loc[partners["type"] == "CUSTOMER", "id"].to_numpy(),
+        "suppliers": partners.loc[partners["type"] == "SUPPLIER", "id"].to_numpy(),
+        "cost_price": dimensions["base_product"]["cost_price"].to_numpy(dtype=np.float64),
+        "employees": len(dimensions["sys_employee"]),
+        "warehouses": len(dimensions["base_warehouse"]),
+    }
+    days, per_day, item_counts, order_id, item_id = synth_data.plan_orders(plan, seed=1, chunks=1)[0]
+    orders, items = synth_data.generate_orders(
+        np.random.default_rng(1), np.repeat(days, per_day), item_counts, order_id, item_id, dims
+    )
+
+    assert orders["id"].tolist() == list(range(1, plan["orders"] + 1))
+    assert orders["order_no"].is_unique
+    totals = items.groupby("order_id")["subtotal"].sum().round(2)
+    assert np.allclose(orders.set_index("id")["total_amount"], totals)
+    purchase = orders["type"] == "PURCHASE"
+    assert orders.loc[purchase, "partner_id"].isin(dims["suppliers"]).all()
+    assert orders.loc[~purchase, "partner_id"].isin(dims["customers"]).all()
+
+    cursor = _FakeCursor()
+    finance = synth_data.generate_finance(plan, dimensions, seed=1)
+    synth_data.copy_frame(cursor, "fact_finance", finance)
+    sql, data = cursor.copies[0]
+    assert sql.startswith("COPY fact_finance (id, type, trans_date, amount, balance,")
+    expense = [line for line in data.splitlines() if ",EXPENSE," in line][0].split(",")
+    # 费用没有余额与往来单位: 写为空值 (NULL)
+    assert expense[4] == "" and expense[6] == ""
@@ -0,0 +1,96 @@
+"""
+测试 OpenTelemetry 链路追踪: 请求 span、SQL 语句 span 的父子关系、失败语句与 JSON Lines 导出
+"""
+import asyncio
+import json
+import time
+
+import httpx
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from app.core import tracing
+from app.db.query_stats import instrument_engine
+
+pytestmark = pytest.mark.skipif(tracing.trace is None, reason="opentelemetry-sdk 未安装")
+
+
+@pytest.fixture
+def exported():
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    assert tracing.setup_tracing(exporter)
+
+    def spans():
+        tracing.force_flush()
+        return exporter.get_finished_spans()
+
+    yield spans
+    tracing.shutdown_tracing()
+
+
+def _get(app, path):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path)
+    return asyncio.run(run())
+
+
+def test_request_span_parents_statement_spans(exported):
+    engine = instrument_engine(create_engine("sqlite://"))
+    app = FastAPI()
+    app.add_middleware(tracing.TracingMiddleware)
+
+    @app.get("/items/{n}")
+    async def items(n: int):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT :n"), {"n": n})
+            try:
+                conn.execute(text("SELECT * FROM missing_table"))
+            except Exception:
+                pass
+        return {"n": n}
+
+    assert _get(app, "/items/3").status_code == 200
+
+    spans = exported()
+    server = next(s for s in spans if s.name == "GET /items/{n}")
+    assert server.attributes["http.route"] == "/items/{n}" and server.attributes["http.status_code"] == 200
+
+    statements = [s for s in spans if s.name == "db SELECT"]
+    assert len(statements) == 2
+    assert all(s.parent.span_id == server.context.span_id for s in statements)
+    failed = next(s for s in statements if "missing_table" in s.attributes["db.statement"])
+    assert not failed.status.is_ok
+
+
+def test_json_lines_exporter_and_service_spans(tmp_path):
+    from app.services.vanna_service import vanna_service
+
+    path = tmp_path / "traces.jsonl"
+    assert tracing.setup_tracing(tracing.JsonLinesSpanExporter(str(path)))
+    try:
+        started = time.time_ns()
+        df = pd.DataFrame({"月份": ["2024-01", "2024-02", "2024-03"], "销售额": [10.0, 12.5, 9.0]})
+        chart_type = vanna_service._recommend_chart_type("每月销售额趋势", df)
+        vanna_service._to_columnar(df)
+        tracing.record_span("llm.request", started, **{"llm.prompt_tokens": 900})
+        tracing.force_flush()
+    finally:
+        tracing.shutdown_tracing()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    names = {record["name"]: record for record in records}
+    assert names["vanna.recommend_chart"]["attributes"]["chart_type"] == chart_type
+    assert names["vanna.to_columnar"]["attributes"]["rows"] == 3
+    assert names["llm.request"]["attributes"]["llm.prompt_tokens"] == 900
+
+
+def test_span_is_noop_when_disabled():
+    assert not tracing.tracing_enabled()
+    with tracing.span("noop") as current:
+        assert current is None
+    tracing.end_span(tracing.start_span("noop"))
@@ -2,13 +2,29 @@
  * ChatBI API 接口
  */
 import { request } from '@/utils/http';
-import type { ChatRequest, ChatResponse } from '@/types/chat';
+import type { ChatApiResponse, ChatColumnarData, ChatData, ChatRequest, ChatResponse } from '@/types/chat';
+
+/**
+ * 列式数据转换为行数据
+ */
+export const columnarToRows = (data: ChatColumnarData): ChatData => {
+  const { columns = [], values = [], row_count = 0 } = data;
+  const rows = Array.from({ length: row_count }, (_, rowIndex) => {
+    const row: Record<string, any> = {};
+    columns.forEach((col, colIndex) => {
+      row[col] = values[colIndex]?.[rowIndex] ?? null;
+    });
+    return row;
+  });
+  return { columns, rows, total_count: data.total_count, truncated: data.truncated };
+};
 
 /**
  * 发送聊天消息到 AI
  */
-export const sendMessage = (data: ChatRequest): Promise<ChatResponse> => {
-  return request.post<ChatResponse>('/api/v1/chat/', data);
+export const sendMessage = async (data: ChatRequest): Promise<ChatResponse> => {
+  const response = await request.post<ChatApiResponse>('/api/v1/chat/', data);
+  return { ...response, data: columnarToRows(response.data) };
 };
 
 /**
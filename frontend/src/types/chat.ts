@@ -3,15 +3,36 @@
  */
 
 // 图表类型枚举
-export type ChartType = 'bar' | 'line' | 'pie' | 'table' | 'scatter' | 'radar';
+export type ChartType =
+  | 'bar' | 'line' | 'pie' | 'table' | 'scatter' | 'radar'
+  | 'grouped_bar' | 'stacked_bar' | 'dual_axis_line';
 
 // AI 返回的数据结构
 export interface ChatData {
   columns: string[];  // 列名数组
   rows: Array<Record<string, any>>;  // 行数据数组
+  total_count?: number | null;  // 查询结果总行数
+  truncated?: boolean;  // 是否因行数上限被截断
 }
 
-// 后端 ChatBI 接口响应
+// 后端返回的列式数据 (values[i] 为 columns[i] 列的全部取值)
+export interface ChatColumnarData {
+  columns: string[];
+  values: any[][];
+  row_count: number;
+  total_count: number | null;
+  truncated: boolean;
+}
+
+// 后端 ChatBI 接口原始响应
+export interface ChatApiResponse {
+  answer_text: string;
+  sql: string;
+  data: ChatColumnarData;
+  chart_type: ChartType;
+}
+
+// ChatBI 接口响应 (已转换为行数据)
 export interface ChatResponse {
   answer_text: string;  // AI 自然语言回答
   sql: string;          // 生成的 SQL 语句
@@ -39,4 +39,5 @@ export interface DashboardOverview {
   trends: TrendPoint[];
   inventory_alerts: InventoryAlert[];
   finance_status: FinanceStatus;
+  last_updated?: string | null;
 }
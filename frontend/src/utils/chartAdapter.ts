@@ -26,9 +26,14 @@ export const convertToEChartsOption = (
 
   switch (chartType) {
     case 'bar':
+    case 'grouped_bar':
       return getBarChartOption(columns, rows, colors, isDark);
+    case 'stacked_bar':
+      return getBarChartOption(columns, rows, colors, isDark, true);
     case 'line':
       return getLineChartOption(columns, rows, colors, isDark);
+    case 'dual_axis_line':
+      return getLineChartOption(columns, rows, colors, isDark, true);
     case 'pie':
       return getPieChartOption(columns, rows, colors, isDark);
     case 'scatter':
@@ -49,14 +54,16 @@ const getBarChartOption = (
   columns: string[],
   rows: Array<Record<string, any>>,
   colors: string[],
-  isDark: boolean
+  isDark: boolean,
+  stacked: boolean = false
 ): EChartsOption => {
-  // 假设第一列为 X 轴（分类），其余列为数值
+  // 假设第一列为 X 轴（分类），其余列为数值；多列时为分组柱状图，stacked 时堆叠
   const xAxisData = rows.map(row => row[columns[0]]);
   const series = columns.slice(1).map((col, index) => ({
     name: col,
     type: 'bar' as const,
     data: rows.map(row => row[col]),
+    ...(stacked ? { stack: 'total' } : {}),
     // 渐变色配置 (Teal/Blue 风格)
     itemStyle: {
       color: {
@@ -76,7 +83,7 @@ const getBarChartOption = (
           }
         ]
       },
-      borderRadius: [4, 4, 0, 0] // 顶部圆角
+      borderRadius: stacked ? 0 : [4, 4, 0, 0] // 顶部圆角 (堆叠时不使用)
     },
     // 鼠标悬停时的高亮效果
     emphasis: {
@@ -260,12 +267,15 @@ const getLineChartOption = (
   columns: string[],
   rows: Array<Record<string, any>>,
   colors: string[],
-  isDark: boolean
+  isDark: boolean,
+  dualAxis: boolean = false
 ): EChartsOption => {
   const xAxisData = rows.map(row => row[columns[0]]);
+  // 双轴: 第一个指标使用左轴，其余指标使用右轴 (量级差异较大时)
   const series = columns.slice(1).map((col, index) => ({
     name: col,
     type: 'line' as const,
+    yAxisIndex: dualAxis && index > 0 ? 1 : 0,
     data: rows.map(row => row[col]),
     smooth: true,
     itemStyle: {
@@ -310,8 +320,9 @@ const getLineChartOption = (
         color: isDark ? '#94a3b8' : '#64748b'
       }
     },
-    yAxis: {
-      type: 'value',
+    yAxis: (dualAxis ? [0, 1] : [0]).map(index => ({
+      type: 'value' as const,
+      position: index === 0 ? 'left' as const : 'right' as const,
       axisLine: {
         lineStyle: {
           color: isDark ? '#334155' : '#cbd5e1'
@@ -321,11 +332,12 @@ const getLineChartOption = (
         color: isDark ? '#94a3b8' : '#64748b'
       },
       splitLine: {
+        show: index === 0,
         lineStyle: {
           color: isDark ? '#1e293b' : '#f1f5f9'
         }
       }
-    },
+    })),
     series
   };
 };